@@ -3,45 +3,121 @@ AI-Powered Product Information Extraction Agent
 Uses OpenAI GPT to intelligently extract product information from URLs
 """
 import asyncio
-import requests
+import aiohttp
 import json
 import logging
-from typing import Dict, Any, Optional
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
 from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
-from openai import OpenAI
-import os
+from bs4 import BeautifulSoup, NavigableString
 import re
+import time
 from core.agent_base import BaseAgent, AgentTask, AgentResult
+from services.single_flight import SingleFlight
+from services.circuit_breaker import host_health
+from services.politeness import PolitenessTimeout, politeness
+from services.scraper_client import scraper_client
+from services.llm_gateway import llm_gateway
+from services.redirect_cache import redirect_cache
+from services.structured_data import missing_fields, structured_product_from_tags
+from utils.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Coalesce concurrent fetches of the same product page
+page_fetch_flight = SingleFlight("page_fetch")
+
+@dataclass
+class HttpResult:
+    """Fully read HTTP response (status, final URL after redirects, body)"""
+    status: int
+    url: str
+    content: bytes
+    redirects: List[Tuple[str, int]] = field(default_factory=list)  # (url, status) of each redirect hop
+
+@dataclass
+class FetchedPage:
+    """LLM-ready page summary plus any schema.org/OpenGraph product fields embedded in the HTML"""
+    content: str
+    structured: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class PageScan:
+    """Everything _build_page_content needs, gathered in one walk over the parsed HTML"""
+    title_candidates: List[str] = field(default_factory=list)
+    image_candidates: List[str] = field(default_factory=list)
+    text: str = ""
+    ld_json_scripts: list = field(default_factory=list)
+    itemprop_tags: list = field(default_factory=list)
+    meta_tags: list = field(default_factory=list)
+
+class TextBudget:
+    """Collects text like get_text(separator='\\n', strip=True), but stops once limit characters are in"""
+    __slots__ = ('limit', 'types', 'parts', 'length', 'full')
+    
+    def __init__(self, limit: int, types):
+        self.limit = limit
+        self.types = types
+        self.parts = []
+        self.length = -1
+        self.full = False
+    
+    def add(self, text: str):
+        self.parts.append(text)
+        self.length += len(text) + 1
+        if self.length >= self.limit:
+            self.full = True
+    
+    def text(self) -> str:
+        return '\n'.join(self.parts)
+
 class ProductInfoAgent(BaseAgent):
     """AI-powered agent for extracting product information from URLs"""
     
+    # Structured data with all of these fields is imported without an LLM call
+    STRUCTURED_REQUIRED_FIELDS = ("title", "price", "image_url", "brand")
+    # Page text sent along with a partial structured record
+    COMPACT_CONTENT_CHARS = 2500
+    
+    # Page summary: subtrees left out of the text, content areas tried in order, and size limits
+    SKIPPED_TAGS = frozenset(["script", "style", "nav", "footer", "noscript"])
+    CONTENT_AREA_IDS = frozenset(["main", "content", "product", "detail", "item"])
+    CONTENT_AREA_CLASSES = frozenset(["product", "item", "detail", "content"])
+    PAGE_TEXT_CHARS = 7000
+    MIN_AREA_TEXT_CHARS = 500
+    IMAGE_CANDIDATES = 2
+    GENERAL_IMAGE_SCAN_LIMIT = 15
+    AMAZON_IMAGE_HOSTS = ('images-amazon', 'ssl-images-amazon', 'm.media-amazon')
+    
     def __init__(self):
         super().__init__(name="ProductInfoAgent")
         self.description = "Extracts product information using AI analysis"
         
-        # Initialize OpenAI client
-        api_key = os.getenv("OPENAI_API_KEY")
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-            self.ai_enabled = True
+        # OpenAI calls go through the shared async LLM gateway
+        self.ai_enabled = llm_gateway.enabled
+        if self.ai_enabled:
             logger.info("ProductInfoAgent initialized with OpenAI API")
         else:
-            self.client = None
-            self.ai_enabled = False
             logger.warning("ProductInfoAgent initialized without OpenAI API - using fallback mode")
         
-        # Setup session for web requests
-        self.session = requests.Session()
-        self.session.headers.update({
+        # Default headers for web requests (per-request headers override them)
+        self.default_headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        }
         
         # Valid categories from the database model
         self.valid_categories = ['tools', 'materials', 'safety', 'accessories', 'other']
+        
+        # How imports were served and the estimated prompt+completion tokens avoided
+        self.extraction_stats = {
+            'imports': 0,
+            'structured_data': 0,
+            'structured_data_with_llm': 0,
+            'llm': 0,
+            'other': 0,
+            'tokens_saved': 0,
+            'search_wins': {},
+        }
     
     def validate_input(self, input_data: dict) -> bool:
         """Validate input data for product info extraction"""
@@ -73,7 +149,9 @@ class ProductInfoAgent(BaseAgent):
             logger.info(f"Extracting product info from: {product_url}")
             
             # Extract product information using AI
-            product_info = await self._extract_product_info_with_ai(product_url)
+            product_info = await self._extract_product_info_with_ai(
+                product_url, bypass_cache=bool(input_data.get('bypass_llm_cache'))
+            )
             
             return AgentResult(
                 success=True,
@@ -87,20 +165,33 @@ class ProductInfoAgent(BaseAgent):
                 error=str(e)
             )
     
-    async def _extract_product_info_with_ai(self, url: str) -> Dict[str, Any]:
+    async def _extract_product_info_with_ai(self, url: str, bypass_cache: bool = False) -> Dict[str, Any]:
         """Extract product information using AI analysis"""
         try:
             # First, get the page content
-            page_content = await self._fetch_page_content(url)
+            page = await self._fetch_page(url)
             
-            if not page_content:
+            if not page:
                 # Try search-based extraction as fallback
                 logger.info(f"Direct page fetch failed for {url}, attempting search-based extraction")
                 return await self._search_based_extraction(url)
+            page_content = page.content
+            
+            # Fast path: the page's own structured data already has everything we need
+            structured = page.structured
+            if structured.get('title') and not missing_fields(structured, self.STRUCTURED_REQUIRED_FIELDS):
+                product_info = self._product_from_structured_data(url, structured)
+                tokens_saved = self._estimate_tokens(self._create_extraction_prompt(
+                    url, page_content, product_info['merchant'])) + self._estimate_tokens(json.dumps(product_info))
+                self._record_extraction('structured_data', tokens_saved)
+                logger.info(f"Structured data complete for {url} ({', '.join(structured['sources'])}), "
+                            f"skipped LLM (~{tokens_saved} tokens saved)")
+                return product_info
             
             # Use AI to extract product information
             if self.ai_enabled:
-                product_info = await self._analyze_with_openai(url, page_content)
+                product_info = await self._analyze_with_openai(url, page_content, structured=structured,
+                                                               bypass_cache=bypass_cache)
                 if product_info and product_info.get('title'):
                     # If critical data is missing (price/image), try search enhancement
                     if not product_info.get('original_price') and not product_info.get('sale_price'):
@@ -116,10 +207,13 @@ class ProductInfoAgent(BaseAgent):
             
             # Fallback to basic extraction if AI fails
             logger.warning("AI analysis failed or unavailable, trying search-based extraction")
+            self._record_extraction('other')
             search_result = await self._search_based_extraction(url)
             if search_result:
                 return search_result
             
+            if structured.get('title'):
+                return self._product_from_structured_data(url, structured)
             return self._extract_basic_info(url, page_content)
             
         except Exception as e:
@@ -133,7 +227,59 @@ class ProductInfoAgent(BaseAgent):
                 pass
             return self._create_fallback_product(url, f"Extraction error: {str(e)}")
     
+    async def _fetch_page(self, url: str) -> Optional[FetchedPage]:
+        """Fetch a page, sharing one in-flight fetch between concurrent callers of the same URL"""
+        return await page_fetch_flight.do(
+            self._normalize_url(redirect_cache.resolve(url)),
+            lambda: self._fetch_page_uncoalesced(url)
+        )
+    
     async def _fetch_page_content(self, url: str) -> Optional[str]:
+        """Fetch the LLM-ready page summary"""
+        page = await self._fetch_page(url)
+        return page.content if page else None
+    
+    def _normalize_url(self, url: str) -> str:
+        """Normalize URL for request coalescing (scheme/host case, fragment)"""
+        parsed = urlparse(url.strip())
+        return parsed._replace(
+            scheme=parsed.scheme.lower(),
+            netloc=parsed.netloc.lower(),
+            fragment=''
+        ).geturl()
+    
+    async def _http_get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 10) -> HttpResult:
+        """Non-blocking GET that follows redirects, using the shared scraper connection pool when running.
+        
+        Every request waits for the target domain's slot in the shared politeness scheduler.
+        Each redirect hop's status is reported to its own domain. The final status is reported
+        to the domain that actually served it, so a shortener that redirects to a throttling
+        merchant slows down the merchant, not the shortener.
+        """
+        request_headers = {**self.default_headers, **(headers or {})}
+        # Same semantics as a requests timeout: limit connect and each read, not the whole transfer
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        
+        await politeness.acquire(url)
+        if scraper_client.is_running:
+            result = await self._read_response(scraper_client.session, url, request_headers, client_timeout)
+        else:
+            # Standalone use (scripts/tests): short-lived session
+            async with aiohttp.ClientSession() as session:
+                result = await self._read_response(session, url, request_headers, client_timeout)
+        for hop_url, hop_status in result.redirects:
+            politeness.feedback(hop_url, hop_status)
+        politeness.feedback(result.url or url, result.status)
+        return result
+    
+    async def _read_response(self, session: aiohttp.ClientSession, url: str, headers: Dict[str, str],
+                             timeout: aiohttp.ClientTimeout) -> HttpResult:
+        async with session.get(url, headers=headers, timeout=timeout, allow_redirects=True) as response:
+            content = await response.read()
+            return HttpResult(status=response.status, url=str(response.url), content=content,
+                              redirects=[(str(hop.url), hop.status) for hop in response.history])
+    
+    async def _fetch_page_uncoalesced(self, url: str) -> Optional[FetchedPage]:
         """Fetch page content while preserving affiliate parameters"""
         try:
             # Handle shortened URLs by following redirects and getting final URL
@@ -144,7 +290,7 @@ class ProductInfoAgent(BaseAgent):
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
                 'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
+                'Accept-Encoding': 'gzip, deflate',
                 'DNT': '1',
                 'Connection': 'keep-alive',
                 'Upgrade-Insecure-Requests': '1',
@@ -159,145 +305,260 @@ class ProductInfoAgent(BaseAgent):
                 'Referer': 'https://www.google.com/'
             }
             
-            # Make request with timeout and handle redirects - with retry logic
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    timeout = 20 + (attempt * 10)  # Increase timeout on retries
-                    response = self.session.get(url, timeout=timeout, allow_redirects=True, headers=headers)
-                    final_url = response.url
-                    
-                    logger.info(f"Final URL after redirects: {final_url}")
-                    
-                    # Check for Amazon bot blocking
-                    if response.status_code == 503 and 'amazon' in final_url.lower():
-                        logger.warning(f"Amazon blocked request (503) for {final_url}, using fallback data extraction")
-                        return self._create_amazon_fallback_content(url, final_url)
-                    
-                    response.raise_for_status()
-                    break  # Success, exit retry loop
-                    
-                except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectTimeout) as e:
-                    if attempt < max_retries - 1:
-                        wait_time = (attempt + 1) * 2
-                        logger.warning(f"Timeout on attempt {attempt + 1} for {url}, retrying in {wait_time}s...")
-                        import time
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        logger.error(f"Failed to fetch {url} after {max_retries} attempts due to timeout")
-                        raise e
-            
-            # Parse with BeautifulSoup to clean up content
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "noscript"]):
-                script.decompose()
-            
-            # Extract product title from meta tags and page title
-            product_info = {'url': final_url}
-            
-            # Try to get product title from various sources
-            title_candidates = []
-            if soup.title:
-                title_candidates.append(soup.title.string.strip())
-            
-            # Look for Open Graph title
-            og_title = soup.find('meta', property='og:title')
-            if og_title and og_title.get('content'):
-                title_candidates.append(og_title['content'].strip())
-            
-            # Look for product name in meta tags
-            product_name = soup.find('meta', attrs={'name': 'title'}) or soup.find('meta', attrs={'name': 'product_name'})
-            if product_name and product_name.get('content'):
-                title_candidates.append(product_name['content'].strip())
-            
-            product_info['title_candidates'] = title_candidates
-            
-            # Try to get product image
-            image_candidates = []
-            og_image = soup.find('meta', property='og:image')
-            if og_image and og_image.get('content'):
-                image_candidates.append(og_image['content'])
-            
-            # Amazon-specific image extraction
-            if 'amazon' in final_url.lower():
-                # Look for Amazon's main product image
-                amazon_img = soup.find('img', {'id': 'landingImage'}) or soup.find('img', {'data-old-hires': True})
-                if amazon_img:
-                    src = amazon_img.get('src') or amazon_img.get('data-old-hires') or amazon_img.get('data-a-dynamic-image')
-                    if src:
-                        image_candidates.insert(0, src)  # Prioritize Amazon main image
+            # Short links we have resolved before are fetched at their final URL directly
+            fetch_url = redirect_cache.resolve(url)
+            if fetch_url != url:
+                logger.info(f"Using cached redirect {url} -> {fetch_url}")
+            
+            # Skip the network entirely while this host's circuit is open. The breaker sees one
+            # result per fetch (not per retry); a cancelled fetch gives its half-open probe back
+            host = urlparse(fetch_url).netloc
+            with host_health.request(host) as call:
+                if not call.allowed:
+                    logger.warning(f"Circuit open for {host}, skipping fetch of {url}")
+                    if 'amazon' in fetch_url.lower() or 'amzn.to' in fetch_url.lower():
+                        return FetchedPage(self._create_amazon_fallback_content(url, fetch_url))
+                    return None
                 
-                # Look for other Amazon product images
-                for img in soup.find_all('img'):
-                    src = img.get('src') or img.get('data-src') or img.get('data-a-dynamic-image')
-                    if src and any(keyword in src.lower() for keyword in ['images-amazon', 'ssl-images-amazon', 'm.media-amazon']):
-                        if src.startswith('//'):
-                            src = 'https:' + src
-                        elif src.startswith('/'):
-                            src = 'https://amazon.com' + src
-                        image_candidates.append(src)
-            
-            # Look for main product images (general sites)
-            for img in soup.find_all('img', limit=15):
-                src = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
-                if src and ('product' in src.lower() or 'item' in src.lower() or len(src) > 50):
-                    if src.startswith('//'):
-                        src = 'https:' + src
-                    elif src.startswith('/'):
-                        from urllib.parse import urljoin
-                        src = urljoin(final_url, src)
-                    image_candidates.append(src)
-            
-            product_info['image_candidates'] = image_candidates
-            
-            # Get text content, focusing on main product areas
-            content_areas = [
-                soup.find('main'),
-                soup.find(id=['main', 'content', 'product', 'detail', 'item']),
-                soup.find(class_=['product', 'item', 'detail', 'content']),
-                soup.find('body')
-            ]
-            
-            text_content = ""
-            for area in content_areas:
-                if area:
-                    text_content = area.get_text(separator='\n', strip=True)
-                    if len(text_content) > 500:  # Ensure we have substantial content
-                        break
-            
-            # If no substantial content found, get full page
-            if len(text_content) < 500:
-                text_content = soup.get_text(separator='\n', strip=True)
-            
-            # Enhance content with extracted metadata
-            enhanced_content = f"""
-EXTRACTED METADATA:
-Final URL: {final_url}
-Title candidates: {', '.join(title_candidates[:3])}
-Image candidates: {', '.join(image_candidates[:2])}
-
-PAGE CONTENT:
-{text_content[:7000]}
-"""
-            
-            return enhanced_content
-            
-        except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectTimeout) as e:
+                # Base timeout adapts to the host's observed p95 latency (capped at 20s)
+                base_timeout = host_health.timeout_for(host, 20)
+                
+                # Make request with timeout and handle redirects - with retry logic
+                max_retries = 3
+                for attempt in range(max_retries):
+                    try:
+                        timeout = base_timeout + (attempt * 10)  # Increase timeout on retries
+                        start = time.monotonic()
+                        response = await self._http_get(fetch_url, headers=headers, timeout=timeout)
+                        final_url = response.url
+                        
+                        logger.info(f"Final URL after redirects: {final_url}")
+                        # Only a short link that landed on a real page becomes the future fetch target;
+                        # bot walls, throttling and error pages are not remembered
+                        if 200 <= response.status < 300:
+                            redirect_cache.record(url, final_url)
+                        
+                        if response.status >= 500 or response.status == 429:
+                            call.failure()
+                        else:
+                            call.success(time.monotonic() - start)
+                        
+                        # Check for Amazon bot blocking
+                        if response.status == 503 and 'amazon' in final_url.lower():
+                            logger.warning(f"Amazon blocked request (503) for {final_url}, using fallback data extraction")
+                            return FetchedPage(self._create_amazon_fallback_content(url, final_url))
+                        
+                        if response.status >= 400:
+                            raise aiohttp.ClientError(f"HTTP {response.status} for {final_url}")
+                        break  # Success, exit retry loop
+                        
+                    except PolitenessTimeout:
+                        # Nothing was sent and the host is not at fault; retrying would only queue again
+                        raise
+                    except asyncio.TimeoutError as e:
+                        if attempt < max_retries - 1:
+                            wait_time = (attempt + 1) * 2
+                            logger.warning(f"Timeout on attempt {attempt + 1} for {url}, retrying in {wait_time}s...")
+                            await asyncio.sleep(wait_time)
+                            continue
+                        else:
+                            call.failure()
+                            logger.error(f"Failed to fetch {url} after {max_retries} attempts due to timeout")
+                            raise e
+                    except aiohttp.ClientConnectionError:
+                        call.failure()
+                        raise
+            
+            return self._parse_page(response.content, final_url)
+            
+        except asyncio.TimeoutError as e:
             logger.error(f"Timeout fetching page content from {url}: {e}")
             # For Amazon URLs, try to extract info from URL structure
-            if 'amazon' in url.lower() or 'amzn.to' in url.lower():
-                return self._create_amazon_fallback_content(url, url)
+            resolved_url = redirect_cache.resolve(url)
+            if 'amazon' in resolved_url.lower() or 'amzn.to' in resolved_url.lower():
+                return FetchedPage(self._create_amazon_fallback_content(url, resolved_url))
             return None
         except Exception as e:
             logger.error(f"Error fetching page content from {url}: {e}")
             # For Amazon URLs, try to extract info from URL structure
-            if 'amazon' in url.lower() or 'amzn.to' in url.lower():
-                return self._create_amazon_fallback_content(url, url)
+            resolved_url = redirect_cache.resolve(url)
+            if 'amazon' in resolved_url.lower() or 'amzn.to' in resolved_url.lower():
+                return FetchedPage(self._create_amazon_fallback_content(url, resolved_url))
             return None
     
+    def _parse_page(self, html, final_url: str) -> FetchedPage:
+        """Page summary and embedded structured data from a single parse of the HTML"""
+        scan = self._scan_page(html, final_url, collect_structured=True)
+        return FetchedPage(
+            content=self._format_page_content(final_url, scan),
+            structured=structured_product_from_tags(
+                scan.ld_json_scripts, scan.itemprop_tags, scan.meta_tags, final_url
+            )
+        )
+    
+    def _build_page_content(self, html, final_url: str) -> str:
+        """Build the LLM-ready page summary from raw HTML (no network, used by benchmarks)"""
+        return self._format_page_content(final_url, self._scan_page(html, final_url))
+    
+    def _format_page_content(self, final_url: str, scan: PageScan) -> str:
+        return f"""
+EXTRACTED METADATA:
+Final URL: {final_url}
+Title candidates: {', '.join(scan.title_candidates[:3])}
+Image candidates: {', '.join(scan.image_candidates[:self.IMAGE_CANDIDATES])}
+
+PAGE CONTENT:
+{scan.text}
+"""
+    
+    def _scan_page(self, html, final_url: str, collect_structured: bool = False) -> PageScan:
+        """Walk the parsed page once, collecting title/image candidates and content-area text.
+        
+        Script, style, nav, footer and noscript subtrees are left out of the summary. Text
+        collection stops per content area once PAGE_TEXT_CHARS are in, and only the image
+        candidates that can make it into the summary are kept. With collect_structured, the
+        JSON-LD scripts, itemprop tags and meta tags (including those in skipped subtrees)
+        are collected for structured_product_from_tags.
+        """
+        soup = BeautifulSoup(html, 'html.parser')
+        is_amazon = 'amazon' in final_url.lower()
+        scan = PageScan()
+        
+        # First matching tag per role, in document order
+        first = {}
+        areas = {}
+        amazon_images = []
+        general_images = []
+        general_images_seen = 0
+        page_text = TextBudget(self.PAGE_TEXT_CHARS, soup.interesting_string_types)
+        
+        # Explicit stack instead of recursion: unclosed tags can nest thousands deep
+        stack = [(iter(soup.contents), False, (page_text,))]
+        while stack:
+            children, skipped, collectors = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                continue
+            
+            if isinstance(node, NavigableString):
+                if skipped:
+                    continue
+                text = None
+                node_type = type(node)
+                for collector in collectors:
+                    if collector.full or node_type not in collector.types:
+                        continue
+                    if text is None:
+                        text = node.strip()
+                        if not text:
+                            break
+                    collector.add(text)
+                continue
+            
+            name = node.name
+            attrs = node.attrs
+            if collect_structured:
+                if name == 'meta':
+                    scan.meta_tags.append(node)
+                elif name == 'script' and attrs.get('type') == 'application/ld+json':
+                    scan.ld_json_scripts.append(node)
+                if 'itemprop' in attrs:
+                    scan.itemprop_tags.append(node)
+            
+            child_skipped = skipped or name in self.SKIPPED_TAGS
+            child_collectors = collectors
+            if not child_skipped:
+                if name == 'title':
+                    first.setdefault('title', node)
+                elif name == 'meta':
+                    meta_property = attrs.get('property')
+                    if meta_property == 'og:title':
+                        first.setdefault('og_title', node)
+                    elif meta_property == 'og:image':
+                        first.setdefault('og_image', node)
+                    meta_name = attrs.get('name')
+                    if meta_name == 'title':
+                        first.setdefault('meta_title', node)
+                    elif meta_name == 'product_name':
+                        first.setdefault('meta_product_name', node)
+                elif name == 'img':
+                    if is_amazon:
+                        if attrs.get('id') == 'landingImage':
+                            first.setdefault('amazon_landing', node)
+                        if 'data-old-hires' in attrs:
+                            first.setdefault('amazon_old_hires', node)
+                        if len(amazon_images) < self.IMAGE_CANDIDATES:
+                            src = attrs.get('src') or attrs.get('data-src') or attrs.get('data-a-dynamic-image')
+                            if src and any(keyword in src.lower() for keyword in self.AMAZON_IMAGE_HOSTS):
+                                if src.startswith('//'):
+                                    src = 'https:' + src
+                                elif src.startswith('/'):
+                                    src = 'https://amazon.com' + src
+                                amazon_images.append(src)
+                    
+                    if general_images_seen < self.GENERAL_IMAGE_SCAN_LIMIT:
+                        general_images_seen += 1
+                        src = attrs.get('src') or attrs.get('data-src') or attrs.get('data-lazy-src')
+                        if (len(general_images) < self.IMAGE_CANDIDATES and src
+                                and ('product' in src.lower() or 'item' in src.lower() or len(src) > 50)):
+                            if src.startswith('//'):
+                                src = 'https:' + src
+                            elif src.startswith('/'):
+                                src = urljoin(final_url, src)
+                            general_images.append(src)
+                
+                # Content areas, tried in this order: <main>, known ids, known classes, <body>
+                roles = []
+                if name == 'main':
+                    roles.append('main')
+                elif name == 'body':
+                    roles.append('body')
+                if attrs.get('id') in self.CONTENT_AREA_IDS:
+                    roles.append('id')
+                if any(cls in self.CONTENT_AREA_CLASSES for cls in attrs.get('class', ())):
+                    roles.append('class')
+                for role in roles:
+                    if role not in areas:
+                        areas[role] = TextBudget(self.PAGE_TEXT_CHARS, node.interesting_string_types)
+                        child_collectors = child_collectors + (areas[role],)
+            
+            if node.contents:
+                stack.append((iter(node.contents), child_skipped, child_collectors))
+        
+        # Try to get product title from various sources
+        if 'title' in first:
+            scan.title_candidates.append(first['title'].string.strip())
+        for role in ('og_title', 'meta_title' if 'meta_title' in first else 'meta_product_name'):
+            tag = first.get(role)
+            if tag is not None and tag.get('content'):
+                scan.title_candidates.append(tag['content'].strip())
+        
+        # Amazon's main product image first, then Open Graph, then other product images
+        amazon_main = first.get('amazon_landing') or first.get('amazon_old_hires')
+        if amazon_main is not None:
+            src = amazon_main.get('src') or amazon_main.get('data-old-hires') or amazon_main.get('data-a-dynamic-image')
+            if src:
+                scan.image_candidates.append(src)
+        og_image = first.get('og_image')
+        if og_image is not None and og_image.get('content'):
+            scan.image_candidates.append(og_image['content'])
+        scan.image_candidates.extend(amazon_images)
+        scan.image_candidates.extend(general_images)
+        
+        # First content area with substantial text, else the whole page
+        text_content = ""
+        for role in ('main', 'id', 'class', 'body'):
+            if role in areas:
+                text_content = areas[role].text()
+                if len(text_content) > self.MIN_AREA_TEXT_CHARS:
+                    break
+        if len(text_content) < self.MIN_AREA_TEXT_CHARS:
+            text_content = page_text.text()
+        scan.text = text_content[:self.PAGE_TEXT_CHARS]
+        
+        return scan
+    
     def _create_amazon_fallback_content(self, original_url: str, final_url: str) -> str:
         """Create fallback content when Amazon blocks requests"""
         import re
@@ -342,60 +603,72 @@ ASIN: {asin_match.group(1) if asin_match else 'Unknown'}
         
         return enhanced_content
     
-    async def _analyze_with_openai(self, url: str, page_content: str) -> Optional[Dict[str, Any]]:
-        """Use OpenAI to analyze page content and extract product information"""
+    async def _analyze_with_openai(self, url: str, page_content: str, structured: Optional[Dict[str, Any]] = None,
+                                   bypass_cache: bool = False) -> Optional[Dict[str, Any]]:
+        """Use OpenAI to analyze page content and extract product information
+
+        When the page's structured data is partial, only the missing fields are requested
+        and the known ones are kept as-is. Responses are cached on a hash of the prompt and
+        model, so re-importing an unchanged page skips the model call. bypass_cache forces
+        a fresh extraction.
+        """
         try:
             # Detect merchant from URL
             merchant = self._detect_merchant(url)
             
             # Create AI prompt
-            prompt = self._create_extraction_prompt(url, page_content, merchant)
-            
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a product information extraction expert. Extract accurate product details from web page content and return them in the specified JSON format. Always preserve the original URL exactly as provided."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.1,
-                max_tokens=1000
-            )
-            
-            # Parse AI response
-            ai_response = response.choices[0].message.content.strip()
-            logger.info(f"AI Response: {ai_response}")
+            full_prompt = self._create_extraction_prompt(url, page_content, merchant)
+            known = self._known_structured_fields(structured or {})
+            if known.get('title'):
+                prompt = self._create_completion_prompt(url, page_content, merchant, known)
+                tokens_saved = max(0, self._estimate_tokens(full_prompt) - self._estimate_tokens(prompt))
+                self._record_extraction('structured_data_with_llm', tokens_saved)
+                logger.info(f"Structured data partial for {url}, asking LLM only for missing fields "
+                            f"(~{tokens_saved} prompt tokens saved)")
+            else:
+                prompt = full_prompt
+                known = {}
+                self._record_extraction('llm')
             
-            # Try to parse JSON response
+            # Call OpenAI API; the JSON is parsed as it streams and the call returns once the object closes
             try:
-                # Clean up response if it contains markdown formatting
-                if ai_response.startswith('```json'):
-                    ai_response = ai_response.split('```json')[1].split('```')[0].strip()
-                elif ai_response.startswith('```'):
-                    ai_response = ai_response.split('```')[1].split('```')[0].strip()
-                
-                product_data = json.loads(ai_response)
-                
-                # Validate and normalize category
-                product_data['category'] = self._validate_category(product_data.get('category', 'other'))
-                
-                # Ensure original URL is preserved
-                product_data['product_url'] = url
-                product_data['scraped'] = True
-                product_data['extraction_method'] = 'ai'
-                
-                return product_data
-                
-            except json.JSONDecodeError as e:
+                product_data = await llm_gateway.chat_json(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "You are a product information extraction expert. Extract accurate product details from web page content and return them in the specified JSON format. Always preserve the original URL exactly as provided."
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    temperature=0.1,
+                    max_tokens=1000,
+                    purpose="product_extraction",
+                    use_cache=True,
+                    bypass_cache=bypass_cache,
+                    required=("title",)
+                )
+            except ValueError as e:
                 logger.error(f"Failed to parse AI JSON response: {e}")
-                logger.error(f"Raw AI response: {ai_response}")
                 return None
+            logger.info(f"AI Response: {product_data}")
+            
+            # Fields from the page's structured data take precedence over the model's
+            if known:
+                product_data = {**product_data, **known, 'merchant': merchant}
+            
+            # Validate and normalize category
+            product_data['category'] = self._validate_category(product_data.get('category', 'other'))
+            
+            # Ensure original URL is preserved
+            product_data['product_url'] = url
+            product_data['scraped'] = True
+            product_data['extraction_method'] = 'structured_data_ai' if known else 'ai'
+            
+            return product_data
                 
         except Exception as e:
             logger.error(f"OpenAI analysis failed: {e}")
@@ -462,6 +735,128 @@ CRITICAL REQUIREMENTS:
 10. MANDATORY: title, description, category, and project_types must NEVER be null
 """
     
+    def _create_completion_prompt(self, url: str, content: str, merchant: str, known: Dict[str, Any]) -> str:
+        """Create a compact prompt asking only for the fields the structured data did not provide"""
+        field_specs = {
+            'title': '"title": "Product title (string)"',
+            'description': '"description": "Brief product description (string, 1-2 sentences)"',
+            'original_price': '"original_price": "Original/list price as number or null"',
+            'sale_price': '"sale_price": "Current price as number or null"',
+            'brand': '"brand": "Brand name (string) or null"',
+            'model': '"model": "Model number (string) or null"',
+            'image_url': '"image_url": "Main product image URL (string) or null"',
+        }
+        requested = [spec for name, spec in field_specs.items() if not known.get(name)]
+        if 'sale_price' in known or 'original_price' in known:
+            requested = [spec for spec in requested if 'price"' not in spec]
+        requested.append('"category": "One of: tools, materials, safety, accessories, other"')
+        requested.append('"project_types": ["One or more of: woodworking, plumbing, electrical, automotive, '
+                         'metalworking, painting, general, outdoor, home_improvement, crafts"]')
+        fields = ',\n    '.join(requested)
+        
+        return f"""
+Complete this {merchant} product record. These fields come from the page's structured data and are correct:
+{json.dumps(known, ensure_ascii=False)}
+
+URL: {url}
+
+Page Content (excerpt):
+{content[:self.COMPACT_CONTENT_CHARS]}
+
+Return ONLY valid JSON with these fields:
+{{
+    {fields}
+}}
+"""
+    
+    def _known_structured_fields(self, structured: Dict[str, Any]) -> Dict[str, Any]:
+        """Structured-data fields that are passed through unchanged (the raw retailer category is only a hint)"""
+        return {
+            key: value for key, value in structured.items()
+            if key not in ('sources', 'category') and value not in (None, '')
+        }
+    
+    def _product_from_structured_data(self, url: str, structured: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a product record from embedded structured data without calling the LLM"""
+        merchant = self._detect_merchant(url)
+        title = structured['title']
+        hint = f"{structured.get('category') or ''} {title}".lower()
+        
+        return {
+            'title': title,
+            'description': structured.get('description') or f"{title} available from {urlparse(url).netloc.replace('www.', '')}",
+            'category': self._infer_category(hint, structured.get('category')),
+            'merchant': merchant,
+            'original_price': structured.get('original_price'),
+            'sale_price': structured.get('sale_price'),
+            'brand': structured.get('brand'),
+            'model': structured.get('model'),
+            'rating': structured.get('rating'),
+            'rating_count': structured.get('rating_count'),
+            'image_url': structured.get('image_url'),
+            'key_features': None,
+            'project_types': self._infer_project_types(hint),
+            'product_url': url,
+            'scraped': True,
+            'extraction_method': 'structured_data'
+        }
+    
+    def _infer_category(self, text: str, retailer_category: Optional[str] = None) -> str:
+        """Keyword-based category for records that never reach the LLM"""
+        category = self._validate_category(retailer_category or '')
+        if category != 'other':
+            return category
+        
+        keyword_categories = [
+            ('accessories', ['drill bit', 'bit set', 'saw blade', 'blade set', 'charger', 'attachment']),
+            ('safety', ['safety', 'glasses', 'goggles', 'gloves', 'respirator', 'mask', 'helmet', 'ear protection']),
+            ('tools', ['drill', 'driver', 'saw', 'sander', 'grinder', 'wrench', 'hammer', 'clamp', 'plier',
+                       'router', 'nailer', 'level', 'stripper', 'cutter', 'tool']),
+            ('materials', ['screw', 'nail', 'lumber', 'plywood', 'pipe', 'fitting', 'paint', 'primer', 'glue',
+                           'adhesive', 'tape', 'wire', 'caulk', 'sandpaper']),
+        ]
+        for category, keywords in keyword_categories:
+            if any(keyword in text for keyword in keywords):
+                return category
+        return 'other'
+    
+    def _infer_project_types(self, text: str) -> list:
+        """Keyword-based DIY project types, mirroring the categories used in the extraction prompt"""
+        keyword_project_types = [
+            ('woodworking', ['saw', 'drill', 'clamp', 'router', 'sander', 'wood', 'chisel', 'nailer']),
+            ('plumbing', ['pipe', 'pvc', 'plumb', 'faucet', 'fitting']),
+            ('electrical', ['wire', 'electrical', 'multimeter', 'voltage', 'outlet']),
+            ('automotive', ['socket', 'ratchet', 'automotive', 'jack', 'torque wrench']),
+            ('metalworking', ['grinder', 'weld', 'metal', 'file']),
+            ('painting', ['paint', 'primer', 'roller', 'brush']),
+            ('outdoor', ['garden', 'lawn', 'shovel', 'hose', 'outdoor']),
+            ('home_improvement', ['drill', 'drywall', 'flooring', 'insulation', 'level', 'stud finder']),
+            ('crafts', ['craft', 'precision', 'hobby', 'glue gun']),
+        ]
+        project_types = [project for project, keywords in keyword_project_types
+                         if any(keyword in text for keyword in keywords)]
+        if 'general' not in project_types and any(keyword in text for keyword in ['drill', 'driver', 'hammer', 'screwdriver', 'tool']):
+            project_types.insert(0, 'general')
+        return project_types or ['general']
+    
+    def _estimate_tokens(self, text: str) -> int:
+        """Rough token count (~4 characters per token for English text)"""
+        return len(text) // 4
+    
+    def _record_extraction(self, method: str, tokens_saved: int = 0):
+        self.extraction_stats['imports'] += 1
+        self.extraction_stats[method] += 1
+        self.extraction_stats['tokens_saved'] += tokens_saved
+    
+    def get_extraction_stats(self) -> Dict[str, Any]:
+        """Share of imports served without a model call and estimated tokens saved"""
+        imports = self.extraction_stats['imports']
+        return {
+            **self.extraction_stats,
+            'no_llm_share': round(self.extraction_stats['structured_data'] / imports, 3) if imports else 0.0,
+            'tokens_saved_per_import': round(self.extraction_stats['tokens_saved'] / imports, 1) if imports else 0.0,
+        }
+    
     def _validate_category(self, category: str) -> str:
         """Validate and normalize category to match database enum"""
         if not category:
@@ -501,8 +896,8 @@ CRITICAL REQUIREMENTS:
         return 'other'
     
     def _detect_merchant(self, url: str) -> str:
-        """Detect merchant from URL"""
-        parsed_url = urlparse(url.lower())
+        """Detect merchant from URL (short links resolve to their cached final URL)"""
+        parsed_url = urlparse(redirect_cache.resolve(url).lower())
         domain = parsed_url.netloc
         
         if 'amazon.com' in domain or 'amzn.to' in domain:
@@ -624,7 +1019,15 @@ CRITICAL REQUIREMENTS:
         }
     
     async def _search_based_extraction(self, url: str, product_title: Optional[str] = None) -> Optional[Dict[str, Any]]:
-        """Extract product info using search when direct scraping fails"""
+        """Extract product info using search when direct scraping fails
+
+        Strategies are hedged: each one starts search_hedge_delay seconds after the previous
+        (or immediately once an earlier one comes back empty), the first sufficient result
+        wins and the rest are cancelled. A sufficient result without an image gives the
+        higher-priority strategies still running one more hedge delay. The merchant search
+        only knows the title it was given and a price, so a Google Shopping result arriving
+        in that window wins, or lends its image to the merchant price.
+        """
         try:
             # Extract product info from URL if no title provided
             if not product_title:
@@ -632,30 +1035,164 @@ CRITICAL REQUIREMENTS:
             
             logger.info(f"Attempting search-based extraction for: {product_title}")
             
-            # Try Google Shopping search
-            logger.info(f"Trying Google Shopping search for: {product_title}")
-            search_results = await self._search_google_shopping(product_title, url)
-            if search_results:
-                logger.info(f"Google Shopping search successful, found: {search_results.get('title', 'N/A')}")
-                return search_results
-            else:
-                logger.info("Google Shopping search returned no results")
-            
-            # Fallback to general web search + AI analysis
-            logger.info(f"Trying web search + AI for: {product_title}")
-            web_search_results = await self._search_web_for_product(product_title, url)
-            if web_search_results:
-                logger.info(f"Web search successful, found: {web_search_results.get('title', 'N/A')}")
-                return web_search_results
-            else:
-                logger.info("Web search returned no results")
+            # In priority order
+            strategies = [
+                ('google_shopping', lambda: self._search_google_shopping(product_title, url)),
+                ('merchant_search', lambda: self._search_merchant_for_product(product_title, url)),
+            ]
+            if self.ai_enabled:
+                strategies.append(('web_search_ai', lambda: self._search_web_for_product(product_title, url)))
             
-            return None
+            settings = get_settings()
+            results, timings = await self._run_hedged(
+                strategies, settings.search_hedge_delay, settings.search_hedge_timeout
+            )
+            
+            winner = next((name for name, _ in strategies
+                           if self._is_sufficient_search_result(results.get(name))), None)
+            if winner:
+                product_info = results[winner]
+                # A winner without an image or brand borrows them from results that came back alongside it
+                for name, _ in strategies:
+                    other = results.get(name)
+                    if name != winner and other and any(
+                            not product_info.get(field) and other.get(field) for field in ('image_url', 'brand')):
+                        product_info = self._merge_product_data(product_info, other)
+            else:
+                # Nothing sufficient: best partial result, with a price from another strategy if it has one
+                partials = [results[name] for name, _ in strategies if results.get(name)]
+                if not partials:
+                    logger.info(f"Search-based extraction found nothing for: {product_title} ({timings})")
+                    self._record_search(None)
+                    return None
+                product_info = partials[0]
+                for other in partials[1:]:
+                    product_info = self._merge_product_data(product_info, other)
+            
+            product_info['search_strategy'] = winner
+            product_info['search_timings'] = timings
+            self._record_search(winner)
+            logger.info(f"Search-based extraction for {product_title}: winner={winner or 'none'} {timings}")
+            return product_info
             
         except Exception as e:
             logger.error(f"Search-based extraction failed: {e}")
             return None
     
+    async def _run_hedged(self, strategies: list, hedge_delay: float,
+                          timeout: float) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """Run strategies with staggered starts until one returns a sufficient result
+
+        A sufficient result without an image waits up to hedge_delay for higher-priority
+        strategies that are still running, so their result can win or be merged.
+        Returns (results by strategy name, per-strategy status and elapsed seconds).
+        """
+        started_at = time.monotonic()
+        results: Dict[str, Any] = {}
+        timings: Dict[str, Dict[str, Any]] = {name: {'status': 'not_started'} for name, _ in strategies}
+        starts: Dict[str, float] = {}
+        # Set when a strategy comes back without a sufficient result: start the rest now
+        hedge_now = asyncio.Event()
+        # Set once a sufficient result is in: no further strategies are started
+        settled = asyncio.Event()
+        
+        async def launch(position: int, name: str, strategy):
+            if position:
+                try:
+                    await asyncio.wait_for(hedge_now.wait(), timeout=hedge_delay * position)
+                except asyncio.TimeoutError:
+                    pass
+            if settled.is_set():
+                return name
+            starts[name] = time.monotonic()
+            timings[name]['status'] = 'running'
+            try:
+                result = await strategy()
+                timings[name]['status'] = 'ok' if self._is_sufficient_search_result(result) else (
+                    'partial' if result else 'empty')
+            except Exception as e:
+                result = None
+                timings[name]['status'] = 'error'
+                logger.warning(f"Search strategy {name} failed: {e}")
+            timings[name]['elapsed'] = round(time.monotonic() - starts[name], 3)
+            results[name] = result
+            if timings[name]['status'] != 'ok':
+                hedge_now.set()
+            return name
+        
+        pending = {asyncio.create_task(launch(position, name, strategy))
+                   for position, (name, strategy) in enumerate(strategies)}
+        names = [name for name, _ in strategies]
+        grace_until = None
+        try:
+            while pending:
+                remaining = timeout - (time.monotonic() - started_at)
+                if grace_until is not None:
+                    remaining = min(remaining, grace_until - time.monotonic())
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                best = next((name for name, timing in timings.items() if timing['status'] == 'ok'), None)
+                if best is None:
+                    continue
+                settled.set()
+                earlier_running = any(timings[name]['status'] == 'running' for name in names[:names.index(best)])
+                if results[best].get('image_url') or not earlier_running:
+                    break
+                if grace_until is None:
+                    grace_until = time.monotonic() + hedge_delay
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            now = time.monotonic()
+            for name, timing in timings.items():
+                if timing['status'] == 'running':
+                    timing['status'] = 'cancelled'
+                    timing['elapsed'] = round(now - starts[name], 3)
+        
+        winner = next((name for name, timing in timings.items() if timing['status'] == 'ok'), None)
+        if winner:
+            timings[winner]['status'] = 'won'
+        return results, timings
+    
+    def _is_sufficient_search_result(self, result: Optional[Dict[str, Any]]) -> bool:
+        """A search result can stand on its own once it has a title and a price"""
+        return bool(result and result.get('title') and (result.get('sale_price') or result.get('original_price')))
+    
+    def _record_search(self, winner: Optional[str]):
+        wins = self.extraction_stats['search_wins']
+        wins[winner or 'none'] = wins.get(winner or 'none', 0) + 1
+    
+    async def _search_merchant_for_product(self, product_title: str, original_url: str) -> Optional[Dict[str, Any]]:
+        """Merchant-specific price search, as a standalone search strategy"""
+        merchant = self._detect_merchant(original_url)
+        price_info = await self._extract_merchant_specific_price(product_title, original_url, merchant)
+        if not price_info:
+            logger.info(f"{merchant.title()} specific search found no price")
+            return None
+        logger.info(f"{merchant.title()} search found price: ${price_info.get('sale_price', 'N/A')}")
+        
+        return {
+            'title': product_title,
+            'description': f'Product found via {merchant} search: {product_title}',
+            'category': self._validate_category('other'),
+            'merchant': merchant,
+            'original_price': price_info.get('original_price'),
+            'sale_price': price_info.get('sale_price'),
+            'brand': None,
+            'model': None,
+            'rating': None,
+            'rating_count': None,
+            'image_url': None,
+            'key_features': None,
+            'project_types': ['general'],
+            'product_url': original_url,
+            'scraped': True,
+            'extraction_method': 'merchant_search'
+        }
+    
     def _extract_title_from_url(self, url: str) -> str:
         """Extract potential product title from URL structure"""
         import re
@@ -730,9 +1267,9 @@ CRITICAL REQUIREMENTS:
                 'Upgrade-Insecure-Requests': '1'
             }
             
-            response = self.session.get(google_url, headers=headers, timeout=15)
-            if response.status_code != 200:
-                logger.warning(f"Google Shopping search failed with status {response.status_code}")
+            response = await self._http_get(google_url, headers=headers, timeout=15)
+            if response.status != 200:
+                logger.warning(f"Google Shopping search failed with status {response.status}")
                 return None
             
             # Parse search results
@@ -742,15 +1279,7 @@ CRITICAL REQUIREMENTS:
             price_info = self._extract_price_from_search(soup)
             image_info = self._extract_image_from_search(soup)
             
-            # Try merchant-specific extraction methods if no price found
-            if not price_info:
-                logger.info(f"No price found in Google Shopping, trying {merchant} specific search for: {product_title}")
-                price_info = await self._extract_merchant_specific_price(product_title, original_url, merchant)
-                if price_info:
-                    logger.info(f"{merchant.title()} search found price: ${price_info.get('sale_price', 'N/A')}")
-                else:
-                    logger.info(f"{merchant.title()} specific search found no price")
-            
+            # Merchant-specific price search runs as its own hedged strategy
             if not price_info and not image_info:
                 return None
             
@@ -792,8 +1321,8 @@ CRITICAL REQUIREMENTS:
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             }
             
-            response = self.session.get(google_url, headers=headers, timeout=15)
-            if response.status_code != 200:
+            response = await self._http_get(google_url, headers=headers, timeout=15)
+            if response.status != 200:
                 return None
             
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -821,17 +1350,18 @@ Extract what you can and return as JSON:
 Return ONLY valid JSON, no extra text.
 """
             
-            response = self.client.chat.completions.create(
+            response = await llm_gateway.chat(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "Extract product information from search results. Return only valid JSON."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.1,
-                max_tokens=500
+                max_tokens=500,
+                purpose="web_search_extraction"
             )
             
-            ai_response = response.choices[0].message.content.strip()
+            ai_response = response.content.strip()
             
             # Clean and parse JSON
             if ai_response.startswith('```json'):
@@ -999,8 +1529,8 @@ Return ONLY valid JSON, no extra text.
                         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                     }
                     
-                    response = self.session.get(google_url, headers=headers, timeout=10)
-                    if response.status_code != 200:
+                    response = await self._http_get(google_url, headers=headers, timeout=10)
+                    if response.status != 200:
                         continue
                     
                     soup = BeautifulSoup(response.content, 'html.parser')
@@ -1174,8 +1704,8 @@ Return ONLY valid JSON, no extra text.
                     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                 }
                 
-                response = self.session.get(google_url, headers=headers, timeout=10)
-                if response.status_code == 200:
+                response = await self._http_get(google_url, headers=headers, timeout=10)
+                if response.status == 200:
                     soup = BeautifulSoup(response.content, 'html.parser')
                     
                     # Look for price spans in shopping results
@@ -1245,8 +1775,8 @@ Return ONLY valid JSON, no extra text.
                         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                     }
                     
-                    response = self.session.get(google_url, headers=headers, timeout=10)
-                    if response.status_code != 200:
+                    response = await self._http_get(google_url, headers=headers, timeout=10)
+                    if response.status != 200:
                         continue
                     
                     soup = BeautifulSoup(response.content, 'html.parser')
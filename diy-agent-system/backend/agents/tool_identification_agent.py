@@ -3,17 +3,36 @@ Tool Identification Agent for recognizing tools and finding shopping links
 """
 import json
 import re
-from typing import Dict, List, Optional, Tuple, Any
+from typing import AsyncIterator, Awaitable, Dict, List, Optional, Tuple, Any
 from datetime import datetime
 import logging
 import asyncio
-from dataclasses import dataclass
+import base64
+import time
+from dataclasses import asdict, dataclass
 
 from core.agent_base import BaseAgent, AgentTask, AgentResult
-from services.price_scraper import get_product_prices, ProductPrice
+from services.price_scraper import get_product_prices, get_product_prices_many, ProductPrice
+from services.price_cache import price_cache
+from services.price_history_service import PriceHistoryService
+from services.price_refresh_scheduler import price_refresh_scheduler
+from services.llm_gateway import llm_gateway
+from services.identification_cache import identification_cache, phash_bytes
+from utils.config import get_settings
+from utils.worker_pool import run_cpu_bound
 
 logger = logging.getLogger(__name__)
 
+# Process-wide budget for concurrent alternative price lookups (shared by all requests)
+_process_price_limit: Optional[asyncio.Semaphore] = None
+
+def _get_process_price_limit() -> asyncio.Semaphore:
+    """Get the process-wide price lookup semaphore"""
+    global _process_price_limit
+    if _process_price_limit is None:
+        _process_price_limit = asyncio.Semaphore(get_settings().price_lookup_process_concurrency)
+    return _process_price_limit
+
 @dataclass
 class ToolInfo:
     """Tool information structure"""
@@ -38,6 +57,11 @@ class ProductListing:
 class ToolIdentificationAgent(BaseAgent):
     """Agent for identifying tools from images and finding purchase options"""
     
+    # Vision fields used for ToolInfo; identification returns once these are parsed
+    # instead of waiting for the rest of the response (alternatives, recommendations)
+    VISION_FIELDS = ("tool_name", "category", "brand", "model", "confidence", "primary_use",
+                     "features", "condition", "estimated_value")
+    
     def __init__(self):
         super().__init__(
             name="tool_identification",
@@ -93,49 +117,10 @@ class ToolIdentificationAgent(BaseAgent):
     async def process_task(self, task: AgentTask) -> AgentResult:
         """Process tool identification task"""
         try:
-            image_data = task.input_data.get("image_data")
-            include_alternatives = task.input_data.get("include_alternatives", True)
-            user_membership = task.input_data.get("membership_level", "free")
-            
-            # Step 1: Identify the tool
-            tool_info = await self._identify_tool(image_data)
-            
-            # Step 2: Search for exact matches if model is identified
-            exact_matches = []
-            if tool_info.model:
-                exact_matches = await self._search_exact_product(
-                    tool_info.brand, 
-                    tool_info.model
-                )
-            
-            # Step 3: Find alternatives or similar products
-            alternatives = []
-            if include_alternatives:
-                max_alternatives = self._get_alternatives_limit(user_membership)
-                alternatives = await self._find_alternatives(
-                    tool_info,
-                    max_alternatives
-                )
-            
-            # Step 4: Get real-time prices if premium user
-            if user_membership in ["premium", "pro"]:
-                exact_matches = await self._update_realtime_prices(exact_matches)
-                alternatives = await self._update_realtime_prices(alternatives)
-            
-            # Step 5: Format response
-            result_data = {
-                "tool_info": {
-                    "name": tool_info.name,
-                    "brand": tool_info.brand,
-                    "model": tool_info.model,
-                    "category": tool_info.category,
-                    "confidence": tool_info.confidence,
-                    "specifications": tool_info.specifications
-                },
-                "exact_matches": [self._format_product(p) for p in exact_matches],
-                "alternatives": [self._format_product(p) for p in alternatives],
-                "search_timestamp": datetime.utcnow().isoformat()
-            }
+            result_data = None
+            async for event in self.stream_stages(task):
+                if event["event"] == "done":
+                    result_data = event["result"]
             
             return AgentResult(
                 success=True,
@@ -151,23 +136,133 @@ class ToolIdentificationAgent(BaseAgent):
                 agent_name=self.name
             )
     
-    async def _identify_tool(self, image_data: str) -> ToolInfo:
+    async def stream_stages(self, task: AgentTask) -> AsyncIterator[Dict[str, Any]]:
+        """Run the identification pipeline, yielding each stage as soon as it is ready.
+        
+        Events, each with elapsed_ms since the start:
+          tool_info      - always first, right after the vision call
+          exact_matches  - retailer listings for the identified model
+          alternatives   - one batch per alternatives strategy, in completion order
+          prices         - premium only: both lists again with real-time prices
+          done           - the complete result, identical to process_task's data
+        
+        Exact matches and the alternatives strategies run concurrently, so a slow
+        retailer lookup only delays its own batch.
+        """
+        start = time.monotonic()
+        
+        def stage(event: str, **data) -> Dict[str, Any]:
+            return {"event": event, **data, "elapsed_ms": int((time.monotonic() - start) * 1000)}
+        
+        image_data = task.input_data.get("image_data")
+        image_mime_type = task.input_data.get("image_mime_type", "image/jpeg")
+        image_hash = task.input_data.get("image_phash")
+        include_alternatives = task.input_data.get("include_alternatives", True)
+        user_membership = task.input_data.get("membership_level", "free")
+        
+        # Step 1: Identify the tool
+        tool_info = await self._identify_tool(image_data, image_mime_type, image_hash)
+        tool_info_data = {
+            "name": tool_info.name,
+            "brand": tool_info.brand,
+            "model": tool_info.model,
+            "category": tool_info.category,
+            "confidence": tool_info.confidence,
+            "specifications": tool_info.specifications
+        }
+        
+        # Steps 2 and 3: exact matches (if the model is identified) and alternatives, concurrently;
+        # started before tool_info is sent so they run while the client renders it
+        pending: Dict[asyncio.Task, Any] = {}
+        if tool_info.model:
+            pending[asyncio.create_task(self._search_exact_product(tool_info.brand, tool_info.model))] = "exact_matches"
+        max_alternatives = 0
+        if include_alternatives:
+            max_alternatives = self._get_alternatives_limit(user_membership)
+            for index, strategy in enumerate(self._alternative_strategies(tool_info, max_alternatives)):
+                pending[asyncio.create_task(strategy)] = index
+        
+        exact_matches = []
+        batches: Dict[int, List[ProductListing]] = {}
+        try:
+            yield stage("tool_info", tool_info=tool_info_data)
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    label = pending.pop(finished)
+                    products = finished.result()
+                    if label == "exact_matches":
+                        exact_matches = products
+                        yield stage("exact_matches", exact_matches=[self._format_product(p) for p in products])
+                    else:
+                        batches[label] = products
+                        yield stage("alternatives", batch=label,
+                                    alternatives=[self._format_product(p) for p in products])
+        finally:
+            # Client went away or a lookup failed: stop the remaining lookups
+            for unfinished in pending:
+                unfinished.cancel()
+        
+        # Strategy order, so the final list matches regardless of completion order
+        alternatives = [product for index in sorted(batches) for product in batches[index]][:max_alternatives]
+        
+        # Step 4: Get real-time prices if premium user
+        if user_membership in ["premium", "pro"]:
+            # One batched lookup covers exact matches and alternatives
+            updated = await self._update_realtime_prices(exact_matches + alternatives)
+            exact_matches, alternatives = updated[:len(exact_matches)], updated[len(exact_matches):]
+            yield stage("prices",
+                        exact_matches=[self._format_product(p) for p in exact_matches],
+                        alternatives=[self._format_product(p) for p in alternatives])
+        
+        # Step 5: Format response
+        yield stage("done", result={
+            "tool_info": tool_info_data,
+            "exact_matches": [self._format_product(p) for p in exact_matches],
+            "alternatives": [self._format_product(p) for p in alternatives],
+            "search_timestamp": datetime.utcnow().isoformat()
+        })
+    
+    async def _image_hash(self, image_data: str) -> Optional[int]:
+        """Perceptual hash of an upload that did not come through the image preprocessor"""
+        try:
+            return await run_cpu_bound(phash_bytes, base64.b64decode(image_data))
+        except Exception as e:
+            logger.warning(f"Could not hash image for the identification cache: {str(e)}")
+            return None
+    
+    async def _identify_tool(self, image_data: str, mime_type: str = "image/jpeg",
+                             image_hash: Optional[int] = None) -> ToolInfo:
         """Identify tool from image using vision API or advanced pattern matching"""
+        # Repeat and near-duplicate uploads reuse the stored identification
+        if identification_cache.enabled:
+            if image_hash is None:
+                image_hash = await self._image_hash(image_data)
+            if image_hash is not None:
+                cached = await identification_cache.lookup(image_hash)
+                if cached:
+                    return ToolInfo(**cached)
+        
         try:
             # Use the OpenAI Vision service
             from services.openai_vision_service import vision_service
             
             # Get tool identification from vision service
-            result = await vision_service.identify_tool(image_data)
+            result = await vision_service.identify_tool(image_data, fields=self.VISION_FIELDS,
+                                                        mime_type=mime_type)
             
             if result:
+                # The model's own confidence decides whether the result is worth reusing;
+                # mock data (API not configured) carries none
+                model_confidence = self._parse_confidence(result.get("confidence"))
+                
                 # Convert the result to ToolInfo
-                return ToolInfo(
+                tool_info = ToolInfo(
                     name=result.get("tool_name", "Unknown Tool"),
                     brand=result.get("brand") if result.get("brand") != "Unknown" else None,
                     model=result.get("model") if result.get("model") != "Unknown" else None,
                     category=self._map_category(result.get("category", "other")),
-                    confidence=0.85,  # High confidence for real API results
+                    confidence=model_confidence if model_confidence is not None else 0.85,
                     specifications={
                         "primary_use": result.get("primary_use", ""),
                         "features": result.get("features", []),
@@ -175,12 +270,24 @@ class ToolIdentificationAgent(BaseAgent):
                         "estimated_value": result.get("estimated_value", "unknown")
                     }
                 )
+                # Only real vision results are worth reusing (not mock data)
+                if image_hash is not None and llm_gateway.enabled and model_confidence is not None:
+                    await identification_cache.record(image_hash, asdict(tool_info), model_confidence)
+                return tool_info
         except Exception as e:
             logger.warning(f"OpenAI Vision API failed: {str(e)}, falling back to intelligent analysis")
         
         # Fallback to intelligent pattern-based identification
         return await self._identify_with_intelligent_analysis(image_data)
     
+    @staticmethod
+    def _parse_confidence(value: Any) -> Optional[float]:
+        """Confidence reported by the vision model, clamped to 0-1; None when missing or invalid"""
+        try:
+            return max(0.0, min(1.0, float(value)))
+        except (ValueError, TypeError):
+            return None
+    
     def _map_category(self, category: str) -> str:
         """Map vision service category to our internal categories"""
         category_map = {
@@ -194,11 +301,7 @@ class ToolIdentificationAgent(BaseAgent):
     
     async def _identify_with_openai_vision(self, image_data: str) -> Optional[ToolInfo]:
         """Identify tool using OpenAI Vision API"""
-        import os
-        import openai
-        
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
+        if not llm_gateway.enabled:
             logger.warning("OpenAI API key not found")
             return None
         
@@ -206,11 +309,8 @@ class ToolIdentificationAgent(BaseAgent):
             # Convert base64 to proper format
             image_url = f"data:image/jpeg;base64,{image_data}"
             
-            # Create OpenAI client
-            client = openai.OpenAI(api_key=api_key)
-            
-            # Call Vision API with improved model
-            response = client.chat.completions.create(
+            # Call Vision API with improved model through the shared gateway
+            response = await llm_gateway.chat(
                 model="gpt-4o",  # Updated to latest model
                 messages=[
                     {
@@ -272,11 +372,12 @@ Be EXTREMELY precise with tool identification. If unsure between similar tools,
                     }
                 ],
                 max_tokens=600,
-                temperature=0.1  # Lower temperature for more consistent results
+                temperature=0.1,  # Lower temperature for more consistent results
+                purpose="tool_vision"
             )
             
             # Parse response with improved error handling
-            content = response.choices[0].message.content
+            content = response.content
             logger.info(f"OpenAI Vision response: {content}")
             
             # Extract and parse JSON from response
@@ -607,7 +708,7 @@ Be EXTREMELY precise with tool identification. If unsure between similar tools,
         
         try:
             # Use real price scraping service
-            real_prices = await get_product_prices(brand, model, "")
+            real_prices = await self._get_prices(brand, model, "")
             
             if real_prices:
                 logger.info(f"Found {len(real_prices)} real prices for {brand} {model}")
@@ -650,32 +751,28 @@ Be EXTREMELY precise with tool identification. If unsure between similar tools,
         
         return products
     
-    async def _find_alternatives(self, tool_info: ToolInfo, max_count: int) -> List[ProductListing]:
-        """Find alternative products"""
-        alternatives = []
+    def _alternative_strategies(self, tool_info: ToolInfo, max_count: int) -> List[Awaitable[List[ProductListing]]]:
+        """Alternatives strategies in result order, sharing one per-request lookup budget"""
+        # Per-request budget on top of the process-wide budget in _lookup_alternative
+        request_limit = asyncio.Semaphore(get_settings().alternatives_request_concurrency)
+        
+        strategies = []
         
         # Strategy 1: Same brand, different models
         if tool_info.brand:
-            alternatives.extend(
-                await self._find_same_brand_alternatives(tool_info, max_count // 3)
-            )
+            strategies.append(self._find_same_brand_alternatives(tool_info, max_count // 3, request_limit))
         
         # Strategy 2: Different brands, similar specs
-        alternatives.extend(
-            await self._find_competing_products(tool_info, max_count // 3)
-        )
+        strategies.append(self._find_competing_products(tool_info, max_count // 3, request_limit))
         
         # Strategy 3: Budget and premium options
-        alternatives.extend(
-            await self._find_price_alternatives(tool_info, max_count // 3)
-        )
+        strategies.append(self._find_price_alternatives(tool_info, max_count // 3, request_limit))
         
-        return alternatives[:max_count]
+        return strategies
     
-    async def _find_same_brand_alternatives(self, tool_info: ToolInfo, count: int) -> List[ProductListing]:
+    async def _find_same_brand_alternatives(self, tool_info: ToolInfo, count: int,
+                                            request_limit: Optional[asyncio.Semaphore] = None) -> List[ProductListing]:
         """Find alternatives from the same brand"""
-        alternatives = []
-        
         # Mock alternative models
         if tool_info.brand == "DeWalt":
             alt_models = ["DCD777C2", "DCD796D2", "DCD999B"]
@@ -684,45 +781,15 @@ Be EXTREMELY precise with tool identification. If unsure between similar tools,
         else:
             alt_models = []
         
-        for model in alt_models[:count]:
-            # Try to get real prices for alternative models
-            try:
-                real_prices = await get_product_prices(tool_info.brand, model, "")
-                if real_prices:
-                    # Use the first real price result
-                    price_info = real_prices[0]
-                    product = ProductListing(
-                        retailer=price_info.retailer.lower().replace("'s", "").replace(" ", "_"),
-                        title=price_info.title,
-                        price=price_info.price,
-                        url=price_info.url,
-                        image_url=price_info.image_url or self._get_product_image(tool_info.brand, model),
-                        in_stock=price_info.in_stock,
-                        is_exact_match=False
-                    )
-                    alternatives.append(product)
-                    continue
-            except Exception as e:
-                logger.warning(f"Failed to get real price for {tool_info.brand} {model}: {str(e)}")
-            
-            # Fallback to intelligent pricing
-            product = ProductListing(
-                retailer="amazon",
-                title=f"{tool_info.brand} {model}",
-                price=await self._get_intelligent_price("amazon", tool_info.brand, model),
-                url=self._build_product_url("amazon", f"{tool_info.brand}+{model}"),
-                image_url=self._get_product_image(tool_info.brand, model),
-                in_stock=True,
-                is_exact_match=False
-            )
-            alternatives.append(product)
-        
-        return alternatives
+        request_limit = request_limit or asyncio.Semaphore(get_settings().alternatives_request_concurrency)
+        return list(await asyncio.gather(*[
+            self._lookup_alternative(tool_info.brand, model, "", "amazon", request_limit)
+            for model in alt_models[:count]
+        ]))
     
-    async def _find_competing_products(self, tool_info: ToolInfo, count: int) -> List[ProductListing]:
+    async def _find_competing_products(self, tool_info: ToolInfo, count: int,
+                                       request_limit: Optional[asyncio.Semaphore] = None) -> List[ProductListing]:
         """Find similar products from competing brands"""
-        alternatives = []
-        
         # Map competing brands
         brand_competitors = {
             "DeWalt": ["Milwaukee", "Makita", "Ryobi"],
@@ -732,103 +799,96 @@ Be EXTREMELY precise with tool identification. If unsure between similar tools,
         
         competitors = brand_competitors.get(tool_info.brand, ["DeWalt", "Milwaukee", "Makita"])
         
-        for brand in competitors[:count]:
-            # Try to get real prices for competing products
-            try:
-                real_prices = await get_product_prices(brand, "", tool_info.name)
-                if real_prices:
-                    # Use the first real price result
-                    price_info = real_prices[0]
-                    product = ProductListing(
-                        retailer=price_info.retailer.lower().replace("'s", "").replace(" ", "_"),
-                        title=price_info.title,
-                        price=price_info.price,
-                        url=price_info.url,
-                        image_url=price_info.image_url or self._get_product_image(brand, tool_info.name),
-                        in_stock=price_info.in_stock,
-                        is_exact_match=False
-                    )
-                    alternatives.append(product)
-                    continue
-            except Exception as e:
-                logger.warning(f"Failed to get real price for {brand} {tool_info.name}: {str(e)}")
-            
-            # Fallback to intelligent pricing
-            product = ProductListing(
-                retailer="home_depot",
-                title=f"{brand} {tool_info.name}",
-                price=await self._get_intelligent_price("home_depot", brand, tool_info.name),
-                url=self._build_product_url("home_depot", f"{brand}+{tool_info.name}"),
-                image_url=self._get_product_image(brand, tool_info.name),
-                in_stock=True,
-                is_exact_match=False
-            )
-            alternatives.append(product)
-        
-        return alternatives
+        request_limit = request_limit or asyncio.Semaphore(get_settings().alternatives_request_concurrency)
+        return list(await asyncio.gather(*[
+            self._lookup_alternative(brand, "", tool_info.name, "home_depot", request_limit)
+            for brand in competitors[:count]
+        ]))
     
-    async def _find_price_alternatives(self, tool_info: ToolInfo, count: int) -> List[ProductListing]:
+    async def _find_price_alternatives(self, tool_info: ToolInfo, count: int,
+                                       request_limit: Optional[asyncio.Semaphore] = None) -> List[ProductListing]:
         """Find budget and premium alternatives"""
-        alternatives = []
-        
         # Budget options
         budget_brands = ["BLACK+DECKER", "Ryobi", "Craftsman"]
         premium_brands = ["Festool", "Hilti", "Metabo"]
         
-        for brand in (budget_brands + premium_brands)[:count]:
-            # Try to get real prices for price alternatives
-            try:
-                real_prices = await get_product_prices(brand, "", tool_info.name)
-                if real_prices:
-                    # Use the first real price result
-                    price_info = real_prices[0]
-                    product = ProductListing(
-                        retailer=price_info.retailer.lower().replace("'s", "").replace(" ", "_"),
-                        title=price_info.title,
-                        price=price_info.price,
-                        url=price_info.url,
-                        image_url=price_info.image_url or self._get_product_image(brand, tool_info.name),
-                        in_stock=price_info.in_stock,
-                        is_exact_match=False
-                    )
-                    alternatives.append(product)
-                    continue
-            except Exception as e:
-                logger.warning(f"Failed to get real price for {brand} {tool_info.name}: {str(e)}")
-            
-            # Fallback to intelligent pricing
-            product = ProductListing(
-                retailer="lowes",
-                title=f"{brand} {tool_info.name}",
-                price=await self._get_intelligent_price("lowes", brand, tool_info.name),
-                url=self._build_product_url("lowes", f"{brand}+{tool_info.name}"),
-                image_url=self._get_product_image(brand, tool_info.name),
-                in_stock=True,
-                is_exact_match=False
-            )
-            alternatives.append(product)
+        request_limit = request_limit or asyncio.Semaphore(get_settings().alternatives_request_concurrency)
+        return list(await asyncio.gather(*[
+            self._lookup_alternative(brand, "", tool_info.name, "lowes", request_limit)
+            for brand in (budget_brands + premium_brands)[:count]
+        ]))
+    
+    async def _lookup_alternative(self, brand: str, model: str, tool_name: str, fallback_retailer: str,
+                                  request_limit: asyncio.Semaphore) -> ProductListing:
+        """Look up one alternative product, falling back to intelligent pricing"""
+        label = model or tool_name
+        
+        # Try to get real prices for the alternative
+        try:
+            async with request_limit, _get_process_price_limit():
+                real_prices = await self._get_prices(brand, model, tool_name)
+            if real_prices:
+                # Use the first real price result
+                price_info = real_prices[0]
+                return ProductListing(
+                    retailer=price_info.retailer.lower().replace("'s", "").replace(" ", "_"),
+                    title=price_info.title,
+                    price=price_info.price,
+                    url=price_info.url,
+                    image_url=price_info.image_url or self._get_product_image(brand, label),
+                    in_stock=price_info.in_stock,
+                    is_exact_match=False
+                )
+        except Exception as e:
+            logger.warning(f"Failed to get real price for {brand} {label}: {str(e)}")
+        
+        # Fallback to intelligent pricing
+        return ProductListing(
+            retailer=fallback_retailer,
+            title=f"{brand} {label}",
+            price=await self._get_intelligent_price(fallback_retailer, brand, label),
+            url=self._build_product_url(fallback_retailer, f"{brand}+{label}"),
+            image_url=self._get_product_image(brand, label),
+            in_stock=True,
+            is_exact_match=False
+        )
+    
+    async def _get_prices(self, brand: str, model: str, tool_name: str = "") -> List[ProductPrice]:
+        """Get prices from the latest PriceHistory snapshot, scraping live only on a miss"""
+        # Identified tools join the background refresh watchlist
+        price_refresh_scheduler.watch(brand, model, tool_name)
+        
+        snapshot = await asyncio.to_thread(PriceHistoryService.get_latest_snapshot, brand, model, tool_name)
+        if snapshot:
+            logger.info(f"Using price snapshot for {brand} {model or tool_name}")
+            return snapshot
         
-        return alternatives
+        return await get_product_prices(brand, model, tool_name)
     
     async def _update_realtime_prices(self, products: List[ProductListing]) -> List[ProductListing]:
-        """Update products with real-time prices (for premium users)"""
+        """Update products with real-time prices (for premium users) using one batched lookup"""
         if not products:
             return products
         
         try:
-            # For premium users, try to get fresh real-time prices
-            updated_products = []
+            # Extract brand and model from title for real price lookup
+            queries = {}
+            for product in products:
+                title_parts = product.title.split()
+                if len(title_parts) >= 2:
+                    brand = title_parts[0]
+                    model = " ".join(title_parts[1:3])  # Take next 1-2 parts as model
+                    queries[id(product)] = (brand, model, "")
+            
+            # Duplicate queries are fetched once and share a connection pool
+            batch_prices = await get_product_prices_many(list(queries.values()))
             
+            updated_products = []
             for product in products:
                 try:
-                    # Extract brand and model from title for real price lookup
-                    title_parts = product.title.split()
-                    if len(title_parts) >= 2:
-                        brand = title_parts[0]
-                        model = " ".join(title_parts[1:3])  # Take next 1-2 parts as model
-                        
-                        # Get real-time prices
-                        real_prices = await get_product_prices(brand, model, "")
+                    query = queries.get(id(product))
+                    if query:
+                        real_prices = batch_prices.get(price_cache.make_key(*query), [])
                         
                         if real_prices:
                             # Find matching retailer or use first result
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Offline extractor benchmark
+Replays the saved retailer pages in fixtures/html through each extractor (no network),
+reports pages/sec, p50/p95 parse time and peak memory, and compares against the stored baseline.
+
+Two separate checks are made against the baseline:
+- outputs: a digest of each extractor's output must not change (deterministic)
+- timing: each extractor's cost relative to a reference parse of the same pages, timed in the
+  same run, must not grow by more than the tolerance. Absolute times depend on the machine and
+  its load, so they are reported but not compared. Per-page times are medians over the iterations.
+
+Usage:
+    python benchmark_extractors.py                    # compare against baseline, exit 1 on regression
+    python benchmark_extractors.py --outputs-only     # only check that outputs are unchanged
+    python benchmark_extractors.py --update-baseline  # record current numbers as the new baseline
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from bs4 import BeautifulSoup
+
+from agents.product_info_agent import ProductInfoAgent
+from services.product_scraper import ProductScraper
+from services.retailer_parsers import AMAZON_SEARCH_BACKENDS
+from services.structured_data import extract_structured_product
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "html")
+MANIFEST_PATH = os.path.join(FIXTURE_DIR, "manifest.json")
+BASELINE_PATH = os.path.join(FIXTURE_DIR, "baseline.json")
+
+# ProductScraper helpers run for each merchant page, in scrape order
+PRODUCT_SCRAPER_EXTRACTORS = {
+    "amazon": ["_extract_amazon_title", "_extract_amazon_price", "_extract_amazon_image", "_extract_amazon_rating"],
+    "home_depot": ["_extract_home_depot_price", "_extract_home_depot_image"],
+    "lowes": ["_extract_lowes_price", "_extract_lowes_image"],
+    "walmart": ["_extract_walmart_price", "_extract_walmart_image"],
+    "other": ["_extract_generic_image"],
+}
+
+
+# Timed alongside the extractors; their cost is compared as a multiple of this one
+REFERENCE_EXTRACTOR = "reference.html_parser"
+
+
+def load_corpus() -> List[Dict[str, Any]]:
+    """Load the fixture pages listed in the manifest"""
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    for page in manifest:
+        with open(os.path.join(FIXTURE_DIR, page["file"]), encoding="utf-8") as f:
+            page["html"] = f.read()
+    return manifest
+
+
+def build_extractors() -> Dict[str, Dict[str, Any]]:
+    """Extractor name -> page kind it applies to and a callable(page) -> output"""
+    extractors = {
+        REFERENCE_EXTRACTOR: {"kind": None, "run": lambda page: BeautifulSoup(page["html"], "html.parser").name},
+    }
+
+    for backend, parser in AMAZON_SEARCH_BACKENDS.items():
+        extractors[f"price_scraper.amazon_search[{backend}]"] = {
+            "kind": "search",
+            "run": lambda page, parser=parser: parser(page["html"], page["query"], page["url"], 2),
+        }
+
+    scraper = ProductScraper()
+
+    def run_product_scraper(page):
+        soup = BeautifulSoup(page["html"], "html.parser")
+        return [getattr(scraper, name)(soup) for name in PRODUCT_SCRAPER_EXTRACTORS[page["merchant"]]]
+
+    extractors["product_scraper.extract"] = {"kind": "product", "run": run_product_scraper}
+
+    agent = ProductInfoAgent()
+    extractors["product_info_agent.page_content"] = {
+        "kind": "product",
+        "run": lambda page: agent._build_page_content(page["html"], page["url"]),
+    }
+    extractors["product_info_agent.parse_page"] = {
+        "kind": "product",
+        "run": lambda page: (lambda parsed: [parsed.content, parsed.structured])(
+            agent._parse_page(page["html"], page["url"])),
+    }
+    extractors["structured_data.extract"] = {
+        "kind": "product",
+        "run": lambda page: extract_structured_product(page["html"], page["url"]),
+    }
+
+    return extractors
+
+
+def output_digest(outputs: List[Any]) -> str:
+    """Stable hash of extractor outputs, so parser changes that alter results are visible"""
+    payload = json.dumps(outputs, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+def measure(run: Callable[[Dict[str, Any]], Any], pages: List[Dict[str, Any]], iterations: int) -> Dict[str, Any]:
+    """Time each page parse (median over the iterations) and measure peak memory of one pass"""
+    outputs = [run(page) for page in pages]  # warm up and capture output
+
+    samples = []
+    page_samples = [[] for _ in pages]
+    for _ in range(iterations):
+        for index, page in enumerate(pages):
+            start = time.perf_counter()
+            run(page)
+            elapsed = time.perf_counter() - start
+            samples.append(elapsed)
+            page_samples[index].append(elapsed)
+
+    # Separate pass: tracemalloc slows parsing down and would skew the timings
+    tracemalloc.start()
+    peak = 0
+    for page in pages:
+        # Parse trees are reference cycles; free earlier ones so they don't count towards this page
+        gc.collect()
+        tracemalloc.reset_peak()
+        run(page)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    samples.sort()
+    page_medians = [statistics.median(times) for times in page_samples]
+    return {
+        "pages": len(pages),
+        "page_medians": page_medians,
+        "pages_per_sec": round(len(pages) / sum(page_medians), 1),
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2),
+        "peak_kb": round(peak / 1024, 1),
+        "output_digest": output_digest(outputs),
+    }
+
+
+def relative_cost(result: Dict[str, Any], reference: Dict[str, Any]) -> float:
+    """Median time over the same pages as a multiple of the reference parse"""
+    return round(sum(result["page_medians"]) / sum(reference["page_medians"]), 3)
+
+
+def compare_outputs(name: str, result: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Return output changes for one extractor"""
+    if result["output_digest"] != baseline["output_digest"]:
+        return [f"{name}: output changed ({baseline['output_digest']} -> {result['output_digest']})"]
+    return []
+
+
+def compare_timing(name: str, result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return timing and memory regressions for one extractor"""
+    problems = []
+    if "relative_cost" in baseline and result["relative_cost"] > baseline["relative_cost"] * (1 + tolerance):
+        problems.append(f"{name}: cost x{result['relative_cost']} of the reference parse > "
+                        f"baseline x{baseline['relative_cost']}")
+    if result["peak_kb"] > baseline["peak_kb"] * (1 + tolerance):
+        problems.append(f"{name}: peak memory {result['peak_kb']} KB > baseline {baseline['peak_kb']} KB")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline extractor throughput benchmark")
+    parser.add_argument("--iterations", type=int, default=20, help="passes over the corpus per extractor")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed growth of the cost relative to the reference parse before failing")
+    parser.add_argument("--outputs-only", action="store_true", help="only check output digests, skip timing")
+    parser.add_argument("--update-baseline", action="store_true", help="write current results to baseline.json")
+    parser.add_argument("--only", help="run only extractors whose name contains this string")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    extractors = build_extractors()
+    reference = extractors.pop(REFERENCE_EXTRACTOR)
+
+    print("=" * 110)
+    print(f"Extractor benchmark ({len(corpus)} fixture pages, "
+          f"{'outputs only' if args.outputs_only else f'{args.iterations} iterations'})")
+    print("=" * 110)
+    if not args.outputs_only:
+        print(f"{'extractor':<44} {'pages':>5} {'pages/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'peak KB':>9} "
+              f"{'x ref':>7}  vs baseline")
+
+    results = {}
+    references = {}
+    output_changes = []
+    timing_problems = []
+    for name, extractor in extractors.items():
+        if args.only and args.only not in name:
+            continue
+        pages = [page for page in corpus if page["kind"] == extractor["kind"]]
+
+        if args.outputs_only:
+            result = {"output_digest": output_digest([extractor["run"](page) for page in pages])}
+            changes = compare_outputs(name, result, baseline[name]) if name in baseline else []
+            output_changes.extend(changes)
+            print(f"{name:<44} {'CHANGED' if changes else 'OK' if name in baseline else 'no baseline'}")
+            continue
+
+        # The reference parse is timed in this run on the same pages, so machine speed cancels out
+        if extractor["kind"] not in references:
+            references[extractor["kind"]] = measure(reference["run"], pages, args.iterations)
+            ref = references[extractor["kind"]]
+            print(f"{REFERENCE_EXTRACTOR + '[' + extractor['kind'] + ']':<44} {ref['pages']:>5} "
+                  f"{ref['pages_per_sec']:>9} {ref['p50_ms']:>8} {ref['p95_ms']:>8} {ref['peak_kb']:>9} {1.0:>7}")
+        result = measure(extractor["run"], pages, args.iterations)
+        result["relative_cost"] = relative_cost(result, references[extractor["kind"]])
+        del result["page_medians"]
+        results[name] = result
+
+        if name in baseline:
+            changes = compare_outputs(name, result, baseline[name])
+            problems = compare_timing(name, result, baseline[name], args.tolerance)
+            output_changes.extend(changes)
+            timing_problems.extend(problems)
+            status = ", ".join(label for label, found in (("OUTPUT CHANGED", changes), ("REGRESSION", problems))
+                               if found) or "OK"
+        else:
+            status = "no baseline"
+
+        print(f"{name:<44} {result['pages']:>5} {result['pages_per_sec']:>9} {result['p50_ms']:>8} "
+              f"{result['p95_ms']:>8} {result['peak_kb']:>9} {result['relative_cost']:>7}  {status}")
+
+    if args.update_baseline:
+        if args.outputs_only:
+            print("\n--update-baseline needs the timing run, baseline not written")
+            return 1
+        baseline.update(results)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {BASELINE_PATH}")
+        return 0
+
+    if output_changes:
+        print("\nOutput changes (re-record with --update-baseline if intended):")
+        for change in output_changes:
+            print(f"  - {change}")
+    if timing_problems:
+        print("\nTiming regressions:")
+        for problem in timing_problems:
+            print(f"  - {problem}")
+    return 1 if output_changes or timing_problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
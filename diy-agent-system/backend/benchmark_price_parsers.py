@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark Amazon search page parsers (pages/sec)
+Compares the original full-document html.parser approach with the pluggable backends
+"""
+import re
+import time
+from typing import List
+
+from bs4 import BeautifulSoup
+
+from services.retailer_parsers import AMAZON_SEARCH_BACKENDS
+
+QUERY = "DeWalt DCD771C2"
+SEARCH_URL = "https://www.amazon.com/s?k=DeWalt+DCD771C2&ref=sr_pg_1"
+
+
+def build_search_page(result_count: int = 48, filler_blocks: int = 400) -> str:
+    """Build an Amazon-shaped search page with navigation/script noise around the results"""
+    filler = "".join(
+        f'<div class="s-widget nav-sprite" data-idx="{i}"><a href="/gp/nav/{i}">Category {i}</a>'
+        f'<span class="a-color-secondary">Sponsored suggestion {i}</span><ul><li>Option A</li><li>Option B</li></ul></div>'
+        for i in range(filler_blocks)
+    )
+    results = "".join(
+        f'''<div data-component-type="s-search-result" data-asin="B00ET5V{i:03d}" class="s-result-item s-asin">
+  <div class="a-section"><span class="a-declarative">
+    <img class="s-image" src="https://m.media-amazon.com/images/I/71{i:03d}._AC_UL320_.jpg" alt="">
+  </span></div>
+  <h2 class="a-size-mini a-spacing-none a-color-base s-line-clamp-2">
+    <a class="a-link-normal s-link-style a-text-normal" href="/DEWALT-DCD771C2-Cordless-Lithium-Ion-Compact/dp/B00ET5V{i:03d}">
+      <span class="a-size-medium a-color-base a-text-normal">DEWALT 20V MAX Cordless Drill Combo Kit, variant {i}</span>
+    </a>
+  </h2>
+  <div class="a-row"><span class="a-icon-alt">4.7 out of 5 stars</span></div>
+  <div class="a-row"><span class="a-price"><span class="a-offscreen">${99 + i}.00</span>
+    <span class="a-price-whole">{99 + i}<span class="a-price-decimal">.</span></span><span class="a-price-fraction">00</span></span></div>
+  <script>window.ue && ue.count("s-result-{i}", 1);</script>
+</div>'''
+        for i in range(result_count)
+    )
+    return (
+        "<!doctype html><html><head><title>Amazon.com : DeWalt DCD771C2</title>"
+        + "<script>var a = 1;</script>" * 50
+        + f"</head><body><header>{filler}</header><div class=\"s-main-slot s-result-list\">{results}</div>"
+        + f"<footer>{filler}</footer></body></html>"
+    )
+
+
+def legacy_parse_amazon_search(html: str, query: str, search_url: str, max_results: int) -> List[dict]:
+    """The original in-coroutine parser: whole document through html.parser"""
+    soup = BeautifulSoup(html, 'html.parser')
+    products = []
+    for container in soup.find_all('div', {'data-component-type': 's-search-result'})[:max_results]:
+        title_elem = container.find('h2', class_='a-size-mini') or container.find('span', class_='a-size-medium')
+        title = title_elem.get_text(strip=True) if title_elem else query
+        price_elem = container.find('span', class_='a-price-whole') or container.find('span', class_='a-offscreen')
+        price = 0.0
+        if price_elem:
+            price_match = re.search(r'[\d,]+\.?\d*', price_elem.get_text(strip=True).replace(',', ''))
+            if price_match:
+                price = float(price_match.group())
+        link_elem = container.find('h2', class_='a-size-mini')
+        link = link_elem.find('a') if link_elem else None
+        product_url = f"https://www.amazon.com{link['href']}" if link else search_url
+        img_elem = container.find('img', class_='s-image')
+        if price > 0:
+            products.append({
+                "retailer": "Amazon", "title": title[:100], "price": price,
+                "url": product_url, "image_url": img_elem['src'] if img_elem else "", "in_stock": True
+            })
+    return products
+
+
+def benchmark(name: str, parser, html: str, iterations: int) -> float:
+    """Run parser repeatedly and report pages/sec"""
+    parser(html, QUERY, SEARCH_URL, 2)  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parser(html, QUERY, SEARCH_URL, 2)
+    elapsed = time.perf_counter() - start
+    pages_per_sec = iterations / elapsed
+    print(f"  {name:<12} {pages_per_sec:8.1f} pages/sec   {elapsed / iterations * 1000:7.2f} ms/page")
+    return pages_per_sec
+
+
+def main():
+    html = build_search_page()
+    print("=" * 60)
+    print(f"Amazon search parser benchmark (page size: {len(html) / 1024:.0f} KB)")
+    print("=" * 60)
+
+    expected = legacy_parse_amazon_search(html, QUERY, SEARCH_URL, 2)
+    baseline = benchmark("legacy", legacy_parse_amazon_search, html, 20)
+
+    for name, parser in AMAZON_SEARCH_BACKENDS.items():
+        result = parser(html, QUERY, SEARCH_URL, 2)
+        status = "OK" if result == expected else "MISMATCH"
+        rate = benchmark(name, parser, html, 20)
+        print(f"  {'':<12} speedup x{rate / baseline:.1f}, output {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Concurrent upload memory benchmark
+Simulates N identify-tool uploads of the same large phone photo arriving at once and reports the
+peak Python heap of the API process (tracemalloc) for:
+
+  - read:   await image.read() + image_preprocessor.prepare(bytes) + base64.b64encode (previous handling)
+  - stream: ingest_upload() to disk + encode_for_vision() (preprocessing reads the file in the worker)
+
+each with image preprocessing enabled and disabled. Decoding happens in the CPU worker pool and
+is not counted for either variant.
+
+Usage:
+    python benchmark_uploads.py --uploads 16 --size-mb 8
+"""
+import argparse
+import asyncio
+import base64
+import gc
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable
+
+from fastapi import UploadFile
+from PIL import Image
+
+import services.upload_ingest as upload_ingest_module
+from services.image_preprocessing import ImagePreprocessor
+from services.upload_ingest import encode_for_vision, ingest_upload
+from utils.worker_pool import shutdown_worker_pool
+
+MAX_FILE_SIZE = 20 * 1024 * 1024
+
+
+def build_photo(size_mb: float) -> bytes:
+    """A noisy JPEG of roughly size_mb megabytes"""
+    side = 1024
+    while True:
+        image = Image.effect_noise((side, side * 3 // 4), 50).convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=95)
+        if output.tell() >= size_mb * 1024 * 1024:
+            return output.getvalue()
+        side = int(side * 1.25)
+
+
+def make_upload(photo: bytes) -> UploadFile:
+    """An UploadFile the way Starlette hands it over: spooled to disk above 1MB"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(photo)
+    spooled.seek(0)
+    return UploadFile(spooled, size=len(photo), filename="photo.jpg")
+
+
+async def read_handling(upload: UploadFile) -> str:
+    content = await upload.read()
+    prepared = await upload_ingest_module.image_preprocessor.prepare(content)
+    return base64.b64encode(prepared.data).decode("utf-8")
+
+
+async def stream_handling(upload: UploadFile) -> str:
+    ingested = await ingest_upload(upload, MAX_FILE_SIZE)
+    try:
+        return (await encode_for_vision(ingested)).base64
+    finally:
+        ingested.discard()
+
+
+async def measure(handler: Callable[[UploadFile], Awaitable[str]], photo: bytes, uploads: int):
+    files = [make_upload(photo) for _ in range(uploads)]
+    gc.collect()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    encoded = await asyncio.gather(*(handler(upload) for upload in files))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for upload in files:
+        await upload.close()
+    return peak, elapsed, len(encoded[0])
+
+
+async def run(uploads: int, size_mb: float):
+    photo = build_photo(size_mb)
+    print(f"{uploads} concurrent uploads of a {len(photo) / 1024 / 1024:.1f}MB JPEG\n")
+    print(f"{'handling':<10} {'preprocess':<11} {'peak MB':>9} {'per upload MB':>14} {'seconds':>8} {'sent KB':>8}")
+
+    original = upload_ingest_module.image_preprocessor
+    try:
+        for enabled in (True, False):
+            upload_ingest_module.image_preprocessor = ImagePreprocessor(
+                enabled=enabled, max_dimension=1536, quality=85, output_format="jpeg")
+            # Warm up the worker pool so process start-up is not measured
+            await read_handling(make_upload(photo))
+            for name, handler in (("read", read_handling), ("stream", stream_handling)):
+                peak, elapsed, sent = await measure(handler, photo, uploads)
+                print(f"{name:<10} {'on' if enabled else 'off':<11} {peak / 1024 / 1024:>9.1f} "
+                      f"{peak / uploads / 1024 / 1024:>14.2f} {elapsed:>8.2f} {sent / 1024:>8.0f}")
+    finally:
+        upload_ingest_module.image_preprocessor = original
+        shutdown_worker_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent upload memory benchmark")
+    parser.add_argument("--uploads", type=int, default=16, help="concurrent uploads")
+    parser.add_argument("--size-mb", type=float, default=8, help="approximate size of the uploaded photo")
+    args = parser.parse_args()
+    asyncio.run(run(args.uploads, args.size_mb))
+
+
+if __name__ == "__main__":
+    main()
@@ -46,6 +46,8 @@ def create_tables():
     # Import here to avoid circular imports
     from models.user_models import Base
     from models.product_models import ProductRecommendation  # Import to register table
+    from models.tool_models import ToolIdentification, PriceHistory  # Import to register tables
+    from models.import_models import ProductImportBatch, ProductImportItem  # Import to register tables
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables created successfully")
 
@@ -3,14 +3,16 @@ Enhanced DIY Agent System with Tool Identification and User Management
 """
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional
+import asyncio
+import json
 import logging
 import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import base64
 
 # Import core modules
 from core import agent_manager
@@ -28,6 +30,21 @@ from database import create_tables, test_connection
 from services.user_service import UserService
 from services.product_service import ProductService
 from agents.product_info_agent import product_info_agent
+from services.scraper_client import scraper_client
+from services.price_cache import price_cache
+from services.single_flight import get_single_flight_stats
+from services.circuit_breaker import host_health
+from services.price_refresh_scheduler import price_refresh_scheduler
+from services.llm_gateway import llm_gateway
+from services.redirect_cache import redirect_cache
+from services.politeness import politeness
+from services.image_preprocessing import image_preprocessor
+from services.identification_cache import identification_cache
+from services.upload_ingest import UploadRejected, encode_for_vision, ingest_upload
+from services.identification_jobs import JobFailed, identification_jobs
+from services.bulk_importer import bulk_importer
+from services.product_import_service import ProductImportService
+from utils.worker_pool import shutdown_worker_pool
 
 # Load environment variables
 load_dotenv()
@@ -124,17 +141,35 @@ class ProductUpdateRequest(BaseModel):
 class ProductURLRequest(BaseModel):
     product_url: str
     is_featured: bool = False
+    bypass_llm_cache: bool = False  # Force a fresh AI extraction instead of the cached result
+
+class ProductBulkImportRequest(BaseModel):
+    product_urls: List[str]
+    is_featured: bool = False
+    bypass_llm_cache: bool = False
 
 # Database initialization
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
     logger.info("Starting up application...")
+    
+    # Start shared scraper connection pool
+    await scraper_client.start()
+    
     try:
         if test_connection():
             create_tables()
             logger.info("Database initialized successfully")
             
+            # Keep PriceHistory snapshots of recently identified tools fresh
+            if get_settings().price_refresh_enabled:
+                await price_refresh_scheduler.start()
+            
+            # Continue bulk imports interrupted by the last shutdown
+            if get_settings().bulk_import_resume_on_startup:
+                await bulk_importer.resume_unfinished()
+            
             # Create demo user if it doesn't exist
             try:
                 demo_user = UserService.get_user_by_username("demo")
@@ -258,6 +293,67 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to get user information")
 
 # Tool identification endpoints
+async def _prepare_identification(image: UploadFile, include_alternatives: bool, current_user: dict):
+    """Check the quota, ingest the upload and build the agent task (sync and job endpoints)"""
+    from core.agent_base import AgentTask
+    
+    user_id = int(current_user.get("sub"))
+    username = current_user.get("username", f"user_{user_id}")
+    
+    # Check daily quota
+    quota_info = UserService.get_user_quota_info(user_id)
+    if not quota_info["can_identify"]:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Daily limit ({quota_info['limit']}) reached. Upgrade to premium for more."
+        )
+    
+    # Stream the upload to disk; oversize or non-image payloads are rejected
+    # before they count against the quota
+    try:
+        upload = await ingest_upload(image, get_settings().max_file_size)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    try:
+        # Increment usage count
+        UserService.increment_daily_usage(user_id)
+        
+        # Downscale / strip metadata and encode image
+        vision_image = await encode_for_vision(upload)
+    finally:
+        upload.discard()
+    
+    task = AgentTask(
+        task_id=f"tool_id_{username}_{datetime.utcnow().timestamp()}",
+        agent_name="tool_identification",
+        input_data={
+            "image_data": vision_image.base64,
+            "image_mime_type": vision_image.mime_type,
+            "image_phash": vision_image.phash,
+            "include_alternatives": include_alternatives,
+            "membership_level": quota_info["membership"]
+        },
+        created_at=datetime.utcnow()
+    )
+    return user_id, task
+
+def _identification_response(data: Dict[str, Any], user_id: int) -> ToolIdentificationResponse:
+    """Attach the updated quota to a successful identification"""
+    # TODO: Save to history - implement actual storage
+    # save_identification_history(username, data)
+    
+    # Get updated quota after increment
+    updated_quota = UserService.get_user_quota_info(user_id)
+    
+    response_data = data
+    response_data["user_quota"] = {
+        "used": updated_quota["used"],
+        "limit": updated_quota["limit"],
+        "membership": updated_quota["membership"]
+    }
+    return ToolIdentificationResponse(**response_data)
+
 @app.post("/api/identify-tool", response_model=ToolIdentificationResponse)
 async def identify_tool(
     image: UploadFile = File(...),
@@ -266,36 +362,7 @@ async def identify_tool(
 ):
     """Identify tool from uploaded image"""
     try:
-        user_id = int(current_user.get("sub"))
-        username = current_user.get("username", f"user_{user_id}")
-        
-        # Check daily quota
-        quota_info = UserService.get_user_quota_info(user_id)
-        if not quota_info["can_identify"]:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Daily limit ({quota_info['limit']}) reached. Upgrade to premium for more."
-            )
-        
-        # Increment usage count
-        UserService.increment_daily_usage(user_id)
-        
-        # Read and encode image
-        image_content = await image.read()
-        image_base64 = base64.b64encode(image_content).decode('utf-8')
-        
-        # Create agent task
-        from core.agent_base import AgentTask
-        task = AgentTask(
-            task_id=f"tool_id_{username}_{datetime.utcnow().timestamp()}",
-            agent_name="tool_identification",
-            input_data={
-                "image_data": image_base64,
-                "include_alternatives": include_alternatives,
-                "membership_level": quota_info["membership"]
-            },
-            created_at=datetime.utcnow()
-        )
+        user_id, task = await _prepare_identification(image, include_alternatives, current_user)
         
         # Process identification
         result = await tool_identification_agent.process_task(task)
@@ -303,28 +370,118 @@ async def identify_tool(
         if not result.success:
             raise HTTPException(status_code=500, detail=result.error)
         
-        # TODO: Save to history - implement actual storage
-        # save_identification_history(username, result.data)
+        return _identification_response(result.data, user_id)
         
-        # Get updated quota after increment
-        updated_quota = UserService.get_user_quota_info(user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Tool identification error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Identification failed")
+
+@app.post("/api/identify-tool/stream")
+async def identify_tool_stream(
+    image: UploadFile = File(...),
+    include_alternatives: bool = Form(default=True),
+    format: str = "ndjson",
+    current_user: dict = Depends(get_current_user)
+):
+    """Identify a tool and stream each stage as it completes, as NDJSON (default) or SSE.
+    
+    tool_info arrives right after the vision call, followed by exact_matches and alternatives
+    batches as their retailer lookups finish; the final done event carries the same result as
+    /api/identify-tool.
+    """
+    try:
+        user_id, task = await _prepare_identification(image, include_alternatives, current_user)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Tool identification error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Identification failed")
+    
+    async def stages():
+        try:
+            async for event in tool_identification_agent.stream_stages(task):
+                if event["event"] == "done":
+                    response = await asyncio.to_thread(_identification_response, event["result"], user_id)
+                    event = {**event, "result": response.model_dump()}
+                    logger.info(f"Streamed identification for user {user_id} in {event['elapsed_ms']}ms")
+                elif event["event"] == "tool_info":
+                    logger.info(f"Streamed tool_info for user {user_id} after {event['elapsed_ms']}ms")
+                yield event
+        except Exception as e:
+            logger.error(f"Streaming tool identification error: {str(e)}")
+            yield {"event": "error", "error": "Identification failed"}
+    
+    return _event_stream_response(stages(), format)
+
+@app.post("/api/identify-tool/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_identify_tool_job(
+    image: UploadFile = File(...),
+    include_alternatives: bool = Form(default=True),
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue a tool identification and return its job id immediately.
+    
+    Poll /api/identify-tool/jobs/{job_id} or subscribe to .../events; the result has the
+    same shape as /api/identify-tool.
+    """
+    try:
+        # Reserve a queue slot before the upload counts against the quota, so concurrent
+        # submissions cannot overshoot the queue limit while they are being prepared
+        if not identification_jobs.reserve():
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many identifications in progress, please retry shortly")
         
-        # Prepare response
-        response_data = result.data
-        response_data["user_quota"] = {
-            "used": updated_quota["used"],
-            "limit": updated_quota["limit"],
-            "membership": updated_quota["membership"]
+        try:
+            user_id, task = await _prepare_identification(image, include_alternatives, current_user)
+        except BaseException:
+            identification_jobs.release()
+            raise
+        
+        async def run() -> Dict[str, Any]:
+            result = await tool_identification_agent.process_task(task)
+            if not result.success:
+                raise JobFailed(result.error or "Identification failed")
+            response = await asyncio.to_thread(_identification_response, result.data, user_id)
+            return response.model_dump()
+        
+        job = await identification_jobs.submit(user_id, run, reserved=True)
+        return {
+            "success": True,
+            "job": job,
+            "status_url": f"/api/identify-tool/jobs/{job['job_id']}",
+            "events_url": f"/api/identify-tool/jobs/{job['job_id']}/events"
         }
         
-        return ToolIdentificationResponse(**response_data)
-        
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Tool identification error: {str(e)}")
+        logger.error(f"Tool identification job error: {str(e)}")
         raise HTTPException(status_code=500, detail="Identification failed")
 
+@app.get("/api/identify-tool/jobs/{job_id}")
+async def get_identify_tool_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Poll an identification job; completed jobs include the result"""
+    job = await identification_jobs.find(job_id, owner=int(current_user.get("sub")))
+    if not job:
+        raise HTTPException(status_code=404, detail="Identification job not found")
+    return {"success": True, "job": job}
+
+@app.get("/api/identify-tool/jobs/{job_id}/events")
+async def identify_tool_job_events(
+    job_id: str,
+    format: str = "sse",
+    current_user: dict = Depends(get_current_user)
+):
+    """Subscribe to an identification job as server-sent events (default) or NDJSON"""
+    if not await identification_jobs.find(job_id, owner=int(current_user.get("sub"))):
+        raise HTTPException(status_code=404, detail="Identification job not found")
+    return _event_stream_response(identification_jobs.events(job_id), format)
+
 @app.get("/api/identification-history")
 async def get_identification_history(
     limit: int = 10,
@@ -582,7 +739,8 @@ async def admin_create_product_from_url(
             task_id=f"product_extract_{user_id}_{datetime.utcnow().timestamp()}",
             agent_name="product_info_extraction",
             input_data={
-                "product_url": request.product_url
+                "product_url": request.product_url,
+                "bypass_llm_cache": request.bypass_llm_cache
             },
             created_at=datetime.utcnow()
         )
@@ -665,6 +823,172 @@ async def admin_create_product_from_url(
         logger.error(f"Error creating product from URL: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create product from URL: {str(e)}")
 
+def _require_admin(current_user: dict) -> int:
+    """Return the user id, or raise 403 if the user is not an admin"""
+    user_id = int(current_user.get("sub"))
+    
+    from database import get_db_session
+    from models.user_models import User
+    
+    with get_db_session() as db:
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user or not user.is_admin():
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required"
+            )
+    return user_id
+
+def _event_stream_response(events: AsyncIterator[Dict[str, Any]], stream_format: str) -> StreamingResponse:
+    """Stream events as NDJSON or server-sent events ("sse")"""
+    async def ndjson():
+        async for event in events:
+            yield json.dumps(event) + "\n"
+    
+    async def sse():
+        async for event in events:
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    
+    if stream_format == "sse":
+        return StreamingResponse(sse(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+def _import_progress_response(batch_id: int, stream_format: str) -> StreamingResponse:
+    """Stream bulk import progress as NDJSON (default) or server-sent events"""
+    return _event_stream_response(bulk_importer.events(batch_id), stream_format)
+
+async def _start_bulk_import(urls: List[str], user_id: int, is_featured: bool, bypass_llm_cache: bool,
+                             stream_format: str) -> StreamingResponse:
+    """Validate URLs, create the batch and stream its progress"""
+    urls = [url.strip() for url in urls if url and url.strip()]
+    if not urls:
+        raise HTTPException(status_code=400, detail="No product URLs provided")
+    
+    max_urls = get_settings().bulk_import_max_urls
+    if len(urls) > max_urls:
+        raise HTTPException(status_code=400, detail=f"Too many URLs ({len(urls)}), the limit is {max_urls} per batch")
+    
+    invalid = [url for url in urls if not product_info_agent.validate_input({"product_url": url})]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid product URLs: {', '.join(invalid[:10])}")
+    
+    batch = await asyncio.to_thread(ProductImportService.create_batch, urls, user_id, is_featured, bypass_llm_cache)
+    await bulk_importer.start(batch["id"])
+    logger.info(f"Bulk import batch {batch['id']} started with {batch['total']} URLs")
+    return _import_progress_response(batch["id"], stream_format)
+
+@app.post("/api/admin/products/bulk-import")
+async def admin_bulk_import_products(
+    request: ProductBulkImportRequest,
+    format: str = "ndjson",
+    current_user: dict = Depends(get_current_user)
+):
+    """Import many product URLs in the background and stream per-URL progress (admin only)"""
+    try:
+        user_id = _require_admin(current_user)
+        return await _start_bulk_import(request.product_urls, user_id, request.is_featured,
+                                        request.bypass_llm_cache, format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting bulk import: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start bulk import: {str(e)}")
+
+@app.post("/api/admin/products/bulk-import/file")
+async def admin_bulk_import_products_file(
+    file: UploadFile = File(...),
+    is_featured: bool = Form(False),
+    bypass_llm_cache: bool = Form(False),
+    format: str = "ndjson",
+    current_user: dict = Depends(get_current_user)
+):
+    """Bulk import from an uploaded text/CSV file with one URL per line (admin only)"""
+    try:
+        user_id = _require_admin(current_user)
+        
+        content = (await file.read()).decode("utf-8-sig", errors="ignore")
+        urls = []
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            # CSV exports: take the first column that looks like a URL
+            url = next((cell.strip().strip('"') for cell in line.split(",")
+                        if cell.strip().strip('"').startswith(("http://", "https://"))), None)
+            if url:
+                urls.append(url)
+        
+        return await _start_bulk_import(urls, user_id, is_featured, bypass_llm_cache, format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting bulk import from file: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start bulk import: {str(e)}")
+
+@app.get("/api/admin/products/bulk-import/{batch_id}")
+async def admin_get_bulk_import(
+    batch_id: int,
+    include_items: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get bulk import batch status and per-URL results (admin only)"""
+    try:
+        _require_admin(current_user)
+        batch = await asyncio.to_thread(ProductImportService.get_batch, batch_id, include_items)
+        if not batch:
+            raise HTTPException(status_code=404, detail="Import batch not found")
+        return {
+            "success": True,
+            "batch": batch,
+            "running": bulk_importer.is_running(batch_id)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting bulk import {batch_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get import batch")
+
+@app.get("/api/admin/products/bulk-import/{batch_id}/events")
+async def admin_bulk_import_events(
+    batch_id: int,
+    format: str = "ndjson",
+    current_user: dict = Depends(get_current_user)
+):
+    """Re-attach to the progress stream of a batch (admin only)"""
+    try:
+        _require_admin(current_user)
+        if not await asyncio.to_thread(ProductImportService.get_batch, batch_id):
+            raise HTTPException(status_code=404, detail="Import batch not found")
+        return _import_progress_response(batch_id, format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming bulk import {batch_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to stream import batch")
+
+@app.post("/api/admin/products/bulk-import/{batch_id}/resume")
+async def admin_resume_bulk_import(
+    batch_id: int,
+    format: str = "ndjson",
+    current_user: dict = Depends(get_current_user)
+):
+    """Resume a batch; URLs that already finished are not fetched again (admin only)"""
+    try:
+        _require_admin(current_user)
+        batch = await asyncio.to_thread(ProductImportService.get_batch, batch_id)
+        if not batch:
+            raise HTTPException(status_code=404, detail="Import batch not found")
+        if batch["counts"]["pending"] and not bulk_importer.is_running(batch_id):
+            if not await bulk_importer.start(batch_id):
+                raise HTTPException(status_code=409, detail="Import batch is being processed by another worker")
+        return _import_progress_response(batch_id, format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error resuming bulk import {batch_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to resume import batch")
+
 @app.post("/api/admin/products")
 async def admin_create_product(
     product: ProductCreateRequest,
@@ -850,6 +1174,50 @@ async def admin_delete_product(
         logger.error(f"Error deleting product: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete product")
 
+@app.get("/api/admin/scraper/stats")
+async def admin_get_scraper_stats(current_user: dict = Depends(get_current_user)):
+    """Get scraper connection pool, price cache, coalescing, circuit breaker, price refresh and redirect cache statistics (admin only)"""
+    try:
+        _require_admin(current_user)
+        
+        return {
+            "success": True,
+            "connection_pool": scraper_client.get_stats(),
+            "price_cache": price_cache.get_stats(),
+            "coalescing": get_single_flight_stats(),
+            "host_health": host_health.get_stats(),
+            "price_refresh": price_refresh_scheduler.get_stats(),
+            "redirect_cache": redirect_cache.get_stats(),
+            "politeness": politeness.get_stats()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting scraper stats: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get scraper stats")
+
+@app.get("/api/admin/llm/stats")
+async def admin_get_llm_stats(current_user: dict = Depends(get_current_user)):
+    """Get LLM gateway, response cache, image preprocessing, identification cache/job and product extraction statistics (admin only)"""
+    try:
+        _require_admin(current_user)
+        
+        return {
+            "success": True,
+            "gateway": llm_gateway.get_stats(),
+            "image_preprocessing": image_preprocessor.get_stats(),
+            "identification_cache": identification_cache.get_stats(),
+            "identification_jobs": identification_jobs.get_stats(),
+            "product_extraction": product_info_agent.get_extraction_stats()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting LLM stats: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get LLM stats")
+
 # Original DIY analysis endpoint (kept for compatibility)
 @app.post("/analyze-project")
 async def analyze_project(
@@ -859,18 +1227,17 @@ async def analyze_project(
     budget_range: str = Form(default="")
 ):
     """Original DIY project analysis endpoint"""
+    uploads = []
     try:
-        # Save uploaded images
-        image_paths = []
-        upload_dir = "uploads"
+        # Save uploaded images under unique names (concurrent requests often share a filename)
+        upload_dir = get_settings().upload_dir
         os.makedirs(upload_dir, exist_ok=True)
         
-        for image in images:
-            file_path = os.path.join(upload_dir, image.filename)
-            with open(file_path, "wb") as buffer:
-                content = await image.read()
-                buffer.write(content)
-            image_paths.append(file_path)
+        try:
+            for image in images:
+                uploads.append(await ingest_upload(image, get_settings().max_file_size, directory=upload_dir))
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
         
         # Use OpenAI Vision API for real image analysis if available
         from services.openai_vision_service import vision_service
@@ -878,16 +1245,14 @@ async def analyze_project(
         # Analyze the first image with OpenAI Vision
         if images and len(images) > 0:
             try:
-                # Read and encode the first image
-                first_image = images[0]
-                first_image.file.seek(0)  # Reset file pointer
-                image_content = await first_image.read()
-                image_base64 = base64.b64encode(image_content).decode('utf-8')
+                # Encode the first image from its saved copy
+                vision_image = await encode_for_vision(uploads[0])
                 
                 # Get AI analysis
                 analysis_data = await vision_service.analyze_diy_project(
-                    image_base64=image_base64,
-                    project_description=description
+                    image_base64=vision_image.base64,
+                    project_description=description,
+                    mime_type=vision_image.mime_type
                 )
                 
                 # Add user's project type if specified
@@ -979,18 +1344,17 @@ async def analyze_project(
             ]
         }
         
-        # Clean up temporary files
-        for path in image_paths:
-            try:
-                os.remove(path)
-            except:
-                pass
-                
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing project: {str(e)}")
         return {"success": False, "error": str(e)}
+    finally:
+        # Clean up saved uploads, including those saved before a failure
+        for upload in uploads:
+            upload.discard()
 
 # Helper functions
 
@@ -1443,6 +1807,12 @@ async def grant_admin_bigmouse8748(setup_key: str = Form(...)):
 async def shutdown_event():
     """Application shutdown event"""
     logger.info("Shutting down Enhanced DIY Agent System...")
+    await bulk_importer.stop()
+    await identification_jobs.stop()
+    await price_refresh_scheduler.stop()
+    await scraper_client.close()
+    await llm_gateway.close()
+    shutdown_worker_pool()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,82 @@
+"""
+Bulk product import models
+"""
+from datetime import datetime
+from typing import Dict
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from models.user_models import Base
+
+class ProductImportBatch(Base):
+    __tablename__ = "product_import_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_by = Column(Integer, nullable=True)
+    status = Column(String(20), default="pending")  # pending, running, completed
+    # Process running the batch; with several workers only the claim holder imports it.
+    # The claim is renewed while running and can be taken over once heartbeat_at is older than the lease
+    owner = Column(String(100), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    is_featured = Column(Boolean, default=False)
+    bypass_llm_cache = Column(Boolean, default=False)
+    total = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+    items = relationship("ProductImportItem", back_populates="batch", cascade="all, delete-orphan",
+                         order_by="ProductImportItem.position")
+
+    def to_dict(self) -> Dict:
+        """Convert to dictionary for API response"""
+        return {
+            "id": self.id,
+            "created_by": self.created_by,
+            "status": self.status,
+            "owner": self.owner,
+            "is_featured": self.is_featured,
+            "total": self.total,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+class ProductImportItem(Base):
+    __tablename__ = "product_import_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey("product_import_batches.id"), nullable=False)
+    position = Column(Integer, nullable=False)  # Order of the URL in the submitted list
+    url = Column(String(1000), nullable=False)
+
+    # pending -> done / failed; anything still pending after a restart is picked up on resume
+    status = Column(String(20), default="pending")
+    product_id = Column(Integer, nullable=True)
+    title = Column(String(255), nullable=True)
+    extraction_method = Column(String(100), nullable=True)
+    error = Column(Text, nullable=True)
+    elapsed = Column(Integer, nullable=True)  # Milliseconds spent extracting
+    finished_at = Column(DateTime, nullable=True)
+
+    batch = relationship("ProductImportBatch", back_populates="items")
+
+    # Pending work lookup on resume: WHERE batch_id = ? AND status = 'pending'
+    __table_args__ = (
+        Index("ix_product_import_items_batch_status", "batch_id", "status"),
+    )
+
+    def to_dict(self) -> Dict:
+        """Convert to dictionary for API response"""
+        return {
+            "id": self.id,
+            "batch_id": self.batch_id,
+            "position": self.position,
+            "url": self.url,
+            "status": self.status,
+            "product_id": self.product_id,
+            "title": self.title,
+            "extraction_method": self.extraction_method,
+            "error": self.error,
+            "elapsed_ms": self.elapsed,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
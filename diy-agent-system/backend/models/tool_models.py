@@ -3,11 +3,9 @@ Tool identification and price tracking models
 """
 from datetime import datetime
 from typing import Dict, List, Optional
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Boolean, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.ext.declarative import declarative_base
-
-Base = declarative_base()
+from models.user_models import Base
 
 class ToolIdentification(Base):
     __tablename__ = "tool_identifications"
@@ -53,8 +51,18 @@ class PriceHistory(Base):
     __tablename__ = "price_history"
     
     id = Column(Integer, primary_key=True, index=True)
-    tool_identification_id = Column(Integer, ForeignKey("tool_identifications.id"), nullable=False)
+    tool_identification_id = Column(Integer, ForeignKey("tool_identifications.id"), nullable=True)
+    
+    # Product query the snapshot belongs to (normalized "brand|model|tool_name")
+    query_key = Column(String(255), nullable=True)
+    brand = Column(String(100), nullable=True)
+    model = Column(String(100), nullable=True)
+    tool_name = Column(String(255), nullable=True)
+    
     retailer = Column(String, nullable=False)
+    title = Column(String(255), nullable=True)
+    url = Column(String(1000), nullable=True)
+    image_url = Column(String(1000), nullable=True)
     price = Column(Float, nullable=False)
     currency = Column(String, default="USD")
     tracked_at = Column(DateTime, default=datetime.utcnow)
@@ -65,10 +73,17 @@ class PriceHistory(Base):
     # Relationship
     identification = relationship("ToolIdentification", back_populates="price_history")
     
+    # Latest snapshot lookup: WHERE query_key = ? ORDER BY tracked_at DESC
+    __table_args__ = (
+        Index("ix_price_history_query_key_tracked_at", "query_key", "tracked_at"),
+    )
+    
     def to_dict(self) -> Dict:
         """Convert to dictionary for API response"""
         return {
             "retailer": self.retailer,
+            "title": self.title,
+            "url": self.url,
             "price": self.price,
             "currency": self.currency,
             "tracked_at": self.tracked_at.isoformat() if self.tracked_at else None,
@@ -0,0 +1,310 @@
+"""
+Bulk product import runner
+批量导入：有界并发 + 按域名限流运行ProductInfoAgent，结果按批写库，逐URL推送进度
+导入在后台任务中运行，客户端断开不影响；重启后未完成的条目可续跑，已完成的不会重新抓取
+多个worker进程时，批次在数据库中认领（带续约的租约），同一批次只由一个进程导入
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+from core.agent_base import AgentTask
+from services.politeness import PRIORITY_BACKGROUND, scrape_priority
+from services.product_import_service import ProductImportService
+from services.product_service import ProductService
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 推送给订阅者的结束标记
+_END = object()
+
+
+class BulkImporter:
+    """批量导入任务管理"""
+
+    def __init__(self, concurrency: int, per_domain: int, batch_size: int, flush_interval: float,
+                 claim_lease: float = 60, poll_interval: float = 1.0):
+        self.concurrency = concurrency
+        self.per_domain = per_domain
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.claim_lease = claim_lease
+        # 订阅其他进程运行的批次时轮询数据库的间隔
+        self.poll_interval = poll_interval
+        # 本进程在数据库中认领批次时使用的标识
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._retry_task: Optional[asyncio.Task] = None
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self.stats = {
+            "batches_started": 0,
+            "batches_completed": 0,
+            "urls_done": 0,
+            "urls_failed": 0,
+            "flushes": 0,
+            "claims_refused": 0,
+        }
+
+    def is_running(self, batch_id: int) -> bool:
+        task = self._tasks.get(batch_id)
+        return task is not None and not task.done()
+
+    async def start(self, batch_id: int, agent=None) -> bool:
+        """认领并启动（或续跑）批次；已在本进程运行或被其他进程认领时返回False"""
+        if self.is_running(batch_id):
+            return False
+        claimed = await asyncio.to_thread(ProductImportService.claim_batch, batch_id, self.owner, self.claim_lease)
+        if not claimed:
+            self.stats["claims_refused"] += 1
+            return False
+        if agent is None:
+            from agents.product_info_agent import product_info_agent
+            agent = product_info_agent
+        task = asyncio.create_task(self._run(batch_id, agent))
+        self._tasks[batch_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(batch_id, None))
+        self.stats["batches_started"] += 1
+        return True
+
+    async def resume_unfinished(self) -> List[int]:
+        """启动时续跑所有未完成且未被其他进程认领的批次
+
+        被认领的批次可能属于刚被杀掉的进程，租约过期后再尝试一次
+        """
+        batch_ids = await asyncio.to_thread(ProductImportService.get_unfinished_batch_ids)
+        started = [batch_id for batch_id in batch_ids if await self.start(batch_id)]
+        if started:
+            logger.info(f"Resuming {len(started)} unfinished import batches: {started}")
+        claimed_elsewhere = [batch_id for batch_id in batch_ids if batch_id not in started]
+        if claimed_elsewhere:
+            self._retry_task = asyncio.create_task(self._resume_after_lease(claimed_elsewhere))
+        return started
+
+    async def _resume_after_lease(self, batch_ids: List[int]):
+        await asyncio.sleep(self.claim_lease)
+        for batch_id in batch_ids:
+            if await self.start(batch_id):
+                logger.info(f"Took over import batch {batch_id} after its claim expired")
+
+    async def stop(self):
+        """取消运行中的批次（在FastAPI shutdown中调用），未写库的条目保持pending，并释放认领以便下次立即续跑"""
+        if self._retry_task is not None:
+            self._retry_task.cancel()
+            self._retry_task = None
+        batch_ids = list(self._tasks)
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for batch_id in batch_ids:
+            try:
+                await asyncio.to_thread(ProductImportService.release_batch, batch_id, self.owner, "pending")
+            except Exception as e:
+                logger.warning(f"Could not release import batch {batch_id}: {str(e)}")
+
+    async def events(self, batch_id: int) -> AsyncIterator[Dict[str, Any]]:
+        """订阅批次进度：先返回当前状态，之后逐条返回写库后的URL结果，批次结束时返回done
+
+        批次由其他worker进程运行时，从数据库轮询进度
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(batch_id, set()).add(queue)
+        try:
+            batch = await asyncio.to_thread(ProductImportService.get_batch, batch_id)
+            yield {"event": "batch", **batch}
+            if not self.is_running(batch_id):
+                if self._claimed_elsewhere(batch):
+                    async for event in self._remote_events(batch):
+                        yield event
+                    return
+                yield {"event": "done", **batch}
+                return
+            while True:
+                event = await queue.get()
+                if event is _END:
+                    return
+                yield event
+        finally:
+            subscribers = self._subscribers.get(batch_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[batch_id]
+
+    def _claimed_elsewhere(self, batch: Dict[str, Any]) -> bool:
+        """批次正由其他进程运行，且其认领仍在租约内"""
+        if batch["status"] != "running" or not batch["owner"] or batch["owner"] == self.owner:
+            return False
+        heartbeat_at = batch["heartbeat_at"]
+        if heartbeat_at is None:
+            return False
+        return datetime.utcnow() - datetime.fromisoformat(heartbeat_at) < timedelta(seconds=self.claim_lease)
+
+    async def _remote_events(self, batch: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        batch_id = batch["id"]
+        # 订阅前已完成的条目已包含在batch事件的计数中
+        finished = await asyncio.to_thread(ProductImportService.get_finished_items, batch_id)
+        seen: Set[int] = {item["id"] for item in finished}
+        since = datetime.fromisoformat(finished[-1]["finished_at"]) if finished else None
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            items = await asyncio.to_thread(ProductImportService.get_finished_items, batch_id, since)
+            batch = await asyncio.to_thread(ProductImportService.get_batch, batch_id)
+            if batch is None:
+                return
+            completed = batch["counts"]["done"] + batch["counts"]["failed"]
+            for item in items:
+                if item["id"] in seen:
+                    continue
+                seen.add(item["id"])
+                yield {"event": "item", **item, "completed": completed, "total": batch["total"]}
+            if items:
+                since = datetime.fromisoformat(items[-1]["finished_at"])
+            if batch["status"] == "completed":
+                yield {"event": "done", **batch}
+                return
+            if not self._claimed_elsewhere(batch):
+                # 运行批次的进程已停止（释放认领或不再续约），批次未完成
+                yield {"event": "error", "batch_id": batch_id, "error": "Import batch stopped before finishing"}
+                return
+
+    def _publish(self, batch_id: int, event: Any):
+        for queue in self._subscribers.get(batch_id, ()):
+            queue.put_nowait(event)
+
+    @staticmethod
+    def _domain(url: str) -> str:
+        netloc = urlparse(url).netloc.lower()
+        return netloc[4:] if netloc.startswith("www.") else netloc
+
+    async def _run(self, batch_id: int, agent):
+        batch = await asyncio.to_thread(ProductImportService.get_batch, batch_id)
+        if batch is None:
+            return
+        pending = await asyncio.to_thread(ProductImportService.get_pending_items, batch_id)
+        logger.info(f"Import batch {batch_id}: {len(pending)} of {batch['total']} URLs pending")
+
+        workers = asyncio.Semaphore(self.concurrency)
+        domains: Dict[str, asyncio.Semaphore] = {}
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def extract(item: Dict[str, Any]):
+            # 先占域名名额再占全局名额，等待同一域名的条目不占用全局worker
+            domain = domains.setdefault(self._domain(item["url"]), asyncio.Semaphore(self.per_domain))
+            async with domain, workers:
+                start = time.monotonic()
+                result = {"item_id": item["id"]}
+                try:
+                    # 导入的抓取排在交互式请求之后
+                    with scrape_priority(PRIORITY_BACKGROUND):
+                        agent_result = await agent.process_task(AgentTask(
+                            task_id=f"bulk_import_{batch_id}_{item['id']}",
+                            agent_name="product_info_extraction",
+                            input_data={"product_url": item["url"], "bypass_llm_cache": batch["bypass_llm_cache"]},
+                            created_at=datetime.utcnow()
+                        ))
+                    if agent_result.success and agent_result.data:
+                        result["product_fields"] = ProductService.fields_from_extraction(item["url"], agent_result.data)
+                        result["extraction_method"] = agent_result.data.get("extraction_method")
+                    else:
+                        result["error"] = agent_result.error or "No product information extracted"
+                except Exception as e:
+                    result["error"] = str(e)
+                result["elapsed_ms"] = int((time.monotonic() - start) * 1000)
+                await results.put(result)
+
+        tasks = [asyncio.create_task(extract(item)) for item in pending]
+        writer = asyncio.create_task(self._write_results(batch_id, batch, results, len(pending)))
+        heartbeat = asyncio.create_task(self._renew_claim(batch_id, asyncio.current_task()))
+        try:
+            await asyncio.gather(*tasks)
+            await writer
+            await asyncio.to_thread(ProductImportService.release_batch, batch_id, self.owner, "completed")
+            self.stats["batches_completed"] += 1
+            summary = await asyncio.to_thread(ProductImportService.get_batch, batch_id)
+            self._publish(batch_id, {"event": "done", **summary})
+            logger.info(f"Import batch {batch_id} completed: {summary['counts']}")
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            writer.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Import batch {batch_id} failed: {str(e)}")
+            self._publish(batch_id, {"event": "error", "batch_id": batch_id, "error": str(e)})
+            try:
+                await asyncio.to_thread(ProductImportService.release_batch, batch_id, self.owner, "pending")
+            except Exception as release_error:
+                logger.warning(f"Could not release import batch {batch_id}: {str(release_error)}")
+        finally:
+            heartbeat.cancel()
+            self._publish(batch_id, _END)
+
+    async def _renew_claim(self, batch_id: int, run: asyncio.Task):
+        """运行期间续约；认领被其他进程接管（如续约长时间失败）时停止本进程的导入"""
+        while True:
+            await asyncio.sleep(self.claim_lease / 3)
+            try:
+                renewed = await asyncio.to_thread(ProductImportService.renew_claim, batch_id, self.owner)
+            except Exception as e:
+                logger.warning(f"Could not renew claim on import batch {batch_id}: {str(e)}")
+                continue
+            if not renewed:
+                logger.warning(f"Import batch {batch_id} was taken over by another worker, stopping")
+                run.cancel()
+                return
+
+    async def _write_results(self, batch_id: int, batch: Dict[str, Any], results: asyncio.Queue, expected: int):
+        """攒够batch_size条或等待flush_interval秒后批量写库，写库后再推送进度"""
+        written = 0
+        while written < expected:
+            buffer = [await results.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(buffer) < self.batch_size and written + len(buffer) < expected:
+                try:
+                    buffer.append(await asyncio.wait_for(results.get(), timeout=max(0, deadline - time.monotonic())))
+                except asyncio.TimeoutError:
+                    break
+
+            items = await asyncio.to_thread(
+                ProductImportService.record_results, batch_id, buffer,
+                batch["is_featured"], batch["created_by"]
+            )
+            written += len(buffer)
+            self.stats["flushes"] += 1
+            for item in items:
+                self.stats["urls_done" if item["status"] == "done" else "urls_failed"] += 1
+                self._publish(batch_id, {"event": "item", **item, "completed": written, "total": expected})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取导入统计"""
+        return {
+            **self.stats,
+            "running_batches": sorted(self._tasks),
+            "concurrency": self.concurrency,
+            "per_domain": self.per_domain,
+            "owner": self.owner,
+        }
+
+
+def _create_bulk_importer() -> BulkImporter:
+    settings = get_settings()
+    return BulkImporter(
+        concurrency=settings.bulk_import_concurrency,
+        per_domain=settings.bulk_import_per_domain,
+        batch_size=settings.bulk_import_batch_size,
+        flush_interval=settings.bulk_import_flush_interval,
+        claim_lease=settings.bulk_import_claim_lease,
+    )
+
+
+# 全局批量导入管理器
+bulk_importer = _create_bulk_importer()
@@ -0,0 +1,250 @@
+"""
+Per-host circuit breakers and adaptive timeouts
+按主机的熔断器（closed/open/half-open，滚动错误率窗口）和基于p95延迟的自适应超时
+请求通过 host_health.request(host) 发起：请求被取消或异常退出而没有记录结果时，half-open的试探名额会被归还
+"""
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """滚动窗口错误率熔断器"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, window_seconds: float, min_requests: int,
+                 error_rate_threshold: float, open_seconds: float, half_open_max_calls: int = 1):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._probe_started_at = 0.0
+        self._results: Deque[Tuple[float, bool]] = deque()
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """当前状态（open超时后自动进入half-open；试探请求超过open_seconds没有结果时名额作废，允许重新试探）"""
+        now = time.monotonic()
+        if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"Circuit for {self.name} half-open, probing")
+        elif (self._state == self.HALF_OPEN and self._half_open_calls
+              and now - self._probe_started_at >= self.open_seconds):
+            self._half_open_calls = 0
+            logger.warning(f"Circuit probe for {self.name} never reported back, probing again")
+        return self._state
+
+    def allow_request(self) -> bool:
+        """是否允许发起网络请求；half-open时占用一个试探名额，必须以record_*或release_probe结束"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            self._probe_started_at = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def release_probe(self):
+        """归还没有结果的试探名额（请求被取消或在发出前放弃）"""
+        if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self):
+        """记录成功"""
+        if self._state == self.HALF_OPEN:
+            self._state = self.CLOSED
+            self._results.clear()
+            logger.info(f"Circuit for {self.name} closed")
+        self._record(True)
+
+    def record_failure(self):
+        """记录失败，错误率超过阈值时熔断"""
+        if self._state == self.HALF_OPEN:
+            self._trip()
+            return
+        self._record(False)
+
+        if self._state == self.CLOSED and len(self._results) >= self.min_requests:
+            failures = sum(1 for _, ok in self._results if not ok)
+            if failures / len(self._results) >= self.error_rate_threshold:
+                self._trip()
+
+    def error_rate(self) -> float:
+        """当前窗口错误率"""
+        self._prune(time.monotonic())
+        if not self._results:
+            return 0.0
+        return sum(1 for _, ok in self._results if not ok) / len(self._results)
+
+    def _trip(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.trips += 1
+        logger.warning(f"Circuit for {self.name} opened (trip #{self.trips})")
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._results.append((now, ok))
+        self._prune(now)
+
+    def _prune(self, now: float):
+        while self._results and now - self._results[0][0] > self.window_seconds:
+            self._results.popleft()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "window_requests": len(self._results),
+            "error_rate": round(self.error_rate(), 3),
+        }
+
+
+class HostRequest:
+    """一次受熔断器保护的请求（with语句）：退出时若没有记录成功或失败，归还half-open试探名额"""
+
+    def __init__(self, breaker: CircuitBreaker, latency: "LatencyTracker"):
+        self._breaker = breaker
+        self._latency = latency
+        self.allowed = False
+        self._reported = True
+
+    def __enter__(self) -> "HostRequest":
+        self.allowed = self._breaker.allow_request()
+        self._reported = not self.allowed
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self._reported:
+            self._reported = True
+            self._breaker.release_probe()
+        return False
+
+    def success(self, latency: Optional[float] = None):
+        self._reported = True
+        self._breaker.record_success()
+        if latency is not None:
+            self._latency.record(latency)
+
+    def failure(self):
+        self._reported = True
+        self._breaker.record_failure()
+
+
+class LatencyTracker:
+    """记录最近的请求延迟并根据p95计算超时"""
+
+    def __init__(self, window_size: int, min_samples: int, multiplier: float, min_timeout: float):
+        self.min_samples = min_samples
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self._samples: Deque[float] = deque(maxlen=window_size)
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+
+    def p95(self) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def timeout(self, default: float) -> float:
+        """p95 × 倍数，限制在 [min_timeout, default] 之间；样本不足时用默认值"""
+        p95 = self.p95()
+        if p95 is None or len(self._samples) < self.min_samples:
+            return default
+        return max(self.min_timeout, min(default, p95 * self.multiplier))
+
+
+class HostHealthRegistry:
+    """按主机管理熔断器和延迟统计"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+
+    @staticmethod
+    def _normalize_host(host: str) -> str:
+        host = host.lower()
+        return host[4:] if host.startswith("www.") else host
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        host = self._normalize_host(host)
+        if host not in self._breakers:
+            settings = get_settings()
+            self._breakers[host] = CircuitBreaker(
+                name=host,
+                window_seconds=settings.breaker_window_seconds,
+                min_requests=settings.breaker_min_requests,
+                error_rate_threshold=settings.breaker_error_rate_threshold,
+                open_seconds=settings.breaker_open_seconds,
+            )
+        return self._breakers[host]
+
+    def latency(self, host: str) -> LatencyTracker:
+        host = self._normalize_host(host)
+        if host not in self._latencies:
+            settings = get_settings()
+            self._latencies[host] = LatencyTracker(
+                window_size=settings.adaptive_timeout_window,
+                min_samples=settings.adaptive_timeout_min_samples,
+                multiplier=settings.adaptive_timeout_multiplier,
+                min_timeout=settings.adaptive_timeout_min,
+            )
+        return self._latencies[host]
+
+    def allow_request(self, host: str) -> bool:
+        return self.breaker(host).allow_request()
+
+    def request(self, host: str) -> HostRequest:
+        """with host_health.request(host) as call: 先检查call.allowed，再用call.success()/call.failure()记录结果"""
+        return HostRequest(self.breaker(host), self.latency(host))
+
+    def timeout_for(self, host: str, default: float) -> float:
+        return self.latency(host).timeout(default)
+
+    def record_success(self, host: str, latency: Optional[float] = None):
+        self.breaker(host).record_success()
+        if latency is not None:
+            self.latency(host).record(latency)
+
+    def record_failure(self, host: str):
+        self.breaker(host).record_failure()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各主机的熔断状态、跳闸次数、p95和当前超时"""
+        stats = {}
+        for host, breaker in self._breakers.items():
+            tracker = self._latencies.get(host)
+            p95 = tracker.p95() if tracker else None
+            stats[host] = {
+                **breaker.get_stats(),
+                "p95_latency": round(p95, 3) if p95 is not None else None,
+                "timeout": round(tracker.timeout(get_settings().scraper_request_timeout), 2) if tracker else None,
+            }
+        return stats
+
+
+# 全局主机健康状态
+host_health = HostHealthRegistry()
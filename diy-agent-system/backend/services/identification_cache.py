@@ -0,0 +1,239 @@
+"""
+Perceptual-hash identification cache
+以图片的64位感知哈希（pHash）为键缓存工具识别结果，持久化到SQLite，内存中用BK树按汉明距离检索
+同一张或几乎相同的照片（重新上传、重新压缩、轻微裁剪/调色）直接复用上次的识别结果，跳过视觉模型调用
+"""
+import asyncio
+import io
+import json
+import logging
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from services.kv_store import SQLiteKVStore
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# pHash：缩小到32x32灰度，取DCT左上角8x8低频系数（去掉直流分量后按中位数二值化）
+_HASH_SAMPLE = 32
+_HASH_FREQUENCIES = 8
+_DCT_COSINES = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * _HASH_SAMPLE)) for x in range(_HASH_SAMPLE)]
+    for u in range(_HASH_FREQUENCIES)
+]
+
+
+def phash_image(image: Image.Image) -> int:
+    """已解码图像的64位感知哈希"""
+    gray = image.convert("L").resize((_HASH_SAMPLE, _HASH_SAMPLE), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    rows = [pixels[i * _HASH_SAMPLE:(i + 1) * _HASH_SAMPLE] for i in range(_HASH_SAMPLE)]
+
+    # 可分离的二维DCT，只计算需要的8x8低频部分
+    row_dct = [[sum(c * p for c, p in zip(cosines, row)) for cosines in _DCT_COSINES] for row in rows]
+    coefficients = [
+        sum(cosines[y] * row_dct[y][u] for y in range(_HASH_SAMPLE))
+        for cosines in _DCT_COSINES
+        for u in range(_HASH_FREQUENCIES)
+    ]
+
+    ac = coefficients[1:]
+    median = sorted(ac)[len(ac) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+def phash_bytes(data: bytes) -> int:
+    """编码图片的感知哈希（纯函数，可在工作进程中执行）"""
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", (_HASH_SAMPLE * 4, _HASH_SAMPLE * 4))
+    return phash_image(image)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """按汉明距离组织的BK树，每个节点是 [hash, {距离: 子节点}]"""
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int) -> bool:
+        """插入哈希，已存在时返回False"""
+        if self._root is None:
+            self._root = [value, {}]
+            self.size = 1
+            return True
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                return False
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                self.size += 1
+                return True
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """距离不超过max_distance的所有哈希，按距离从近到远返回 (距离, 哈希)"""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[0]))
+            # 三角不等式：只有距离在 [d - max, d + max] 的子树可能命中
+            for edge, child in node[1].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort()
+        return matches
+
+
+class IdentificationCache:
+    """pHash → 识别结果的近似重复缓存"""
+
+    def __init__(self, store: SQLiteKVStore, ttl: float, max_distance: int, min_confidence: float,
+                 enabled: bool = True):
+        self.store = store
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.min_confidence = min_confidence
+        self.enabled = enabled
+        self._tree: Optional[BKTree] = None
+        self._stale = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "exact_hits": 0,
+            "near_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "skipped_low_confidence": 0,
+            "errors": 0,
+        }
+        self._hit_distance_total = 0
+
+    @staticmethod
+    def make_key(image_hash: int) -> str:
+        return f"{image_hash:016x}"
+
+    def _index(self) -> BKTree:
+        """懒加载：首次使用时从持久化存储重建BK树（调用方持有锁）"""
+        if self._tree is None:
+            tree = BKTree()
+            for key, _ in self.store.items():
+                tree.add(int(key, 16))
+            self._tree = tree
+            self._stale = 0
+            logger.info(f"Identification cache index loaded with {tree.size} image hashes")
+        return self._tree
+
+    def _lookup_sync(self, image_hash: int) -> Optional[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            candidates = self._index().search(image_hash, self.max_distance)
+        for distance, candidate in candidates:
+            raw = self.store.get(self.make_key(candidate))
+            if raw is not None:
+                return distance, json.loads(raw)
+            # 已过期或被淘汰；BK树不便删除节点，过期过多时整体重建
+            with self._lock:
+                self._stale += 1
+                if self._tree is not None and self._stale > self._tree.size // 2:
+                    self._tree = None
+        return None
+
+    async def lookup(self, image_hash: int) -> Optional[Dict[str, Any]]:
+        """返回汉明距离阈值内最近的已知识别结果，未命中或出错时返回None"""
+        if not self.enabled:
+            return None
+        self.stats["lookups"] += 1
+        try:
+            found = await asyncio.to_thread(self._lookup_sync, image_hash)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Identification cache read failed: {str(e)}")
+            return None
+
+        if found is None:
+            self.stats["misses"] += 1
+            return None
+        distance, result = found
+        self.stats["hits"] += 1
+        self.stats["exact_hits" if distance == 0 else "near_hits"] += 1
+        self._hit_distance_total += distance
+        logger.info(f"Identification cache hit for {self.make_key(image_hash)} at distance {distance}")
+        return result
+
+    def _record_sync(self, image_hash: int, payload: str):
+        self.store.set(self.make_key(image_hash), payload, self.ttl)
+        with self._lock:
+            self._index().add(image_hash)
+
+    async def record(self, image_hash: int, result: Dict[str, Any], confidence: float):
+        """保存识别结果；低于置信度阈值的结果（如兜底的规则识别）不缓存"""
+        if not self.enabled:
+            return
+        if confidence < self.min_confidence:
+            self.stats["skipped_low_confidence"] += 1
+            return
+        try:
+            await asyncio.to_thread(self._record_sync, image_hash, json.dumps(result, ensure_ascii=False))
+            self.stats["writes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Identification cache write failed: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        lookups = self.stats["lookups"]
+        stats = {
+            **self.stats,
+            "enabled": self.enabled,
+            "max_distance": self.max_distance,
+            "min_confidence": self.min_confidence,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "avg_hit_distance": round(self._hit_distance_total / self.stats["hits"], 2) if self.stats["hits"] else None,
+            "indexed_hashes": self._tree.size if self._tree is not None else None,
+        }
+        try:
+            stats["store"] = self.store.get_stats()
+        except Exception as e:
+            stats["store"] = {"error": str(e)}
+        return stats
+
+
+def _create_identification_cache() -> IdentificationCache:
+    settings = get_settings()
+    store = SQLiteKVStore(
+        path=settings.identification_cache_path,
+        table="identifications",
+        max_entries=settings.identification_cache_max_entries,
+        max_bytes=settings.identification_cache_max_bytes,
+    )
+    return IdentificationCache(
+        store,
+        ttl=settings.identification_cache_ttl,
+        max_distance=settings.identification_cache_max_distance,
+        min_confidence=settings.identification_cache_min_confidence,
+        enabled=settings.identification_cache_enabled,
+    )
+
+
+# 全局识别结果缓存
+identification_cache = _create_identification_cache()
@@ -0,0 +1,350 @@
+"""
+Asynchronous tool identification jobs
+提交后立即返回任务ID，识别流程（视觉模型 + 零售商抓取）在有界的worker池中运行，不再占用HTTP连接；
+客户端轮询任务状态或通过SSE订阅结果。任务在提交它的进程中运行，状态和结果同时写入共享的SQLite存储，
+多个worker进程（gunicorn -w N）中任意一个都能查询和订阅；完成后保留一段时间供查询
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from services.kv_store import SQLiteKVStore
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 推送给订阅者的结束标记
+_END = object()
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+_FINISHED = (COMPLETED, FAILED)
+
+# 排队或运行中的任务在存储中的保留时间；超过这个时间仍未结束的任务视为已丢失
+_ACTIVE_JOB_TTL = 3600
+
+
+class JobFailed(Exception):
+    """任务执行失败，message作为返回给客户端的错误信息"""
+
+
+class IdentificationJob:
+    """单个识别任务"""
+
+    def __init__(self, owner: int, runner: Callable[[], Awaitable[Dict[str, Any]]]):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.runner = runner
+        self.status = QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED
+
+    def to_dict(self, position: Optional[int] = None) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if position is not None:
+            data["queue_position"] = position
+        if self.status == COMPLETED:
+            data["result"] = self.result
+        elif self.status == FAILED:
+            data["error"] = self.error
+        return data
+
+
+class IdentificationJobs:
+    """识别任务队列和worker池"""
+
+    def __init__(self, workers: int, max_queued: int, result_ttl: float,
+                 store: Optional[SQLiteKVStore] = None, poll_interval: float = 0.5, window_size: int = 200):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        # 其他worker进程提交的任务从这里读取
+        self.store = store
+        self.poll_interval = poll_interval
+
+        self._jobs: Dict[str, IdentificationJob] = {}
+        self._queue: Deque[IdentificationJob] = deque()
+        self._reserved = 0
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._running = 0
+        self._queue_waits: Deque[float] = deque(maxlen=window_size)
+        self._run_times: Deque[float] = deque(maxlen=window_size)
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "store_errors": 0,
+        }
+
+    def _ensure_workers(self):
+        """首次提交时在当前事件循环中启动worker"""
+        if self._worker_tasks:
+            return
+        self._wakeup = asyncio.Condition()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Identification job pool started with {self.workers} workers")
+
+    async def stop(self):
+        """取消worker和运行中的任务（在FastAPI shutdown中调用）"""
+        tasks, self._worker_tasks = self._worker_tasks, []
+        self._wakeup = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _prune(self):
+        """删除过期的已完成任务"""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at < cutoff and job_id not in self._subscribers]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def accepting(self) -> bool:
+        """排队任务数（含已预留的名额）未达上限；排满时不接受新任务"""
+        if len(self._queue) + self._reserved >= self.max_queued:
+            self.stats["rejected"] += 1
+            return False
+        return True
+
+    def reserve(self) -> bool:
+        """预留一个排队名额，排满时返回False
+
+        在扣除识别次数、读取上传之前调用，之后必须submit(reserved=True)或release()；
+        并发提交在await期间不会超出max_queued
+        """
+        if not self.accepting():
+            return False
+        self._reserved += 1
+        return True
+
+    def release(self):
+        """归还未使用的预留名额（提交前失败时）"""
+        self._reserved = max(0, self._reserved - 1)
+
+    async def submit(self, owner: int, runner: Callable[[], Awaitable[Dict[str, Any]]],
+                     reserved: bool = False) -> Dict[str, Any]:
+        """排队一个任务（reserved表示使用reserve()预留的名额），返回任务状态"""
+        if reserved:
+            self.release()
+        self._prune()
+        self._ensure_workers()
+        job = IdentificationJob(owner, runner)
+        self._jobs[job.id] = job
+        self._queue.append(job)
+        self.stats["submitted"] += 1
+        async with self._wakeup:
+            self._wakeup.notify()
+        position = len(self._queue)
+        await self._save(job)
+        return job.to_dict(position=position)
+
+    async def _save(self, job: IdentificationJob):
+        """把任务状态写入共享存储，供其他worker进程查询"""
+        if self.store is None:
+            return
+        ttl = self.result_ttl if job.finished else _ACTIVE_JOB_TTL
+        value = json.dumps({"owner": job.owner, **job.to_dict()}, ensure_ascii=False, default=str)
+        try:
+            await asyncio.to_thread(self.store.set, job.id, value, ttl)
+        except Exception as e:
+            self.stats["store_errors"] += 1
+            logger.warning(f"Could not save identification job {job.id}: {str(e)}")
+
+    async def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """从共享存储读取其他进程的任务（含owner）"""
+        if self.store is None:
+            return None
+        try:
+            raw = await asyncio.to_thread(self.store.get, job_id)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            self.stats["store_errors"] += 1
+            logger.warning(f"Could not load identification job {job_id}: {str(e)}")
+            return None
+
+    async def find(self, job_id: str, owner: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """同get，本进程没有的任务从共享存储读取（其他worker提交的任务）"""
+        job = self.get(job_id, owner)
+        if job is not None or job_id in self._jobs:
+            return job
+        data = await self._load(job_id)
+        if data is None:
+            return None
+        job_owner = data.pop("owner", None)
+        if owner is not None and job_owner != owner:
+            return None
+        return data
+
+    def get(self, job_id: str, owner: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """任务状态；owner不匹配时视为不存在"""
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job.to_dict(position=self._position(job))
+
+    def _position(self, job: IdentificationJob) -> Optional[int]:
+        if job.status != QUEUED:
+            return None
+        for position, queued in enumerate(self._queue, start=1):
+            if queued is job:
+                return position
+        return None
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """订阅任务：先返回当前状态，之后返回状态变化，任务结束时返回completed或failed"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            # 其他worker进程的任务：轮询共享存储
+            async for event in self._remote_events(job_id):
+                yield event
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            yield {"event": "job", **job.to_dict(position=self._position(job))}
+            if job.finished:
+                yield {"event": job.status, **job.to_dict()}
+                return
+            while True:
+                event = await queue.get()
+                if event is _END:
+                    return
+                yield event
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    async def _remote_events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        data = await self.find(job_id)
+        if data is None:
+            return
+        yield {"event": "job", **data}
+        status = data["status"]
+        if status in _FINISHED:
+            yield {"event": status, **data}
+            return
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            data = await self.find(job_id)
+            if data is None:
+                # 运行任务的进程退出，任务记录已过期
+                yield {"event": FAILED, "job_id": job_id, "status": FAILED, "error": "Identification job was lost"}
+                return
+            if data["status"] != status:
+                status = data["status"]
+                yield {"event": status, **data}
+                if status in _FINISHED:
+                    return
+
+    def _publish(self, job: IdentificationJob, event: Any):
+        for queue in self._subscribers.get(job.id, ()):
+            queue.put_nowait(event)
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: bool(self._queue))
+                job = self._queue.popleft()
+            await self._run(job)
+
+    async def _run(self, job: IdentificationJob):
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._queue_waits.append(job.started_at - job.created_at)
+        self._running += 1
+        self._publish(job, {"event": RUNNING, **job.to_dict()})
+        await self._save(job)
+        try:
+            job.result = await job.runner()
+            job.status = COMPLETED
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            job.status = FAILED
+            job.error = "Server shutting down"
+            raise
+        except JobFailed as e:
+            job.status = FAILED
+            job.error = str(e)
+            self.stats["failed"] += 1
+        except Exception as e:
+            logger.error(f"Identification job {job.id} failed: {str(e)}")
+            job.status = FAILED
+            job.error = "Identification failed"
+            self.stats["failed"] += 1
+        finally:
+            job.finished_at = time.time()
+            job.runner = None
+            self._running -= 1
+            self._run_times.append(job.finished_at - job.started_at)
+            self._publish(job, {"event": job.status, **job.to_dict()})
+            self._publish(job, _END)
+            await self._save(job)
+
+    @staticmethod
+    def _percentile(values: Deque[float], q: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取任务统计"""
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "queued": len(self._queue),
+            "reserved": self._reserved,
+            "running": self._running,
+            "retained": len(self._jobs),
+            "p50_queue_wait": self._percentile(self._queue_waits, 0.5),
+            "p95_queue_wait": self._percentile(self._queue_waits, 0.95),
+            "p50_run_time": self._percentile(self._run_times, 0.5),
+            "p95_run_time": self._percentile(self._run_times, 0.95),
+        }
+
+
+def _create_identification_jobs() -> IdentificationJobs:
+    settings = get_settings()
+    store = SQLiteKVStore(
+        path=settings.identify_job_store_path,
+        table="identification_jobs",
+        max_entries=settings.identify_job_store_max_entries,
+        max_bytes=settings.identify_job_store_max_bytes,
+    )
+    return IdentificationJobs(
+        workers=settings.identify_job_workers,
+        max_queued=settings.identify_job_max_queued,
+        result_ttl=settings.identify_job_result_ttl,
+        store=store,
+    )
+
+
+# 全局识别任务队列
+identification_jobs = _create_identification_jobs()
@@ -0,0 +1,180 @@
+"""
+Image preprocessing before vision calls
+上传的照片在发给视觉模型前先处理：解码、按EXIF方向摆正、缩小到最大边长、去掉EXIF等元数据、重新编码为JPEG/WebP
+在进程池中执行；模型本身会把大图缩小后再识别，原图分辨率不提高准确率，只增加请求体积、上传时间和token费用
+"""
+import io
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Union
+
+from PIL import Image, ImageOps
+
+from services.identification_cache import phash_image
+from utils.config import get_settings
+from utils.worker_pool import run_cpu_bound
+
+logger = logging.getLogger(__name__)
+
+_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+@dataclass
+class PreparedImage:
+    """预处理结果（在工作进程中生成，必须可pickle）"""
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    width: int
+    height: int
+    original_width: int = 0
+    original_height: int = 0
+    elapsed_ms: float = 0.0
+    processed: bool = True
+    phash: Optional[int] = None  # 64位感知哈希，用于识别结果缓存
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def preprocess_image(source: Union[bytes, str], max_dimension: int, quality: int,
+                     output_format: str = "jpeg") -> PreparedImage:
+    """解码、摆正、缩小、去元数据并重新编码（纯函数，在工作进程中执行）
+
+    source可以是图片内容或文件路径；传路径时原图只在工作进程中读取
+    """
+    start = time.perf_counter()
+    pil_format, mime_type = _FORMATS[output_format]
+
+    if isinstance(source, bytes):
+        image = Image.open(io.BytesIO(source))
+        original_bytes = len(source)
+    else:
+        image = Image.open(source)
+        original_bytes = os.path.getsize(source)
+    original_width, original_height = image.size
+    # JPEG可以在解码时按1/2、1/4、1/8缩小（不小于目标尺寸），大照片省掉大部分解码时间
+    scale = min(1.0, max_dimension / max(original_width, original_height))
+    image.draft("RGB", (int(original_width * scale), int(original_height * scale)))
+    # 先按EXIF方向旋转，否则去掉EXIF后竖拍的照片会横过来
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    # 新建的图像不带info，保存时不会写入EXIF/ICC/XMP
+    output = io.BytesIO()
+    clean = Image.new("RGB", image.size)
+    clean.paste(image)
+    clean.save(output, format=pil_format, quality=quality, optimize=True)
+    # 图像已解码，顺便计算感知哈希，识别时不必再解码一次
+    image_hash = phash_image(clean)
+
+    return PreparedImage(
+        data=output.getvalue(),
+        mime_type=mime_type,
+        original_bytes=original_bytes,
+        width=clean.width,
+        height=clean.height,
+        original_width=original_width,
+        original_height=original_height,
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 1),
+        phash=image_hash,
+    )
+
+
+class ImagePreprocessor:
+    """调用进程池预处理上传图片并统计节省的字节数和耗时"""
+
+    def __init__(self, enabled: bool, max_dimension: int, quality: int, output_format: str, window_size: int = 200):
+        if output_format not in _FORMATS:
+            raise ValueError(f"Unsupported image format {output_format!r}, expected one of {sorted(_FORMATS)}")
+        self.enabled = enabled
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.output_format = output_format
+        self.stats = {
+            "images": 0,
+            "failed": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+        }
+        self._elapsed_ms: Deque[float] = deque(maxlen=window_size)
+
+    @staticmethod
+    def _unprocessed(source: Union[bytes, str]) -> PreparedImage:
+        # 传入路径时不读入原图，由调用方按需自行编码（processed=False）
+        if isinstance(source, bytes):
+            return PreparedImage(data=source, mime_type="image/jpeg", original_bytes=len(source),
+                                 width=0, height=0, processed=False)
+        return PreparedImage(data=b"", mime_type="image/jpeg", original_bytes=os.path.getsize(source),
+                             width=0, height=0, processed=False)
+
+    async def prepare(self, source: Union[bytes, str]) -> PreparedImage:
+        """返回发给视觉模型的图片；未启用或无法解码时原样返回"""
+        if not self.enabled:
+            return self._unprocessed(source)
+        try:
+            prepared = await run_cpu_bound(preprocess_image, source, self.max_dimension, self.quality,
+                                           self.output_format)
+        except Exception as e:
+            # 交给模型自己判断（通常是不支持的格式或损坏的文件）
+            self.stats["failed"] += 1
+            fallback = self._unprocessed(source)
+            logger.warning(f"Image preprocessing failed ({fallback.original_bytes} bytes), "
+                           f"sending original: {str(e)}")
+            return fallback
+
+        self.stats["images"] += 1
+        self.stats["bytes_in"] += prepared.original_bytes
+        self.stats["bytes_out"] += len(prepared.data)
+        self._elapsed_ms.append(prepared.elapsed_ms)
+        logger.info(f"Image preprocessed {prepared.original_width}x{prepared.original_height} -> "
+                    f"{prepared.width}x{prepared.height}, {prepared.original_bytes} -> {len(prepared.data)} bytes "
+                    f"({prepared.bytes_saved} saved) in {prepared.elapsed_ms}ms")
+        return prepared
+
+    def _percentile(self, q: float) -> Optional[float]:
+        if not self._elapsed_ms:
+            return None
+        ordered = sorted(self._elapsed_ms)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预处理统计"""
+        bytes_in = self.stats["bytes_in"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "max_dimension": self.max_dimension,
+            "format": self.output_format,
+            "bytes_saved": bytes_in - self.stats["bytes_out"],
+            "size_ratio": round(self.stats["bytes_out"] / bytes_in, 3) if bytes_in else None,
+            "p50_ms": self._percentile(0.5),
+            "p95_ms": self._percentile(0.95),
+        }
+
+
+def _create_image_preprocessor() -> ImagePreprocessor:
+    settings = get_settings()
+    return ImagePreprocessor(
+        enabled=settings.image_preprocess_enabled,
+        max_dimension=settings.image_max_dimension,
+        quality=settings.image_quality,
+        output_format=settings.image_format,
+    )
+
+
+# 全局图片预处理器
+image_preprocessor = _create_image_preprocessor()
@@ -0,0 +1,125 @@
+"""
+Persistent key/value store
+基于SQLite的持久化键值存储：每个条目带过期时间，按条目数和字节数做LRU淘汰
+同步接口，异步调用方通过 asyncio.to_thread 使用
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteKVStore:
+    """单表SQLite键值存储，进程内共享一个连接"""
+
+    def __init__(self, path: str, table: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats = {"evictions": 0, "expired": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        """懒加载连接并建表"""
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_access ON {self.table} (last_access)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """读取未过期的值，并刷新访问时间"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.stats["expired"] += 1
+                return None
+            conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        """写入值，超出容量时淘汰最久未访问的条目"""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now + ttl, now),
+            )
+            self._evict(conn, now)
+
+    def items(self) -> List[Tuple[str, str]]:
+        """所有未过期的条目（用于启动时重建内存索引），不刷新访问时间"""
+        with self._lock:
+            return self._connect().execute(
+                f"SELECT key, value FROM {self.table} WHERE expires_at > ?", (time.time(),)
+            ).fetchall()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """先清理过期条目，再按LRU淘汰到容量以内"""
+        expired = conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)).rowcount
+        self.stats["expired"] += max(0, expired)
+
+        entries, total_bytes = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access").fetchall():
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            entries -= 1
+            total_bytes -= size
+            evicted += 1
+        self.stats["evictions"] += evicted
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计"""
+        with self._lock:
+            entries, total_bytes = self._connect().execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+        return {
+            **self.stats,
+            "path": self.path,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
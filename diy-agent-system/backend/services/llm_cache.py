@@ -0,0 +1,126 @@
+"""
+LLM response cache
+按 (模型 + 完整prompt) 的内容哈希缓存模型输出，持久化到SQLite
+重复导入同一页面时直接返回上次的结果，统计命中率和节省的token
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from services.kv_store import SQLiteKVStore
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """LLM输出的内容哈希缓存"""
+
+    def __init__(self, store: SQLiteKVStore, ttl: float, enabled: bool = True):
+        self.store = store
+        self.ttl = ttl
+        self.enabled = enabled
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "writes": 0,
+            "errors": 0,
+            "discarded": 0,
+            "prompt_tokens_saved": 0,
+            "completion_tokens_saved": 0,
+            "latency_saved": 0.0,
+        }
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], **params: Any) -> str:
+        """模型名 + 消息 + 影响输出的参数的sha256"""
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的响应，未命中或出错时返回None；无法解析的条目视为未命中并删除"""
+        try:
+            raw = await asyncio.to_thread(self.store.get, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"LLM cache read failed: {str(e)}")
+            return None
+
+        if raw is None:
+            self.stats["misses"] += 1
+            return None
+
+        try:
+            cached = json.loads(raw)
+            if not isinstance(cached, dict) or not isinstance(cached.get("content"), str):
+                raise ValueError("not a cached LLM response")
+        except ValueError as e:
+            logger.warning(f"Discarding unreadable LLM cache entry: {str(e)}")
+            self.stats["misses"] += 1
+            await self.discard(key)
+            return None
+
+        self.stats["hits"] += 1
+        self.stats["prompt_tokens_saved"] += cached.get("prompt_tokens", 0)
+        self.stats["completion_tokens_saved"] += cached.get("completion_tokens", 0)
+        self.stats["latency_saved"] += cached.get("latency", 0.0)
+        return cached
+
+    async def set(self, key: str, response: Dict[str, Any]):
+        """写入响应，写入失败只记录日志"""
+        try:
+            await asyncio.to_thread(self.store.set, key, json.dumps(response, ensure_ascii=False), self.ttl)
+            self.stats["writes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"LLM cache write failed: {str(e)}")
+
+    async def discard(self, key: str):
+        """删除无效的条目（损坏或调用方无法解析的回复）"""
+        self.stats["discarded"] += 1
+        try:
+            await asyncio.to_thread(self.store.delete, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"LLM cache delete failed: {str(e)}")
+
+    def record_bypass(self):
+        self.stats["bypassed"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        stats = {
+            **self.stats,
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "tokens_saved": self.stats["prompt_tokens_saved"] + self.stats["completion_tokens_saved"],
+            "latency_saved": round(self.stats["latency_saved"], 3),
+        }
+        try:
+            stats["store"] = self.store.get_stats()
+        except Exception as e:
+            stats["store"] = {"error": str(e)}
+        return stats
+
+
+def _create_llm_cache() -> LLMResponseCache:
+    settings = get_settings()
+    store = SQLiteKVStore(
+        path=settings.llm_cache_path,
+        table="llm_responses",
+        max_entries=settings.llm_cache_max_entries,
+        max_bytes=settings.llm_cache_max_bytes,
+    )
+    return LLMResponseCache(store, ttl=settings.llm_cache_ttl, enabled=settings.llm_cache_enabled)
+
+
+# 全局LLM响应缓存
+llm_cache = _create_llm_cache()
@@ -0,0 +1,381 @@
+"""
+Shared async LLM gateway
+所有OpenAI调用共用一个异步客户端：连接池、并发上限、单次调用超时、延迟/token统计
+需要JSON结果的调用走流式接口，边接收边解析，字段齐全或对象闭合后即返回
+base_url可配置，便于指向本地的OpenAI兼容服务做测试
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import httpx
+from openai import APITimeoutError, AsyncOpenAI
+
+from services.llm_cache import llm_cache
+from services.streaming_json import IncrementalJSONObject
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LLMResponse:
+    """一次LLM调用的结果"""
+    content: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+
+
+@dataclass
+class JSONProgress:
+    """流式JSON调用的一次进度：目前已解析完成的顶层字段"""
+    fields: Dict[str, Any]
+    complete: bool = False
+    from_cache: bool = False
+
+
+class _CallMetrics:
+    """按用途统计调用次数、错误、token和延迟分位数"""
+
+    def __init__(self, window_size: int = 200):
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.streams = 0
+        self.early_returns = 0
+        self._latencies: Deque[float] = deque(maxlen=window_size)
+        self._first_field_latencies: Deque[float] = deque(maxlen=window_size)
+
+    def record(self, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self._latencies.append(latency)
+
+    def record_first_field(self, latency: float):
+        self._first_field_latencies.append(latency)
+
+    @staticmethod
+    def _percentile(values: Deque[float], q: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "streams": self.streams,
+            "early_returns": self.early_returns,
+            "p50_latency": self._percentile(self._latencies, 0.5),
+            "p95_latency": self._percentile(self._latencies, 0.95),
+            "p50_first_field_latency": self._percentile(self._first_field_latencies, 0.5),
+        }
+
+
+class LLMGateway:
+    """共享的异步OpenAI客户端"""
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str], max_concurrency: int,
+                 timeout: float, max_connections: int, max_keepalive_connections: int, max_retries: int):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.max_retries = max_retries
+
+        self._client: Optional[AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight = 0
+        self._metrics: Dict[str, _CallMetrics] = {}
+        # 事件循环更换时被替换的旧客户端
+        self._retired_clients = {"closed": 0, "dropped": 0}
+
+    @property
+    def enabled(self) -> bool:
+        """是否配置了API key（或本地兼容服务）"""
+        return bool(self.api_key or self.base_url)
+
+    def _get_client(self) -> AsyncOpenAI:
+        """按事件循环懒加载客户端（脚本中多次asyncio.run时重建，避免连接跨循环复用）"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._retire_client(self._client, self._loop)
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                ),
+                timeout=self.timeout,
+            )
+            self._client = AsyncOpenAI(
+                # 本地兼容服务通常不校验key
+                api_key=self.api_key or "local",
+                base_url=self.base_url,
+                http_client=http_client,
+                max_retries=self.max_retries,
+                timeout=self.timeout,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+            logger.info(f"LLM gateway client created (base_url={self.base_url or 'default'}, "
+                        f"concurrency={self.max_concurrency})")
+        return self._client
+
+    def _retire_client(self, client: AsyncOpenAI, loop: Optional[asyncio.AbstractEventLoop]):
+        """释放旧事件循环上的客户端：循环仍在运行（其他线程）时在该循环上关闭连接池，
+        已结束的循环无法再关闭其上的连接，只丢弃引用
+        """
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            try:
+                asyncio.run_coroutine_threadsafe(client.close(), loop)
+                self._retired_clients["closed"] += 1
+                return
+            except RuntimeError:
+                pass
+        self._retired_clients["dropped"] += 1
+        logger.debug("LLM gateway client from a finished event loop dropped")
+
+    def _check_enabled(self):
+        if not self.enabled:
+            raise RuntimeError("LLM gateway is not configured (OPENAI_API_KEY / OPENAI_BASE_URL)")
+
+    async def _cache_lookup(self, messages: List[Dict[str, Any]], model: str, max_tokens: Optional[int],
+                            temperature: Optional[float], metrics: _CallMetrics, purpose: str,
+                            use_cache: bool, bypass_cache: bool) -> Tuple[Optional[str], Optional[LLMResponse]]:
+        """返回 (缓存key, 命中的结果)；未启用缓存时key为None"""
+        if not use_cache or not llm_cache.enabled:
+            return None, None
+        cache_key = llm_cache.make_key(model, messages, max_tokens=max_tokens, temperature=temperature)
+        if bypass_cache:
+            llm_cache.record_bypass()
+            return cache_key, None
+        cached = await llm_cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+        metrics.cache_hits += 1
+        logger.info(f"LLM cache hit [{purpose}] model={model} "
+                    f"saved {cached['prompt_tokens'] + cached['completion_tokens']} tokens")
+        return cache_key, LLMResponse(**{**cached, "latency": 0.0})
+
+    def _params(self, messages: List[Dict[str, Any]], model: str, max_tokens: Optional[int],
+                temperature: Optional[float], timeout: Optional[float]) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"model": model, "messages": messages, "timeout": timeout or self.timeout}
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        if temperature is not None:
+            params["temperature"] = temperature
+        return params
+
+    @staticmethod
+    def _record_error(metrics: _CallMetrics, error: Exception):
+        metrics.errors += 1
+        if isinstance(error, (APITimeoutError, asyncio.TimeoutError)):
+            metrics.timeouts += 1
+
+    async def chat(self, messages: List[Dict[str, Any]], model: str, max_tokens: Optional[int] = None,
+                   temperature: Optional[float] = None, timeout: Optional[float] = None,
+                   purpose: str = "default", use_cache: bool = False,
+                   bypass_cache: bool = False) -> LLMResponse:
+        """调用chat.completions，受并发上限约束，失败时抛出原始异常
+
+        use_cache=True 时先查内容哈希缓存，命中则不调用模型；
+        bypass_cache=True 时跳过读取，但仍用新结果覆盖缓存
+        """
+        self._check_enabled()
+        metrics = self._metrics.setdefault(purpose, _CallMetrics())
+        cache_key, cached = await self._cache_lookup(messages, model, max_tokens, temperature, metrics,
+                                                     purpose, use_cache, bypass_cache)
+        if cached is not None:
+            return cached
+
+        client = self._get_client()
+        params = self._params(messages, model, max_tokens, temperature, timeout)
+
+        async with self._semaphore:
+            self._in_flight += 1
+            start = time.monotonic()
+            try:
+                response = await client.chat.completions.create(**params)
+            except Exception as e:
+                self._record_error(metrics, e)
+                raise
+            finally:
+                self._in_flight -= 1
+            latency = time.monotonic() - start
+
+        usage = response.usage
+        result = LLMResponse(
+            content=response.choices[0].message.content or "",
+            model=response.model or model,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            latency=latency,
+        )
+        metrics.record(latency, result.prompt_tokens, result.completion_tokens)
+        logger.info(f"LLM call [{purpose}] model={model} latency={latency:.2f}s "
+                    f"tokens={result.prompt_tokens}+{result.completion_tokens}")
+        if cache_key is not None and result.content:
+            await llm_cache.set(cache_key, asdict(result))
+        return result
+
+    async def stream_json(self, messages: List[Dict[str, Any]], model: str, max_tokens: Optional[int] = None,
+                          temperature: Optional[float] = None, timeout: Optional[float] = None,
+                          purpose: str = "default", use_cache: bool = False, bypass_cache: bool = False,
+                          required: Tuple[str, ...] = ()) -> AsyncIterator[JSONProgress]:
+        """流式调用chat.completions，边接收边解析回复中的JSON对象
+
+        每有顶层字段解析完成就yield一次当前全部字段；对象闭合后立即断开连接，不再等待之后的说明文字。
+        调用方可以在拿到需要的字段后提前结束迭代（用contextlib.aclosing确保连接及时关闭）。
+        缓存命中时直接yield完整对象；完整对象按原文写入缓存，与chat()共用。
+        只缓存能完整解析且包含required字段的回复，缓存中无法解析的条目删除后重新调用模型
+        """
+        self._check_enabled()
+        metrics = self._metrics.setdefault(purpose, _CallMetrics())
+        cache_key, cached = await self._cache_lookup(messages, model, max_tokens, temperature, metrics,
+                                                     purpose, use_cache, bypass_cache)
+        if cached is not None:
+            parser = IncrementalJSONObject()
+            parser.feed(cached.content)
+            if parser.complete and all(field in parser.fields for field in required):
+                yield JSONProgress(fields=dict(parser.fields), complete=True, from_cache=True)
+                return
+            # 旧版本写入或不再满足调用方要求的回复：当作未命中
+            await llm_cache.discard(cache_key)
+
+        client = self._get_client()
+        params = self._params(messages, model, max_tokens, temperature, timeout)
+        # 正常结束时带上usage；提前断开时按收到的chunk数估算completion tokens
+        params["stream"] = True
+        params["extra_body"] = {"stream_options": {"include_usage": True}}
+
+        parser = IncrementalJSONObject()
+        usage = None
+        chunks = 0
+        first_field_at = None
+        async with self._semaphore:
+            self._in_flight += 1
+            metrics.streams += 1
+            start = time.monotonic()
+            stream = None
+            try:
+                stream = await client.chat.completions.create(**params)
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    chunks += 1
+                    if parser.feed(delta):
+                        if first_field_at is None:
+                            first_field_at = time.monotonic() - start
+                            metrics.record_first_field(first_field_at)
+                        yield JSONProgress(fields=dict(parser.fields), complete=parser.complete)
+                    if parser.complete:
+                        break
+            except GeneratorExit:
+                # 调用方拿到需要的字段后提前结束
+                metrics.early_returns += 1
+                metrics.record(time.monotonic() - start, 0, chunks)
+                raise
+            except Exception as e:
+                self._record_error(metrics, e)
+                raise
+            finally:
+                self._in_flight -= 1
+                if stream is not None:
+                    await stream.response.aclose()
+            latency = time.monotonic() - start
+
+        result = LLMResponse(
+            content=parser.object_text if parser.complete else parser.text,
+            model=model,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else chunks,
+            latency=latency,
+        )
+        metrics.record(latency, result.prompt_tokens, result.completion_tokens)
+        logger.info(f"LLM stream [{purpose}] model={model} latency={latency:.2f}s "
+                    f"first_field={first_field_at or 0:.2f}s fields={len(parser.fields)} "
+                    f"complete={parser.complete} tokens={result.prompt_tokens}+{result.completion_tokens}")
+        if parser.invalid_members:
+            logger.warning(f"LLM stream [{purpose}] dropped malformed fields: {parser.invalid_members}")
+        usable = (parser.complete and not parser.invalid_members
+                  and all(field in parser.fields for field in required))
+        if cache_key is not None and usable:
+            await llm_cache.set(cache_key, asdict(result))
+
+    async def chat_json(self, messages: List[Dict[str, Any]], model: str, required: Tuple[str, ...] = (),
+                        return_when: Optional[Tuple[str, ...]] = None, **kwargs) -> Dict[str, Any]:
+        """流式调用并返回解析出的JSON对象（参数同stream_json）
+
+        对象闭合即返回，忽略之后的说明文字；指定return_when时这些字段齐全就返回，不再等待对象剩余部分。
+        回复被截断（如达到max_tokens）时返回已完整解析的字段；缺少required字段时抛出ValueError
+        """
+        fields: Dict[str, Any] = {}
+        async with aclosing(self.stream_json(messages, model, required=required, **kwargs)) as progress:
+            async for update in progress:
+                fields = update.fields
+                if return_when and all(field in fields for field in return_when):
+                    break
+
+        missing = [field for field in required if field not in fields]
+        if not fields or missing:
+            raise ValueError(f"LLM response missing required JSON fields: {missing or list(required) or 'any'}")
+        return fields
+
+    async def close(self):
+        """关闭底层连接池和缓存连接（在FastAPI shutdown中调用）"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._loop = None
+        llm_cache.store.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取网关统计"""
+        return {
+            "enabled": self.enabled,
+            "base_url": self.base_url,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "retired_clients": dict(self._retired_clients),
+            "by_purpose": {purpose: metrics.to_dict() for purpose, metrics in self._metrics.items()},
+            "cache": llm_cache.get_stats(),
+        }
+
+
+def _create_llm_gateway() -> LLMGateway:
+    settings = get_settings()
+    return LLMGateway(
+        api_key=settings.openai_api_key or os.getenv("OPENAI_API_KEY"),
+        base_url=settings.openai_base_url,
+        max_concurrency=settings.llm_max_concurrency,
+        timeout=settings.llm_timeout,
+        max_connections=settings.llm_pool_limit,
+        max_keepalive_connections=settings.llm_pool_keepalive,
+        max_retries=settings.llm_max_retries,
+    )
+
+
+# 全局LLM网关
+llm_gateway = _create_llm_gateway()
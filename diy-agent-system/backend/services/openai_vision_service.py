@@ -1,45 +1,41 @@
 """
 OpenAI GPT-4 Vision Service for Image Analysis
 """
-import os
-import base64
 import logging
-from typing import Dict, List, Optional, Any
-import openai
-from openai import OpenAI
-import json
+from typing import Dict, List, Optional, Tuple, Any
+
+from services.llm_gateway import llm_gateway
 
 logger = logging.getLogger(__name__)
 
 class OpenAIVisionService:
     """Service for analyzing images using OpenAI GPT-4 Vision"""
     
+    # Responses are streamed and parsed as they arrive; without these fields the response is rejected
+    DIY_REQUIRED_FIELDS = ("project_name", "materials", "tools")
+    TOOL_REQUIRED_FIELDS = ("tool_name",)
+    
     def __init__(self):
-        """Initialize OpenAI client"""
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
+        """Use the shared LLM gateway"""
+        if not llm_gateway.enabled:
             logger.warning("OpenAI API key not found, vision features will use mock data")
-            self.client = None
         else:
-            try:
-                self.client = OpenAI(api_key=api_key)
-                logger.info("OpenAI Vision service initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize OpenAI client: {e}")
-                self.client = None
+            logger.info("OpenAI Vision service initialized successfully")
     
-    async def analyze_diy_project(self, image_base64: str, project_description: str = "") -> Dict[str, Any]:
+    async def analyze_diy_project(self, image_base64: str, project_description: str = "",
+                                  mime_type: str = "image/jpeg") -> Dict[str, Any]:
         """
         Analyze DIY project image and extract information
         
         Args:
             image_base64: Base64 encoded image
             project_description: Optional description from user
+            mime_type: MIME type of the encoded image
             
         Returns:
             Dictionary containing project analysis
         """
-        if not self.client:
+        if not llm_gateway.enabled:
             logger.info("Using mock data - OpenAI API not configured")
             return self._get_mock_diy_analysis()
         
@@ -74,7 +70,7 @@ class OpenAIVisionService:
             }}
             """
             
-            response = self.client.chat.completions.create(
+            return await llm_gateway.chat_json(
                 model="gpt-4o",
                 messages=[
                     {
@@ -84,48 +80,40 @@ class OpenAIVisionService:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
+                                    "url": f"data:{mime_type};base64,{image_base64}"
                                 }
                             }
                         ]
                     }
                 ],
-                max_tokens=2000
+                max_tokens=2000,
+                purpose="diy_analysis",
+                required=self.DIY_REQUIRED_FIELDS
             )
-            
-            # Parse the JSON response
-            result_text = response.choices[0].message.content
-            
-            # Try to extract JSON from the response
-            try:
-                # Find JSON content between curly braces
-                start_idx = result_text.find('{')
-                end_idx = result_text.rfind('}') + 1
-                if start_idx != -1 and end_idx != 0:
-                    json_str = result_text[start_idx:end_idx]
-                    return json.loads(json_str)
-                else:
-                    logger.error("No JSON found in OpenAI response")
-                    return self._get_mock_diy_analysis()
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse OpenAI response as JSON: {e}")
-                return self._get_mock_diy_analysis()
                 
         except Exception as e:
             logger.error(f"OpenAI Vision API error: {e}")
             return self._get_mock_diy_analysis()
     
-    async def identify_tool(self, image_base64: str) -> Dict[str, Any]:
+    async def identify_tool(self, image_base64: str, fields: Optional[Tuple[str, ...]] = None,
+                            mime_type: str = "image/jpeg") -> Dict[str, Any]:
         """
         Identify tool from image
         
         Args:
             image_base64: Base64 encoded image
+            fields: Return as soon as these fields are parsed instead of waiting for the
+                rest of the response (e.g. the alternatives list)
+            mime_type: MIME type of the encoded image
             
         Returns:
-            Dictionary containing tool identification
+            Dictionary containing tool identification (mock data when the API is not configured)
+            
+        Raises:
+            Exception: the API call failed or the response was unusable; callers decide the
+                fallback so that failures are never mistaken for real identifications
         """
-        if not self.client:
+        if not llm_gateway.enabled:
             logger.info("Using mock data - OpenAI API not configured")
             return self._get_mock_tool_identification()
         
@@ -137,6 +125,7 @@ class OpenAIVisionService:
                 "category": "power tool/hand tool/measuring/safety/other",
                 "brand": "identified brand or 'Unknown'",
                 "model": "model number if visible or 'Unknown'",
+                "confidence": 0.0-1.0 how certain you are of the tool, brand and model,
                 "primary_use": "main purpose of this tool",
                 "features": ["feature 1", "feature 2"],
                 "condition": "new/good/fair/poor",
@@ -152,7 +141,7 @@ class OpenAIVisionService:
             }
             """
             
-            response = self.client.chat.completions.create(
+            return await llm_gateway.chat_json(
                 model="gpt-4o",
                 messages=[
                     {
@@ -162,34 +151,21 @@ class OpenAIVisionService:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
+                                    "url": f"data:{mime_type};base64,{image_base64}"
                                 }
                             }
                         ]
                     }
                 ],
-                max_tokens=1000
+                max_tokens=1000,
+                purpose="tool_identification",
+                required=self.TOOL_REQUIRED_FIELDS,
+                return_when=fields
             )
-            
-            # Parse the JSON response
-            result_text = response.choices[0].message.content
-            
-            try:
-                start_idx = result_text.find('{')
-                end_idx = result_text.rfind('}') + 1
-                if start_idx != -1 and end_idx != 0:
-                    json_str = result_text[start_idx:end_idx]
-                    return json.loads(json_str)
-                else:
-                    logger.error("No JSON found in OpenAI response")
-                    return self._get_mock_tool_identification()
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse OpenAI response as JSON: {e}")
-                return self._get_mock_tool_identification()
                 
         except Exception as e:
             logger.error(f"OpenAI Vision API error: {e}")
-            return self._get_mock_tool_identification()
+            raise
     
     def _get_mock_diy_analysis(self) -> Dict[str, Any]:
         """Return mock DIY analysis data"""
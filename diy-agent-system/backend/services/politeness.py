@@ -0,0 +1,356 @@
+"""
+Per-domain politeness scheduler
+所有对外抓取（PriceScraper、ProductScraper、ProductInfoAgent）共用的按域名令牌桶限速
+请求按优先级排队（交互式识别优先于后台导入和价格刷新）；被限流（429/503）时降速，正常响应时缓慢提速（AIMD），
+使每个域名保持在不被封的最高速率；同时记录排队等待时间
+排队时间有上限（按优先级配置，可逐次覆盖）：预计或实际超过时抛出PolitenessTimeout，调用方走回退路径
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# 当前任务的抓取优先级；asyncio任务创建时继承，后台任务在入口处设置即可，不必逐层传参
+_scrape_priority: ContextVar[int] = ContextVar("scrape_priority", default=PRIORITY_INTERACTIVE)
+
+# 被限流的状态码
+THROTTLE_STATUSES = (429, 503)
+
+
+class PolitenessTimeout(TimeoutError):
+    """排队等待超过max_wait（或预计会超过）时抛出，请求未发送"""
+
+
+@contextmanager
+def scrape_priority(priority: int) -> Iterator[None]:
+    """在该上下文（及其中创建的asyncio任务）内发起的抓取使用指定优先级"""
+    token = _scrape_priority.set(priority)
+    try:
+        yield
+    finally:
+        _scrape_priority.reset(token)
+
+
+def current_priority() -> int:
+    return _scrape_priority.get()
+
+
+class _WaitStats:
+    """最近的排队等待时间"""
+
+    def __init__(self, window_size: int = 200):
+        self.requests = 0
+        self.queued = 0
+        self.rejected = 0
+        self._waits: Deque[float] = deque(maxlen=window_size)
+
+    def record(self, wait: float):
+        self.requests += 1
+        if wait > 0:
+            self.queued += 1
+        self._waits.append(wait)
+
+    def _percentile(self, q: float) -> Optional[float]:
+        if not self._waits:
+            return None
+        ordered = sorted(self._waits)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "p50_wait": self._percentile(0.5),
+            "p95_wait": self._percentile(0.95),
+        }
+
+
+class DomainBucket:
+    """单个域名的令牌桶和优先级等待队列（线程安全，asyncio和同步调用方共用）
+
+    只有队首等待令牌（按补充速率计算等待时间）；其余等待者不轮询，队首变化时由桶唤醒新的队首
+    """
+
+    def __init__(self, domain: str, rate: float, burst: int, min_rate: float, max_rate: float,
+                 increase_step: float, backoff_factor: float):
+        self.domain = domain
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.backoff_factor = backoff_factor
+
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int]] = []
+        self._wakeups: Dict[Tuple[int, int], Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.wait_stats: Dict[int, _WaitStats] = {}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def enqueue(self, ticket: Tuple[int, int], wakeup: Callable[[], None]) -> float:
+        """加入等待队列，返回按当前速率预计的等待秒数；wakeup在该等待者成为队首时被调用（可能来自其他线程）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            ahead = sum(1 for waiter in self._waiters if waiter < ticket)
+            heapq.heappush(self._waiters, ticket)
+            self._wakeups[ticket] = wakeup
+            return max(0.0, (ahead + 1 - self.tokens) / self.rate)
+
+    def cancel(self, ticket: Tuple[int, int]):
+        """等待者放弃（任务取消等）时移出队列"""
+        with self._lock:
+            self._wakeups.pop(ticket, None)
+            if ticket in self._waiters:
+                was_head = self._waiters[0] == ticket
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                if was_head:
+                    self._wake_head()
+
+    def _wake_head(self):
+        while self._waiters:
+            try:
+                self._wakeups[self._waiters[0]]()
+                return
+            except RuntimeError:
+                # 等待者的事件循环已关闭，丢弃它，唤醒下一个
+                self._wakeups.pop(heapq.heappop(self._waiters), None)
+
+    def try_take(self, ticket: Tuple[int, int]) -> Optional[float]:
+        """队首且有令牌时取走令牌返回0；队首但没有令牌时返回需要等待的秒数；
+        不是队首时返回None，等成为队首时被唤醒
+        """
+        with self._lock:
+            if not self._waiters or self._waiters[0] != ticket:
+                return None
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= 1:
+                heapq.heappop(self._waiters)
+                self._wakeups.pop(ticket, None)
+                self.tokens -= 1
+                self._wake_head()
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def record_wait(self, priority: int, wait: float):
+        with self._lock:
+            self.wait_stats.setdefault(priority, _WaitStats()).record(wait)
+
+    def record_rejected(self, priority: int):
+        with self._lock:
+            self.wait_stats.setdefault(priority, _WaitStats()).rejected += 1
+
+    def feedback(self, status: int):
+        """根据响应状态调整速率：429/503乘性降速并清空令牌，其余非5xx响应加性提速"""
+        with self._lock:
+            if status in THROTTLE_STATUSES:
+                previous = self.rate
+                self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+                self.tokens = min(self.tokens, 0.0)
+                self.throttled += 1
+                logger.warning(f"{self.domain} throttled us (HTTP {status}), "
+                               f"rate {previous:.2f} -> {self.rate:.2f} req/s")
+            elif status < 500:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate": round(self.rate, 3),
+                "tokens": round(self.tokens, 2),
+                "waiting": len(self._waiters),
+                "throttled": self.throttled,
+                "by_priority": {_PRIORITY_NAMES.get(priority, str(priority)): stats.to_dict()
+                                for priority, stats in sorted(self.wait_stats.items())},
+            }
+
+
+class PolitenessScheduler:
+    """进程级的按域名限速调度器"""
+
+    def __init__(self, enabled: bool, rate: float, burst: int, min_rate: float, max_rate: float,
+                 increase_step: float, backoff_factor: float, max_wait: float = 0,
+                 background_max_wait: float = 0):
+        self.enabled = enabled
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.backoff_factor = backoff_factor
+        # 各优先级的默认最长排队秒数，0表示不限
+        self.max_wait = {PRIORITY_INTERACTIVE: max_wait, PRIORITY_BACKGROUND: background_max_wait}
+
+        self._buckets: Dict[str, DomainBucket] = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    @staticmethod
+    def domain_for(url: str) -> str:
+        """按host限速（忽略www.前缀和端口）"""
+        host = (urlparse(url).hostname or url).lower()
+        return host[4:] if host.startswith("www.") else host
+
+    def bucket(self, domain: str) -> DomainBucket:
+        with self._lock:
+            if domain not in self._buckets:
+                self._buckets[domain] = DomainBucket(
+                    domain, rate=self.rate, burst=self.burst, min_rate=self.min_rate, max_rate=self.max_rate,
+                    increase_step=self.increase_step, backoff_factor=self.backoff_factor,
+                )
+            return self._buckets[domain]
+
+    def _ticket(self, priority: Optional[int]) -> Tuple[int, int]:
+        # 同优先级按到达顺序
+        return (current_priority() if priority is None else priority, next(self._sequence))
+
+    def _deadline(self, priority: int, max_wait: Optional[float], start: float) -> Optional[float]:
+        limit = self.max_wait.get(priority, 0) if max_wait is None else max_wait
+        return start + limit if limit and limit > 0 else None
+
+    @staticmethod
+    def _next_timeout(bucket: DomainBucket, delay: Optional[float], deadline: Optional[float]) -> Optional[float]:
+        """下一次等待的超时（None为等到被唤醒）；已知赶不上deadline时抛出PolitenessTimeout"""
+        if deadline is None:
+            return delay
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (delay is not None and delay > remaining):
+            raise PolitenessTimeout(f"Gave up waiting for a request slot on {bucket.domain}")
+        return remaining if delay is None else delay
+
+    def _reject(self, bucket: DomainBucket, ticket: Tuple[int, int]):
+        bucket.cancel(ticket)
+        bucket.record_rejected(ticket[0])
+        logger.info(f"Politeness queue for {bucket.domain} is over its max wait, "
+                    f"rejecting {_PRIORITY_NAMES.get(ticket[0], str(ticket[0]))} request")
+
+    async def acquire(self, url: str, priority: Optional[int] = None, max_wait: Optional[float] = None) -> float:
+        """等待该域名的发送名额，返回排队秒数；priority默认取当前上下文的优先级
+
+        max_wait: 最长排队秒数，None使用该优先级的默认值，0表示不限；
+        预计或实际超过时抛出PolitenessTimeout（请求不发送）
+        """
+        if not self.enabled:
+            return 0.0
+        bucket = self.bucket(self.domain_for(url))
+        ticket = self._ticket(priority)
+        start = time.monotonic()
+        deadline = self._deadline(ticket[0], max_wait, start)
+        queued = False
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        expected = bucket.enqueue(ticket, lambda: loop.call_soon_threadsafe(wakeup.set))
+        try:
+            self._next_timeout(bucket, expected or None, deadline)
+            while True:
+                # 先清除再检查，检查之后的唤醒不会丢失
+                wakeup.clear()
+                delay = bucket.try_take(ticket)
+                if delay == 0:
+                    break
+                queued = True
+                timeout = self._next_timeout(bucket, delay, deadline)
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except PolitenessTimeout:
+            self._reject(bucket, ticket)
+            raise
+        except BaseException:
+            bucket.cancel(ticket)
+            raise
+        wait = time.monotonic() - start if queued else 0.0
+        bucket.record_wait(ticket[0], wait)
+        return wait
+
+    def acquire_blocking(self, url: str, priority: Optional[int] = None, max_wait: Optional[float] = None) -> float:
+        """同步版acquire，供requests等同步抓取代码使用（会阻塞当前线程）"""
+        if not self.enabled:
+            return 0.0
+        bucket = self.bucket(self.domain_for(url))
+        ticket = self._ticket(priority)
+        start = time.monotonic()
+        deadline = self._deadline(ticket[0], max_wait, start)
+        queued = False
+        wakeup = threading.Event()
+        expected = bucket.enqueue(ticket, wakeup.set)
+        try:
+            self._next_timeout(bucket, expected or None, deadline)
+            while True:
+                wakeup.clear()
+                delay = bucket.try_take(ticket)
+                if delay == 0:
+                    break
+                queued = True
+                wakeup.wait(self._next_timeout(bucket, delay, deadline))
+        except PolitenessTimeout:
+            self._reject(bucket, ticket)
+            raise
+        except BaseException:
+            bucket.cancel(ticket)
+            raise
+        wait = time.monotonic() - start if queued else 0.0
+        bucket.record_wait(ticket[0], wait)
+        return wait
+
+    def feedback(self, url: str, status: int):
+        """上报响应状态码，用于调整该域名的速率"""
+        if self.enabled:
+            self.bucket(self.domain_for(url)).feedback(status)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各域名的速率、队列长度和排队等待时间"""
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {
+            "enabled": self.enabled,
+            "default_rate": self.rate,
+            "burst": self.burst,
+            "max_wait": {_PRIORITY_NAMES[priority]: limit for priority, limit in self.max_wait.items()},
+            "domains": {domain: bucket.get_stats() for domain, bucket in sorted(buckets.items())},
+        }
+
+
+def _create_politeness_scheduler() -> PolitenessScheduler:
+    settings = get_settings()
+    return PolitenessScheduler(
+        enabled=settings.politeness_enabled,
+        rate=settings.politeness_rate,
+        burst=settings.politeness_burst,
+        min_rate=settings.politeness_min_rate,
+        max_rate=settings.politeness_max_rate,
+        increase_step=settings.politeness_increase_step,
+        backoff_factor=settings.politeness_backoff_factor,
+        max_wait=settings.politeness_max_wait,
+        background_max_wait=settings.politeness_background_max_wait,
+    )
+
+
+# 全局抓取限速调度器
+politeness = _create_politeness_scheduler()
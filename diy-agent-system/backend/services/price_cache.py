@@ -0,0 +1,186 @@
+"""
+Price lookup cache
+价格查询缓存：TTL + stale-while-revalidate，按条目数和字节数做LRU淘汰
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, is_dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CacheEntry:
+    """缓存条目"""
+    value: Any
+    size: int
+    fresh_until: float
+    stale_until: float
+
+
+class PriceCache:
+    """有界LRU缓存，过期后在stale窗口内先返回旧值并后台刷新"""
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+        }
+
+    @staticmethod
+    def make_key(brand: str, model: str, tool_name: str = "") -> str:
+        """规范化查询 (brand, model, tool_name) 作为缓存键"""
+        parts = [" ".join((part or "").lower().split()) for part in (brand, model, tool_name)]
+        return "|".join(parts)
+
+    def get(self, key: str) -> Tuple[Optional[Any], str]:
+        """读取缓存，返回 (值, 状态)，状态为 fresh / stale / miss"""
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is None or now >= entry.stale_until:
+            if entry is not None:
+                self._remove(key)
+            self.stats["misses"] += 1
+            return None, "miss"
+
+        self._entries.move_to_end(key)
+        if now < entry.fresh_until:
+            self.stats["hits"] += 1
+            return entry.value, "fresh"
+
+        self.stats["stale_hits"] += 1
+        return entry.value, "stale"
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存并按容量淘汰最久未使用的条目"""
+        size = self._estimate_size(value)
+        if size > self.max_bytes:
+            logger.debug(f"Skip caching oversized entry {key} ({size} bytes)")
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        now = time.monotonic()
+        fresh_until = now + (self.ttl if ttl is None else ttl)
+        self._entries[key] = _CacheEntry(
+            value=value,
+            size=size,
+            fresh_until=fresh_until,
+            stale_until=fresh_until + self.stale_ttl,
+        )
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.stats["evictions"] += 1
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        refresh: Optional[Callable[[], Awaitable[Any]]] = None,
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None,
+    ) -> Any:
+        """命中直接返回；stale时返回旧值并后台刷新；未命中时同步抓取并写入
+
+        ttl_for: 按值决定TTL（例如部分结果使用更短的TTL），返回None使用默认TTL
+        """
+        value, state = self.get(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            self._schedule_refresh(key, refresh or fetch, ttl_for)
+            return value
+
+        value = await fetch()
+        self.set(key, value, ttl_for(value) if ttl_for else None)
+        return value
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hit_rate": round((self.stats["hits"] + self.stats["stale_hits"]) / lookups, 3) if lookups else 0.0,
+            "refreshing": len(self._refreshing),
+        }
+
+    def _schedule_refresh(self, key: str, refresh: Callable[[], Awaitable[Any]],
+                          ttl_for: Optional[Callable[[Any], Optional[float]]] = None):
+        """后台刷新过期条目（同一键只刷新一次）"""
+        if key in self._refreshing:
+            return
+
+        async def _run():
+            try:
+                value = await refresh()
+                self.set(key, value, ttl_for(value) if ttl_for else None)
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                logger.warning(f"Background price refresh failed for '{key}': {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(_run())
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    @staticmethod
+    def _estimate_size(value: Any) -> int:
+        """估算缓存值占用的字节数"""
+        def _default(obj):
+            if is_dataclass(obj):
+                return asdict(obj)
+            return str(obj)
+
+        try:
+            return len(json.dumps(value, default=_default).encode("utf-8"))
+        except (TypeError, ValueError):
+            return len(repr(value).encode("utf-8"))
+
+
+def _create_price_cache() -> PriceCache:
+    settings = get_settings()
+    return PriceCache(
+        ttl=settings.price_cache_ttl,
+        stale_ttl=settings.price_cache_stale_ttl,
+        max_entries=settings.price_cache_max_entries,
+        max_bytes=settings.price_cache_max_bytes,
+    )
+
+
+# 全局价格缓存实例
+price_cache = _create_price_cache()
@@ -0,0 +1,101 @@
+"""
+Price history service for recording and reading price snapshots
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import func
+from models.tool_models import PriceHistory
+from services.price_cache import PriceCache
+from services.price_scraper import ProductPrice
+from database import get_db_session
+from utils.config import get_settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (brand, model, tool_name)
+PriceQuery = Tuple[str, str, str]
+
+class PriceHistoryService:
+    """Service for PriceHistory database operations"""
+
+    @staticmethod
+    def record_snapshots(snapshots: List[Tuple[PriceQuery, List[ProductPrice]]]) -> int:
+        """Bulk insert one snapshot per query in a single transaction, returns rows written
+
+        Estimated (fallback) prices are not written: snapshots are read back as real prices.
+        """
+        tracked_at = datetime.utcnow()
+        rows = []
+        for (brand, model, tool_name), products in snapshots:
+            query_key = PriceCache.make_key(brand, model, tool_name)
+            for product in products:
+                if product.fallback:
+                    continue
+                rows.append({
+                    "query_key": query_key,
+                    "brand": brand or None,
+                    "model": model or None,
+                    "tool_name": tool_name or None,
+                    "retailer": product.retailer,
+                    "title": product.title[:255],
+                    "url": product.url,
+                    "image_url": product.image_url,
+                    "price": product.price,
+                    "currency": product.currency,
+                    "in_stock": product.in_stock,
+                    # All rows of a snapshot share one timestamp so it can be read back as a unit
+                    "tracked_at": tracked_at,
+                })
+
+        if not rows:
+            return 0
+
+        try:
+            with get_db_session() as db:
+                db.bulk_insert_mappings(PriceHistory, rows)
+            logger.info(f"Recorded {len(rows)} price history rows for {len(snapshots)} queries")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error recording price snapshots: {e}")
+            return 0
+
+    @staticmethod
+    def get_latest_snapshot(brand: str, model: str, tool_name: str = "",
+                            max_age_seconds: Optional[float] = None) -> Optional[List[ProductPrice]]:
+        """Get the most recent snapshot for a query if it is newer than max_age_seconds"""
+        if max_age_seconds is None:
+            max_age_seconds = get_settings().price_snapshot_max_age
+        query_key = PriceCache.make_key(brand, model, tool_name)
+        cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+
+        try:
+            with get_db_session() as db:
+                latest = db.query(func.max(PriceHistory.tracked_at)).filter(
+                    PriceHistory.query_key == query_key,
+                    PriceHistory.tracked_at >= cutoff
+                ).scalar_subquery()
+
+                rows = db.query(PriceHistory).filter(
+                    PriceHistory.query_key == query_key,
+                    PriceHistory.tracked_at == latest
+                ).order_by(PriceHistory.price).all()
+
+                if not rows:
+                    return None
+
+                return [
+                    ProductPrice(
+                        retailer=row.retailer,
+                        title=row.title or "",
+                        price=row.price,
+                        currency=row.currency or "USD",
+                        in_stock=row.in_stock,
+                        url=row.url or "",
+                        image_url=row.image_url or ""
+                    )
+                    for row in rows
+                ]
+        except Exception as e:
+            logger.error(f"Error reading price snapshot for '{query_key}': {e}")
+            return None
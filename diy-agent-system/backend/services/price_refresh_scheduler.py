@@ -0,0 +1,183 @@
+"""
+Background price refresh scheduler
+后台价格刷新：维护最近识别的品牌/型号观察列表，按热度决定刷新频率，批量写入PriceHistory
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.price_cache import PriceCache
+from services.politeness import PRIORITY_BACKGROUND, scrape_priority
+from services.price_history_service import PriceHistoryService
+from services.price_scraper import PriceScraper
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _WatchEntry:
+    """观察列表条目"""
+    brand: str
+    model: str
+    tool_name: str
+    hits: int = 0
+    last_seen: float = 0.0
+    last_refreshed: Optional[float] = None  # None表示尚未刷新，下一轮立即刷新
+
+
+class PriceRefreshScheduler:
+    """按热度刷新观察列表中的价格"""
+
+    def __init__(self, tick_seconds: float, min_interval: float, max_interval: float,
+                 batch_size: int, watchlist_size: int, watch_ttl: float):
+        self.tick_seconds = tick_seconds
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.batch_size = batch_size
+        self.watchlist_size = watchlist_size
+        self.watch_ttl = watch_ttl
+
+        self._watchlist: Dict[str, _WatchEntry] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "runs": 0,
+            "queries_refreshed": 0,
+            "rows_written": 0,
+            "partial_skipped": 0,
+            "errors": 0,
+            "last_run_seconds": 0.0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def watch(self, brand: str, model: str, tool_name: str = ""):
+        """记录一次识别，把查询加入观察列表"""
+        if not " ".join(part for part in (brand, model, tool_name) if part).strip():
+            return
+
+        key = PriceCache.make_key(brand, model, tool_name)
+        entry = self._watchlist.get(key)
+        if entry is None:
+            if len(self._watchlist) >= self.watchlist_size:
+                # 淘汰最久未被识别的条目
+                oldest_key = min(self._watchlist, key=lambda k: self._watchlist[k].last_seen)
+                del self._watchlist[oldest_key]
+            entry = _WatchEntry(brand=brand or "", model=model or "", tool_name=tool_name or "")
+            self._watchlist[key] = entry
+
+        entry.hits += 1
+        entry.last_seen = time.monotonic()
+
+    def refresh_interval(self, entry: _WatchEntry) -> float:
+        """热度越高刷新越频繁：max_interval / hits，限制在 [min_interval, max_interval]"""
+        return max(self.min_interval, min(self.max_interval, self.max_interval / max(1, entry.hits)))
+
+    def due_queries(self, now: Optional[float] = None) -> List[Tuple[str, Tuple[str, str, str]]]:
+        """返回到期需要刷新的查询（最热门优先，最多batch_size个）"""
+        now = time.monotonic() if now is None else now
+
+        # 清理长时间未被识别的条目
+        for key in [k for k, e in self._watchlist.items() if now - e.last_seen > self.watch_ttl]:
+            del self._watchlist[key]
+
+        due = [
+            (key, entry) for key, entry in self._watchlist.items()
+            if entry.last_refreshed is None or now - entry.last_refreshed >= self.refresh_interval(entry)
+        ]
+        due.sort(key=lambda item: item[1].hits, reverse=True)
+        return [(key, (e.brand, e.model, e.tool_name)) for key, e in due[:self.batch_size]]
+
+    async def refresh_due(self) -> int:
+        """刷新一批到期查询并写入PriceHistory，返回写入行数"""
+        due = self.due_queries()
+        if not due:
+            return 0
+
+        start = time.monotonic()
+        # 后台刷新让位于用户的识别请求
+        with scrape_priority(PRIORITY_BACKGROUND):
+            async with PriceScraper() as scraper:
+                results = await scraper.search_real_prices_many([query for _, query in due], use_cache=False)
+
+        snapshots = []
+        for key, query in due:
+            result = results.get(key)
+            if result is None or not result.products:
+                continue
+            if result.partial:
+                # 缺少部分平台的结果不作为快照，否则识别时会在快照有效期内只返回这些平台
+                self.stats["partial_skipped"] += 1
+                continue
+            snapshots.append((query, result.products))
+        rows = await asyncio.to_thread(PriceHistoryService.record_snapshots, snapshots)
+
+        refreshed_at = time.monotonic()
+        for key, _ in due:
+            entry = self._watchlist.get(key)
+            if entry is not None:
+                entry.last_refreshed = refreshed_at
+
+        self.stats["runs"] += 1
+        self.stats["queries_refreshed"] += len(due)
+        self.stats["rows_written"] += rows
+        self.stats["last_run_seconds"] = round(refreshed_at - start, 3)
+        return rows
+
+    async def start(self):
+        """启动后台刷新任务（在FastAPI startup中调用）"""
+        if self.is_running:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Price refresh scheduler started (tick {self.tick_seconds}s)")
+
+    async def stop(self):
+        """停止后台刷新任务（在FastAPI shutdown中调用）"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("Price refresh scheduler stopped")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Price refresh run failed: {str(e)}")
+            await asyncio.sleep(self.tick_seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计"""
+        return {
+            **self.stats,
+            "running": self.is_running,
+            "watchlist": len(self._watchlist),
+        }
+
+
+def _create_price_refresh_scheduler() -> PriceRefreshScheduler:
+    settings = get_settings()
+    return PriceRefreshScheduler(
+        tick_seconds=settings.price_refresh_tick_seconds,
+        min_interval=settings.price_refresh_min_interval,
+        max_interval=settings.price_refresh_max_interval,
+        batch_size=settings.price_refresh_batch_size,
+        watchlist_size=settings.price_refresh_watchlist_size,
+        watch_ttl=settings.price_refresh_watch_ttl,
+    )
+
+
+# 全局价格刷新调度器
+price_refresh_scheduler = _create_price_refresh_scheduler()
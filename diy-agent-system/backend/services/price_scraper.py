@@ -4,17 +4,46 @@ Real-time Price Scraping Service
 """
 import asyncio
 import aiohttp
+import copy
 import logging
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
 import re
 from urllib.parse import quote_plus
 import json
-from bs4 import BeautifulSoup
 import random
+import time
+from contextvars import ContextVar
+from urllib.parse import urlparse
+
+from services.scraper_client import scraper_client
+from services.price_cache import price_cache
+from services.single_flight import SingleFlight
+from services.circuit_breaker import host_health
+from services.politeness import PolitenessTimeout, politeness
+from services.retailer_parsers import parse_amazon_search
+from utils.config import get_settings
+from utils.worker_pool import run_cpu_bound
 
 logger = logging.getLogger(__name__)
 
+# 合并并发的相同零售商搜索
+price_search_flight = SingleFlight("price_search")
+
+# 当前零售商搜索的请求已通过限速队列发出；用于发出后的内层超时，并区分截止时仍在排队的平台
+_request_sent: ContextVar[Optional[asyncio.Event]] = ContextVar("price_request_sent", default=None)
+
+
+def _mark_request_sent():
+    sent = _request_sent.get()
+    if sent is not None:
+        sent.set()
+
+
+def _normalize_query(query: str) -> str:
+    """规范化搜索词，用作合并键"""
+    return " ".join(query.lower().split())
+
 @dataclass
 class ProductPrice:
     """产品价格信息"""
@@ -27,12 +56,37 @@ class ProductPrice:
     image_url: str = ""
     rating: float = 0.0
     review_count: int = 0
+    fallback: bool = False  # 估算价格：抓取失败（熔断打开、网络错误、解析不到结果）或该零售商尚未解析真实页面
+
+@dataclass
+class PriceSearchResult:
+    """多平台价格搜索结果"""
+    products: List[ProductPrice] = field(default_factory=list)
+    omitted_retailers: List[str] = field(default_factory=list)  # 截止时间前未返回或失败的平台
+    
+    @property
+    def partial(self) -> bool:
+        """是否为部分结果"""
+        return bool(self.omitted_retailers)
+    
+    @property
+    def degraded(self) -> bool:
+        """部分结果或包含抓取失败后的估算价格，只短暂缓存"""
+        return self.partial or any(product.fallback for product in self.products)
+
+
+def _as_fallback(products: List[ProductPrice]) -> List[ProductPrice]:
+    """标记抓取失败后返回的估算价格"""
+    for product in products:
+        product.fallback = True
+    return products
 
 class PriceScraper:
     """真实价格抓取器"""
     
     def __init__(self):
         self.session = None
+        self._owns_session = False
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -47,6 +101,12 @@ class PriceScraper:
         
     async def __aenter__(self):
         """异步上下文管理器进入"""
+        # 优先复用应用级共享连接池，避免每次查询都重新握手
+        if scraper_client.is_running:
+            self.session = scraper_client.session
+            return self
+        
+        # 独立运行（脚本/测试）时创建临时会话
         connector = aiohttp.TCPConnector(limit=10)
         timeout = aiohttp.ClientTimeout(total=self.timeout)
         self.session = aiohttp.ClientSession(
@@ -54,124 +114,156 @@ class PriceScraper:
             connector=connector,
             timeout=timeout
         )
+        self._owns_session = True
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """异步上下文管理器退出"""
-        if self.session:
+        if self.session and self._owns_session:
             await self.session.close()
+        self.session = None
+        self._owns_session = False
+    
+    async def _in_flight_session(self, search: Callable[["PriceScraper"], Awaitable[Any]]) -> Any:
+        """在与合并请求同生命周期的会话上执行search
+
+        合并的请求由第一个调用方发起，其他调用方也在等待它；独立运行时第一个调用方的临时会话
+        可能在请求完成前关闭（退出async with或被取消），因此使用属于这次请求的会话
+        """
+        if scraper_client.is_running:
+            # 应用级共享会话在整个进程生命周期内可用
+            return await search(self)
+        flight = copy.copy(self)
+        async with flight:
+            return await search(flight)
+    
+    async def _fetch_search_page(self, url: str) -> Optional[str]:
+        """带熔断、按域名限速和自适应超时的页面获取；熔断打开、非200或网络错误时返回None"""
+        host = urlparse(url).netloc
+        # A cancelled request (deadline, hedging, shutdown) gives its half-open probe back on exit
+        with host_health.request(host) as call:
+            if not call.allowed:
+                logger.info(f"Circuit open for {host}, skipping request")
+                return None
+            
+            try:
+                await politeness.acquire(url)
+            except PolitenessTimeout as e:
+                # 请求未发送，不计入熔断
+                logger.info(str(e))
+                return None
+            _mark_request_sent()
+            timeout = aiohttp.ClientTimeout(total=host_health.timeout_for(host, self.timeout))
+            start = time.monotonic()
+            try:
+                async with self.session.get(url, headers=self.headers, timeout=timeout) as response:
+                    politeness.feedback(url, response.status)
+                    if response.status >= 500 or response.status == 429:
+                        call.failure()
+                        logger.warning(f"{host} search failed with status {response.status}")
+                        return None
+                    html = await response.text()
+            except Exception as e:
+                call.failure()
+                logger.warning(f"{host} request error: {str(e)}")
+                return None
+            
+            call.success(time.monotonic() - start)
+        if response.status != 200:
+            logger.warning(f"{host} search failed with status {response.status}")
+            return None
+        return html
+    
+    async def _coalesced_search(self, retailer: str, query: str, max_results: int,
+                                search: Callable[["PriceScraper"], Awaitable[List[ProductPrice]]]) -> List[ProductPrice]:
+        """并发相同查询只抓取一次"""
+        key = (retailer, _normalize_query(query), max_results)
+        if price_search_flight.in_flight(key):
+            # 加入已发出的请求，它的排队时间属于发起方
+            _mark_request_sent()
+        products = await price_search_flight.do(key, lambda: self._in_flight_session(search))
+        return list(products)
     
     async def search_amazon(self, query: str, max_results: int = 5) -> List[ProductPrice]:
-        """搜索Amazon产品价格"""
+        """搜索Amazon产品价格（并发相同查询只抓取一次）"""
+        return await self._coalesced_search(
+            "amazon", query, max_results, lambda scraper: scraper._search_amazon(query, max_results)
+        )
+    
+    async def _search_amazon(self, query: str, max_results: int) -> List[ProductPrice]:
+        """抓取Amazon搜索结果"""
         try:
             search_url = f"https://www.amazon.com/s?k={quote_plus(query)}&ref=sr_pg_1"
             
-            async with self.session.get(search_url) as response:
-                if response.status != 200:
-                    logger.warning(f"Amazon search failed with status {response.status}")
-                    return await self._get_fallback_amazon_prices(query, max_results)
-                
-                html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                products = []
-                # 查找产品容器
-                product_containers = soup.find_all('div', {'data-component-type': 's-search-result'})
-                
-                for container in product_containers[:max_results]:
-                    try:
-                        # 提取标题
-                        title_elem = container.find('h2', class_='a-size-mini')
-                        if not title_elem:
-                            title_elem = container.find('span', class_='a-size-medium')
-                        title = title_elem.get_text(strip=True) if title_elem else query
-                        
-                        # 提取价格
-                        price_elem = container.find('span', class_='a-price-whole')
-                        if not price_elem:
-                            price_elem = container.find('span', class_='a-offscreen')
-                        
-                        price = 0.0
-                        if price_elem:
-                            price_text = price_elem.get_text(strip=True)
-                            # 清理价格文本，提取数字
-                            price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', ''))
-                            if price_match:
-                                price = float(price_match.group())
-                        
-                        # 提取产品链接
-                        link_elem = container.find('h2', class_='a-size-mini')
-                        if link_elem:
-                            link = link_elem.find('a')
-                            product_url = f"https://www.amazon.com{link['href']}" if link else search_url
-                        else:
-                            product_url = search_url
-                        
-                        # 提取图片
-                        img_elem = container.find('img', class_='s-image')
-                        image_url = img_elem['src'] if img_elem else ""
-                        
-                        if price > 0:  # 只添加有价格的产品
-                            products.append(ProductPrice(
-                                retailer="Amazon",
-                                title=title[:100],  # 限制标题长度
-                                price=price,
-                                url=product_url,
-                                image_url=image_url,
-                                in_stock=True
-                            ))
-                    except Exception as e:
-                        logger.warning(f"Failed to parse Amazon product: {str(e)}")
-                        continue
-                
-                if not products:
-                    return await self._get_fallback_amazon_prices(query, max_results)
-                
-                return products[:max_results]
+            html = await self._fetch_search_page(search_url)
+            if html is None:
+                return _as_fallback(await self._get_fallback_amazon_prices(query, max_results))
+            
+            # 解析放到工作进程，避免阻塞事件循环
+            parsed = await run_cpu_bound(
+                parse_amazon_search, html, query, search_url, max_results,
+                get_settings().html_parser_backend
+            )
+            products = [ProductPrice(**fields) for fields in parsed]
+            
+            if not products:
+                return _as_fallback(await self._get_fallback_amazon_prices(query, max_results))
+            
+            return products[:max_results]
                 
         except Exception as e:
             logger.error(f"Amazon search error for '{query}': {str(e)}")
-            return await self._get_fallback_amazon_prices(query, max_results)
+            return _as_fallback(await self._get_fallback_amazon_prices(query, max_results))
     
     async def search_home_depot(self, query: str, max_results: int = 5) -> List[ProductPrice]:
-        """搜索Home Depot产品价格"""
+        """搜索Home Depot产品价格（并发相同查询只抓取一次）"""
+        return await self._coalesced_search(
+            "home_depot", query, max_results, lambda scraper: scraper._search_home_depot(query, max_results)
+        )
+    
+    async def _search_home_depot(self, query: str, max_results: int) -> List[ProductPrice]:
+        """抓取Home Depot搜索结果"""
         try:
             search_url = f"https://www.homedepot.com/s/{quote_plus(query)}"
             
-            async with self.session.get(search_url) as response:
-                if response.status != 200:
-                    return await self._get_fallback_home_depot_prices(query, max_results)
-                
-                # 由于Home Depot使用JavaScript渲染，我们使用智能回退策略
-                return await self._get_fallback_home_depot_prices(query, max_results)
+            # 仍然请求页面以跟踪站点健康状况（熔断打开时跳过网络）
+            await self._fetch_search_page(search_url)
+            
+            # 由于Home Depot使用JavaScript渲染，我们使用智能回退策略；估算价格即使页面请求成功也标记为回退
+            return _as_fallback(await self._get_fallback_home_depot_prices(query, max_results))
                 
         except Exception as e:
             logger.error(f"Home Depot search error for '{query}': {str(e)}")
-            return await self._get_fallback_home_depot_prices(query, max_results)
+            return _as_fallback(await self._get_fallback_home_depot_prices(query, max_results))
     
     async def search_lowes(self, query: str, max_results: int = 5) -> List[ProductPrice]:
-        """搜索Lowe's产品价格"""
+        """搜索Lowe's产品价格（并发相同查询只抓取一次）"""
+        return await self._coalesced_search(
+            "lowes", query, max_results, lambda scraper: scraper._search_lowes(query, max_results)
+        )
+    
+    async def _search_lowes(self, query: str, max_results: int) -> List[ProductPrice]:
+        """抓取Lowe's搜索结果"""
         try:
             search_url = f"https://www.lowes.com/search?searchTerm={quote_plus(query)}"
             
-            async with self.session.get(search_url) as response:
-                if response.status != 200:
-                    return await self._get_fallback_lowes_prices(query, max_results)
-                
-                # 由于Lowe's使用JavaScript渲染，我们使用智能回退策略
-                return await self._get_fallback_lowes_prices(query, max_results)
+            # 仍然请求页面以跟踪站点健康状况（熔断打开时跳过网络）
+            await self._fetch_search_page(search_url)
+            
+            # 由于Lowe's使用JavaScript渲染，我们使用智能回退策略；估算价格即使页面请求成功也标记为回退
+            return _as_fallback(await self._get_fallback_lowes_prices(query, max_results))
                 
         except Exception as e:
             logger.error(f"Lowe's search error for '{query}': {str(e)}")
-            return await self._get_fallback_lowes_prices(query, max_results)
+            return _as_fallback(await self._get_fallback_lowes_prices(query, max_results))
     
     async def search_walmart(self, query: str, max_results: int = 3) -> List[ProductPrice]:
-        """搜索Walmart产品价格"""
+        """搜索Walmart产品价格（尚未抓取页面，均为估算价格）"""
         try:
-            return await self._get_fallback_walmart_prices(query, max_results)
+            return _as_fallback(await self._get_fallback_walmart_prices(query, max_results))
         except Exception as e:
             logger.error(f"Walmart search error for '{query}': {str(e)}")
-            return await self._get_fallback_walmart_prices(query, max_results)
+            return _as_fallback(await self._get_fallback_walmart_prices(query, max_results))
     
     async def _get_fallback_amazon_prices(self, query: str, max_results: int) -> List[ProductPrice]:
         """Amazon智能回退价格策略"""
@@ -310,39 +402,164 @@ class PriceScraper:
         
         return base_price
 
-    async def get_real_prices(self, brand: str, model: str, tool_name: str = "") -> List[ProductPrice]:
-        """获取真实价格的主要方法"""
+    async def get_real_prices(self, brand: str, model: str, tool_name: str = "", use_cache: bool = True,
+                              deadline: Optional[float] = None) -> List[ProductPrice]:
+        """获取真实价格的主要方法（带缓存）"""
+        result = await self.search_real_prices(brand, model, tool_name, use_cache, deadline)
+        return list(result.products)
+    
+    async def search_real_prices(self, brand: str, model: str, tool_name: str = "", use_cache: bool = True,
+                                 deadline: Optional[float] = None) -> PriceSearchResult:
+        """获取真实价格，并标记截止时间内未返回的平台
+
+        返回的是缓存值的副本，调用方可以修改
+        """
+        query_parts = [part for part in [brand, model, tool_name] if part]
+        if not " ".join(query_parts).strip():
+            return PriceSearchResult()
+        
+        if not use_cache:
+            return await self._fetch_real_prices(brand, model, tool_name, deadline)
+        
+        # 过期条目先返回旧值，再用独立会话后台刷新（当前会话可能在刷新完成前关闭）
+        # 部分结果和抓取失败后的估算价格只短暂缓存，尽快用完整结果替换
+        result = await price_cache.get_or_fetch(
+            price_cache.make_key(brand, model, tool_name),
+            lambda: self._fetch_real_prices(brand, model, tool_name, deadline),
+            refresh=lambda: _refresh_product_prices(brand, model, tool_name),
+            ttl_for=lambda result: get_settings().price_search_partial_ttl if result.degraded else None
+        )
+        return copy.deepcopy(result)
+    
+    async def get_real_prices_many(self, queries: List[Tuple[str, str, str]], use_cache: bool = True,
+                                   concurrency: Optional[int] = None) -> Dict[str, List[ProductPrice]]:
+        """批量获取价格：按缓存键去重，共享当前会话，有界并发
+
+        queries: (brand, model, tool_name) 列表
+        返回 {price_cache.make_key(brand, model, tool_name): 价格列表}，失败的查询为空列表
+        """
+        results = await self.search_real_prices_many(queries, use_cache, concurrency)
+        return {key: list(result.products) for key, result in results.items()}
+    
+    async def search_real_prices_many(self, queries: List[Tuple[str, str, str]], use_cache: bool = True,
+                                      concurrency: Optional[int] = None) -> Dict[str, PriceSearchResult]:
+        """批量搜索价格，保留每个查询的部分结果标记；失败的查询为空结果"""
+        unique_queries: Dict[str, Tuple[str, str, str]] = {}
+        for brand, model, tool_name in queries:
+            unique_queries.setdefault(price_cache.make_key(brand, model, tool_name), (brand, model, tool_name))
+        
+        if len(unique_queries) < len(queries):
+            logger.info(f"Batch price lookup: {len(queries)} queries, {len(unique_queries)} unique")
+        
+        limit = asyncio.Semaphore(concurrency or get_settings().price_batch_concurrency)
+        
+        async def _lookup(key: str, query: Tuple[str, str, str]) -> Tuple[str, PriceSearchResult]:
+            try:
+                async with limit:
+                    return key, await self.search_real_prices(*query, use_cache=use_cache)
+            except Exception as e:
+                logger.warning(f"Batch price lookup failed for '{key}': {str(e)}")
+                return key, PriceSearchResult()
+        
+        results = await asyncio.gather(*[_lookup(key, query) for key, query in unique_queries.items()])
+        return dict(results)
+    
+    async def _fetch_real_prices(self, brand: str, model: str, tool_name: str = "",
+                                 deadline: Optional[float] = None) -> PriceSearchResult:
+        """实时抓取各平台价格，截止时间到达时返回已完成平台的结果并取消其余请求
+
+        截止时间覆盖整个调用：从发起搜索开始，包括在按域名限速队列中排队和请求发出后的等待，
+        到期时仍在排队的搜索同样取消；设置了price_search_sent_timeout时，请求发出后最多再等这么久。
+        取消的请求没有其他等待者时会真正中止（SingleFlight在最后一个等待者离开时取消抓取）
+        """
         # 构建搜索查询
         query_parts = [part for part in [brand, model, tool_name] if part]
         query = " ".join(query_parts)
         
         if not query.strip():
-            return []
+            return PriceSearchResult()
+        
+        settings = get_settings()
+        if deadline is None:
+            deadline = settings.price_search_deadline
+        expires = asyncio.get_running_loop().time() + deadline if deadline > 0 else None
         
         logger.info(f"Searching for real prices: {query}")
         
         # 并行搜索多个平台
-        tasks = [
-            self.search_amazon(query, 2),
-            self.search_home_depot(query, 2),
-            self.search_lowes(query, 2),
-            self.search_walmart(query, 1)
-        ]
+        searches = {
+            "Amazon": lambda: self.search_amazon(query, 2),
+            "Home Depot": lambda: self.search_home_depot(query, 2),
+            "Lowe's": lambda: self.search_lowes(query, 2),
+            "Walmart": lambda: self.search_walmart(query, 1),
+        }
+        tasks = {}
+        sent = {}
+        for retailer, search in searches.items():
+            sent[retailer] = asyncio.Event()
+            # 任务创建时复制上下文，抓取通过限速队列后设置该平台的事件
+            token = _request_sent.set(sent[retailer])
+            try:
+                tasks[asyncio.ensure_future(search())] = retailer
+            finally:
+                _request_sent.reset(token)
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.gather(*[
+                _wait_for_search(task, sent[retailer], expires, settings.price_search_sent_timeout)
+                for task, retailer in tasks.items()
+            ])
+            pending = {task for task in tasks if not task.done()}
+        finally:
+            # 取消超时未返回的平台，包括仍在排队的（调用方被取消时同样清理）
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
         
         # 整合结果
         all_products = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.warning(f"Platform {i} search failed: {str(result)}")
+        omitted = []
+        for task, retailer in tasks.items():
+            if task in pending:
+                omitted.append(retailer)
+                continue
+            if task.exception() is not None:
+                logger.warning(f"{retailer} search failed: {str(task.exception())}")
+                omitted.append(retailer)
                 continue
-            if isinstance(result, list):
-                all_products.extend(result)
+            all_products.extend(task.result())
+        
+        if omitted:
+            queued = [tasks[task] for task in pending if not sent[tasks[task]].is_set()]
+            logger.warning(f"Returning partial prices for '{query}' after {deadline}s deadline, omitted: {', '.join(omitted)}"
+                           + (f" (still queued: {', '.join(queued)})" if queued else ""))
         
         # 按价格排序并返回
         all_products.sort(key=lambda x: x.price)
-        return all_products[:8]  # 返回最多8个结果
+        return PriceSearchResult(
+            products=all_products[:8],  # 返回最多8个结果
+            omitted_retailers=omitted
+        )
+
+
+async def _wait_for_search(task: asyncio.Future, sent: asyncio.Event, expires: Optional[float], sent_timeout: float):
+    """等待task完成，最多到expires（事件循环时间，None为不限）；sent_timeout > 0时请求发出后最多再等sent_timeout秒"""
+    loop = asyncio.get_running_loop()
+    
+    def remaining() -> Optional[float]:
+        return None if expires is None else max(0.0, expires - loop.time())
+    
+    if sent_timeout <= 0:
+        await asyncio.wait({task}, timeout=remaining())
+        return
+    sent_wait = asyncio.ensure_future(sent.wait())
+    try:
+        await asyncio.wait({task, sent_wait}, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sent_wait.cancel()
+    if not task.done() and sent.is_set():
+        left = remaining()
+        await asyncio.wait({task}, timeout=sent_timeout if left is None else min(sent_timeout, left))
 
 
 # 便利函数
@@ -352,6 +569,18 @@ async def get_product_prices(brand: str, model: str, tool_name: str = "") -> Lis
         return await scraper.get_real_prices(brand, model, tool_name)
 
 
+async def get_product_prices_many(queries: List[Tuple[str, str, str]]) -> Dict[str, List[ProductPrice]]:
+    """批量获取产品真实价格的便利函数，结果按price_cache.make_key索引"""
+    async with PriceScraper() as scraper:
+        return await scraper.get_real_prices_many(queries)
+
+
+async def _refresh_product_prices(brand: str, model: str, tool_name: str = "") -> PriceSearchResult:
+    """后台刷新缓存条目时使用的独立抓取"""
+    async with PriceScraper() as scraper:
+        return await scraper._fetch_real_prices(brand, model, tool_name)
+
+
 if __name__ == "__main__":
     # 测试代码
     async def test_price_scraper():
@@ -0,0 +1,213 @@
+"""
+Bulk product import service for database operations
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+from sqlalchemy import func, or_
+from models.import_models import ProductImportBatch, ProductImportItem
+from services.product_service import ProductService
+from database import get_db_session
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ProductImportService:
+    """Service for bulk import batch database operations"""
+
+    @staticmethod
+    def create_batch(
+        urls: List[str],
+        created_by: Optional[int] = None,
+        is_featured: bool = False,
+        bypass_llm_cache: bool = False
+    ) -> Dict[str, Any]:
+        """Create a batch with one pending item per unique URL (submission order is kept)"""
+        unique_urls = list(dict.fromkeys(url.strip() for url in urls if url and url.strip()))
+
+        with get_db_session() as db:
+            batch = ProductImportBatch(
+                created_by=created_by,
+                status="pending",
+                is_featured=is_featured,
+                bypass_llm_cache=bypass_llm_cache,
+                total=len(unique_urls),
+                created_at=datetime.utcnow()
+            )
+            batch.items = [
+                ProductImportItem(position=position, url=url, status="pending")
+                for position, url in enumerate(unique_urls)
+            ]
+            db.add(batch)
+            db.flush()
+            logger.info(f"Created import batch {batch.id} with {len(unique_urls)} URLs")
+            return batch.to_dict()
+
+    @staticmethod
+    def get_batch(batch_id: int, include_items: bool = False) -> Optional[Dict[str, Any]]:
+        """Get a batch with per-status item counts"""
+        with get_db_session() as db:
+            batch = db.query(ProductImportBatch).filter(ProductImportBatch.id == batch_id).first()
+            if not batch:
+                return None
+
+            counts = dict(
+                db.query(ProductImportItem.status, func.count(ProductImportItem.id))
+                .filter(ProductImportItem.batch_id == batch_id)
+                .group_by(ProductImportItem.status)
+                .all()
+            )
+            result = batch.to_dict()
+            result["bypass_llm_cache"] = batch.bypass_llm_cache
+            result["heartbeat_at"] = batch.heartbeat_at.isoformat() if batch.heartbeat_at else None
+            result["counts"] = {status: counts.get(status, 0) for status in ("pending", "done", "failed")}
+            if include_items:
+                result["items"] = [item.to_dict() for item in batch.items]
+            return result
+
+    @staticmethod
+    def get_pending_items(batch_id: int) -> List[Dict[str, Any]]:
+        """Items that have not finished yet (includes items interrupted by a restart)"""
+        with get_db_session() as db:
+            items = db.query(ProductImportItem).filter(
+                ProductImportItem.batch_id == batch_id,
+                ProductImportItem.status == "pending"
+            ).order_by(ProductImportItem.position).all()
+            return [item.to_dict() for item in items]
+
+    @staticmethod
+    def get_finished_items(batch_id: int, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Items that finished at or after since, in the order they finished"""
+        with get_db_session() as db:
+            query = db.query(ProductImportItem).filter(
+                ProductImportItem.batch_id == batch_id,
+                ProductImportItem.status != "pending"
+            )
+            if since is not None:
+                query = query.filter(ProductImportItem.finished_at >= since)
+            items = query.order_by(ProductImportItem.finished_at, ProductImportItem.position).all()
+            return [item.to_dict() for item in items]
+
+    @staticmethod
+    def get_unfinished_batch_ids() -> List[int]:
+        """Batches that still have pending items"""
+        with get_db_session() as db:
+            rows = db.query(ProductImportBatch.id).filter(
+                ProductImportBatch.status != "completed"
+            ).order_by(ProductImportBatch.id).all()
+            return [row[0] for row in rows]
+
+    @staticmethod
+    def claim_batch(batch_id: int, owner: str, lease_seconds: float) -> bool:
+        """Atomically take over an unfinished batch for one process
+
+        A single conditional UPDATE, so when several workers resume or start the same batch
+        only one of them gets it. Succeeds if nobody holds the claim or the holder stopped
+        renewing it for longer than the lease (e.g. the process was killed).
+        """
+        now = datetime.utcnow()
+        with get_db_session() as db:
+            claimed = db.query(ProductImportBatch).filter(
+                ProductImportBatch.id == batch_id,
+                ProductImportBatch.status != "completed",
+                or_(
+                    ProductImportBatch.owner.is_(None),
+                    ProductImportBatch.heartbeat_at.is_(None),
+                    ProductImportBatch.heartbeat_at < now - timedelta(seconds=lease_seconds)
+                )
+            ).update({"owner": owner, "status": "running", "heartbeat_at": now}, synchronize_session=False)
+            return claimed == 1
+
+    @staticmethod
+    def renew_claim(batch_id: int, owner: str) -> bool:
+        """Renew the claim; False if another process has taken the batch over"""
+        with get_db_session() as db:
+            renewed = db.query(ProductImportBatch).filter(
+                ProductImportBatch.id == batch_id,
+                ProductImportBatch.owner == owner
+            ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+            return renewed == 1
+
+    @staticmethod
+    def release_batch(batch_id: int, owner: str, status: str):
+        """Give up the claim and set the batch status (completed batches get a completion time)"""
+        values = {"owner": None, "heartbeat_at": None, "status": status}
+        if status == "completed":
+            values["completed_at"] = datetime.utcnow()
+        with get_db_session() as db:
+            db.query(ProductImportBatch).filter(
+                ProductImportBatch.id == batch_id,
+                ProductImportBatch.owner == owner
+            ).update(values, synchronize_session=False)
+
+    @staticmethod
+    def record_results(batch_id: int, results: List[Dict[str, Any]], is_featured: bool = False,
+                       created_by: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Insert products and mark their items finished in one transaction
+
+        Each result has item_id, elapsed_ms and either product_fields (from
+        ProductService.fields_from_extraction) or error. Returns the updated items;
+        items that are no longer pending are left alone.
+        """
+        try:
+            with get_db_session() as db:
+                return ProductImportService._record_results(db, batch_id, results, is_featured, created_by)
+        except Exception as e:
+            if len(results) == 1:
+                raise
+            # One bad row should not fail the whole batch: retry row by row
+            logger.warning(f"Batch insert for import batch {batch_id} failed ({e}), retrying row by row")
+            recorded = []
+            for result in results:
+                try:
+                    recorded.extend(ProductImportService.record_results(batch_id, [result], is_featured, created_by))
+                except Exception as row_error:
+                    failed = {key: value for key, value in result.items() if key != "product_fields"}
+                    failed["error"] = f"Failed to save product: {row_error}"
+                    with get_db_session() as db:
+                        recorded.extend(ProductImportService._record_results(
+                            db, batch_id, [failed], is_featured, created_by))
+            return recorded
+
+    @staticmethod
+    def _record_results(db, batch_id: int, results: List[Dict[str, Any]], is_featured: bool,
+                        created_by: Optional[int]) -> List[Dict[str, Any]]:
+        items = {
+            item.id: item for item in db.query(ProductImportItem).filter(
+                ProductImportItem.batch_id == batch_id,
+                ProductImportItem.id.in_([result["item_id"] for result in results])
+            )
+        }
+
+        created = []
+        recorded = []
+        finished_at = datetime.utcnow()
+        for result in results:
+            item = items.get(result["item_id"])
+            # Never import a URL twice, even if the item was finished by an earlier run
+            if item is None or item.status != "pending":
+                continue
+            recorded.append(item)
+            item.elapsed = result.get("elapsed_ms")
+            item.finished_at = finished_at
+
+            fields = result.get("product_fields")
+            if fields is None:
+                item.status = "failed"
+                item.error = result.get("error") or "Extraction failed"
+                continue
+
+            product = ProductService.build_product(**fields, is_featured=is_featured, created_by=created_by)
+            db.add(product)
+            created.append((item, product))
+            item.status = "done"
+            item.title = product.title
+            item.extraction_method = result.get("extraction_method")
+
+        # Assign product ids before the commit so items and products are written together
+        db.flush()
+        for item, product in created:
+            item.product_id = product.id
+
+        logger.info(f"Import batch {batch_id}: saved {len(created)} products, "
+                    f"{len(recorded) - len(created)} failed")
+        return [item.to_dict() for item in recorded]
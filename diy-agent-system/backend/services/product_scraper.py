@@ -10,6 +10,8 @@ from urllib.parse import urlparse
 from bs4 import BeautifulSoup
 import logging
 
+from services.politeness import politeness
+
 logger = logging.getLogger(__name__)
 
 class ProductScraper:
@@ -21,6 +23,13 @@ class ProductScraper:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
     
+    def _get(self, url: str) -> requests.Response:
+        """GET through the shared per-domain rate limit"""
+        politeness.acquire_blocking(url)
+        response = self.session.get(url, timeout=10)
+        politeness.feedback(url, response.status_code)
+        return response
+    
     def scrape_product_info(self, url: str) -> Dict[str, Any]:
         """
         Scrape product information from a given URL
@@ -55,7 +64,7 @@ class ProductScraper:
     def _scrape_amazon(self, url: str) -> Dict[str, Any]:
         """Scrape Amazon product information"""
         try:
-            response = self.session.get(url, timeout=10)
+            response = self._get(url)
             response.raise_for_status()
             soup = BeautifulSoup(response.content, 'html.parser')
             
@@ -87,7 +96,7 @@ class ProductScraper:
     def _scrape_home_depot(self, url: str) -> Dict[str, Any]:
         """Scrape Home Depot product information"""
         try:
-            response = self.session.get(url, timeout=10)
+            response = self._get(url)
             response.raise_for_status()
             soup = BeautifulSoup(response.content, 'html.parser')
             
@@ -121,7 +130,7 @@ class ProductScraper:
     def _scrape_lowes(self, url: str) -> Dict[str, Any]:
         """Scrape Lowes product information"""
         try:
-            response = self.session.get(url, timeout=10)
+            response = self._get(url)
             response.raise_for_status()
             soup = BeautifulSoup(response.content, 'html.parser')
             
@@ -154,7 +163,7 @@ class ProductScraper:
     def _scrape_walmart(self, url: str) -> Dict[str, Any]:
         """Scrape Walmart product information"""
         try:
-            response = self.session.get(url, timeout=10)
+            response = self._get(url)
             response.raise_for_status()
             soup = BeautifulSoup(response.content, 'html.parser')
             
@@ -187,7 +196,7 @@ class ProductScraper:
     def _scrape_generic(self, url: str) -> Dict[str, Any]:
         """Generic scraper for unknown websites"""
         try:
-            response = self.session.get(url, timeout=10)
+            response = self._get(url)
             response.raise_for_status()
             soup = BeautifulSoup(response.content, 'html.parser')
             
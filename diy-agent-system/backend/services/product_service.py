@@ -6,6 +6,7 @@ from typing import Optional, Dict, Any, List
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from models.product_models import ProductRecommendation, ProductCategory, ProductMerchant
+from services.redirect_cache import redirect_cache
 from database import get_db_session
 import logging
 import re
@@ -37,51 +38,29 @@ class ProductService:
         """Create a new product recommendation"""
         try:
             with get_db_session() as db:
-                # Auto-detect merchant from URL if not provided
-                if not merchant:
-                    merchant = ProductService._detect_merchant_from_url(product_url)
-                
-                # Auto-generate thumbnail from image if needed
-                thumbnail_url = ProductService._generate_thumbnail_url(image_url) if image_url else None
-                
-                # Calculate discount percentage if both prices provided
-                discount_percentage = None
-                if original_price and sale_price and sale_price < original_price:
-                    discount_percentage = int(((original_price - sale_price) / original_price) * 100)
-                
-                # Ensure title is never None or empty
-                if not title or title.strip() == '':
-                    # Create fallback title based on URL
-                    parsed = urlparse(product_url)
-                    domain = parsed.netloc.replace('www.', '')
-                    title = f"Product from {domain}"
-                
-                new_product = ProductRecommendation(
+                new_product = ProductService.build_product(
                     title=title,
+                    product_url=product_url,
                     description=description,
-                    category=ProductCategory(category),
-                    merchant=ProductMerchant(merchant),
+                    category=category,
+                    merchant=merchant,
                     original_price=original_price,
                     sale_price=sale_price,
-                    discount_percentage=discount_percentage,
-                    product_url=product_url,
                     image_url=image_url,
-                    thumbnail_url=thumbnail_url,
                     brand=brand,
                     model=model,
                     rating=rating,
                     rating_count=rating_count,
                     is_featured=is_featured,
-                    project_types=project_types or [],
-                    created_by=created_by,
-                    created_at=datetime.utcnow()
+                    project_types=project_types,
+                    created_by=created_by
                 )
                 
                 db.add(new_product)
                 db.commit()
                 db.refresh(new_product)
                 
-                logger.info(f"Product created successfully: {title}")
+                logger.info(f"Product created successfully: {new_product.title}")
                 return new_product.to_dict()
                 
         except IntegrityError as e:
@@ -91,6 +70,95 @@ class ProductService:
             logger.error(f"Product creation failed: {e}")
             return None
     
+    @staticmethod
+    def build_product(
+        title: str,
+        product_url: str,
+        description: Optional[str] = None,
+        category: str = "other",
+        merchant: Optional[str] = None,
+        original_price: Optional[float] = None,
+        sale_price: Optional[float] = None,
+        image_url: Optional[str] = None,
+        brand: Optional[str] = None,
+        model: Optional[str] = None,
+        rating: Optional[float] = None,
+        rating_count: Optional[int] = None,
+        is_featured: bool = False,
+        project_types: Optional[List[str]] = None,
+        created_by: Optional[int] = None
+    ) -> ProductRecommendation:
+        """Build an unsaved product recommendation (callers add it to their own session)"""
+        # Auto-detect merchant from URL if not provided
+        if not merchant:
+            merchant = ProductService._detect_merchant_from_url(product_url)
+        
+        # Auto-generate thumbnail from image if needed
+        thumbnail_url = ProductService._generate_thumbnail_url(image_url) if image_url else None
+        
+        # Calculate discount percentage if both prices provided
+        discount_percentage = None
+        if original_price and sale_price and sale_price < original_price:
+            discount_percentage = int(((original_price - sale_price) / original_price) * 100)
+        
+        # Ensure title is never None or empty
+        if not title or title.strip() == '':
+            # Create fallback title based on URL
+            parsed = urlparse(product_url)
+            domain = parsed.netloc.replace('www.', '')
+            title = f"Product from {domain}"
+        
+        return ProductRecommendation(
+            title=title,
+            description=description,
+            category=ProductCategory(category),
+            merchant=ProductMerchant(merchant),
+            original_price=original_price,
+            sale_price=sale_price,
+            discount_percentage=discount_percentage,
+            product_url=product_url,
+            image_url=image_url,
+            thumbnail_url=thumbnail_url,
+            brand=brand,
+            model=model,
+            rating=rating,
+            rating_count=rating_count,
+            is_featured=is_featured,
+            project_types=project_types or [],
+            created_by=created_by,
+            created_at=datetime.utcnow()
+        )
+    
+    @staticmethod
+    def fields_from_extraction(product_url: str, scraped_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Map ProductInfoAgent output to product fields, always keeping the original (affiliate) URL"""
+        domain = urlparse(product_url).netloc.replace('www.', '')
+        
+        title = (scraped_data.get('title') or '').strip()
+        if not title or title == 'Unknown Product':
+            title = 'Amazon Product' if 'amazon' in domain else f'Product from {domain}'
+        
+        # The agent knows more merchants than the database enum
+        merchant = scraped_data.get('merchant') or ProductService._detect_merchant_from_url(product_url)
+        if merchant not in {m.value for m in ProductMerchant}:
+            merchant = 'other'
+        
+        return {
+            'title': title[:255],
+            'description': scraped_data.get('description') or f'Product available from {domain}',
+            'category': scraped_data.get('category') or 'other',
+            'merchant': merchant,
+            'original_price': scraped_data.get('original_price'),
+            'sale_price': scraped_data.get('sale_price'),
+            'product_url': product_url,
+            'image_url': scraped_data.get('image_url'),
+            'brand': scraped_data.get('brand'),
+            'model': scraped_data.get('model'),
+            'rating': scraped_data.get('rating'),
+            'rating_count': scraped_data.get('rating_count'),
+            'project_types': scraped_data.get('project_types') or ['general'],
+        }
+    
     @staticmethod
     def get_product_by_id(product_id: int) -> Optional[Dict[str, Any]]:
         """Get product by ID"""
@@ -298,9 +366,9 @@ class ProductService:
     
     @staticmethod
     def _detect_merchant_from_url(url: str) -> str:
-        """Auto-detect merchant from URL"""
+        """Auto-detect merchant from URL (short links resolve to their cached final URL)"""
         try:
-            parsed = urlparse(url.lower())
+            parsed = urlparse(redirect_cache.resolve(url).lower())
             domain = parsed.netloc
             
             if 'amazon.com' in domain or 'amzn.to' in domain:
@@ -0,0 +1,183 @@
+"""
+Short URL redirect cache
+短链接（amzn.to、bit.ly、联盟跳转链接等）→ 最终商品URL 的持久化映射
+首次抓取跟随重定向后写入，之后商家识别和页面抓取直接使用最终URL，省去重定向往返
+只缓存短链接/联盟链接成功（2xx）落地的结果；跳到验证码、登录、地区或错误页面的重定向不缓存
+"""
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from services.kv_store import SQLiteKVStore
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 短链接和联盟跳转域名（含子域名）
+SHORT_LINK_HOSTS = (
+    "amzn.to", "a.co", "bit.ly", "tinyurl.com", "t.co", "goo.gl", "ow.ly", "is.gd", "buff.ly",
+    "rebrand.ly", "cutt.ly", "shorturl.at", "tiny.cc", "lnkd.in", "howl.me", "shopstyle.it",
+    "linksynergy.com", "anrdoezrs.net", "tkqlhce.com", "jdoqocy.com", "dpbolvw.net", "kqzyfj.com",
+    "sjv.io", "7tiv.net", "pxf.io", "go.skimresources.com", "redirect.viglink.com", "shareasale.com",
+    "awin1.com", "prf.hn", "goto.walmart.com",
+)
+
+# 商家商品页本身就是最终URL，商家识别时不必查缓存
+MERCHANT_HOSTS = (
+    "amazon.com", "homedepot.com", "lowes.com", "walmart.com", "target.com", "menards.com",
+    "harborfreight.com", "northerntool.com",
+)
+
+# 未知短链接服务的典型形式：根路径下一段短ID，如 https://xyz.link/aB3dE
+_SHORT_PATH_RE = re.compile(r'^/[A-Za-z0-9_-]{3,16}/?$')
+
+
+def _host_matches(host: str, domains) -> bool:
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+class RedirectCache:
+    """跨域名重定向的持久化缓存，进程内再加一层LRU"""
+
+    def __init__(self, store: SQLiteKVStore, ttl: float, memory_entries: int = 1024, miss_ttl: float = 300):
+        self.store = store
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.miss_ttl = miss_ttl
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        # 最近未命中的URL -> 过期时间，避免每次商家识别都在事件循环里查一次SQLite
+        self._misses: "OrderedDict[str, float]" = OrderedDict()
+        self.stats = {"hits": 0, "memory_hits": 0, "misses": 0, "memory_misses": 0, "skipped": 0,
+                      "writes": 0, "rejected": 0, "errors": 0}
+
+    @staticmethod
+    def _host(url: str) -> str:
+        netloc = urlparse(url).netloc.lower()
+        return netloc[4:] if netloc.startswith("www.") else netloc
+
+    @staticmethod
+    def make_key(url: str) -> str:
+        """规范化：去掉首尾空白和fragment，scheme和host小写"""
+        parsed = urlparse(url.strip())
+        return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), fragment="").geturl()
+
+    @classmethod
+    def is_short_link(cls, url: str) -> bool:
+        """已知的短链接/联盟跳转域名，或不属于已知商家的"域名/短ID"形式"""
+        host = cls._host(url)
+        if _host_matches(host, SHORT_LINK_HOSTS):
+            return True
+        if _host_matches(host, MERCHANT_HOSTS):
+            return False
+        parsed = urlparse(url)
+        return not parsed.query and bool(_SHORT_PATH_RE.match(parsed.path))
+
+    def lookup(self, url: str) -> Optional[str]:
+        """返回已知的最终URL，未缓存时返回None"""
+        if not url:
+            return None
+        # 商家商品页不会被记录为短链接，不必查询
+        if _host_matches(self._host(url), MERCHANT_HOSTS):
+            self.stats["skipped"] += 1
+            return None
+        key = self.make_key(url)
+
+        canonical = self._memory.get(key)
+        if canonical is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            self.stats["hits"] += 1
+            return canonical
+
+        expires = self._misses.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                self.stats["memory_misses"] += 1
+                self.stats["misses"] += 1
+                return None
+            del self._misses[key]
+
+        try:
+            canonical = self.store.get(key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Redirect cache read failed: {str(e)}")
+            return None
+
+        if canonical is None:
+            self.stats["misses"] += 1
+            self._remember_miss(key)
+            return None
+        self.stats["hits"] += 1
+        self._remember(key, canonical)
+        return canonical
+
+    def resolve(self, url: str) -> str:
+        """最终URL（未缓存时原样返回）"""
+        return self.lookup(url) or url
+
+    def record(self, url: str, final_url: str):
+        """记录一次成功（2xx）落地的重定向；只缓存短链接、联盟跳转链接跳到其他域名的重定向"""
+        if not url or not final_url or self._host(url) == self._host(final_url):
+            return
+        if not self.is_short_link(url):
+            # 普通商品页跨域名跳转多半是验证码、登录或地区页面，不能成为长期的抓取目标
+            self.stats["rejected"] += 1
+            return
+        key = self.make_key(url)
+        self._misses.pop(key, None)
+        if self._memory.get(key) == final_url:
+            return
+        try:
+            self.store.set(key, final_url, self.ttl)
+            self.stats["writes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Redirect cache write failed: {str(e)}")
+        self._remember(key, final_url)
+        logger.info(f"Cached redirect {url} -> {final_url}")
+
+    def _remember_miss(self, key: str):
+        self._misses[key] = time.monotonic() + self.miss_ttl
+        self._misses.move_to_end(key)
+        while len(self._misses) > self.memory_entries:
+            self._misses.popitem(last=False)
+
+    def _remember(self, key: str, canonical: str):
+        self._memory[key] = canonical
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        stats = {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_miss_entries": len(self._misses),
+        }
+        try:
+            stats["store"] = self.store.get_stats()
+        except Exception as e:
+            stats["store"] = {"error": str(e)}
+        return stats
+
+
+def _create_redirect_cache() -> RedirectCache:
+    settings = get_settings()
+    store = SQLiteKVStore(
+        path=settings.redirect_cache_path,
+        table="redirects",
+        max_entries=settings.redirect_cache_max_entries,
+        max_bytes=settings.redirect_cache_max_bytes,
+    )
+    return RedirectCache(store, ttl=settings.redirect_cache_ttl)
+
+
+# 全局重定向缓存
+redirect_cache = _create_redirect_cache()
@@ -0,0 +1,134 @@
+"""
+Retailer search page parsers
+零售商搜索页解析器：可插拔后端（lxml / BeautifulSoup+SoupStrainer），只构建搜索结果容器
+所有函数均为纯函数，可在工作进程中执行
+"""
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+    LXML_AVAILABLE = True
+except ImportError:  # lxml未安装时退回BeautifulSoup
+    LXML_AVAILABLE = False
+
+AMAZON_BASE_URL = "https://www.amazon.com"
+
+_PRICE_RE = re.compile(r'[\d,]+\.?\d*')
+
+# Amazon搜索结果容器
+_AMAZON_RESULT_XPATH = '//div[@data-component-type="s-search-result"]'
+
+
+def _parse_price_text(price_text: str) -> float:
+    """从价格文本提取数字"""
+    price_match = _PRICE_RE.search(price_text.replace(',', ''))
+    return float(price_match.group()) if price_match else 0.0
+
+
+def _build_amazon_product(title: str, price: float, href: Optional[str], image_url: str,
+                          query: str, search_url: str) -> Dict[str, Any]:
+    return {
+        "retailer": "Amazon",
+        "title": (title or query)[:100],  # 限制标题长度
+        "price": price,
+        "url": f"{AMAZON_BASE_URL}{href}" if href else search_url,
+        "image_url": image_url,
+        "in_stock": True,
+    }
+
+
+def _has_class(class_name: str) -> str:
+    """XPath: 元素class包含指定类名"""
+    return f'contains(concat(" ", normalize-space(@class), " "), " {class_name} ")'
+
+
+def _lxml_text(element) -> str:
+    """等价于BeautifulSoup的get_text(strip=True)"""
+    return "".join(part.strip() for part in element.itertext())
+
+
+def _parse_amazon_search_lxml(html: str, query: str, search_url: str, max_results: int) -> List[Dict[str, Any]]:
+    """lxml后端（C实现）"""
+    tree = lxml.html.fromstring(html)
+    products = []
+
+    for container in tree.xpath(_AMAZON_RESULT_XPATH)[:max_results]:
+        try:
+            title_h2 = container.xpath(f'.//h2[{_has_class("a-size-mini")}]')
+            title_elem = title_h2 or container.xpath(f'.//span[{_has_class("a-size-medium")}]')
+            title = _lxml_text(title_elem[0]) if title_elem else query
+
+            price_elem = (container.xpath(f'.//span[{_has_class("a-price-whole")}]')
+                          or container.xpath(f'.//span[{_has_class("a-offscreen")}]'))
+            price = _parse_price_text(_lxml_text(price_elem[0])) if price_elem else 0.0
+
+            href = None
+            if title_h2:
+                links = title_h2[0].xpath('.//a')
+                href = links[0].get('href') if links else None
+
+            img_elem = container.xpath(f'.//img[{_has_class("s-image")}]')
+            image_url = img_elem[0].get('src', '') if img_elem else ""
+
+            if price > 0:  # 只添加有价格的产品
+                products.append(_build_amazon_product(title, price, href, image_url, query, search_url))
+        except Exception:
+            continue
+
+    return products
+
+
+def _parse_amazon_search_bs4(html: str, query: str, search_url: str, max_results: int) -> List[Dict[str, Any]]:
+    """BeautifulSoup后端，SoupStrainer只构建搜索结果容器"""
+    strainer = SoupStrainer('div', attrs={'data-component-type': 's-search-result'})
+    soup = BeautifulSoup(html, 'html.parser', parse_only=strainer)
+    products = []
+
+    for container in soup.find_all('div', {'data-component-type': 's-search-result'})[:max_results]:
+        try:
+            title_h2 = container.find('h2', class_='a-size-mini')
+            title_elem = title_h2 or container.find('span', class_='a-size-medium')
+            title = title_elem.get_text(strip=True) if title_elem else query
+
+            price_elem = container.find('span', class_='a-price-whole') or container.find('span', class_='a-offscreen')
+            price = _parse_price_text(price_elem.get_text(strip=True)) if price_elem else 0.0
+
+            href = None
+            if title_h2:
+                link = title_h2.find('a')
+                href = link.get('href') if link else None
+
+            img_elem = container.find('img', class_='s-image')
+            image_url = img_elem.get('src', '') if img_elem else ""
+
+            if price > 0:  # 只添加有价格的产品
+                products.append(_build_amazon_product(title, price, href, image_url, query, search_url))
+        except Exception:
+            continue
+
+    return products
+
+
+AMAZON_SEARCH_BACKENDS: Dict[str, Callable[..., List[Dict[str, Any]]]] = {
+    "bs4": _parse_amazon_search_bs4,
+}
+if LXML_AVAILABLE:
+    AMAZON_SEARCH_BACKENDS["lxml"] = _parse_amazon_search_lxml
+
+
+def resolve_backend(backend: str = "auto") -> str:
+    """解析后端名称，auto优先使用lxml"""
+    if backend == "auto":
+        return "lxml" if LXML_AVAILABLE else "bs4"
+    if backend not in AMAZON_SEARCH_BACKENDS:
+        raise ValueError(f"Unknown or unavailable HTML parser backend: {backend}")
+    return backend
+
+
+def parse_amazon_search(html: str, query: str, search_url: str, max_results: int,
+                        backend: str = "auto") -> List[Dict[str, Any]]:
+    """解析Amazon搜索页，返回ProductPrice字段字典列表"""
+    return AMAZON_SEARCH_BACKENDS[resolve_backend(backend)](html, query, search_url, max_results)
@@ -0,0 +1,101 @@
+"""
+Shared HTTP client for scrapers
+进程级共享的抓取HTTP客户端（连接池、Keep-Alive复用、DNS缓存）
+"""
+import logging
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ScraperClient:
+    """进程级共享的aiohttp客户端，在应用启动时创建、关闭时释放"""
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.stats = {
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        """共享会话是否可用"""
+        return self.session is not None and not self.session.closed
+
+    async def start(self):
+        """创建共享连接池（在FastAPI startup中调用）"""
+        if self.is_running:
+            return
+
+        settings = get_settings()
+        connector = aiohttp.TCPConnector(
+            limit=settings.scraper_pool_limit,
+            limit_per_host=settings.scraper_pool_limit_per_host,
+            keepalive_timeout=settings.scraper_keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=settings.scraper_dns_cache_ttl,
+        )
+        timeout = aiohttp.ClientTimeout(total=settings.scraper_request_timeout)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self._build_trace_config()],
+        )
+        logger.info(
+            f"Scraper client started (limit={settings.scraper_pool_limit}, "
+            f"per_host={settings.scraper_pool_limit_per_host})"
+        )
+
+    async def close(self):
+        """关闭共享连接池（在FastAPI shutdown中调用）"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+            logger.info("Scraper client closed")
+        self.session = None
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """注册连接/DNS事件计数器，用于观察握手节省情况"""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.stats["requests"] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.stats["connections_opened"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.stats["connections_reused"] += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.stats["dns_cache_hits"] += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.stats["dns_cache_misses"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计"""
+        connections = self.stats["connections_opened"] + self.stats["connections_reused"]
+        return {
+            **self.stats,
+            "running": self.is_running,
+            "reuse_ratio": round(self.stats["connections_reused"] / connections, 3) if connections else 0.0,
+        }
+
+
+# 全局共享客户端实例
+scraper_client = ScraperClient()
@@ -0,0 +1,78 @@
+"""
+Single-flight request coalescing
+并发的相同请求共享同一个进行中的协程，所有调用方获得相同的结果或异常；
+单个调用方被取消不影响其他等待者，最后一个等待者离开时取消共享的协程
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+# 所有合并组，用于统一输出统计
+_groups: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self.stats = {
+            "calls": 0,
+            "executions": 0,
+            "duplicates_avoided": 0,
+            "abandoned": 0,
+        }
+        _groups[name] = self
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行fn；若相同key已在进行中，则等待其结果而不重复执行"""
+        self.stats["calls"] += 1
+
+        future = self._inflight.get(key)
+        if future is None:
+            self.stats["executions"] += 1
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._on_done(key, f))
+        else:
+            self.stats["duplicates_avoided"] += 1
+            logger.debug(f"[{self.name}] Joined in-flight call for {key}")
+
+        # shield: 单个调用方被取消时不影响其他等待者
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+                if not future.done():
+                    # 所有调用方都已取消，没有人需要结果：取消共享的协程，之后的调用重新执行
+                    if self._inflight.get(key) is future:
+                        del self._inflight[key]
+                    future.cancel()
+                    self.stats["abandoned"] += 1
+
+    def in_flight(self, key: Hashable) -> bool:
+        """该key是否有进行中的调用（下一次do会加入它）"""
+        return key in self._inflight
+
+    def _on_done(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 所有调用方都已取消时避免 "exception was never retrieved" 警告
+        if not future.cancelled():
+            future.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        return {**self.stats, "in_flight": len(self._inflight)}
+
+
+def get_single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    """获取所有合并组的统计"""
+    return {name: group.get_stats() for name, group in _groups.items()}
@@ -0,0 +1,108 @@
+"""
+Incremental JSON object parser for streamed LLM completions
+边接收token边解析模型输出中的第一个JSON对象：
+跳过对象前的说明文字和markdown代码块标记，顶层字段一完整就可用，对象闭合后忽略之后的内容
+"""
+import json
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+_OPENERS = "{["
+_CLOSERS = "}]"
+
+
+class IncrementalJSONObject:
+    """逐块喂入文本，解析第一个顶层JSON对象的字段
+
+    单个字段的值不合法时只丢弃该字段（记录在invalid_members中），不影响其他字段
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.invalid_members: List[str] = []
+        self.complete = False
+        self._start = -1
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = -1
+
+    @property
+    def started(self) -> bool:
+        return self._start != -1
+
+    @property
+    def object_text(self) -> str:
+        """目前为止的对象文本（对象闭合后即完整的JSON）"""
+        return self.text[self._start:self._pos] if self.started else ""
+
+    def has(self, fields) -> bool:
+        return all(field in self.fields for field in fields)
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """追加一段文本，返回本次新解析完成的顶层字段"""
+        if self.complete or not chunk:
+            return {}
+        self.text += chunk
+        text = self.text
+        pos = self._pos
+
+        if not self.started:
+            start = text.find("{", pos)
+            if start == -1:
+                self._pos = len(text)
+                return {}
+            self._start = start
+            self._depth = 1
+            self._member_start = start + 1
+            pos = start + 1
+
+        completed: Dict[str, Any] = {}
+        length = len(text)
+        while pos < length:
+            char = text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in _OPENERS:
+                self._depth += 1
+            elif char in _CLOSERS:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_member(text[self._member_start:pos], completed)
+                    self.complete = True
+                    pos += 1
+                    break
+            elif char == "," and self._depth == 1:
+                self._finish_member(text[self._member_start:pos], completed)
+                self._member_start = pos + 1
+            pos += 1
+
+        self._pos = pos
+        return completed
+
+    def _finish_member(self, member: str, completed: Dict[str, Any]):
+        """一个完整的顶层 "key": value"""
+        if not member.strip():
+            return
+        try:
+            parsed = json.loads("{" + member + "}", strict=False)
+        except ValueError:
+            self.invalid_members.append(member.strip()[:80])
+            logger.debug(f"Skipping malformed JSON member: {member.strip()[:80]}")
+            return
+        for key, value in parsed.items():
+            if key not in self.fields:
+                self.fields[key] = value
+                completed[key] = value
+
@@ -0,0 +1,308 @@
+"""
+Embedded structured product data
+从商品页内嵌的 schema.org JSON-LD / microdata 以及 OpenGraph 标签中提取商品字段
+优先级：JSON-LD > microdata > OpenGraph，高优先级来源缺失的字段由低优先级补齐
+纯函数，不做网络请求
+"""
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# 与ProductInfoAgent输出一致的字段
+STRUCTURED_FIELDS = (
+    "title", "description", "brand", "model", "original_price", "sale_price",
+    "rating", "rating_count", "image_url", "category",
+)
+
+_PRICE_RE = re.compile(r'\d+(?:\.\d+)?')
+_LIST_PRICE_TYPES = ("listprice", "strikethroughprice", "msrp")
+
+# 只构建结构化数据相关的标签，跳过正文（保留itemscope以确定itemprop属于哪个item）
+_STRUCTURED_TAGS = SoupStrainer(
+    lambda name, attrs: name in ("script", "meta") or "itemprop" in (attrs or {}) or "itemscope" in (attrs or {})
+)
+
+
+def _parse_price(value: Any) -> Optional[float]:
+    """价格可能是数字、"39.97"、"$1,299.00" 等"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    match = _PRICE_RE.search(str(value).replace(",", ""))
+    if not match:
+        return None
+    price = float(match.group())
+    return price if price > 0 else None
+
+
+def _parse_number(value: Any, as_int: bool = False) -> Optional[float]:
+    price = _parse_price(value)
+    if price is None:
+        return None
+    return int(price) if as_int else price
+
+
+def _first(value: Any) -> Any:
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _text(value: Any) -> Optional[str]:
+    """JSON-LD中的文本字段可能是字符串、列表或带name的对象"""
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get("name") or value.get("@value")
+    if value is None:
+        return None
+    text = " ".join(str(value).split())
+    return text or None
+
+
+def _image(value: Any, base_url: str) -> Optional[str]:
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get("url") or value.get("contentUrl")
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value.startswith("//"):
+        return "https:" + value
+    return urljoin(base_url, value)
+
+
+def _has_type(node: Dict[str, Any], type_name: str) -> bool:
+    types = node.get("@type")
+    types = types if isinstance(types, list) else [types]
+    return any(isinstance(t, str) and t.rsplit("/", 1)[-1].lower() == type_name for t in types)
+
+
+def _find_products(node: Any, depth: int = 0) -> List[Dict[str, Any]]:
+    """在JSON-LD中查找Product节点（支持@graph、列表和嵌套mainEntity）"""
+    if depth > 6:
+        return []
+    if isinstance(node, list):
+        return [product for item in node for product in _find_products(item, depth + 1)]
+    if not isinstance(node, dict):
+        return []
+    if _has_type(node, "product") or _has_type(node, "productgroup"):
+        return [node]
+    products = []
+    for key in ("@graph", "mainEntity", "itemListElement", "item"):
+        if key in node:
+            products.extend(_find_products(node[key], depth + 1))
+    return products
+
+
+def _offer_prices(offers: Any) -> Dict[str, Optional[float]]:
+    """从Offer / AggregateOffer / priceSpecification中取当前价和原价"""
+    sale_price = None
+    original_price = None
+    for offer in offers if isinstance(offers, list) else [offers]:
+        if not isinstance(offer, dict):
+            continue
+        price = _parse_price(offer.get("price"))
+        if price is None and _has_type(offer, "aggregateoffer"):
+            price = _parse_price(offer.get("lowPrice"))
+
+        specifications = offer.get("priceSpecification") or []
+        for spec in specifications if isinstance(specifications, list) else [specifications]:
+            if not isinstance(spec, dict):
+                continue
+            spec_price = _parse_price(spec.get("price"))
+            price_type = str(spec.get("priceType") or "").rsplit("/", 1)[-1].lower()
+            if price_type in _LIST_PRICE_TYPES:
+                original_price = original_price or spec_price
+            elif price is None:
+                price = spec_price
+
+        if price is not None and sale_price is None:
+            sale_price = price
+
+    if original_price is not None and sale_price is not None and original_price <= sale_price:
+        original_price = None
+    return {"sale_price": sale_price, "original_price": original_price}
+
+
+def _from_json_ld(scripts: Iterable, base_url: str) -> Dict[str, Any]:
+    for script in scripts:
+        raw = (script.string or script.get_text() or "").strip()
+        if not raw:
+            continue
+        try:
+            data = json.loads(raw, strict=False)
+        except ValueError:
+            continue
+
+        for product in _find_products(data):
+            # ProductGroup的价格通常在第一个变体上
+            variant = _first(product.get("hasVariant")) if _has_type(product, "productgroup") else None
+            offers = product.get("offers") or (variant or {}).get("offers")
+            rating = product.get("aggregateRating") or {}
+            if not isinstance(rating, dict):
+                rating = {}
+            record = {
+                "title": _text(product.get("name")),
+                "description": _text(product.get("description")),
+                "brand": _text(product.get("brand") or product.get("manufacturer")),
+                "model": _text(product.get("model") or product.get("mpn") or product.get("sku")),
+                "image_url": _image(product.get("image") or (variant or {}).get("image"), base_url),
+                "category": _text(product.get("category")),
+                "rating": _parse_number(rating.get("ratingValue")),
+                "rating_count": _parse_number(rating.get("reviewCount") or rating.get("ratingCount"), as_int=True),
+                **_offer_prices(offers),
+            }
+            if record["title"]:
+                return record
+    return {}
+
+
+def _itemprop_value(tag) -> Optional[str]:
+    value = tag.get("content") or tag.get("src") or tag.get("href") or tag.get_text(" ", strip=True)
+    return " ".join(str(value).split()) or None
+
+
+def _itemprop_names(tag) -> List[str]:
+    names = tag["itemprop"]
+    return names.split() if isinstance(names, str) else list(names)
+
+
+def _owner_scope(tag):
+    """itemprop所属的item：最近的带itemscope的祖先；不在任何item中时返回None"""
+    parent = tag.parent
+    while parent is not None:
+        if "itemscope" in (parent.attrs or {}):
+            return parent
+        parent = parent.parent
+    return None
+
+
+def _item_type(scope) -> str:
+    item_type = scope.get("itemtype") or ""
+    item_type = item_type.split()[0] if isinstance(item_type, str) and item_type.split() else ""
+    return item_type.rstrip("/").rsplit("/", 1)[-1].lower()
+
+
+def _from_microdata(itemprop_tags: Iterable, base_url: str) -> Dict[str, Any]:
+    """只读取schema.org/Product这个item的属性及其Offer/Brand/AggregateRating子item；
+    面包屑、评论等其他item的name/price会让标题变成"Home"之类的值。页面没有Product item时只用不属于任何item的属性
+    """
+    # item -> {属性名: 值}；None表示不属于任何item
+    props: Dict[Any, Dict[str, str]] = {}
+    # item -> {属性名: 嵌套的子item}
+    children: Dict[Any, Dict[str, Any]] = {}
+    product = None
+    for tag in itemprop_tags:
+        owner = _owner_scope(tag)
+        key = id(owner) if owner is not None else None
+        if product is None and owner is not None and _item_type(owner) in ("product", "productgroup"):
+            product = owner
+        if "itemscope" in tag.attrs:
+            # 嵌套item的值是它自己的属性
+            for name in _itemprop_names(tag):
+                children.setdefault(key, {}).setdefault(name, tag)
+            continue
+        value = _itemprop_value(tag)
+        if value:
+            for name in _itemprop_names(tag):
+                props.setdefault(key, {}).setdefault(name, value)
+
+    if product is None:
+        found = dict(props.get(None, {}))
+    else:
+        found = dict(props.get(id(product), {}))
+        nested = children.get(id(product), {})
+        brand = nested.get("brand") or nested.get("manufacturer")
+        if brand is not None and "brand" not in found:
+            brand_props = props.get(id(brand), {})
+            if brand_props.get("name"):
+                found["brand"] = brand_props["name"]
+        for name, fields in (("offers", ("price", "lowPrice")),
+                             ("aggregateRating", ("ratingValue", "reviewCount", "ratingCount"))):
+            child = nested.get(name)
+            if child is not None:
+                for field, value in props.get(id(child), {}).items():
+                    if field in fields:
+                        found.setdefault(field, value)
+    if not found:
+        return {}
+    return {
+        "title": found.get("name"),
+        "description": found.get("description"),
+        "brand": found.get("brand"),
+        "model": found.get("model") or found.get("mpn") or found.get("sku"),
+        "image_url": _image(found.get("image"), base_url),
+        "category": found.get("category"),
+        "rating": _parse_number(found.get("ratingValue")),
+        "rating_count": _parse_number(found.get("reviewCount") or found.get("ratingCount"), as_int=True),
+        "sale_price": _parse_price(found.get("price") or found.get("lowPrice")),
+    }
+
+
+def _from_open_graph(meta_tags: Iterable, base_url: str) -> Dict[str, Any]:
+    meta: Dict[str, str] = {}
+    for tag in meta_tags:
+        key = tag.get("property") or tag.get("name")
+        if key and tag.get("content") and key.lower() not in meta:
+            meta[key.lower()] = tag["content"].strip()
+    return {
+        "title": meta.get("og:title"),
+        "description": meta.get("og:description"),
+        "brand": meta.get("product:brand") or meta.get("og:brand"),
+        "image_url": _image(meta.get("og:image") or meta.get("og:image:url"), base_url),
+        "sale_price": _parse_price(meta.get("product:sale_price:amount") or meta.get("product:price:amount")
+                                   or meta.get("og:price:amount")),
+        "original_price": _parse_price(meta.get("product:original_price:amount")),
+    }
+
+
+def extract_structured_product(html, base_url: str) -> Dict[str, Any]:
+    """合并JSON-LD、microdata和OpenGraph，返回找到的字段（缺失字段不出现在结果中）"""
+    soup = BeautifulSoup(html, "html.parser", parse_only=_STRUCTURED_TAGS)
+    return structured_product_from_tags(
+        soup.find_all("script", type="application/ld+json"),
+        soup.find_all(attrs={"itemprop": True}),
+        soup.find_all("meta"),
+        base_url,
+    )
+
+
+def structured_product_from_tags(ld_json_scripts: Iterable, itemprop_tags: Iterable,
+                                 meta_tags: Iterable, base_url: str) -> Dict[str, Any]:
+    """同extract_structured_product，标签由调用方在已解析的文档中收集（按文档顺序），省去再解析一次"""
+    record: Dict[str, Any] = {}
+    sources = []
+    for source, extract, tags in (("json_ld", _from_json_ld, ld_json_scripts),
+                                  ("microdata", _from_microdata, itemprop_tags),
+                                  ("open_graph", _from_open_graph, meta_tags)):
+        found = False
+        for field, value in extract(tags, base_url).items():
+            if value is not None and value != "" and field not in record:
+                record[field] = value
+                found = True
+        if found:
+            sources.append(source)
+
+    # 原价和当前价来自不同来源时可能互相矛盾
+    if record.get("original_price") and record.get("sale_price") and record["original_price"] <= record["sale_price"]:
+        del record["original_price"]
+
+    if record:
+        record["sources"] = sources
+    return record
+
+
+def missing_fields(record: Dict[str, Any], required: tuple) -> List[str]:
+    """返回record中缺失的必需字段；"price" 表示当前价和原价都缺失"""
+    missing = []
+    for field in required:
+        if field == "price":
+            if not record.get("sale_price") and not record.get("original_price"):
+                missing.append(field)
+        elif not record.get(field):
+            missing.append(field)
+    return missing
@@ -0,0 +1,152 @@
+"""
+Streaming image upload ingestion
+分块读取上传的图片：首块按文件头判断格式（只接受视觉模型能处理的图片），累计超过大小上限立即拒绝，
+边读边写入磁盘，请求处理过程中不在内存里保留整个原图；发给模型的base64也按块编码
+"""
+import asyncio
+import binascii
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from fastapi import UploadFile
+
+from services.image_preprocessing import image_preprocessor
+
+logger = logging.getLogger(__name__)
+
+# 3的倍数，分块base64编码时块与块之间不需要填充
+CHUNK_SIZE = 48 * 1024
+
+# (文件头偏移, 文件头, MIME类型)
+_SIGNATURES: Tuple[Tuple[int, bytes, str], ...] = (
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+)
+
+
+class UploadRejected(Exception):
+    """上传内容不符合要求（过大或不是支持的图片），status_code为应返回的HTTP状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """按文件头识别图片格式，不支持的格式返回None"""
+    for offset, signature, mime_type in _SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if mime_type == "image/webp" and not head.startswith(b"RIFF"):
+                continue
+            return mime_type
+    return None
+
+
+@dataclass
+class IngestedUpload:
+    """已落盘的上传图片"""
+    path: str
+    size: int
+    mime_type: str
+    filename: str
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+@dataclass
+class VisionImage:
+    """发给视觉模型的图片"""
+    base64: str
+    mime_type: str
+    phash: Optional[int] = None
+
+
+def _copy_upload(source, destination: str, max_bytes: int, label: str) -> Tuple[int, str]:
+    """把上传内容分块复制到destination，返回 (字节数, MIME类型)；不合格时删除已写入的部分"""
+    size = 0
+    mime_type = None
+    try:
+        with open(destination, "wb") as out:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if mime_type is None:
+                    mime_type = sniff_image_type(chunk)
+                    if mime_type is None:
+                        raise UploadRejected(415, f"{label} is not a supported image (JPEG, PNG, WebP or GIF)")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(413, f"{label} exceeds the {max_bytes // (1024 * 1024)}MB upload limit")
+                out.write(chunk)
+    except BaseException:
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        raise
+    if mime_type is None:
+        os.remove(destination)
+        raise UploadRejected(400, f"{label} is empty")
+    return size, mime_type
+
+
+async def ingest_upload(upload: UploadFile, max_bytes: int, destination: Optional[str] = None,
+                        directory: Optional[str] = None) -> IngestedUpload:
+    """分块校验并保存上传的图片
+
+    destination为None时在directory（默认系统临时目录）中创建唯一命名的文件，不使用客户端给的文件名，
+    并发请求上传同名文件（如photo.jpg）也不会互相覆盖；调用方用完后调用discard()删除
+    """
+    label = upload.filename or "Upload"
+    # 客户端声明的大小已超限时不读取内容
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadRejected(413, f"{label} exceeds the {max_bytes // (1024 * 1024)}MB upload limit")
+
+    if destination is None:
+        fd, destination = tempfile.mkstemp(prefix="upload_", suffix=".img", dir=directory)
+        os.close(fd)
+
+    await upload.seek(0)
+    # 整个复制过程在一个线程内完成，避免每块都切换一次线程
+    size, mime_type = await asyncio.to_thread(_copy_upload, upload.file, destination, max_bytes, label)
+    return IngestedUpload(path=destination, size=size, mime_type=mime_type, filename=label)
+
+
+def encode_file_base64(path: str) -> str:
+    """分块base64编码文件，只在内存中保留编码结果（预先分配好大小）"""
+    size = os.path.getsize(path)
+    encoded = bytearray(4 * ((size + 2) // 3))
+    position = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            piece = binascii.b2a_base64(chunk, newline=False)
+            encoded[position:position + len(piece)] = piece
+            position += len(piece)
+    # 文件在读取期间被截断时去掉未填充的部分
+    del encoded[position:]
+    return encoded.decode("ascii")
+
+
+async def encode_for_vision(upload: IngestedUpload) -> VisionImage:
+    """预处理（缩小、去元数据）后编码；未启用预处理或解码失败时直接编码原图"""
+    prepared = await image_preprocessor.prepare(upload.path)
+    if prepared.processed:
+        return VisionImage(base64=binascii.b2a_base64(prepared.data, newline=False).decode("ascii"),
+                           mime_type=prepared.mime_type, phash=prepared.phash)
+    encoded = await asyncio.to_thread(encode_file_base64, upload.path)
+    return VisionImage(base64=encoded, mime_type=upload.mime_type)
@@ -0,0 +1,67 @@
+"""
+Test the alternatives fan-out in ToolIdentificationAgent
+Alternative price lookups run concurrently, bounded by the per-request budget, and each strategy
+returns its products in the same order as the sequential version. A lookup that fails falls back to
+an estimated price without failing its strategy.
+"""
+import asyncio
+import time
+
+from agents.tool_identification_agent import ToolIdentificationAgent, ToolInfo
+from services.price_scraper import ProductPrice
+from utils.config import get_settings
+
+LOOKUP_SECONDS = 0.1
+
+
+async def run_alternatives_fan_out():
+    agent = ToolIdentificationAgent()
+    running = 0
+    peak = 0
+    lookups = []
+
+    async def get_prices(brand, model, tool_name=""):
+        nonlocal running, peak
+        lookups.append(brand)
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(LOOKUP_SECONDS)
+            if brand == "Makita":
+                raise RuntimeError("retailer unavailable")
+            return [ProductPrice(retailer="Home Depot", title=f"{brand} {model or tool_name}", price=120.0)]
+        finally:
+            running -= 1
+
+    agent._get_prices = get_prices
+    tool_info = ToolInfo(name="Cordless Drill", brand="DeWalt", model="DCD771C2", category="power_tools")
+
+    start = time.monotonic()
+    batches = await asyncio.gather(*agent._alternative_strategies(tool_info, 9))
+    elapsed = time.monotonic() - start
+
+    limit = get_settings().alternatives_request_concurrency
+    print(f"  {len(lookups)} lookups in {elapsed:.2f}s, peak concurrency {peak} (limit {limit})")
+    assert len(lookups) == 9
+    assert peak == min(limit, 9)
+    assert elapsed < LOOKUP_SECONDS * len(lookups) / 2
+
+    same_brand, competing, price = batches
+    assert [product.title for product in same_brand] == ["DeWalt DCD777C2", "DeWalt DCD796D2", "DeWalt DCD999B"]
+    assert [product.title for product in competing] == ["Milwaukee Cordless Drill", "Makita Cordless Drill",
+                                                        "Ryobi Cordless Drill"]
+    assert [product.title for product in price] == ["BLACK+DECKER Cordless Drill", "Ryobi Cordless Drill",
+                                                    "Craftsman Cordless Drill"]
+    # The failed Makita lookup is an estimate from the strategy's fallback retailer
+    assert competing[1].retailer == "home_depot" and competing[1].price not in (0, 120.0)
+    assert competing[0].retailer == "home_depot" and competing[0].price == 120.0
+
+
+def test_alternatives_fan_out():
+    asyncio.run(run_alternatives_fan_out())
+
+
+if __name__ == "__main__":
+    print("Testing the alternatives fan-out...")
+    test_alternatives_fan_out()
+    print("All alternatives tests passed")
@@ -0,0 +1,125 @@
+"""
+Test that ProductInfoAgent page fetching does not block the event loop
+Runs a local aiohttp server in the same loop: while a slow product page import is in flight,
+a heartbeat task and a /api/products-style endpoint must keep responding.
+"""
+import asyncio
+import time
+
+from aiohttp import web, ClientSession
+
+from agents.product_info_agent import ProductInfoAgent
+
+SLOW_PAGE_SECONDS = 1.5
+PRODUCT_PAGE = """<html><head><title>DEWALT 20V MAX Cordless Drill (DCD771C2)</title>
+<meta property="og:image" content="https://example.com/images/product-dcd771c2.jpg"></head>
+<body><main><h1>DEWALT 20V MAX Cordless Drill</h1><p>$99.00</p></main></body></html>"""
+
+
+async def slow_product(request):
+    await asyncio.sleep(SLOW_PAGE_SECONDS)
+    return web.Response(text=PRODUCT_PAGE, content_type="text/html")
+
+
+async def short_link(request):
+    raise web.HTTPFound("/p/dewalt-dcd771c2")
+
+
+async def amazon_blocked(request):
+    return web.Response(status=503, text="Service Unavailable")
+
+
+async def products_api(request):
+    return web.json_response({"products": []})
+
+
+async def start_server():
+    app = web.Application()
+    app.router.add_get("/p/dewalt-dcd771c2", slow_product)
+    app.router.add_get("/s/abc", short_link)
+    app.router.add_get("/amazon/dp/B00ET5VMTU", amazon_blocked)
+    app.router.add_get("/api/products", products_api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def heartbeat(stop: asyncio.Event, gaps: list):
+    """Record the largest gap between 50ms ticks"""
+    last = time.monotonic()
+    while not stop.is_set():
+        await asyncio.sleep(0.05)
+        now = time.monotonic()
+        gaps.append(now - last)
+        last = now
+
+
+async def run_event_loop_keeps_serving():
+    runner, base_url = await start_server()
+    agent = ProductInfoAgent()
+    stop = asyncio.Event()
+    gaps = []
+
+    try:
+        beat = asyncio.create_task(heartbeat(stop, gaps))
+        started = time.monotonic()
+        fetch = asyncio.create_task(agent._fetch_page_content(f"{base_url}/s/abc"))
+
+        # Public API traffic while the import is in flight
+        api_latencies = []
+        async with ClientSession() as session:
+            while not fetch.done():
+                request_start = time.monotonic()
+                async with session.get(f"{base_url}/api/products") as response:
+                    assert response.status == 200
+                api_latencies.append(time.monotonic() - request_start)
+                await asyncio.sleep(0.1)
+
+        content = await fetch
+        elapsed = time.monotonic() - started
+        stop.set()
+        await beat
+
+        print(f"  Import took {elapsed:.2f}s")
+        print(f"  Heartbeat max gap: {max(gaps) * 1000:.0f}ms over {len(gaps)} ticks")
+        print(f"  /api/products served {len(api_latencies)} requests during import, "
+              f"max latency {max(api_latencies) * 1000:.0f}ms")
+
+        assert content and "DEWALT 20V MAX Cordless Drill" in content
+        assert f"Final URL: {base_url}/p/dewalt-dcd771c2" in content, "redirect should be followed"
+        assert elapsed >= SLOW_PAGE_SECONDS
+        assert max(gaps) < 0.25, "event loop was blocked during page fetch"
+        assert len(api_latencies) >= 5 and max(api_latencies) < 0.25, "API stalled during page fetch"
+    finally:
+        stop.set()
+        await runner.cleanup()
+
+
+async def run_amazon_503_fallback():
+    runner, base_url = await start_server()
+    agent = ProductInfoAgent()
+    try:
+        content = await agent._fetch_page_content(f"{base_url}/amazon/dp/B00ET5VMTU")
+        print(f"  503 fallback content: {content.strip().splitlines()[0] if content else None}")
+        assert content and "B00ET5VMTU" in content
+    finally:
+        await runner.cleanup()
+
+
+def test_event_loop_keeps_serving():
+    asyncio.run(run_event_loop_keeps_serving())
+
+
+def test_amazon_503_fallback():
+    asyncio.run(run_amazon_503_fallback())
+
+
+if __name__ == "__main__":
+    print("Testing event loop responsiveness during page import...")
+    test_event_loop_keeps_serving()
+    print("Testing Amazon 503 fallback...")
+    test_amazon_503_fallback()
+    print("All async page fetch tests passed")
@@ -0,0 +1,206 @@
+"""
+Test bulk product import
+Serves product pages with complete JSON-LD from a local server (no LLM needed), checks the
+worker and per-domain limits, batched inserts, streamed progress, and that a resumed batch
+does not re-fetch URLs that already finished. A batch is claimed in the database, so a second
+worker process cannot run it at the same time and finished items are never imported twice.
+A subscriber connected to another worker follows the batch from the database until it finishes.
+Each test runs against its own SQLite database, whichever test modules imported database first.
+"""
+import asyncio
+import os
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+
+from aiohttp import web
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import database
+from agents.product_info_agent import ProductInfoAgent
+from services.bulk_importer import BulkImporter
+from services.product_import_service import ProductImportService
+
+PAGE_DELAY_SECONDS = 0.2
+PRODUCT_PAGE = """<html><head><title>{name}</title><script type="application/ld+json">
+{{"@context": "https://schema.org", "@type": "Product", "name": "{name}", "brand": "DEWALT",
+  "image": "/images/{sku}.jpg", "category": "Power Tools",
+  "offers": {{"@type": "Offer", "price": "{price}"}}}}
+</script></head><body><main><h1>{name}</h1></main></body></html>"""
+
+
+class PageServer:
+    def __init__(self):
+        self.hits = Counter()
+        self.in_flight = Counter()
+        self.max_in_flight = Counter()
+        self.max_total_in_flight = 0
+
+    async def product(self, request):
+        sku = request.match_info["sku"]
+        host = request.host.split(":")[0]
+        self.hits[sku] += 1
+        self.in_flight[host] += 1
+        self.max_in_flight[host] = max(self.max_in_flight[host], self.in_flight[host])
+        self.max_total_in_flight = max(self.max_total_in_flight, sum(self.in_flight.values()))
+        try:
+            await asyncio.sleep(PAGE_DELAY_SECONDS)
+            if sku.startswith("missing"):
+                return web.Response(status=404, text="Not Found")
+            return web.Response(text=PRODUCT_PAGE.format(name=f"DEWALT Drill {sku}", sku=sku, price=99),
+                                content_type="text/html")
+        finally:
+            self.in_flight[host] -= 1
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/p/{sku}", self.product)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+
+@contextmanager
+def isolated_database():
+    """Point database.get_db_session at a fresh SQLite database for the duration of a test"""
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bulk_import_test.db')}",
+                           connect_args={"check_same_thread": False})
+    real_engine, real_session_local = database.engine, database.SessionLocal
+    database.engine = engine
+    database.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    try:
+        database.create_tables()
+        yield
+    finally:
+        database.engine, database.SessionLocal = real_engine, real_session_local
+        engine.dispose()
+
+
+async def collect(importer: BulkImporter, batch_id: int, limit: int = None):
+    events = []
+    async for event in importer.events(batch_id):
+        events.append(event)
+        if limit and len([e for e in events if e["event"] == "item"]) >= limit:
+            break
+    return events
+
+
+async def run_bulk_import_and_resume():
+    server = PageServer()
+    port = await server.start()
+    agent = ProductInfoAgent()
+    agent.ai_enabled = False
+
+    # Two "domains" (127.0.0.1 and localhost), plus one URL that 404s
+    urls = [f"http://127.0.0.1:{port}/p/a{i}" for i in range(6)]
+    urls += [f"http://localhost:{port}/p/b{i}" for i in range(6)]
+    urls += [f"http://localhost:{port}/p/missing-1", urls[0]]  # duplicate is dropped
+
+    try:
+        batch = ProductImportService.create_batch(urls, created_by=None)
+        assert batch["total"] == 13
+
+        # First run: stop ("restart") after a few URLs have been saved
+        importer = BulkImporter(concurrency=3, per_domain=2, batch_size=2, flush_interval=0.2)
+        assert await importer.start(batch["id"], agent=agent)
+        # Another worker process (e.g. a second gunicorn worker resuming on startup) is refused
+        other_worker = BulkImporter(concurrency=3, per_domain=2, batch_size=2, flush_interval=0.2)
+        assert not await other_worker.start(batch["id"], agent=agent)
+        assert await other_worker.resume_unfinished() == []
+        other_worker._retry_task.cancel()
+        first_events = await collect(importer, batch["id"], limit=4)
+        await importer.stop()
+
+        status = ProductImportService.get_batch(batch["id"])
+        finished_first = status["counts"]["done"] + status["counts"]["failed"]
+        print(f"  Before restart: {finished_first} finished, {status['counts']['pending']} pending, "
+              f"max in flight per domain {dict(server.max_in_flight)}, total {server.max_total_in_flight}")
+        assert first_events[0]["event"] == "batch"
+        assert 4 <= finished_first < 13
+        assert max(server.max_in_flight.values()) <= 2 and server.max_total_in_flight <= 3
+
+        # Resume with a new importer, as after a process restart
+        importer = BulkImporter(concurrency=3, per_domain=2, batch_size=5, flush_interval=0.2)
+        assert await importer.start(batch["id"], agent=agent), "a clean shutdown releases the claim"
+        events = await collect(importer, batch["id"])
+        done = events[-1]
+        print(f"  After resume: {done['counts']}, {len([e for e in events if e['event'] == 'item'])} items streamed")
+
+        assert done["event"] == "done" and done["status"] == "completed"
+        assert done["counts"] == {"pending": 0, "done": 12, "failed": 1}
+        saved = [item for item in ProductImportService.get_batch(batch["id"], include_items=True)["items"]
+                 if item["status"] == "done"]
+        assert len({item["product_id"] for item in saved}) == 12
+        assert all(item["extraction_method"] == "structured_data" for item in saved)
+        # Nothing finished in the first run was fetched a second time
+        first_done = [e["url"] for e in first_events if e["event"] == "item"]
+        assert all(server.hits[url.rsplit("/", 1)[-1]] == 1 for url in first_done)
+
+        # A late result for an item that already finished does not insert another product
+        late = ProductImportService.record_results(batch["id"], [{
+            "item_id": saved[0]["id"], "elapsed_ms": 1,
+            "product_fields": {"title": "Duplicate", "product_url": saved[0]["url"]}}])
+        assert late == []
+        assert ProductImportService.get_batch(batch["id"], include_items=True)["items"][0] == saved[0]
+    finally:
+        await server.runner.cleanup()
+
+
+async def run_progress_from_other_worker():
+    server = PageServer()
+    port = await server.start()
+    agent = ProductInfoAgent()
+    agent.ai_enabled = False
+    urls = [f"http://127.0.0.1:{port}/p/c{i}" for i in range(6)]
+    try:
+        batch = ProductImportService.create_batch(urls, created_by=None)
+        running = BulkImporter(concurrency=2, per_domain=2, batch_size=1, flush_interval=0.1)
+        # The subscriber reached a different worker process than the one importing
+        other_worker = BulkImporter(concurrency=2, per_domain=2, batch_size=1, flush_interval=0.1,
+                                    poll_interval=0.05)
+        assert await running.start(batch["id"], agent=agent)
+        events = await collect(other_worker, batch["id"])
+        items = [event for event in events if event["event"] == "item"]
+        print(f"  Other worker streamed {len(items)} items, then {events[-1]['event']}")
+        assert events[0]["event"] == "batch" and events[0]["status"] == "running"
+        assert events[-1]["event"] == "done" and events[-1]["status"] == "completed"
+        assert events[-1]["counts"] == {"pending": 0, "done": 6, "failed": 0}
+        assert sorted(item["url"] for item in items) == sorted(urls)
+    finally:
+        await server.runner.cleanup()
+
+
+def test_batch_claims():
+    with isolated_database():
+        batch = ProductImportService.create_batch(["https://www.homedepot.com/p/318369451"])
+        assert ProductImportService.claim_batch(batch["id"], "worker-a", lease_seconds=60)
+        assert not ProductImportService.claim_batch(batch["id"], "worker-b", lease_seconds=60)
+        # worker-a stopped renewing (killed): once the lease is over worker-b takes over
+        assert ProductImportService.claim_batch(batch["id"], "worker-b", lease_seconds=0)
+        assert not ProductImportService.renew_claim(batch["id"], "worker-a")
+        assert ProductImportService.renew_claim(batch["id"], "worker-b")
+        ProductImportService.release_batch(batch["id"], "worker-b", "completed")
+        assert not ProductImportService.claim_batch(batch["id"], "worker-a", lease_seconds=60)
+
+
+def test_bulk_import_and_resume():
+    with isolated_database():
+        asyncio.run(run_bulk_import_and_resume())
+
+
+def test_progress_from_other_worker():
+    with isolated_database():
+        asyncio.run(run_progress_from_other_worker())
+
+
+if __name__ == "__main__":
+    print("Testing batch claims...")
+    test_batch_claims()
+    print("Testing bulk import with restart and resume...")
+    test_bulk_import_and_resume()
+    print("Testing progress streamed from another worker...")
+    test_progress_from_other_worker()
+    print("All bulk import tests passed")
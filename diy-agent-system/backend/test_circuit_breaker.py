@@ -0,0 +1,189 @@
+"""
+Test per-host circuit breakers
+The breaker opens once the windowed error rate passes the threshold, rejects requests while open,
+lets one probe through after open_seconds, and closes or re-opens on the probe's result. A probe
+that is cancelled before it reports back (deadline, hedging, shutdown) must give its slot back
+instead of leaving the host blocked, and a page fetch counts once no matter how often it retried.
+"""
+import asyncio
+import time
+
+from aiohttp import web
+
+from agents.product_info_agent import ProductInfoAgent
+from services.circuit_breaker import CircuitBreaker, HostHealthRegistry, host_health
+from services.price_scraper import PriceScraper
+
+OPEN_SECONDS = 0.05
+
+
+def make_breaker() -> CircuitBreaker:
+    return CircuitBreaker("tools.example", window_seconds=60, min_requests=4,
+                          error_rate_threshold=0.5, open_seconds=OPEN_SECONDS)
+
+
+def trip(breaker: CircuitBreaker):
+    for _ in range(breaker.min_requests):
+        assert breaker.allow_request()
+        breaker.record_failure()
+        if breaker.state == CircuitBreaker.OPEN:
+            return
+    assert False, "breaker should have opened"
+
+
+def run_state_transitions():
+    breaker = make_breaker()
+    # Below min_requests the breaker stays closed whatever the error rate
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED, "3 of 4 failed but the last one succeeded"
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 1
+
+    assert not breaker.allow_request() and breaker.rejected == 1
+
+    # After open_seconds exactly one probe is let through
+    time.sleep(OPEN_SECONDS)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 2
+
+    time.sleep(OPEN_SECONDS)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.error_rate() == 0.0
+
+
+async def run_cancelled_probe_releases_slot():
+    registry = HostHealthRegistry()
+    breaker = registry.breaker("tools.example")
+    breaker.open_seconds = OPEN_SECONDS
+    trip(breaker)
+    await asyncio.sleep(OPEN_SECONDS)
+
+    async def probe():
+        with registry.request("tools.example") as call:
+            assert call.allowed
+            await asyncio.sleep(10)
+            call.success()
+
+    task = asyncio.create_task(probe())
+    await asyncio.sleep(0.01)
+    assert not registry.allow_request("tools.example"), "the probe is still in flight"
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    print(f"  After cancelled probe: {breaker.get_stats()}")
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with registry.request("tools.example") as call:
+        assert call.allowed, "a cancelled probe must not block the host"
+        call.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    # A probe that never reports back (no with-block) expires after open_seconds
+    trip(breaker)
+    await asyncio.sleep(OPEN_SECONDS)
+    assert breaker.allow_request() and not breaker.allow_request()
+    await asyncio.sleep(OPEN_SECONDS)
+    assert breaker.allow_request()
+
+
+async def run_cancelled_price_search_probe(base_url: str):
+    host = base_url.split("//", 1)[1]
+    breaker = host_health.breaker(host)
+    breaker.open_seconds = OPEN_SECONDS
+    trip(breaker)
+    await asyncio.sleep(OPEN_SECONDS)
+
+    async with PriceScraper() as scraper:
+        # The retailer hangs; the caller's deadline cancels the probe mid-request
+        try:
+            await asyncio.wait_for(scraper._fetch_search_page(f"{base_url}/hang"), timeout=0.2)
+            assert False, "the search should have been cancelled"
+        except asyncio.TimeoutError:
+            pass
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        html = await scraper._fetch_search_page(f"{base_url}/search")
+    assert html == "<html>results</html>"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def run_page_fetch_counts_once(base_url: str):
+    host = base_url.split("//", 1)[1]
+    agent = ProductInfoAgent()
+
+    async def timing_out(url, headers=None, timeout=10):
+        raise asyncio.TimeoutError()
+
+    agent._http_get = timing_out
+    real_sleep = asyncio.sleep
+
+    async def no_backoff(delay, *args, **kwargs):
+        return await real_sleep(0)
+
+    asyncio.sleep = no_backoff
+    try:
+        assert await agent._fetch_page_uncoalesced(f"{base_url}/p/slow") is None
+    finally:
+        asyncio.sleep = real_sleep
+    stats = host_health.breaker(host).get_stats()
+    print(f"  After one fetch with 3 timed-out attempts: {stats}")
+    assert stats["window_requests"] == 1 and stats["error_rate"] == 1.0
+
+
+async def start_server():
+    async def hang(request):
+        await asyncio.sleep(10)
+        return web.Response(text="too late")
+
+    async def search(request):
+        return web.Response(text="<html>results</html>", content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/hang", hang)
+    app.router.add_get("/search", search)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+async def run_with_server(scenario):
+    runner, base_url = await start_server()
+    try:
+        await scenario(base_url)
+    finally:
+        await runner.cleanup()
+
+
+def test_state_transitions():
+    run_state_transitions()
+
+
+def test_cancelled_probe_releases_slot():
+    asyncio.run(run_cancelled_probe_releases_slot())
+
+
+def test_cancelled_price_search_probe():
+    asyncio.run(run_with_server(run_cancelled_price_search_probe))
+
+
+def test_page_fetch_counts_once():
+    asyncio.run(run_with_server(run_page_fetch_counts_once))
+
+
+if __name__ == "__main__":
+    print("Testing breaker state transitions...")
+    test_state_transitions()
+    print("Testing that a cancelled probe releases its slot...")
+    test_cancelled_probe_releases_slot()
+    print("Testing a price search cancelled while probing...")
+    test_cancelled_price_search_probe()
+    print("Testing that a page fetch counts once for all retries...")
+    test_page_fetch_counts_once()
+    print("All circuit breaker tests passed")
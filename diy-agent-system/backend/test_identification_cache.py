@@ -0,0 +1,243 @@
+"""
+Test the perceptual-hash identification cache
+Re-uploads of the same tool photo (re-compressed, resized, slightly brightened) must hash within
+the Hamming-distance threshold while a different photo does not; the BK-tree must find the same
+matches as a brute-force scan; and ToolIdentificationAgent must skip the vision call for
+near-duplicates, including after a restart. Failed vision calls and results without a model
+confidence are never cached.
+"""
+import asyncio
+import base64
+import io
+import os
+import random
+import tempfile
+from dataclasses import asdict
+from types import SimpleNamespace
+
+from PIL import Image, ImageDraw, ImageEnhance
+
+import agents.tool_identification_agent as tool_agent_module
+import services.openai_vision_service as vision_module
+from agents.tool_identification_agent import ToolIdentificationAgent
+from services.identification_cache import BKTree, IdentificationCache, hamming_distance, phash_bytes
+from services.image_preprocessing import preprocess_image
+from services.kv_store import SQLiteKVStore
+from services.openai_vision_service import vision_service
+
+VISION_RESULT = {
+    "tool_name": "Cordless Drill/Driver",
+    "category": "power tool",
+    "brand": "DeWalt",
+    "model": "DCD771C2",
+    "confidence": 0.92,
+    "primary_use": "Drilling holes and driving screws",
+    "features": ["20V MAX battery"],
+}
+
+
+def make_photo(seed: int, width=1600, height=1200) -> Image.Image:
+    """A cluttered workbench: random shapes on a gradient"""
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(25):
+        x, y = rng.randrange(width), rng.randrange(height)
+        size = rng.randrange(80, 400)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle((x, y, x + size, y + size // 2), fill=color)
+        else:
+            draw.ellipse((x, y, x + size, y + size), fill=color)
+    return image
+
+
+def encode(image: Image.Image, quality=92) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def make_cache(path: str, max_distance=6) -> IdentificationCache:
+    store = SQLiteKVStore(path, "identifications", max_entries=100, max_bytes=1024 * 1024)
+    return IdentificationCache(store, ttl=3600, max_distance=max_distance, min_confidence=0.8)
+
+
+def run_phash_near_duplicates():
+    photo = make_photo(1)
+    original = phash_bytes(encode(photo))
+    variants = {
+        "recompressed": encode(photo, quality=40),
+        "resized": encode(photo.resize((800, 600))),
+        "brighter": encode(ImageEnhance.Brightness(photo).enhance(1.1)),
+        "cropped": encode(photo.crop((16, 12, 1584, 1188))),
+    }
+    for name, data in variants.items():
+        distance = hamming_distance(original, phash_bytes(data))
+        print(f"  {name}: distance {distance}")
+        assert distance <= 6
+
+    different = hamming_distance(original, phash_bytes(encode(make_photo(2))))
+    print(f"  different photo: distance {different}")
+    assert different > 12
+
+    # The preprocessor hashes the image it already decoded; it matches the original upload
+    prepared = preprocess_image(encode(photo), max_dimension=1024, quality=85)
+    assert hamming_distance(original, prepared.phash) <= 6
+
+
+def run_bk_tree_matches_brute_force():
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    # Plant some near neighbours of the first hash
+    for bits in (1, 3, 5, 9):
+        flipped = hashes[0]
+        for bit in rng.sample(range(64), bits):
+            flipped ^= 1 << bit
+        hashes.append(flipped)
+
+    tree = BKTree()
+    for value in hashes:
+        tree.add(value)
+    assert not tree.add(hashes[0]) and tree.size == len(set(hashes))
+
+    for query in hashes[:20]:
+        expected = sorted((hamming_distance(query, value), value) for value in set(hashes)
+                          if hamming_distance(query, value) <= 6)
+        assert tree.search(query, 6) == expected
+    assert [distance for distance, _ in tree.search(hashes[0], 6)] == [0, 1, 3, 5]
+
+
+async def run_agent_skips_vision_for_near_duplicates(tmp_dir: str):
+    calls = []
+
+    async def identify_tool(image_base64, fields=None, mime_type="image/jpeg"):
+        calls.append(mime_type)
+        return dict(VISION_RESULT)
+
+    path = os.path.join(tmp_dir, "identification_cache.db")
+    original_cache = tool_agent_module.identification_cache
+    original_gateway = tool_agent_module.llm_gateway
+    original_identify = vision_service.identify_tool
+    tool_agent_module.identification_cache = make_cache(path)
+    tool_agent_module.llm_gateway = SimpleNamespace(enabled=True)
+    vision_service.identify_tool = identify_tool
+    try:
+        agent = ToolIdentificationAgent()
+        photo = make_photo(3)
+        prepared = preprocess_image(encode(photo), max_dimension=1024, quality=85)
+        first = await agent._identify_tool(base64.b64encode(prepared.data).decode(), prepared.mime_type,
+                                           prepared.phash)
+        assert first.brand == "DeWalt" and len(calls) == 1
+
+        # Same tool photo re-uploaded at a lower quality; the agent hashes it itself
+        reupload = base64.b64encode(encode(photo, quality=50)).decode()
+        second = await agent._identify_tool(reupload)
+        assert second == first and len(calls) == 1
+
+        # A different photo still goes to the vision model
+        await agent._identify_tool(base64.b64encode(encode(make_photo(4))).decode())
+        assert len(calls) == 2
+
+        stats = tool_agent_module.identification_cache.get_stats()
+        print(f"  Stats: hits {stats['hits']}, misses {stats['misses']}, writes {stats['writes']}, "
+              f"hit rate {stats['hit_rate']}")
+        assert stats["hits"] == 1 and stats["misses"] == 2 and stats["writes"] == 2
+
+        # After a restart the index is rebuilt from the persisted entries
+        tool_agent_module.identification_cache.store.close()
+        tool_agent_module.identification_cache = make_cache(path)
+        third = await agent._identify_tool(reupload)
+        assert third == first and len(calls) == 2
+        assert tool_agent_module.identification_cache.get_stats()["indexed_hashes"] == 2
+    finally:
+        tool_agent_module.identification_cache.store.close()
+        tool_agent_module.identification_cache = original_cache
+        tool_agent_module.llm_gateway = original_gateway
+        vision_service.identify_tool = original_identify
+
+
+async def run_low_confidence_results_are_not_cached(tmp_dir: str):
+    cache = make_cache(os.path.join(tmp_dir, "low_confidence.db"))
+    await cache.record(0x1234, {"name": "Hammer"}, confidence=0.5)
+    assert await cache.lookup(0x1234) is None
+    assert cache.stats["skipped_low_confidence"] == 1
+    cache.store.close()
+
+
+async def run_failed_vision_calls_are_not_cached(tmp_dir: str):
+    responses = []
+
+    async def chat_json(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    original_cache = tool_agent_module.identification_cache
+    original_agent_gateway = tool_agent_module.llm_gateway
+    original_vision_gateway = vision_module.llm_gateway
+    cache = make_cache(os.path.join(tmp_dir, "failures.db"))
+    tool_agent_module.identification_cache = cache
+    tool_agent_module.llm_gateway = vision_module.llm_gateway = SimpleNamespace(enabled=True, chat_json=chat_json)
+    try:
+        agent = ToolIdentificationAgent()
+        photo = base64.b64encode(encode(make_photo(5))).decode()
+
+        # A rate-limited call falls back to pattern analysis, which is not stored
+        responses.append(RuntimeError("Error code: 429"))
+        fallback = await agent._identify_tool(photo)
+        print(f"  API failure -> {fallback.name}, writes {cache.stats['writes']}")
+        assert cache.stats["writes"] == 0
+
+        # A real answer without the model's confidence is returned but not reused
+        responses.append({key: value for key, value in VISION_RESULT.items() if key != "confidence"})
+        unrated = await agent._identify_tool(photo)
+        assert unrated.brand == "DeWalt" and cache.stats["writes"] == 0
+
+        responses.append(dict(VISION_RESULT))
+        rated = await agent._identify_tool(photo)
+        assert rated.confidence == 0.92 and cache.stats["writes"] == 1
+        assert await cache.lookup(phash_bytes(base64.b64decode(photo))) == asdict(rated)
+    finally:
+        cache.store.close()
+        tool_agent_module.identification_cache = original_cache
+        tool_agent_module.llm_gateway = original_agent_gateway
+        vision_module.llm_gateway = original_vision_gateway
+
+
+def test_phash_near_duplicates():
+    run_phash_near_duplicates()
+
+
+def test_bk_tree_matches_brute_force():
+    run_bk_tree_matches_brute_force()
+
+
+def test_agent_skips_vision_for_near_duplicates():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(run_agent_skips_vision_for_near_duplicates(tmp_dir))
+
+
+def test_failed_vision_calls_are_not_cached():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(run_failed_vision_calls_are_not_cached(tmp_dir))
+
+
+def test_low_confidence_results_are_not_cached():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(run_low_confidence_results_are_not_cached(tmp_dir))
+
+
+if __name__ == "__main__":
+    print("Testing pHash distances for near-duplicate uploads...")
+    test_phash_near_duplicates()
+    print("Testing the BK-tree against a brute-force scan...")
+    test_bk_tree_matches_brute_force()
+    print("Testing that the agent reuses identifications...")
+    test_agent_skips_vision_for_near_duplicates()
+    print("Testing that failed vision calls are not cached...")
+    test_failed_vision_calls_are_not_cached()
+    print("Testing the confidence threshold...")
+    test_low_confidence_results_are_not_cached()
+    print("All identification cache tests passed")
@@ -0,0 +1,197 @@
+"""
+Test asynchronous tool identification jobs
+Jobs return an id immediately, run on a bounded worker pool in submission order, report their
+queue position while waiting, and deliver the result (or a client-safe error) to pollers and
+event subscribers. Submissions are refused once the queue is full, counting slots reserved by
+submissions still being prepared. Job state is shared through a SQLite store so any worker process
+can answer polls and event subscriptions.
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from services.identification_jobs import COMPLETED, FAILED, RUNNING, IdentificationJobs, JobFailed
+from services.kv_store import SQLiteKVStore
+
+RUN_SECONDS = 0.1
+
+
+async def run_bounded_pool_and_polling():
+    jobs = IdentificationJobs(workers=2, max_queued=10, result_ttl=60)
+    running = []
+    peak = []
+
+    def make_runner(index):
+        async def runner():
+            running.append(index)
+            peak.append(len(running))
+            await asyncio.sleep(RUN_SECONDS)
+            running.remove(index)
+            return {"tool_info": {"name": f"Drill {index}"}, "exact_matches": [], "alternatives": []}
+        return runner
+
+    start = time.monotonic()
+    submitted = [await jobs.submit(owner=1, runner=make_runner(i)) for i in range(5)]
+    submit_time = time.monotonic() - start
+    assert submit_time < RUN_SECONDS / 2, "submission must not wait for the pipeline"
+    assert [job["queue_position"] for job in submitted] == [1, 2, 3, 4, 5]
+
+    await asyncio.sleep(0)
+    polled = jobs.get(submitted[4]["job_id"], owner=1)
+    print(f"  Last job while waiting: {polled['status']}, position {polled.get('queue_position')}")
+    assert polled["status"] == "queued" and polled["queue_position"] == 3
+
+    # Other users cannot see the job
+    assert jobs.get(submitted[0]["job_id"], owner=2) is None
+
+    while not all(jobs.get(job["job_id"])["status"] == COMPLETED for job in submitted):
+        await asyncio.sleep(0.01)
+    elapsed = time.monotonic() - start
+    print(f"  5 jobs on 2 workers finished in {elapsed:.2f}s, peak concurrency {max(peak)}")
+    assert max(peak) == 2
+    assert elapsed >= 3 * RUN_SECONDS * 0.9
+    assert jobs.get(submitted[2]["job_id"])["result"]["tool_info"]["name"] == "Drill 2"
+
+    stats = jobs.get_stats()
+    print(f"  Stats: {stats}")
+    assert stats["completed"] == 5 and stats["queued"] == 0 and stats["running"] == 0
+    assert stats["p95_queue_wait"] >= RUN_SECONDS
+    await jobs.stop()
+
+
+async def run_events_and_failures():
+    jobs = IdentificationJobs(workers=1, max_queued=1, result_ttl=60)
+
+    async def slow():
+        await asyncio.sleep(RUN_SECONDS)
+        return {"tool_info": {"name": "Hammer"}}
+
+    async def agent_error():
+        raise JobFailed("No tool recognised in the image")
+
+    async def crash():
+        raise RuntimeError("internal detail that should stay in the logs")
+
+    first = await jobs.submit(owner=1, runner=slow)
+    events = []
+    async for event in jobs.events(first["job_id"]):
+        events.append(event["event"])
+    assert events == ["job", "running", "completed"]
+
+    # A finished job replays its final state to late subscribers
+    late = [event async for event in jobs.events(first["job_id"])]
+    assert [event["event"] for event in late] == ["job", "completed"]
+    assert late[-1]["result"] == {"tool_info": {"name": "Hammer"}}
+
+    failed = await jobs.submit(owner=1, runner=agent_error)
+    crashed = await jobs.submit(owner=1, runner=crash)
+    final = [event async for event in jobs.events(crashed["job_id"])][-1]
+    assert final["event"] == FAILED and final["error"] == "Identification failed"
+    assert jobs.get(failed["job_id"])["error"] == "No tool recognised in the image"
+
+    # The queue holds at most max_queued waiting jobs (running ones do not count)
+    await jobs.submit(owner=1, runner=slow)
+    await asyncio.sleep(0.01)
+    assert jobs.accepting()
+    await jobs.submit(owner=1, runner=slow)
+    assert not jobs.accepting()
+    assert jobs.get_stats()["rejected"] == 1
+
+    # Finished jobs are dropped after the result TTL
+    jobs.result_ttl = 0
+    await jobs.stop()
+    jobs._prune()
+    assert jobs.get(first["job_id"]) is None
+
+
+async def run_reserved_slots():
+    jobs = IdentificationJobs(workers=1, max_queued=2, result_ttl=60)
+
+    # Concurrent submissions reserve their slot before the slow preparation step
+    async def submit_request():
+        if not jobs.reserve():
+            return None
+        try:
+            await asyncio.sleep(0.02)
+        except BaseException:
+            jobs.release()
+            raise
+        return await jobs.submit(owner=1, runner=lambda: asyncio.sleep(RUN_SECONDS), reserved=True)
+
+    results = await asyncio.gather(*(submit_request() for _ in range(6)))
+    accepted = [job for job in results if job is not None]
+    print(f"  Accepted {len(accepted)} of 6 concurrent submissions")
+    assert len(accepted) == 2
+    stats = jobs.get_stats()
+    assert stats["reserved"] == 0 and stats["rejected"] == 4
+
+    # A released reservation frees its slot again
+    await asyncio.sleep(0.01)
+    assert jobs.reserve()
+    jobs.release()
+    assert jobs.get_stats()["reserved"] == 0
+    await jobs.stop()
+
+
+async def run_shared_between_workers():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "jobs.db")
+        worker_a = IdentificationJobs(workers=1, max_queued=10, result_ttl=60,
+                                      store=SQLiteKVStore(path, "identification_jobs", 100, 1024 * 1024))
+        worker_b = IdentificationJobs(workers=1, max_queued=10, result_ttl=60, poll_interval=0.01,
+                                      store=SQLiteKVStore(path, "identification_jobs", 100, 1024 * 1024))
+
+        async def slow():
+            await asyncio.sleep(RUN_SECONDS)
+            return {"tool_info": {"name": "Jigsaw"}}
+
+        submitted = await worker_a.submit(owner=1, runner=slow)
+        job_id = submitted["job_id"]
+
+        # The other worker never saw the submission but can still answer for it
+        assert worker_b.get(job_id) is None
+        polled = await worker_b.find(job_id, owner=1)
+        assert polled is not None and polled["status"] in ("queued", RUNNING)
+        assert "owner" not in polled
+        assert await worker_b.find(job_id, owner=2) is None
+        assert await worker_b.find("missing", owner=1) is None
+
+        events = [event async for event in worker_b.events(job_id)]
+        print(f"  Events seen by the other worker: {[event['event'] for event in events]}")
+        assert events[0]["event"] == "job" and events[-1]["event"] == COMPLETED
+        assert events[-1]["result"] == {"tool_info": {"name": "Jigsaw"}}
+
+        finished = await worker_b.find(job_id, owner=1)
+        assert finished["status"] == COMPLETED and finished["result"]["tool_info"]["name"] == "Jigsaw"
+        await worker_a.stop()
+        worker_a.store.close()
+        worker_b.store.close()
+
+
+def test_bounded_pool_and_polling():
+    asyncio.run(run_bounded_pool_and_polling())
+
+
+def test_events_and_failures():
+    asyncio.run(run_events_and_failures())
+
+
+def test_reserved_slots():
+    asyncio.run(run_reserved_slots())
+
+
+def test_shared_between_workers():
+    asyncio.run(run_shared_between_workers())
+
+
+if __name__ == "__main__":
+    print("Testing the bounded worker pool and polling...")
+    test_bounded_pool_and_polling()
+    print("Testing event streams and failures...")
+    test_events_and_failures()
+    print("Testing reserved queue slots...")
+    test_reserved_slots()
+    print("Testing jobs shared between worker processes...")
+    test_shared_between_workers()
+    print("All identification job tests passed")
@@ -0,0 +1,120 @@
+"""
+Test progressive identification stages
+ToolIdentificationAgent.stream_stages must emit tool_info right after the vision call, then exact
+matches and alternatives batches as their lookups finish (a slow retailer only delays its own
+batch), and finish with the same result process_task returns. Abandoning the stream cancels the
+outstanding lookups.
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from agents.tool_identification_agent import ProductListing, ToolIdentificationAgent, ToolInfo
+from core.agent_base import AgentTask
+
+VISION_SECONDS = 0.05
+DELAYS = {"exact": 0.4, "same_brand": 0.3, "competing": 0.1, "price": 0.2}
+
+
+def listing(retailer: str, title: str, exact=False) -> ProductListing:
+    return ProductListing(retailer=retailer, title=title, price=100.0, url=f"https://{retailer}.example/p",
+                          image_url="https://images.example/p.jpg", is_exact_match=exact)
+
+
+def make_agent(cancelled: list) -> ToolIdentificationAgent:
+    agent = ToolIdentificationAgent()
+
+    async def identify(image_data, mime_type="image/jpeg", image_hash=None):
+        await asyncio.sleep(VISION_SECONDS)
+        return ToolInfo(name="Cordless Drill", brand="DeWalt", model="DCD771C2", category="power_tools",
+                        confidence=0.85, specifications={"primary_use": "Drilling"})
+
+    def lookup(name, products):
+        async def run(*args, **kwargs):
+            try:
+                await asyncio.sleep(DELAYS[name])
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+            return products
+        return run
+
+    agent._identify_tool = identify
+    agent._search_exact_product = lookup("exact", [listing("amazon", "DeWalt DCD771C2", exact=True)])
+    agent._find_same_brand_alternatives = lookup("same_brand", [listing("amazon", "DeWalt DCD777C2")])
+    agent._find_competing_products = lookup("competing", [listing("home_depot", "Milwaukee Drill")])
+    agent._find_price_alternatives = lookup("price", [listing("lowes", "Ryobi Drill")])
+
+    async def realtime(products):
+        for product in products:
+            product.price = 89.0
+        return products
+
+    agent._update_realtime_prices = realtime
+    return agent
+
+
+def make_task(membership="free") -> AgentTask:
+    return AgentTask(task_id="stages", agent_name="tool_identification", created_at=datetime.utcnow(),
+                     input_data={"image_data": "aW1hZ2U=", "include_alternatives": True,
+                                 "membership_level": membership})
+
+
+async def run_stages_arrive_as_they_complete():
+    agent = make_agent([])
+    start = time.monotonic()
+    events = []
+    async for event in agent.stream_stages(make_task("premium")):
+        events.append((event, time.monotonic() - start))
+
+    names = [event["event"] for event, _ in events]
+    print(f"  Stages: {[(event['event'], event.get('batch'), event['elapsed_ms']) for event, _ in events]}")
+    assert names == ["tool_info", "alternatives", "alternatives", "alternatives", "exact_matches", "prices", "done"]
+
+    tool_info_at = events[0][1]
+    done_at = events[-1][1]
+    assert tool_info_at < VISION_SECONDS + 0.05, "tool_info should not wait for retailer lookups"
+    # Lookups run concurrently: total is the slowest lookup, not the sum
+    assert done_at < VISION_SECONDS + DELAYS["exact"] + 0.1
+
+    # Batches arrive fastest first, but the final list keeps strategy order
+    assert [event["batch"] for event, _ in events if event["event"] == "alternatives"] == [1, 2, 0]
+    result = events[-1][0]["result"]
+    assert [p["title"] for p in result["alternatives"]] == ["DeWalt DCD777C2", "Milwaukee Drill", "Ryobi Drill"]
+    assert all(p["price"] == 89.0 for p in result["exact_matches"] + result["alternatives"])
+
+    # process_task returns the same result as the done event
+    agent_result = await agent.process_task(make_task("premium"))
+    assert agent_result.success
+    del agent_result.data["search_timestamp"], result["search_timestamp"]
+    assert agent_result.data == result
+
+
+async def run_abandoned_stream_cancels_lookups():
+    cancelled = []
+    agent = make_agent(cancelled)
+    stream = agent.stream_stages(make_task())
+    first = await stream.__anext__()
+    assert first["event"] == "tool_info" and first["tool_info"]["model"] == "DCD771C2"
+    # Lookups are already running while the client handles tool_info
+    await asyncio.sleep(0.01)
+    await stream.aclose()
+    await asyncio.sleep(0)
+    print(f"  Cancelled lookups: {sorted(cancelled)}")
+    assert sorted(cancelled) == ["competing", "exact", "price", "same_brand"]
+
+
+def test_stages_arrive_as_they_complete():
+    asyncio.run(run_stages_arrive_as_they_complete())
+
+
+def test_abandoned_stream_cancels_lookups():
+    asyncio.run(run_abandoned_stream_cancels_lookups())
+
+
+if __name__ == "__main__":
+    print("Testing progressive identification stages...")
+    test_stages_arrive_as_they_complete()
+    print("Testing that an abandoned stream cancels its lookups...")
+    test_abandoned_stream_cancels_lookups()
+    print("All identification stage tests passed")
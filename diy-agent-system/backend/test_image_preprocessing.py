@@ -0,0 +1,94 @@
+"""
+Test image preprocessing before vision calls
+A large phone-style JPEG with EXIF (GPS, camera model, rotated orientation) must be downscaled,
+turned upright, stripped of metadata and re-encoded smaller, in the worker pool, with the savings
+reported in the preprocessor stats. Undecodable uploads are passed through unchanged.
+"""
+import asyncio
+import io
+
+from PIL import Image, ImageDraw
+
+from services.image_preprocessing import ImagePreprocessor, preprocess_image
+
+ORIENTATION_TAG = 0x0112
+MODEL_TAG = 0x0110
+GPS_IFD_TAG = 0x8825
+
+
+def make_photo(width=4032, height=3024) -> bytes:
+    """A noisy landscape photo stored sideways with orientation 6 (rotate 90° clockwise to view)"""
+    image = Image.effect_noise((width, height), 40).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((width // 4, height // 4, width // 2, height // 2), fill=(200, 60, 30))
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    exif[MODEL_TAG] = "Test Phone 12"
+    exif[GPS_IFD_TAG] = {1: "N", 2: (37.0, 46.0, 30.0)}
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=95, exif=exif.tobytes())
+    return output.getvalue()
+
+
+def run_preprocess_image():
+    photo = make_photo()
+    for output_format, mime_type in (("jpeg", "image/jpeg"), ("webp", "image/webp")):
+        prepared = preprocess_image(photo, max_dimension=1536, quality=85, output_format=output_format)
+        print(f"  {output_format}: {prepared.original_width}x{prepared.original_height} -> "
+              f"{prepared.width}x{prepared.height}, {prepared.original_bytes} -> {len(prepared.data)} bytes "
+              f"in {prepared.elapsed_ms}ms")
+        assert prepared.mime_type == mime_type
+        # Orientation 6 is applied, so the stored landscape becomes portrait
+        assert (prepared.width, prepared.height) == (1152, 1536)
+        assert prepared.bytes_saved > prepared.original_bytes // 2
+
+        result = Image.open(io.BytesIO(prepared.data))
+        assert result.format == output_format.upper()
+        assert len(result.getexif()) == 0, "EXIF should be stripped"
+        assert b"Test Phone" not in prepared.data
+
+    # Images already under the limit keep their size; alpha is flattened for JPEG
+    small = Image.new("RGBA", (300, 200), (0, 0, 255, 0))
+    output = io.BytesIO()
+    small.save(output, format="PNG")
+    prepared = preprocess_image(output.getvalue(), max_dimension=1536, quality=85)
+    assert (prepared.width, prepared.height) == (300, 200)
+    assert Image.open(io.BytesIO(prepared.data)).getpixel((10, 10)) > (240, 240, 240)
+
+
+async def run_preprocessor_stats():
+    preprocessor = ImagePreprocessor(enabled=True, max_dimension=1024, quality=80, output_format="jpeg")
+    photos = [make_photo(3000, 2000), make_photo(2000, 3000)]
+    prepared = await asyncio.gather(*(preprocessor.prepare(photo) for photo in photos))
+    assert all(max(p.width, p.height) == 1024 for p in prepared)
+
+    # Not an image: the original bytes are sent and counted as a failure
+    garbage = b"not an image"
+    passthrough = await preprocessor.prepare(garbage)
+    assert passthrough.data == garbage and not passthrough.processed
+
+    stats = preprocessor.get_stats()
+    print(f"  Stats: {stats}")
+    assert stats["images"] == 2 and stats["failed"] == 1
+    assert stats["bytes_in"] == sum(len(photo) for photo in photos)
+    assert stats["bytes_saved"] == sum(p.bytes_saved for p in prepared) > 0
+    assert stats["p50_ms"] is not None
+
+    disabled = ImagePreprocessor(enabled=False, max_dimension=1024, quality=80, output_format="jpeg")
+    assert (await disabled.prepare(photos[0])).data == photos[0]
+
+
+def test_preprocess_image():
+    run_preprocess_image()
+
+
+def test_preprocessor_stats():
+    asyncio.run(run_preprocessor_stats())
+
+
+if __name__ == "__main__":
+    print("Testing downscale, orientation and metadata stripping...")
+    test_preprocess_image()
+    print("Testing the pooled preprocessor and its stats...")
+    test_preprocessor_stats()
+    print("All image preprocessing tests passed")
@@ -0,0 +1,208 @@
+"""
+Test the LLM response cache
+Runs a local OpenAI-compatible server: the first product extraction calls the model,
+a repeated import of the same page is served from the cache, and the bypass flag forces a new call.
+Completions the caller cannot use (missing required fields) are not cached, and unreadable cache
+entries are treated as misses and deleted.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from aiohttp import web
+
+from services.kv_store import SQLiteKVStore
+from services.llm_cache import LLMResponseCache
+from services.llm_gateway import LLMGateway
+import services.llm_gateway as llm_gateway_module
+
+MODEL_DELAY_SECONDS = 0.3
+PRODUCT_JSON = {"title": "DEWALT 20V MAX Cordless Drill", "brand": "DEWALT", "category": "tools",
+                "original_price": 129.0, "sale_price": 99.0}
+
+
+async def start_model_server(calls: list):
+    async def chat_completions(request):
+        body = await request.json()
+        calls.append(body)
+        await asyncio.sleep(MODEL_DELAY_SECONDS)
+        return web.json_response({
+            "id": f"chatcmpl-{len(calls)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(PRODUCT_JSON)}}],
+            "usage": {"prompt_tokens": 1800, "completion_tokens": 120, "total_tokens": 1920},
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+async def start_streaming_model_server(replies: list, calls: list):
+    """Streams the next reply from replies for each call"""
+    async def chat_completions(request):
+        body = await request.json()
+        calls.append(body)
+        content = replies[min(len(calls), len(replies)) - 1]
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunk = {"id": f"chatcmpl-{len(calls)}", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": body["model"], "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+async def run_unusable_completions_are_not_cached():
+    calls = []
+    replies = [json.dumps({"description": "A drill, but no title"}), json.dumps(PRODUCT_JSON)]
+    runner, base_url = await start_streaming_model_server(replies, calls)
+    tmp_dir = tempfile.mkdtemp()
+    store = SQLiteKVStore(os.path.join(tmp_dir, "llm_cache.db"), "llm_responses", max_entries=100, max_bytes=1024 * 1024)
+    cache = LLMResponseCache(store, ttl=60)
+    gateway = LLMGateway(api_key=None, base_url=base_url, max_concurrency=4, timeout=10,
+                         max_connections=4, max_keepalive_connections=2, max_retries=0)
+
+    original_cache = llm_gateway_module.llm_cache
+    llm_gateway_module.llm_cache = cache
+    messages = [{"role": "user", "content": "Extract product info from: <page text>"}]
+    key = cache.make_key("gpt-4o-mini", messages, max_tokens=1000, temperature=0.1)
+
+    async def extract():
+        return await gateway.chat_json(messages, model="gpt-4o-mini", temperature=0.1, max_tokens=1000,
+                                       purpose="product_extraction", use_cache=True, required=("title",))
+
+    try:
+        # A completion without the required title fails the caller and is not written
+        try:
+            await extract()
+            assert False, "a completion without a title should be rejected"
+        except ValueError:
+            pass
+        assert cache.stats["writes"] == 0 and store.get(key) is None
+
+        assert await extract() == PRODUCT_JSON
+        assert await extract() == PRODUCT_JSON
+        assert len(calls) == 2 and cache.stats["writes"] == 1 and cache.stats["hits"] == 1
+
+        # An entry that is not valid JSON is a miss and is deleted
+        store.set(key, "{not json", ttl=60)
+        assert await cache.get(key) is None
+        assert store.get(key) is None
+
+        # An entry written before the caller required a title is discarded and refetched
+        store.set(key, json.dumps({"content": replies[0], "model": "gpt-4o-mini", "prompt_tokens": 1,
+                                   "completion_tokens": 1, "latency": 0.1}), ttl=60)
+        assert await extract() == PRODUCT_JSON
+        stats = cache.get_stats()
+        print(f"  Model calls: {len(calls)}, writes {stats['writes']}, discarded {stats['discarded']}")
+        assert len(calls) == 3 and stats["discarded"] == 2
+        assert json.loads(json.loads(store.get(key))["content"]) == PRODUCT_JSON
+    finally:
+        llm_gateway_module.llm_cache = original_cache
+        await gateway.close()
+        store.close()
+        await runner.cleanup()
+
+
+async def run_repeated_import_hits_cache():
+    calls = []
+    runner, base_url = await start_model_server(calls)
+    tmp_dir = tempfile.mkdtemp()
+    store = SQLiteKVStore(os.path.join(tmp_dir, "llm_cache.db"), "llm_responses", max_entries=100, max_bytes=1024 * 1024)
+    cache = LLMResponseCache(store, ttl=60)
+    gateway = LLMGateway(api_key=None, base_url=base_url, max_concurrency=4, timeout=10,
+                         max_connections=4, max_keepalive_connections=2, max_retries=0)
+
+    original_cache = llm_gateway_module.llm_cache
+    llm_gateway_module.llm_cache = cache
+    messages = [{"role": "user", "content": "Extract product info from: <page text>"}]
+    try:
+        timings = []
+        for bypass in (False, False, True):
+            start = time.monotonic()
+            response = await gateway.chat(messages, model="gpt-4o-mini", temperature=0.1, max_tokens=1000,
+                                          purpose="product_extraction", use_cache=True, bypass_cache=bypass)
+            timings.append(time.monotonic() - start)
+            assert json.loads(response.content) == PRODUCT_JSON
+
+        stats = cache.get_stats()
+        print(f"  First import {timings[0] * 1000:.0f}ms, repeat {timings[1] * 1000:.1f}ms, "
+              f"bypass {timings[2] * 1000:.0f}ms")
+        print(f"  Model calls: {len(calls)}, hit rate {stats['hit_rate']}, tokens saved {stats['tokens_saved']}")
+
+        assert len(calls) == 2, "repeat should be served from cache, bypass should call the model"
+        assert timings[1] < 0.05
+        assert stats["hits"] == 1 and stats["bypassed"] == 1
+        assert stats["tokens_saved"] == 1920
+
+        # A different model is a different cache key
+        await gateway.chat(messages, model="gpt-4o", temperature=0.1, max_tokens=1000, use_cache=True)
+        assert len(calls) == 3
+    finally:
+        llm_gateway_module.llm_cache = original_cache
+        await gateway.close()
+        store.close()
+        await runner.cleanup()
+
+
+def run_store_ttl_and_eviction():
+    tmp_dir = tempfile.mkdtemp()
+    store = SQLiteKVStore(os.path.join(tmp_dir, "kv.db"), "entries", max_entries=3, max_bytes=1024)
+    try:
+        store.set("expired", "x", ttl=-1)
+        assert store.get("expired") is None
+
+        for i in range(5):
+            store.set(f"key{i}", "v" * 10, ttl=60)
+        assert store.get("key0") is None and store.get("key4") == "v" * 10
+        assert store.get_stats()["entries"] == 3
+
+        store.set("big", "v" * 900, ttl=60)
+        stats = store.get_stats()
+        print(f"  Store after eviction: {stats['entries']} entries, {stats['bytes']} bytes, "
+              f"{stats['evictions']} evictions")
+        assert stats["bytes"] <= 1024 and store.get("big") is not None
+    finally:
+        store.close()
+
+
+def test_repeated_import_hits_cache():
+    asyncio.run(run_repeated_import_hits_cache())
+
+
+def test_unusable_completions_are_not_cached():
+    asyncio.run(run_unusable_completions_are_not_cached())
+
+
+def test_store_ttl_and_eviction():
+    run_store_ttl_and_eviction()
+
+
+if __name__ == "__main__":
+    print("Testing repeated product extraction against the LLM cache...")
+    test_repeated_import_hits_cache()
+    print("Testing that unusable completions are not cached...")
+    test_unusable_completions_are_not_cached()
+    print("Testing cache TTL and size-bounded eviction...")
+    test_store_ttl_and_eviction()
+    print("All LLM cache tests passed")
@@ -0,0 +1,65 @@
+"""
+Test LLM gateway client lifetime
+The gateway keeps one AsyncOpenAI client per event loop. When a call arrives on a new loop,
+the previous client is closed on its own loop if that loop is still running, and dropped if
+the loop has already finished.
+"""
+import asyncio
+import threading
+
+from services.llm_gateway import LLMGateway
+
+
+def make_gateway() -> LLMGateway:
+    return LLMGateway(api_key="test", base_url="http://127.0.0.1:9/v1", max_concurrency=2, timeout=5,
+                      max_connections=4, max_keepalive_connections=2, max_retries=0)
+
+
+async def get_client(gateway: LLMGateway):
+    return gateway._get_client()
+
+
+def run_client_replaced_on_new_loop():
+    gateway = make_gateway()
+
+    # A loop that keeps running in another thread: its client is closed on that loop
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        old_client = asyncio.run_coroutine_threadsafe(get_client(gateway), loop).result(timeout=5)
+
+        async def on_new_loop():
+            client = gateway._get_client()
+            assert client is not old_client
+            # Give the other loop time to run the close
+            for _ in range(50):
+                if old_client.is_closed():
+                    break
+                await asyncio.sleep(0.01)
+            return client
+
+        new_client = asyncio.run(on_new_loop())
+        print(f"  Old client closed: {old_client.is_closed()}, retired: {gateway.get_stats()['retired_clients']}")
+        assert old_client.is_closed()
+        assert gateway.get_stats()["retired_clients"] == {"closed": 1, "dropped": 0}
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+    # A finished loop cannot close its connections any more: the client is only dropped
+    latest = asyncio.run(get_client(gateway))
+    assert latest is not new_client
+    assert gateway.get_stats()["retired_clients"] == {"closed": 1, "dropped": 1}
+    asyncio.run(gateway.close())
+
+
+def test_client_replaced_on_new_loop():
+    run_client_replaced_on_new_loop()
+
+
+if __name__ == "__main__":
+    print("Testing that clients from other event loops are released...")
+    test_client_replaced_on_new_loop()
+    print("All LLM gateway tests passed")
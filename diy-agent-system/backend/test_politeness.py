@@ -0,0 +1,316 @@
+"""
+Test the per-domain politeness scheduler
+Checks the token-bucket rate per domain, that interactive requests overtake queued background
+ones, that 429/503 responses slow a domain down, and that sync (requests-based) callers share
+the same buckets. Waiters behind the head of a queue are woken when they reach the head instead
+of polling, and responses reached through a redirect are reported to the domain that served them.
+Requests that would wait longer than max_wait are rejected with PolitenessTimeout, counted in the
+stats, and the scrapers fall back instead of failing or retrying.
+"""
+import asyncio
+import threading
+import time
+
+from aiohttp import web
+
+import agents.product_info_agent as product_info_module
+import services.price_scraper as price_scraper_module
+from agents.product_info_agent import ProductInfoAgent
+from services.circuit_breaker import host_health
+from services.politeness import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PolitenessScheduler,
+                                 PolitenessTimeout, scrape_priority)
+from services.price_scraper import PriceScraper
+
+
+def make_scheduler(rate=20.0, burst=2, max_wait=0, background_max_wait=0):
+    return PolitenessScheduler(enabled=True, rate=rate, burst=burst, min_rate=1.0, max_rate=50.0,
+                               increase_step=0.5, backoff_factor=0.5, max_wait=max_wait,
+                               background_max_wait=background_max_wait)
+
+
+async def run_rate_and_priorities():
+    scheduler = make_scheduler(rate=20.0, burst=2)
+    order = []
+
+    async def request(name, url, priority):
+        await scheduler.acquire(url, priority=priority)
+        order.append((name, time.monotonic()))
+
+    start = time.monotonic()
+    # Background imports queue up first, then an interactive identify arrives
+    tasks = [asyncio.create_task(request(f"import-{i}", "https://www.amazon.com/dp/B00", PRIORITY_BACKGROUND))
+             for i in range(6)]
+    await asyncio.sleep(0.01)
+    tasks.append(asyncio.create_task(request("identify", "https://amazon.com/s?k=drill", PRIORITY_INTERACTIVE)))
+    # Another domain has its own bucket
+    tasks.append(asyncio.create_task(request("homedepot", "https://www.homedepot.com/s/drill", PRIORITY_BACKGROUND)))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - start
+
+    names = [name for name, _ in order]
+    print(f"  Order: {names} in {elapsed:.2f}s")
+    assert names.index("identify") <= 3, "interactive request should overtake queued imports"
+    assert names.index("homedepot") <= 2, "other domains are not held up"
+    # 7 amazon requests at burst 2 + 20/s: at least 5 / 20 = 0.25s
+    assert 0.2 < elapsed < 1.0
+
+    stats = scheduler.get_stats()["domains"]
+    print(f"  amazon.com: {stats['amazon.com']}")
+    assert set(stats) == {"amazon.com", "homedepot.com"}
+    assert stats["amazon.com"]["by_priority"]["background"]["requests"] == 6
+    assert stats["amazon.com"]["by_priority"]["background"]["p95_wait"] > 0
+
+    # Cancelled waiters leave the queue
+    waiter = asyncio.create_task(scheduler.acquire("https://amazon.com/x"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert scheduler.get_stats()["domains"]["amazon.com"]["waiting"] == 0
+
+
+def run_throttle_backoff_and_sync_callers():
+    scheduler = make_scheduler(rate=20.0, burst=1)
+    url = "https://www.lowes.com/search?searchTerm=drill"
+    scheduler.feedback(url, 200)
+    assert scheduler.bucket("lowes.com").rate == 20.5
+    scheduler.feedback(url, 503)
+    scheduler.feedback(url, 429)
+    bucket = scheduler.bucket("lowes.com")
+    print(f"  After two throttled responses: {bucket.rate} req/s, throttled {bucket.throttled}")
+    assert bucket.rate == 20.5 / 4 and bucket.throttled == 2
+
+    # Threads using the blocking API share the same bucket
+    start = time.monotonic()
+    threads = [threading.Thread(target=scheduler.acquire_blocking, args=(url,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    print(f"  3 blocking requests at {bucket.rate} req/s took {elapsed:.2f}s")
+    assert elapsed > 2 / bucket.rate * 0.8
+
+
+async def run_agent_fetches_are_rate_limited():
+    hits = []
+
+    async def product(request):
+        hits.append(time.monotonic())
+        return web.Response(text="<html><title>Drill</title><body><main>Drill</main></body></html>",
+                            content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/p/{sku}", product)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    original = product_info_module.politeness
+    product_info_module.politeness = make_scheduler(rate=10.0, burst=1)
+    try:
+        agent = ProductInfoAgent()
+        with scrape_priority(PRIORITY_BACKGROUND):
+            await asyncio.gather(*(agent._http_get(f"http://127.0.0.1:{port}/p/{i}") for i in range(4)))
+        spread = hits[-1] - hits[0]
+        stats = product_info_module.politeness.get_stats()["domains"]["127.0.0.1"]
+        print(f"  4 agent fetches spread over {spread:.2f}s, {stats['by_priority']}")
+        assert spread > 0.25
+        assert stats["by_priority"]["background"]["requests"] == 4
+    finally:
+        product_info_module.politeness = original
+        await runner.cleanup()
+
+
+async def run_queued_waiters_do_not_poll():
+    scheduler = make_scheduler(rate=20.0, burst=1)
+    bucket = scheduler.bucket("amazon.com")
+    checks = []
+    try_take = bucket.try_take
+
+    def counting_try_take(ticket):
+        checks.append(ticket)
+        return try_take(ticket)
+
+    bucket.try_take = counting_try_take
+    start = time.monotonic()
+    await asyncio.gather(*(scheduler.acquire("https://www.amazon.com/dp/B0") for _ in range(8)))
+    elapsed = time.monotonic() - start
+    print(f"  8 waiters served in {elapsed:.2f}s with {len(checks)} queue checks")
+    # Each waiter checks on arrival, once when it reaches the head and once when its token is ready
+    assert len(checks) <= 8 * 3
+    assert 7 / 20 * 0.8 < elapsed < 1.0
+
+    # A cancelled head hands over to the next waiter straight away
+    bucket.tokens = 0.0
+    first = asyncio.create_task(scheduler.acquire("https://www.amazon.com/dp/B1"))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(scheduler.acquire("https://www.amazon.com/dp/B2"))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    await asyncio.wait_for(second, timeout=0.2)
+
+
+async def run_feedback_goes_to_final_domain():
+    merchant = {}
+
+    async def short_link(request):
+        raise web.HTTPFound(f"{merchant['url']}/p/blocked")
+
+    async def blocked(request):
+        return web.Response(status=429, text="slow down")
+
+    app = web.Application()
+    app.router.add_get("/go/{code}", short_link)
+    app.router.add_get("/p/blocked", blocked)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    merchant["url"] = f"http://127.0.0.1:{port}"
+
+    original = product_info_module.politeness
+    product_info_module.politeness = make_scheduler(rate=10.0, burst=3)
+    try:
+        agent = ProductInfoAgent()
+        # "localhost" stands in for the shortener and 127.0.0.1 for the merchant
+        result = await agent._http_get(f"http://localhost:{port}/go/dwlt7")
+        assert result.status == 429 and result.url.startswith("http://127.0.0.1")
+        stats = product_info_module.politeness.get_stats()["domains"]
+        print(f"  Shortener: {stats['localhost']['rate']} req/s, merchant: {stats['127.0.0.1']['rate']} req/s "
+              f"(throttled {stats['127.0.0.1']['throttled']})")
+        assert stats["127.0.0.1"]["throttled"] == 1 and stats["127.0.0.1"]["rate"] == 5.0
+        assert stats["localhost"]["throttled"] == 0 and stats["localhost"]["rate"] > 10.0
+    finally:
+        product_info_module.politeness = original
+        await runner.cleanup()
+
+
+async def run_max_wait_rejects():
+    scheduler = make_scheduler(rate=10.0, burst=1, max_wait=0.25)
+    url = "https://www.amazon.com/s?k=drill"
+
+    async def request():
+        try:
+            return await scheduler.acquire(url)
+        except PolitenessTimeout:
+            return None
+
+    # With one token and 10 req/s the 4th request would wait 0.3s: it and everything after it is
+    # rejected straight away instead of queueing
+    start = time.monotonic()
+    waits = await asyncio.gather(*(request() for _ in range(6)))
+    elapsed = time.monotonic() - start
+    stats = scheduler.get_stats()["domains"]["amazon.com"]
+    print(f"  Waits: {waits} in {elapsed:.2f}s, {stats['by_priority']['interactive']}")
+    assert [wait is not None for wait in waits] == [True] * 3 + [False] * 3
+    assert elapsed < 0.25
+    assert stats["by_priority"]["interactive"]["requests"] == 3
+    assert stats["by_priority"]["interactive"]["rejected"] == 3
+    assert stats["waiting"] == 0
+
+    # A per-call max_wait overrides the configured limit (0 waits as long as it takes)
+    bucket = scheduler.bucket("amazon.com")
+    bucket.tokens = -3.0
+    await scheduler.acquire(url, max_wait=0)
+    # Background requests have their own limit
+    bucket.tokens = -3.0
+    await scheduler.acquire(url, priority=PRIORITY_BACKGROUND)
+
+    # A waiter whose slot moves past its deadline while queued (the domain was throttled) gives up
+    bucket.tokens = 0.0
+    waiter = asyncio.create_task(scheduler.acquire(url, max_wait=0.2))
+    await asyncio.sleep(0.01)
+    scheduler.feedback(url, 429)
+    scheduler.feedback(url, 429)
+    try:
+        await asyncio.wait_for(waiter, timeout=0.5)
+        assert False, "the throttled waiter should have been rejected"
+    except PolitenessTimeout:
+        pass
+
+    # The blocking API applies the same limit
+    bucket.tokens = -1.0
+    try:
+        scheduler.acquire_blocking(url, max_wait=0.1)
+        assert False, "the blocking request should have been rejected"
+    except PolitenessTimeout:
+        pass
+    stats = scheduler.get_stats()["domains"]["amazon.com"]
+    assert stats["by_priority"]["interactive"]["rejected"] == 5
+    assert stats["waiting"] == 0
+
+
+async def run_scrapers_fall_back_on_rejection():
+    scheduler = make_scheduler(rate=1.0, burst=1, max_wait=0.5)
+    for domain in ("politeness-test.example", "amazon.com"):
+        scheduler.bucket(domain).tokens = -10.0
+    original_price, original_agent = price_scraper_module.politeness, product_info_module.politeness
+    price_scraper_module.politeness = product_info_module.politeness = scheduler
+    try:
+        breaker = host_health.breaker("politeness-test.example")
+        before = breaker.get_stats()["window_requests"]
+        start = time.monotonic()
+        html = await PriceScraper()._fetch_search_page("https://politeness-test.example/s?k=drill")
+        assert html is None
+        # Nothing was sent, so the host's breaker has nothing to record
+        assert breaker.get_stats()["window_requests"] == before
+
+        # The agent neither retries nor counts the host as failing: Amazon pages use the URL fallback
+        page = await ProductInfoAgent()._fetch_page_uncoalesced("https://www.amazon.com/dp/B00ET5VMTU")
+        elapsed = time.monotonic() - start
+        print(f"  Scrapers fell back after {elapsed:.2f}s")
+        assert page is not None and "B00ET5VMTU" in page.content
+        assert elapsed < 1.0
+        assert scheduler.get_stats()["domains"]["amazon.com"]["by_priority"]["interactive"]["rejected"] == 1
+    finally:
+        price_scraper_module.politeness, product_info_module.politeness = original_price, original_agent
+
+
+def test_rate_and_priorities():
+    asyncio.run(run_rate_and_priorities())
+
+
+def test_throttle_backoff_and_sync_callers():
+    run_throttle_backoff_and_sync_callers()
+
+
+def test_agent_fetches_are_rate_limited():
+    asyncio.run(run_agent_fetches_are_rate_limited())
+
+
+def test_queued_waiters_do_not_poll():
+    asyncio.run(run_queued_waiters_do_not_poll())
+
+
+def test_feedback_goes_to_final_domain():
+    asyncio.run(run_feedback_goes_to_final_domain())
+
+
+def test_max_wait_rejects():
+    asyncio.run(run_max_wait_rejects())
+
+
+def test_scrapers_fall_back_on_rejection():
+    asyncio.run(run_scrapers_fall_back_on_rejection())
+
+
+if __name__ == "__main__":
+    print("Testing per-domain rate and priorities...")
+    test_rate_and_priorities()
+    print("Testing throttle backoff and blocking callers...")
+    test_throttle_backoff_and_sync_callers()
+    print("Testing that ProductInfoAgent fetches go through the scheduler...")
+    test_agent_fetches_are_rate_limited()
+    print("Testing that queued waiters are woken instead of polling...")
+    test_queued_waiters_do_not_poll()
+    print("Testing that redirected responses are reported to the final domain...")
+    test_feedback_goes_to_final_domain()
+    print("Testing that waits over max_wait are rejected...")
+    test_max_wait_rejects()
+    print("Testing that the scrapers fall back when a wait is rejected...")
+    test_scrapers_fall_back_on_rejection()
+    print("All politeness tests passed")
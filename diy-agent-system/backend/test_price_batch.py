@@ -0,0 +1,51 @@
+"""
+Test batched price lookups
+A batch runs each distinct query once, however it is spelled, with bounded concurrency, and a
+query whose lookup fails maps to an empty list instead of failing the batch.
+"""
+import asyncio
+
+import services.price_scraper as price_scraper_module
+from services.price_scraper import PriceScraper, PriceSearchResult, ProductPrice
+
+
+async def run_batch_lookup_deduplicates():
+    calls = []
+    running = 0
+    peak = 0
+
+    async def search_real_prices(brand, model, tool_name="", use_cache=True):
+        nonlocal running, peak
+        calls.append((brand, model, tool_name))
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.05)
+            if model == "BROKEN":
+                raise RuntimeError("retailer layout changed")
+            return PriceSearchResult(products=[ProductPrice(retailer="Amazon", title=f"{brand} {model}", price=99.0)])
+        finally:
+            running -= 1
+
+    async with PriceScraper() as scraper:
+        scraper.search_real_prices = search_real_prices
+        queries = [("DeWalt", "DCD771", "Drill"), ("dewalt", " DCD771 ", "drill"), ("Ryobi", "P215K", "Drill"),
+                   ("Makita", "XFD131", "Drill"), ("Bosch", "BROKEN", "Drill"), ("Ryobi", "P215K", "Drill")]
+        results = await scraper.get_real_prices_many(queries, concurrency=2)
+
+    print(f"  {len(queries)} queries, {len(calls)} lookups, peak concurrency {peak}")
+    assert len(calls) == 4 and peak == 2
+    assert len(results) == 4
+    assert results[price_scraper_module.price_cache.make_key("DeWalt", "DCD771", "Drill")][0].price == 99.0
+    # A failed lookup is an empty list rather than failing the batch
+    assert results[price_scraper_module.price_cache.make_key("Bosch", "BROKEN", "Drill")] == []
+
+
+def test_batch_lookup_deduplicates():
+    asyncio.run(run_batch_lookup_deduplicates())
+
+
+if __name__ == "__main__":
+    print("Testing batched price lookups...")
+    test_batch_lookup_deduplicates()
+    print("All batch lookup tests passed")
@@ -0,0 +1,144 @@
+"""
+Test the background price refresh scheduler
+Frequently identified tools are refreshed more often, at most batch_size per run and hottest
+first. A run fetches the due queries in one batch, bypassing the price cache, records one snapshot
+per query that returned prices, and does not refresh a query again before its interval.
+Partial results and estimated (fallback) prices are never written to the price history.
+"""
+import asyncio
+from contextlib import contextmanager
+
+import services.price_history_service as price_history_module
+import services.price_refresh_scheduler as scheduler_module
+from services.price_history_service import PriceHistoryService
+from services.price_refresh_scheduler import PriceRefreshScheduler
+from services.price_cache import PriceCache
+from services.price_scraper import PriceScraper, PriceSearchResult, ProductPrice
+
+
+def make_scheduler(batch_size: int = 2) -> PriceRefreshScheduler:
+    return PriceRefreshScheduler(tick_seconds=60, min_interval=100, max_interval=1000,
+                                 batch_size=batch_size, watchlist_size=3, watch_ttl=3600)
+
+
+def run_due_queries_by_heat():
+    scheduler = make_scheduler()
+    for _ in range(5):
+        scheduler.watch("DeWalt", "DCD771", "Drill")
+    scheduler.watch("Ryobi", "P215K", "Drill")
+    scheduler.watch("Makita", "XFD131", "Drill")
+    scheduler.watch("Makita", "XFD131", "Drill")
+    scheduler.watch("", "", "")
+
+    due = scheduler.due_queries()
+    print(f"  Due: {[key for key, _ in due]}")
+    assert [query for _, query in due] == [("DeWalt", "DCD771", "Drill"), ("Makita", "XFD131", "Drill")]
+
+    hot = scheduler._watchlist[PriceCache.make_key("DeWalt", "DCD771", "Drill")]
+    cold = scheduler._watchlist[PriceCache.make_key("Ryobi", "P215K", "Drill")]
+    assert scheduler.refresh_interval(hot) == 200
+    assert scheduler.refresh_interval(cold) == 1000
+
+    # A full watchlist evicts the tool identified longest ago
+    scheduler.watch("Bosch", "GSR12V", "Drill")
+    assert len(scheduler._watchlist) == 3
+    assert PriceCache.make_key("DeWalt", "DCD771", "Drill") not in scheduler._watchlist
+
+
+async def run_refresh_records_snapshots():
+    scheduler = make_scheduler(batch_size=5)
+    scheduler.watch("DeWalt", "DCD771", "Drill")
+    scheduler.watch("Ryobi", "P215K", "Drill")
+    scheduler.watch("Makita", "XFD131", "Drill")
+    batches = []
+    recorded = []
+
+    def search_result(query):
+        if query[1] == "P215K":
+            return PriceSearchResult()
+        products = [ProductPrice(retailer="Amazon", title=" ".join(query), price=99.0)]
+        if query[1] == "XFD131":
+            # Only Amazon answered before the deadline
+            return PriceSearchResult(products=products, omitted_retailers=["Home Depot"])
+        return PriceSearchResult(products=products)
+
+    async def search_real_prices_many(self, queries, use_cache=True, concurrency=None):
+        batches.append((list(queries), use_cache))
+        return {PriceCache.make_key(*query): search_result(query) for query in queries}
+
+    def record_snapshots(snapshots):
+        recorded.extend(snapshots)
+        return sum(len(products) for _, products in snapshots)
+
+    real_many = PriceScraper.search_real_prices_many
+    real_record = scheduler_module.PriceHistoryService.record_snapshots
+    PriceScraper.search_real_prices_many = search_real_prices_many
+    scheduler_module.PriceHistoryService.record_snapshots = record_snapshots
+    try:
+        rows = await scheduler.refresh_due()
+        print(f"  Refreshed {scheduler.stats['queries_refreshed']} queries, wrote {rows} rows")
+        assert len(batches) == 1 and batches[0][1] is False
+        assert len(batches[0][0]) == 3
+        # The queries without prices or with a partial result are refreshed but write no snapshot
+        assert [query for query, _ in recorded] == [("DeWalt", "DCD771", "Drill")]
+        assert rows == 1 and scheduler.stats["rows_written"] == 1
+        assert scheduler.stats["queries_refreshed"] == 3
+        assert scheduler.stats["partial_skipped"] == 1
+
+        # Nothing is due again until the refresh interval has passed
+        assert await scheduler.refresh_due() == 0
+        assert len(batches) == 1
+    finally:
+        PriceScraper.search_real_prices_many = real_many
+        scheduler_module.PriceHistoryService.record_snapshots = staticmethod(real_record)
+
+
+def run_fallback_prices_not_recorded():
+    inserted = []
+
+    class RecordingSession:
+        def bulk_insert_mappings(self, model, rows):
+            inserted.extend(rows)
+
+    @contextmanager
+    def get_db_session():
+        yield RecordingSession()
+
+    real_get_db_session = price_history_module.get_db_session
+    price_history_module.get_db_session = get_db_session
+    try:
+        live = ProductPrice(retailer="Amazon", title="DeWalt DCD771 kit", price=99.0)
+        estimated = ProductPrice(retailer="Home Depot", title="DeWalt DCD771", price=104.0, fallback=True)
+        rows = PriceHistoryService.record_snapshots([
+            (("DeWalt", "DCD771", "Drill"), [live, estimated]),
+            (("Ryobi", "P215K", "Drill"), [ProductPrice(retailer="Walmart", title="Ryobi P215K", price=79.0,
+                                                        fallback=True)]),
+        ])
+    finally:
+        price_history_module.get_db_session = real_get_db_session
+
+    print(f"  Wrote {rows} of 3 rows")
+    assert rows == 1
+    assert [(row["retailer"], row["price"]) for row in inserted] == [("Amazon", 99.0)]
+
+
+def test_due_queries_by_heat():
+    run_due_queries_by_heat()
+
+
+def test_refresh_records_snapshots():
+    asyncio.run(run_refresh_records_snapshots())
+
+
+def test_fallback_prices_not_recorded():
+    run_fallback_prices_not_recorded()
+
+
+if __name__ == "__main__":
+    print("Testing which watched queries are due...")
+    test_due_queries_by_heat()
+    print("Testing a refresh run...")
+    test_refresh_records_snapshots()
+    print("Testing that estimated prices are not recorded...")
+    test_fallback_prices_not_recorded()
+    print("All price refresh tests passed")
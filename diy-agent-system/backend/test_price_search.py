@@ -0,0 +1,300 @@
+"""
+Test multi-retailer price searches
+Fallback prices are cached only for the short partial TTL, like partial results, while live results
+keep the full TTL. That covers retailer fetches that failed (breaker open, network error) and the
+retailers whose prices are always estimated, even when their page fetch succeeded.
+Callers get their own copy of the cached result. A coalesced retailer search keeps running on its
+own session when the caller that started it leaves. At the deadline the retailers that answered
+are returned and the slow request is really aborted. The deadline covers the whole search, so a
+search still waiting in the politeness queue is cancelled too; the optional sent timeout also caps
+the wait once a request is sent.
+"""
+import asyncio
+import time
+
+from aiohttp import web
+
+import services.price_scraper as price_scraper_module
+from services.politeness import PolitenessScheduler
+from services.price_cache import PriceCache
+from services.price_scraper import PriceScraper, ProductPrice, price_search_flight
+from utils.config import get_settings
+
+FULL_TTL = 3600
+
+
+def make_cache() -> PriceCache:
+    return PriceCache(ttl=FULL_TTL, stale_ttl=60, max_entries=100, max_bytes=1024 * 1024)
+
+
+def fresh_for(cache: PriceCache, key: str) -> float:
+    return cache._entries[key].fresh_until - time.monotonic()
+
+
+async def run_fallback_results_are_cached_briefly():
+    cache = make_cache()
+    real_cache = price_scraper_module.price_cache
+    price_scraper_module.price_cache = cache
+    partial_ttl = get_settings().price_search_partial_ttl
+    try:
+        async with PriceScraper() as scraper:
+            async def retailers_down(url):
+                return None
+
+            scraper._fetch_search_page = retailers_down
+            result = await scraper.search_real_prices("Ryobi", "P215K", "Drill", deadline=0)
+            print(f"  Breaker open: {len(result.products)} estimated prices, "
+                  f"cached for {fresh_for(cache, cache.make_key('Ryobi', 'P215K', 'Drill')):.0f}s")
+            assert not result.partial and result.degraded
+            assert any(product.fallback for product in result.products)
+            assert fresh_for(cache, cache.make_key("Ryobi", "P215K", "Drill")) <= partial_ttl
+
+            async def retailers_up(url):
+                return "<html>results</html>"
+
+            async def amazon(query, max_results):
+                return [ProductPrice(retailer="Amazon", title=f"{query} kit", price=79.0)]
+
+            scraper._fetch_search_page = retailers_up
+            scraper._search_amazon = amazon
+            # Home Depot, Lowe's and Walmart prices are estimated even when their pages load
+            result = await scraper.search_real_prices("Ryobi", "P252", "Drill", deadline=0)
+            estimated = {product.retailer for product in result.products if product.fallback}
+            assert estimated == {"Home Depot", "Lowe's", "Walmart"}
+            assert result.degraded
+            assert fresh_for(cache, cache.make_key("Ryobi", "P252", "Drill")) <= partial_ttl
+
+            def live(retailer):
+                async def search(query, max_results):
+                    return [ProductPrice(retailer=retailer, title=f"{query} kit", price=89.0)]
+                return search
+
+            scraper._search_home_depot = live("Home Depot")
+            scraper._search_lowes = live("Lowe's")
+            scraper.search_walmart = live("Walmart")
+            result = await scraper.search_real_prices("Ryobi", "P737", "Drill", deadline=0)
+            assert not result.degraded
+            assert fresh_for(cache, cache.make_key("Ryobi", "P737", "Drill")) > partial_ttl
+    finally:
+        price_scraper_module.price_cache = real_cache
+
+
+async def run_callers_get_copies():
+    cache = make_cache()
+    real_cache = price_scraper_module.price_cache
+    price_scraper_module.price_cache = cache
+    try:
+        async with PriceScraper() as scraper:
+            async def retailers_up(url):
+                return "<html>results</html>"
+
+            async def amazon(query, max_results):
+                return [ProductPrice(retailer="Amazon", title=f"{query} kit", price=79.0)]
+
+            scraper._fetch_search_page = retailers_up
+            scraper._search_amazon = amazon
+            first = await scraper.search_real_prices("Makita", "XFD131", deadline=0)
+            original = [(product.title, product.price) for product in first.products]
+
+            # One caller applying its own discount must not change what the next caller sees
+            for product in first.products:
+                product.price = 1.0
+            first.products.clear()
+            first.omitted_retailers.append("Amazon")
+
+            second = await scraper.search_real_prices("Makita", "XFD131", deadline=0)
+            assert cache.stats["hits"] == 1
+            assert [(product.title, product.price) for product in second.products] == original
+            assert not second.partial
+    finally:
+        price_scraper_module.price_cache = real_cache
+
+
+class LocalScraper(PriceScraper):
+    """Searches a local stand-in Amazon; the other retailers answer offline"""
+
+    base_url = ""
+
+    async def _search_amazon(self, query, max_results):
+        html = await self._fetch_search_page(f"{self.base_url}/s?k={query}")
+        if html is None:
+            return await self._get_fallback_amazon_prices(query, max_results)
+        return [ProductPrice(retailer="Amazon", title=html, price=99.0)]
+
+    async def _search_home_depot(self, query, max_results):
+        return await self._get_fallback_home_depot_prices(query, max_results)
+
+    async def _search_lowes(self, query, max_results):
+        return await self._get_fallback_lowes_prices(query, max_results)
+
+
+# Requests to the stand-in retailer that were aborted before it answered
+aborted = []
+
+
+async def start_retailer():
+    async def search(request):
+        try:
+            await asyncio.sleep(5 if request.query["k"].startswith("Slow") else 0.2)
+        except asyncio.CancelledError:
+            aborted.append(request.query["k"])
+            raise
+        return web.Response(text=f"Live {request.query['k']}")
+
+    app = web.Application()
+    app.router.add_get("/s", search)
+    # Cancel the handler when the client goes away, so aborted requests are visible
+    runner = web.AppRunner(app, handler_cancellation=True)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    LocalScraper.base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    return runner
+
+
+async def run_flight_outlives_first_caller():
+    runner = await start_retailer()
+    try:
+        executions = price_search_flight.stats["executions"]
+
+        async def first_caller(started: asyncio.Event):
+            async with LocalScraper() as scraper:
+                task = asyncio.ensure_future(scraper.search_amazon("oscillating tool", 1))
+                started.set()
+                await task
+
+        started = asyncio.Event()
+        first = asyncio.create_task(first_caller(started))
+        await started.wait()
+        await asyncio.sleep(0.01)
+
+        async with LocalScraper() as scraper:
+            joined = asyncio.ensure_future(scraper.search_amazon("oscillating tool", 1))
+            await asyncio.sleep(0.05)
+            # The caller that started the search is cancelled and closes its session
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+            products = await joined
+
+        print(f"  Joined caller got: {[product.title for product in products]}")
+        assert price_search_flight.stats["executions"] == executions + 1
+        assert [product.title for product in products] == ["Live oscillating tool"]
+        assert not products[0].fallback
+    finally:
+        await runner.cleanup()
+
+
+def make_scheduler(rate: float, burst: int) -> PolitenessScheduler:
+    return PolitenessScheduler(enabled=True, rate=rate, burst=burst, min_rate=1.0, max_rate=rate,
+                               increase_step=0.0, backoff_factor=0.5)
+
+
+async def run_partial_results_at_deadline():
+    runner = await start_retailer()
+    real_politeness = price_scraper_module.politeness
+    price_scraper_module.politeness = make_scheduler(rate=10.0, burst=5)
+    try:
+        async with LocalScraper() as scraper:
+            start = time.monotonic()
+            result = await scraper.search_real_prices("Slow", "AMZ1", use_cache=False, deadline=0.3)
+            elapsed = time.monotonic() - start
+        print(f"  Partial after {elapsed:.2f}s, omitted {result.omitted_retailers}")
+        assert elapsed < 1.0
+        assert result.partial and result.omitted_retailers == ["Amazon"]
+        assert {product.retailer for product in result.products} == {"Home Depot", "Lowe's", "Walmart"}
+
+        # Nobody else was waiting for the Amazon search, so the request itself was aborted
+        await asyncio.sleep(0.1)
+        assert aborted == ["Slow AMZ1"]
+        assert not price_search_flight.in_flight(("amazon", "slow amz1", 2))
+        assert price_search_flight.stats["abandoned"] >= 1
+    finally:
+        price_scraper_module.politeness = real_politeness
+        await runner.cleanup()
+
+
+async def run_queued_search_cancelled_at_deadline():
+    runner = await start_retailer()
+    real_politeness = price_scraper_module.politeness
+    # One request per 0.5s to the retailer, and another search is already using the slot
+    scheduler = make_scheduler(rate=2.0, burst=1)
+    await scheduler.acquire(LocalScraper.base_url)
+    price_scraper_module.politeness = scheduler
+    try:
+        async with LocalScraper() as scraper:
+            start = time.monotonic()
+            result = await scraper.search_real_prices("Queued", "AMZ2", use_cache=False, deadline=0.3)
+            elapsed = time.monotonic() - start
+        print(f"  Still queued at the deadline, returned after {elapsed:.2f}s, omitted {result.omitted_retailers}")
+        assert elapsed < 0.45
+        assert result.partial and result.omitted_retailers == ["Amazon"]
+
+        # The queued search left the queue without sending its request
+        await asyncio.sleep(0.3)
+        stats = scheduler.get_stats()["domains"]["127.0.0.1"]
+        assert stats["waiting"] == 0 and stats["by_priority"]["interactive"]["requests"] == 1
+        assert not price_search_flight.in_flight(("amazon", "queued amz2", 2))
+    finally:
+        price_scraper_module.politeness = real_politeness
+        await runner.cleanup()
+
+
+async def run_sent_timeout():
+    runner = await start_retailer()
+    real_politeness = price_scraper_module.politeness
+    price_scraper_module.politeness = make_scheduler(rate=10.0, burst=5)
+    settings = get_settings()
+    real_sent_timeout = settings.price_search_sent_timeout
+    settings.price_search_sent_timeout = 0.3
+    try:
+        async with LocalScraper() as scraper:
+            start = time.monotonic()
+            result = await scraper.search_real_prices("Slow", "AMZ3", use_cache=False, deadline=3.0)
+            elapsed = time.monotonic() - start
+        print(f"  Sent request cut off after {elapsed:.2f}s, omitted {result.omitted_retailers}")
+        assert elapsed < 1.0
+        assert result.omitted_retailers == ["Amazon"]
+    finally:
+        settings.price_search_sent_timeout = real_sent_timeout
+        price_scraper_module.politeness = real_politeness
+        await runner.cleanup()
+
+
+def test_fallback_results_are_cached_briefly():
+    asyncio.run(run_fallback_results_are_cached_briefly())
+
+
+def test_callers_get_copies():
+    asyncio.run(run_callers_get_copies())
+
+
+def test_flight_outlives_first_caller():
+    asyncio.run(run_flight_outlives_first_caller())
+
+
+def test_partial_results_at_deadline():
+    asyncio.run(run_partial_results_at_deadline())
+
+
+def test_queued_search_cancelled_at_deadline():
+    asyncio.run(run_queued_search_cancelled_at_deadline())
+
+
+def test_sent_timeout():
+    asyncio.run(run_sent_timeout())
+
+
+if __name__ == "__main__":
+    print("Testing how fallback prices are cached...")
+    test_fallback_results_are_cached_briefly()
+    print("Testing that callers get copies of cached results...")
+    test_callers_get_copies()
+    print("Testing a coalesced search after its first caller is cancelled...")
+    test_flight_outlives_first_caller()
+    print("Testing partial results at the deadline...")
+    test_partial_results_at_deadline()
+    print("Testing that searches still queued at the deadline are cancelled...")
+    test_queued_search_cancelled_at_deadline()
+    print("Testing the timeout after a request is sent...")
+    test_sent_timeout()
+    print("All price search tests passed")
@@ -0,0 +1,142 @@
+"""
+Test the short URL redirect cache
+A short link on one host redirects to a product page on another. The first import follows the
+redirect and caches it; repeat imports and merchant detection use the final URL directly.
+Redirects that end on an error or bot-check page, or that start from a regular product page,
+are not cached.
+"""
+import asyncio
+import os
+import tempfile
+from collections import Counter
+
+from aiohttp import web
+
+import agents.product_info_agent as product_info_module
+import services.product_service as product_service_module
+from agents.product_info_agent import ProductInfoAgent
+from services.kv_store import SQLiteKVStore
+from services.product_service import ProductService
+from services.redirect_cache import RedirectCache
+
+PRODUCT_PAGE = """<html><head><title>DEWALT 20V MAX Cordless Drill (DCD771C2)</title></head>
+<body><main><h1>DEWALT 20V MAX Cordless Drill</h1><p>$99.00</p></main></body></html>"""
+
+
+def make_cache(path):
+    return RedirectCache(SQLiteKVStore(path, "redirects", max_entries=100, max_bytes=1024 * 1024), ttl=3600)
+
+
+async def start_server(hits: Counter):
+    async def short_link(request):
+        hits["short"] += 1
+        port = request.host.rsplit(":", 1)[1]
+        raise web.HTTPFound(f"http://localhost:{port}/p/dewalt-dcd771c2")
+
+    async def product(request):
+        hits["product"] += 1
+        return web.Response(text=PRODUCT_PAGE, content_type="text/html")
+
+    async def blocked_link(request):
+        hits["blocked_link"] += 1
+        port = request.host.rsplit(":", 1)[1]
+        raise web.HTTPFound(f"http://localhost:{port}/validate.perfdrive")
+
+    async def bot_wall(request):
+        hits["bot_wall"] += 1
+        return web.Response(status=503, text="Please verify you are a human")
+
+    app = web.Application()
+    app.router.add_get("/dwlt7", short_link)
+    app.router.add_get("/p/dewalt-dcd771c2", product)
+    app.router.add_get("/blk42", blocked_link)
+    app.router.add_get("/validate.perfdrive", bot_wall)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+async def run_repeat_import_skips_redirect():
+    hits = Counter()
+    runner, port = await start_server(hits)
+    path = os.path.join(tempfile.mkdtemp(), "redirect_cache.db")
+    original = product_info_module.redirect_cache
+    product_info_module.redirect_cache = make_cache(path)
+    short_url = f"http://127.0.0.1:{port}/dwlt7"
+    try:
+        agent = ProductInfoAgent()
+        first = await agent._fetch_page_content(short_url)
+        assert hits == Counter(short=1, product=1)
+
+        # New cache instance over the same file, as after a restart
+        product_info_module.redirect_cache = make_cache(path)
+        second = await agent._fetch_page_content(short_url)
+        print(f"  Requests after two imports: {dict(hits)}")
+        assert hits == Counter(short=1, product=2), "repeat import should skip the short link"
+        assert first == second
+        assert f"Final URL: http://localhost:{port}/p/dewalt-dcd771c2" in second
+        assert product_info_module.redirect_cache.get_stats()["hits"] >= 1
+
+        # A short link that ends on a bot-check page is followed every time
+        blocked_url = f"http://127.0.0.1:{port}/blk42"
+        for _ in range(2):
+            assert await agent._fetch_page_content(blocked_url) is None
+        assert hits["blocked_link"] == 2 and hits["bot_wall"] == 2
+        assert product_info_module.redirect_cache.lookup(blocked_url) is None
+    finally:
+        product_info_module.redirect_cache = original
+        await runner.cleanup()
+
+
+def run_merchant_detection_uses_cache():
+    cache = make_cache(os.path.join(tempfile.mkdtemp(), "redirect_cache.db"))
+    originals = (product_info_module.redirect_cache, product_service_module.redirect_cache)
+    product_info_module.redirect_cache = product_service_module.redirect_cache = cache
+    try:
+        short_url = "https://bit.ly/3dewalt"
+        agent = ProductInfoAgent()
+        assert agent._detect_merchant(short_url) == "other"
+        assert ProductService._detect_merchant_from_url(short_url) == "other"
+
+        cache.record(short_url, "https://www.homedepot.com/p/DEWALT-Drill-DCD771C2/204279858")
+        # Same-host redirects (http -> https, trailing slash) are not worth caching
+        cache.record("http://www.lowes.com/pd/1000842358", "https://www.lowes.com/pd/1000842358")
+
+        print(f"  {short_url} -> {agent._detect_merchant(short_url)}")
+        assert agent._detect_merchant(short_url) == "home_depot"
+        assert ProductService._detect_merchant_from_url(short_url) == "home_depot"
+        assert cache.lookup("http://www.lowes.com/pd/1000842358") is None
+
+        # Cross-host hops from regular product pages (bot walls, geo pages) are not cached
+        product_url = "https://www.walmart.com/ip/HART-20-Volt-Drill/566449366"
+        cache.record(product_url, "https://validate.perfdrive.com/?ssa=1")
+        assert cache.stats["rejected"] == 1
+        # Merchant product pages skip the store entirely; unknown URLs hit SQLite only once
+        skipped = cache.stats["skipped"]
+        assert agent._detect_merchant(product_url) == "walmart"
+        assert cache.stats["skipped"] == skipped + 1
+        other_url = "https://www.example-tools.com/products/clamp"
+        memory_misses = cache.stats["memory_misses"]
+        for _ in range(3):
+            assert cache.lookup(other_url) is None
+        assert cache.stats["memory_misses"] == memory_misses + 2
+    finally:
+        product_info_module.redirect_cache, product_service_module.redirect_cache = originals
+
+
+def test_repeat_import_skips_redirect():
+    asyncio.run(run_repeat_import_skips_redirect())
+
+
+def test_merchant_detection_uses_cache():
+    run_merchant_detection_uses_cache()
+
+
+if __name__ == "__main__":
+    print("Testing repeat import of a short link...")
+    test_repeat_import_skips_redirect()
+    print("Testing merchant detection through the redirect cache...")
+    test_merchant_detection_uses_cache()
+    print("All redirect cache tests passed")
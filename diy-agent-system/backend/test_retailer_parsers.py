@@ -0,0 +1,78 @@
+"""
+Test retailer search page parsing
+The lxml and BeautifulSoup backends must return the same products for an Amazon search page,
+skipping results without a price, and parsing in the worker pool must give the same result as
+parsing in-process.
+"""
+import asyncio
+
+from services.retailer_parsers import AMAZON_SEARCH_BACKENDS, LXML_AVAILABLE, parse_amazon_search, resolve_backend
+from utils.worker_pool import run_cpu_bound, shutdown_worker_pool
+
+QUERY = "DeWalt DCD771C2"
+SEARCH_URL = "https://www.amazon.com/s?k=DeWalt+DCD771C2&ref=sr_pg_1"
+
+
+def search_result(title: str, price: str, href: str, image: str) -> str:
+    price_html = f'<span class="a-price"><span class="a-price-whole">{price}</span></span>' if price else ""
+    return f"""
+<div data-component-type="s-search-result" class="s-result-item">
+  <img class="s-image" src="{image}">
+  <h2 class="a-size-mini a-spacing-none"><a class="a-link-normal" href="{href}"><span> {title} </span></a></h2>
+  {price_html}
+</div>"""
+
+
+SEARCH_PAGE = "<html><head><title>Amazon.com : DeWalt DCD771C2</title></head><body>" \
+    + '<div class="nav">Sponsored <span class="a-price-whole">1.00</span></div>' \
+    + search_result("DEWALT 20V MAX Cordless Drill/Driver Kit", "99.", "/dp/B00ET5VMTU", "https://m.media-amazon.com/1.jpg") \
+    + search_result("DEWALT 20V MAX Drill, 2 Batteries", "1,149.", "/dp/B01N5FRTTG", "https://m.media-amazon.com/2.jpg") \
+    + search_result("DEWALT Drill Bit Set", "", "/dp/B00IJ0ZJXA", "https://m.media-amazon.com/3.jpg") \
+    + search_result("DEWALT Impact Driver Kit", "129.", "/dp/B00ET5VMXX", "https://m.media-amazon.com/4.jpg") \
+    + "</body></html>"
+
+
+def run_backends_agree():
+    results = {backend: parse_amazon_search(SEARCH_PAGE, QUERY, SEARCH_URL, 5, backend=backend)
+               for backend in AMAZON_SEARCH_BACKENDS}
+    print(f"  Backends: {sorted(results)}, products: {len(results['bs4'])}")
+    assert [(product["title"], product["price"], product["url"]) for product in results["bs4"]] == [
+        ("DEWALT 20V MAX Cordless Drill/Driver Kit", 99.0, "https://www.amazon.com/dp/B00ET5VMTU"),
+        ("DEWALT 20V MAX Drill, 2 Batteries", 1149.0, "https://www.amazon.com/dp/B01N5FRTTG"),
+        ("DEWALT Impact Driver Kit", 129.0, "https://www.amazon.com/dp/B00ET5VMXX"),
+    ]
+    for backend, products in results.items():
+        assert products == results["bs4"], f"{backend} differs from bs4"
+
+    assert resolve_backend("auto") == ("lxml" if LXML_AVAILABLE else "bs4")
+    try:
+        resolve_backend("html5lib")
+        assert False, "unknown backends should be rejected"
+    except ValueError:
+        pass
+
+
+async def run_parse_in_worker_pool():
+    try:
+        parsed = await run_cpu_bound(parse_amazon_search, SEARCH_PAGE, QUERY, SEARCH_URL, 2)
+    finally:
+        shutdown_worker_pool()
+    print(f"  Worker pool parsed {len(parsed)} products")
+    assert parsed == parse_amazon_search(SEARCH_PAGE, QUERY, SEARCH_URL, 2)
+    assert len(parsed) == 2
+
+
+def test_backends_agree():
+    run_backends_agree()
+
+
+def test_parse_in_worker_pool():
+    asyncio.run(run_parse_in_worker_pool())
+
+
+if __name__ == "__main__":
+    print("Testing that parser backends agree...")
+    test_backends_agree()
+    print("Testing parsing in the worker pool...")
+    test_parse_in_worker_pool()
+    print("All retailer parser tests passed")
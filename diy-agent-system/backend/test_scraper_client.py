@@ -0,0 +1,73 @@
+"""
+Test the shared scraper HTTP client
+While the app-lifetime client is running, every PriceScraper lookup uses its session, so later
+lookups to the same host reuse the pooled connection instead of opening a new one, and leaving a
+lookup does not close the shared session. Standalone scrapers get their own temporary session.
+"""
+import asyncio
+
+from aiohttp import web
+
+from services.price_scraper import PriceScraper
+from services.scraper_client import scraper_client
+
+
+async def start_retailer():
+    async def search(request):
+        return web.Response(text=f"Results for {request.query['k']}")
+
+    app = web.Application()
+    app.router.add_get("/s", search)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+async def run_lookups_share_pooled_client():
+    runner, base_url = await start_retailer()
+    await scraper_client.start()
+    try:
+        opened = scraper_client.stats["connections_opened"]
+        reused = scraper_client.stats["connections_reused"]
+        for query in ("jigsaw", "planer", "router"):
+            async with PriceScraper() as scraper:
+                assert scraper.session is scraper_client.session
+                async with scraper.session.get(f"{base_url}/s", params={"k": query}) as response:
+                    assert await response.text() == f"Results for {query}"
+            # Leaving the lookup does not close the shared session
+            assert scraper_client.is_running
+
+        stats = scraper_client.get_stats()
+        print(f"  Connections opened: {stats['connections_opened'] - opened}, "
+              f"reused: {stats['connections_reused'] - reused}")
+        assert stats["connections_opened"] - opened == 1
+        assert stats["connections_reused"] - reused == 2
+    finally:
+        await scraper_client.close()
+        await runner.cleanup()
+
+
+async def run_standalone_session():
+    assert not scraper_client.is_running
+    async with PriceScraper() as scraper:
+        session = scraper.session
+        assert session is not None and not session.closed
+    assert session.closed
+
+
+def test_lookups_share_pooled_client():
+    asyncio.run(run_lookups_share_pooled_client())
+
+
+def test_standalone_session():
+    asyncio.run(run_standalone_session())
+
+
+if __name__ == "__main__":
+    print("Testing that lookups share the pooled client...")
+    test_lookups_share_pooled_client()
+    print("Testing a standalone scraper session...")
+    test_standalone_session()
+    print("All scraper client tests passed")
@@ -0,0 +1,156 @@
+"""
+Test hedged execution of ProductInfoAgent search fallbacks
+Strategies are replaced with timed stand-ins so the race is deterministic and offline.
+A price-only merchant result does not discard a Google Shopping result that arrives within
+one hedge delay: Google wins if it has a price, otherwise its image is merged in.
+"""
+import asyncio
+import time
+
+from agents.product_info_agent import ProductInfoAgent
+
+URL = "https://www.homedepot.com/p/DEWALT-20V-MAX-Cordless-Drill-Driver-DCD771C2/204279858"
+
+
+def search_result(method, price=None, image_url=None):
+    return {"title": "Dewalt Max Cordless Drill Driver", "sale_price": price, "original_price": None,
+            "image_url": image_url, "brand": None, "extraction_method": method}
+
+
+def make_agent(google, merchant, web=None):
+    agent = ProductInfoAgent()
+    agent.ai_enabled = web is not None
+    agent._search_google_shopping = google
+    agent._search_merchant_for_product = merchant
+    if web is not None:
+        agent._search_web_for_product = web
+    return agent
+
+
+async def run_fast_strategy_wins_and_slow_ones_are_cancelled():
+    cancelled = []
+
+    async def slow_google(title, url):
+        try:
+            await asyncio.sleep(5)
+            return search_result("google_shopping_search", price=99.0)
+        except asyncio.CancelledError:
+            cancelled.append("google_shopping")
+            raise
+
+    async def merchant(title, url):
+        await asyncio.sleep(0.1)
+        return search_result("merchant_search", price=89.0)
+
+    agent = make_agent(slow_google, merchant)
+    start = time.monotonic()
+    result = await agent._search_based_extraction(URL)
+    elapsed = time.monotonic() - start
+
+    print(f"  Winner {result['search_strategy']} after {elapsed:.2f}s, timings {result['search_timings']}")
+    assert result["search_strategy"] == "merchant_search" and result["sale_price"] == 89.0
+    assert elapsed < 1.5, "should not wait for the slow strategy"
+    assert cancelled == ["google_shopping"]
+    assert result["search_timings"]["google_shopping"]["status"] == "cancelled"
+    assert result["search_timings"]["merchant_search"]["status"] == "won"
+
+
+async def run_empty_result_starts_next_strategy_immediately():
+    async def empty_google(title, url):
+        return None
+
+    async def merchant(title, url):
+        return search_result("merchant_search", price=89.0)
+
+    agent = make_agent(empty_google, merchant)
+    start = time.monotonic()
+    result = await agent._search_based_extraction(URL)
+    elapsed = time.monotonic() - start
+
+    print(f"  Empty first strategy: winner {result['search_strategy']} after {elapsed:.2f}s")
+    assert result["search_strategy"] == "merchant_search"
+    assert elapsed < 0.3, "hedge delay should be skipped once an earlier strategy comes back empty"
+
+
+async def run_partial_results_are_merged():
+    async def image_only_google(title, url):
+        return search_result("google_shopping_search", image_url="https://images.example.com/drill.jpg")
+
+    async def no_price_merchant(title, url):
+        return None
+
+    async def web(title, url):
+        await asyncio.sleep(0.05)
+        return search_result("web_search_ai", price=79.0)
+
+    agent = make_agent(image_only_google, no_price_merchant, web)
+    result = await agent._search_based_extraction(URL)
+
+    print(f"  Web search winner: {result['search_strategy']}, {result['search_timings']}")
+    assert result["search_strategy"] == "web_search_ai" and result["sale_price"] == 79.0
+
+    async def no_web(title, url):
+        return None
+
+    agent = make_agent(image_only_google, no_price_merchant, no_web)
+    result = await agent._search_based_extraction(URL)
+    assert result["search_strategy"] is None
+    assert result["image_url"] == "https://images.example.com/drill.jpg"
+    assert agent.get_extraction_stats()["search_wins"] == {"none": 1}
+
+
+async def run_google_result_in_hedge_window_is_kept():
+    image = "https://images.example.com/drill.jpg"
+
+    def google_after(delay, price):
+        async def google(title, url):
+            await asyncio.sleep(delay)
+            return search_result("google_shopping_search", price=price, image_url=image)
+        return google
+
+    async def merchant(title, url):
+        await asyncio.sleep(0.05)
+        return search_result("merchant_search", price=89.0)
+
+    # Google answers just after the merchant price: the higher-priority result wins
+    agent = make_agent(google_after(0.7, 95.0), merchant)
+    result = await agent._search_based_extraction(URL)
+    print(f"  Google in the window: winner {result['search_strategy']}, {result['search_timings']}")
+    assert result["search_strategy"] == "google_shopping"
+    assert result["sale_price"] == 95.0 and result["image_url"] == image
+    assert result["search_timings"]["merchant_search"]["status"] == "ok"
+
+    # Google only finds the image: the merchant price wins and keeps Google's image
+    agent = make_agent(google_after(0.7, None), merchant)
+    result = await agent._search_based_extraction(URL)
+    assert result["search_strategy"] == "merchant_search"
+    assert result["sale_price"] == 89.0 and result["image_url"] == image
+    assert result["extraction_method"] == "merchant_search_enhanced_with_google_shopping_search"
+
+
+def test_fast_strategy_wins_and_slow_ones_are_cancelled():
+    asyncio.run(run_fast_strategy_wins_and_slow_ones_are_cancelled())
+
+
+def test_empty_result_starts_next_strategy_immediately():
+    asyncio.run(run_empty_result_starts_next_strategy_immediately())
+
+
+def test_partial_results_are_merged():
+    asyncio.run(run_partial_results_are_merged())
+
+
+def test_google_result_in_hedge_window_is_kept():
+    asyncio.run(run_google_result_in_hedge_window_is_kept())
+
+
+if __name__ == "__main__":
+    print("Testing that the fastest sufficient strategy wins...")
+    test_fast_strategy_wins_and_slow_ones_are_cancelled()
+    print("Testing early hedge after an empty result...")
+    test_empty_result_starts_next_strategy_immediately()
+    print("Testing partial result handling...")
+    test_partial_results_are_merged()
+    print("Testing that a Google result in the hedge window is kept...")
+    test_google_result_in_hedge_window_is_kept()
+    print("All search hedging tests passed")
@@ -0,0 +1,140 @@
+"""
+Test streamed LLM completions with incremental JSON parsing
+A local OpenAI-compatible server streams a tool identification a few characters at a time,
+followed by slow trailing prose. The gateway must return once the JSON object closes (or once
+the requested fields are parsed) instead of waiting for the whole completion.
+"""
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+import services.openai_vision_service as vision_module
+from services.llm_gateway import LLMGateway
+from services.streaming_json import IncrementalJSONObject
+
+CHUNK_DELAY_SECONDS = 0.01
+TOOL_JSON = {
+    "tool_name": "Cordless Drill/Driver",
+    "category": "power tool",
+    "brand": "DeWalt",
+    "model": "DCD771C2",
+    "primary_use": "Drilling holes and driving screws",
+    "features": ["20V MAX battery", "2-speed \"high/low\" gearbox", "LED light {work}"],
+    "alternatives": [{"name": "Impact Driver", "reason": "Better for long screws"}] * 6,
+}
+RESPONSE = ("Here is the identification:\n```json\n" + json.dumps(TOOL_JSON, indent=2) + "\n```\n"
+            + "This drill is a popular choice for home workshops. " * 40)
+
+
+def sse_chunks(content: str, size: int = 8):
+    for i in range(0, len(content), size):
+        yield {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": int(time.time()),
+               "model": "gpt-4o", "choices": [{"index": 0, "delta": {"content": content[i:i + size]},
+                                                "finish_reason": None}]}
+
+
+async def start_model_server(state: dict):
+    async def chat_completions(request):
+        body = await request.json()
+        assert body["stream"] is True
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        state["chunks_sent"] = 0
+        try:
+            for chunk in sse_chunks(RESPONSE):
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                state["chunks_sent"] += 1
+                await asyncio.sleep(CHUNK_DELAY_SECONDS)
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            # The client hung up once it had what it needed
+            state["disconnected"] = True
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+def run_incremental_parser():
+    parser = IncrementalJSONObject()
+    completed = []
+    for char in RESPONSE:
+        completed.extend(parser.feed(char))
+        if parser.complete:
+            break
+    assert parser.fields == TOOL_JSON
+    assert completed == list(TOOL_JSON), "fields should complete one at a time, in order"
+    assert parser.feed("more prose") == {}
+
+    parser = IncrementalJSONObject()
+    parser.feed('{"title": "Drill", "price": 99.0.0, "brand": "DEWALT"}')
+    print(f"  Malformed member dropped: {parser.invalid_members}")
+    assert parser.fields == {"title": "Drill", "brand": "DEWALT"} and parser.complete
+
+
+async def run_stream_returns_before_trailing_prose():
+    state = {}
+    runner, base_url = await start_model_server(state)
+    gateway = LLMGateway(api_key=None, base_url=base_url, max_concurrency=4, timeout=10,
+                         max_connections=4, max_keepalive_connections=2, max_retries=0)
+    original = vision_module.llm_gateway
+    messages = [{"role": "user", "content": "Identify this tool"}]
+    total_chunks = len(list(sse_chunks(RESPONSE)))
+    try:
+        start = time.monotonic()
+        result = await gateway.chat_json(messages, model="gpt-4o", purpose="tool_identification",
+                                         required=("tool_name",))
+        full_object = time.monotonic() - start
+        assert result == TOOL_JSON
+        sent_full = state["chunks_sent"]
+
+        start = time.monotonic()
+        result = await gateway.chat_json(messages, model="gpt-4o", purpose="tool_identification",
+                                         required=("tool_name",), return_when=("tool_name", "brand", "model"))
+        early = time.monotonic() - start
+        assert set(result) == {"tool_name", "category", "brand", "model"}
+
+        print(f"  Full object after {full_object:.2f}s ({sent_full}/{total_chunks} chunks), "
+              f"required fields after {early:.2f}s ({state['chunks_sent']}/{total_chunks} chunks)")
+        assert sent_full < total_chunks / 2, "trailing prose should be abandoned"
+        assert state["disconnected"]
+        assert early < full_object / 2
+
+        # The vision service returns the requested fields without waiting for the alternatives
+        vision_module.llm_gateway = gateway
+        tool = await vision_module.OpenAIVisionService().identify_tool(
+            "aW1hZ2U=", fields=("tool_name", "primary_use"))
+        assert tool["tool_name"] == "Cordless Drill/Driver" and "alternatives" not in tool
+
+        stats = gateway.get_stats()["by_purpose"]["tool_identification"]
+        print(f"  Stats: {stats}")
+        assert stats["streams"] == 3 and stats["early_returns"] == 2
+        assert stats["p50_first_field_latency"] is not None
+    finally:
+        vision_module.llm_gateway = original
+        await gateway.close()
+        await runner.cleanup()
+
+
+def test_incremental_parser():
+    run_incremental_parser()
+
+
+def test_stream_returns_before_trailing_prose():
+    asyncio.run(run_stream_returns_before_trailing_prose())
+
+
+if __name__ == "__main__":
+    print("Testing the incremental JSON parser...")
+    test_incremental_parser()
+    print("Testing early return from a streamed completion...")
+    test_stream_returns_before_trailing_prose()
+    print("All streaming JSON tests passed")
@@ -0,0 +1,176 @@
+"""
+Test the structured-data fast path in ProductInfoAgent
+A page with complete schema.org JSON-LD must be imported without any model call;
+a page with only partial OpenGraph data must send a compact prompt asking for the missing fields.
+Microdata is read from the Product item only, not from breadcrumbs, reviews or other items.
+"""
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from agents.product_info_agent import ProductInfoAgent
+from services.llm_cache import llm_cache
+from services.llm_gateway import llm_gateway
+from services.structured_data import extract_structured_product, structured_product_from_tags
+
+PAGE_TEXT = "<p>" + "Compact, lightweight design fits into tight areas. " * 200 + "</p>"
+
+COMPLETE_PAGE = """<html><head><title>DEWALT Drill</title>
+<script type="application/ld+json">{"@context": "https://schema.org", "@graph": [
+  {"@type": "BreadcrumbList", "itemListElement": []},
+  {"@type": "Product", "name": "DEWALT 20V MAX Cordless Drill/Driver Kit", "mpn": "DCD771C2",
+   "brand": {"@type": "Brand", "name": "DEWALT"}, "image": ["/images/dcd771c2.jpg"],
+   "description": "Compact, lightweight drill/driver for tight areas.",
+   "category": "Power Tools",
+   "aggregateRating": {"@type": "AggregateRating", "ratingValue": "4.7", "reviewCount": "12,345"},
+   "offers": {"@type": "Offer", "price": "99.00", "priceCurrency": "USD",
+              "priceSpecification": {"@type": "UnitPriceSpecification",
+                                     "priceType": "https://schema.org/ListPrice", "price": 129.0}}}
+]}</script></head><body><main>""" + PAGE_TEXT + """</main></body></html>"""
+
+PARTIAL_PAGE = """<html><head><title>Kobalt Drill</title>
+<meta property="og:title" content="Kobalt 24-volt Max 1/2-in Brushless Cordless Drill">
+<meta property="og:image" content="https://mobileimages.lowes.com/productimages/kobalt-kdd-1424b.jpg">
+</head><body><main>""" + PAGE_TEXT + """<p>Kobalt $79.98</p></main></body></html>"""
+
+LLM_COMPLETION = {"brand": "Kobalt", "sale_price": 79.98, "description": "Brushless cordless drill.",
+                  "category": "tools", "project_types": ["general", "woodworking"],
+                  "title": "Wrong title from the model"}
+
+
+async def start_server(prompts: list):
+    async def complete_page(request):
+        return web.Response(text=COMPLETE_PAGE, content_type="text/html")
+
+    async def partial_page(request):
+        return web.Response(text=PARTIAL_PAGE, content_type="text/html")
+
+    async def chat_completions(request):
+        # Product extraction streams its completion
+        body = await request.json()
+        prompts.append(body["messages"][-1]["content"])
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": body["model"], "choices": [{"index": 0, "finish_reason": "stop",
+                                                      "delta": {"content": json.dumps(LLM_COMPLETION)}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+        return response
+
+    app = web.Application()
+    app.router.add_get("/p/dewalt-dcd771c2", complete_page)
+    app.router.add_get("/pd/kobalt-drill", partial_page)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def run_structured_fast_path():
+    prompts = []
+    runner, base_url = await start_server(prompts)
+    original = (llm_gateway.base_url, llm_cache.enabled)
+    llm_gateway.base_url = f"{base_url}/v1"
+    llm_cache.enabled = False
+    agent = ProductInfoAgent()
+    try:
+        complete = await agent._extract_product_info_with_ai(f"{base_url}/p/dewalt-dcd771c2")
+        print(f"  Complete page: {complete['extraction_method']}, {complete['title']}, "
+              f"${complete['sale_price']} (list ${complete['original_price']}), {complete['category']}")
+        assert not prompts, "complete structured data must not call the model"
+        assert complete['extraction_method'] == 'structured_data'
+        assert complete['brand'] == 'DEWALT' and complete['model'] == 'DCD771C2'
+        assert complete['sale_price'] == 99.0 and complete['original_price'] == 129.0
+        assert complete['image_url'] == f"{base_url}/images/dcd771c2.jpg"
+        assert complete['rating'] == 4.7 and complete['rating_count'] == 12345
+        assert complete['category'] == 'tools' and 'general' in complete['project_types']
+
+        partial = await agent._extract_product_info_with_ai(f"{base_url}/pd/kobalt-drill")
+        full_prompt = agent._create_extraction_prompt(f"{base_url}/pd/kobalt-drill",
+                                                      await agent._fetch_page_content(f"{base_url}/pd/kobalt-drill"),
+                                                      "other")
+        print(f"  Partial page: {partial['extraction_method']}, prompt {len(prompts[0])} chars "
+              f"vs full {len(full_prompt)} chars")
+        assert len(prompts) == 1 and len(prompts[0]) < len(full_prompt) / 2
+        assert '"brand"' in prompts[0] and '"image_url"' not in prompts[0].split("Return ONLY")[1]
+        assert partial['title'] == "Kobalt 24-volt Max 1/2-in Brushless Cordless Drill", "structured title must win"
+        assert partial['brand'] == 'Kobalt' and partial['sale_price'] == 79.98
+        assert partial['extraction_method'] == 'structured_data_ai'
+
+        stats = agent.get_extraction_stats()
+        print(f"  Imports without model call: {stats['no_llm_share']:.0%}, "
+              f"~{stats['tokens_saved_per_import']} tokens saved per import")
+        assert stats['imports'] == 2 and stats['structured_data'] == 1 and stats['structured_data_with_llm'] == 1
+        assert stats['tokens_saved'] > 0
+    finally:
+        llm_gateway.base_url, llm_cache.enabled = original
+        await llm_gateway.close()
+        await runner.cleanup()
+
+
+def test_structured_fast_path():
+    asyncio.run(run_structured_fast_path())
+
+
+def test_microdata_and_open_graph():
+    html = """<html><head><meta property="og:title" content="HART Drill">
+    <meta property="og:image" content="//i5.walmartimages.com/hart.jpeg"></head>
+    <body><h1 itemprop="name">HART 20-Volt Cordless Drill</h1><span itemprop="brand">HART</span>
+    <span itemprop="price">Now $39.97</span></body></html>"""
+    record = extract_structured_product(html, "https://www.walmart.com/ip/566449366")
+    assert record['title'] == "HART 20-Volt Cordless Drill", "microdata outranks OpenGraph"
+    assert record['brand'] == "HART" and record['sale_price'] == 39.97
+    assert record['image_url'] == "https://i5.walmartimages.com/hart.jpeg"
+    assert record['sources'] == ['microdata', 'open_graph']
+
+
+BREADCRUMB_PAGE = """<html><body>
+<ol itemscope itemtype="https://schema.org/BreadcrumbList">
+  <li itemprop="itemListElement" itemscope itemtype="https://schema.org/ListItem">
+    <a itemprop="item" href="/"><span itemprop="name">Home</span></a><meta itemprop="position" content="1">
+  </li>
+</ol>
+<div itemscope itemtype="https://schema.org/Offer"><span itemprop="price">5.00</span></div>
+<div itemscope itemtype="http://schema.org/Product">
+  <h1 itemprop="name">RYOBI ONE+ 18V Cordless 1/2 in. Drill/Driver</h1>
+  <div itemprop="brand" itemscope itemtype="https://schema.org/Brand"><span itemprop="name">RYOBI</span></div>
+  <span itemprop="model">PCL206K1</span>
+  <div itemprop="aggregateRating" itemscope itemtype="https://schema.org/AggregateRating">
+    <span itemprop="ratingValue">4.6</span> (<span itemprop="reviewCount">2,310</span>)
+  </div>
+  <div itemprop="review" itemscope itemtype="https://schema.org/Review">
+    <span itemprop="name">Great drill</span><span itemprop="ratingValue">2</span>
+  </div>
+  <div itemprop="offers" itemscope itemtype="https://schema.org/Offer">
+    <meta itemprop="priceCurrency" content="USD"><span itemprop="price">59.00</span>
+  </div>
+</div></body></html>"""
+
+
+def test_microdata_reads_only_the_product_item():
+    expected = {"title": "RYOBI ONE+ 18V Cordless 1/2 in. Drill/Driver", "brand": "RYOBI",
+                "model": "PCL206K1", "rating": 4.6, "rating_count": 2310, "sale_price": 59.0,
+                "sources": ["microdata"]}
+    assert extract_structured_product(BREADCRUMB_PAGE, "https://www.homedepot.com/p/318369451") == expected
+
+    # The agent collects itemprop tags from its own full parse of the page
+    agent = ProductInfoAgent()
+    scan = agent._scan_page(BREADCRUMB_PAGE, "https://www.homedepot.com/p/318369451", collect_structured=True)
+    record = structured_product_from_tags(scan.ld_json_scripts, scan.itemprop_tags, scan.meta_tags,
+                                          "https://www.homedepot.com/p/318369451")
+    assert record == expected
+
+
+if __name__ == "__main__":
+    print("Testing structured-data fast path...")
+    test_structured_fast_path()
+    print("Testing microdata and OpenGraph extraction...")
+    test_microdata_and_open_graph()
+    print("Testing that microdata outside the Product item is ignored...")
+    test_microdata_reads_only_the_product_item()
+    print("All structured data tests passed")
@@ -0,0 +1,184 @@
+"""
+Test streaming, size-capped upload ingestion
+Uploads are checked from their first bytes (non-images are rejected before the rest is read),
+cut off as soon as they pass the size limit, written to disk in chunks, and base64-encoded
+incrementally with the same result as encoding the whole buffer. Concurrent uploads with the same
+filename are saved to separate files.
+"""
+import asyncio
+import base64
+import io
+import os
+import tempfile
+
+from fastapi import UploadFile
+from PIL import Image
+
+import services.upload_ingest as upload_ingest_module
+from services.image_preprocessing import ImagePreprocessor
+from services.upload_ingest import (CHUNK_SIZE, UploadRejected, encode_file_base64, encode_for_vision,
+                                    ingest_upload, sniff_image_type)
+
+
+class CountingFile(io.BytesIO):
+    """Records how many bytes the ingester actually read"""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def make_jpeg(width=2400, height=1800) -> bytes:
+    output = io.BytesIO()
+    Image.effect_noise((width, height), 40).convert("RGB").save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+def make_upload(data: bytes, filename="photo.jpg", declare_size=True) -> UploadFile:
+    # Clients may omit the part size, so the cap must also hold while streaming
+    return UploadFile(CountingFile(data), size=len(data) if declare_size else None, filename=filename)
+
+
+def run_sniff_image_type():
+    assert sniff_image_type(make_jpeg(64, 64)) == "image/jpeg"
+    for image_format, mime_type in (("PNG", "image/png"), ("WEBP", "image/webp"), ("GIF", "image/gif")):
+        output = io.BytesIO()
+        Image.new("RGB", (8, 8)).save(output, format=image_format)
+        assert sniff_image_type(output.getvalue()) == mime_type
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WAVEfmt ") is None
+    assert sniff_image_type(b"%PDF-1.7\n") is None
+
+
+async def run_ingest_limits(tmp_dir: str):
+    photo = make_jpeg()
+
+    ingested = await ingest_upload(make_upload(photo), max_bytes=len(photo))
+    try:
+        with open(ingested.path, "rb") as f:
+            assert f.read() == photo
+        assert ingested.size == len(photo) and ingested.mime_type == "image/jpeg"
+    finally:
+        ingested.discard()
+    assert not os.path.exists(ingested.path)
+
+    # A declared oversize part is rejected without reading it
+    upload = make_upload(photo)
+    try:
+        await ingest_upload(upload, max_bytes=len(photo) - 1)
+        assert False, "oversize upload should be rejected"
+    except UploadRejected as e:
+        assert e.status_code == 413
+    assert upload.file.bytes_read == 0
+
+    # Without a declared size, reading stops at the first chunk over the limit
+    destination = os.path.join(tmp_dir, "oversize.jpg")
+    upload = make_upload(photo, declare_size=False)
+    try:
+        await ingest_upload(upload, max_bytes=3 * CHUNK_SIZE, destination=destination)
+        assert False, "oversize upload should be rejected"
+    except UploadRejected as e:
+        assert e.status_code == 413
+    print(f"  Oversize upload of {len(photo)} bytes stopped after {upload.file.bytes_read} bytes")
+    assert upload.file.bytes_read == 4 * CHUNK_SIZE
+    assert not os.path.exists(destination), "partial file should be removed"
+
+    # Non-images are rejected from the first chunk
+    upload = make_upload(b"MZ\x90\x00" + os.urandom(5 * CHUNK_SIZE), filename="setup.exe")
+    try:
+        await ingest_upload(upload, max_bytes=len(photo))
+        assert False, "non-image upload should be rejected"
+    except UploadRejected as e:
+        assert e.status_code == 415 and "setup.exe" in e.detail
+    assert upload.file.bytes_read == CHUNK_SIZE
+
+
+async def run_same_filename_uploads(tmp_dir: str):
+    photos = [make_jpeg(640, 480), make_jpeg(800, 600)]
+    ingested = await asyncio.gather(*(ingest_upload(make_upload(photo, filename="photo.jpg"), max_bytes=len(photo),
+                                                    directory=tmp_dir) for photo in photos))
+    assert ingested[0].path != ingested[1].path
+    for upload, photo in zip(ingested, photos):
+        assert os.path.dirname(upload.path) == tmp_dir and upload.filename == "photo.jpg"
+        with open(upload.path, "rb") as f:
+            assert f.read() == photo
+    ingested[1].discard()
+    with open(ingested[0].path, "rb") as f:
+        assert f.read() == photos[0], "discarding one upload must not touch the other"
+    ingested[0].discard()
+
+    # Rejected uploads leave nothing behind in the upload directory
+    try:
+        await ingest_upload(make_upload(photos[0]), max_bytes=10, directory=tmp_dir)
+        assert False, "oversize upload should be rejected"
+    except UploadRejected:
+        pass
+    assert os.listdir(tmp_dir) == []
+
+
+async def run_incremental_base64(tmp_dir: str):
+    for size in (0, 1, 2, 3, CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 1, 5 * CHUNK_SIZE + 2):
+        data = os.urandom(size)
+        path = os.path.join(tmp_dir, f"blob_{size}")
+        with open(path, "wb") as f:
+            f.write(data)
+        assert encode_file_base64(path) == base64.b64encode(data).decode("ascii")
+
+    original = upload_ingest_module.image_preprocessor
+    photo = make_jpeg()
+    try:
+        # Preprocessing off: the original upload is encoded as-is with its sniffed type
+        upload_ingest_module.image_preprocessor = ImagePreprocessor(
+            enabled=False, max_dimension=1024, quality=85, output_format="jpeg")
+        ingested = await ingest_upload(make_upload(photo), max_bytes=len(photo))
+        vision_image = await encode_for_vision(ingested)
+        assert base64.b64decode(vision_image.base64) == photo
+        assert vision_image.mime_type == "image/jpeg" and vision_image.phash is None
+
+        # Preprocessing on: the worker reads the saved file and only the small result comes back
+        upload_ingest_module.image_preprocessor = ImagePreprocessor(
+            enabled=True, max_dimension=1024, quality=85, output_format="webp")
+        vision_image = await encode_for_vision(ingested)
+        ingested.discard()
+        sent = base64.b64decode(vision_image.base64)
+        print(f"  Upload {len(photo)} bytes -> {len(sent)} bytes sent to the vision model")
+        assert vision_image.mime_type == "image/webp" and vision_image.phash is not None
+        assert max(Image.open(io.BytesIO(sent)).size) == 1024
+        assert upload_ingest_module.image_preprocessor.get_stats()["bytes_in"] == len(photo)
+    finally:
+        upload_ingest_module.image_preprocessor = original
+
+
+def test_sniff_image_type():
+    run_sniff_image_type()
+
+
+def test_ingest_limits():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(run_ingest_limits(tmp_dir))
+
+
+def test_same_filename_uploads():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(run_same_filename_uploads(tmp_dir))
+
+
+def test_incremental_base64():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(run_incremental_base64(tmp_dir))
+
+
+if __name__ == "__main__":
+    print("Testing image type sniffing...")
+    test_sniff_image_type()
+    print("Testing size and type limits...")
+    test_ingest_limits()
+    print("Testing concurrent uploads with the same filename...")
+    test_same_filename_uploads()
+    print("Testing incremental base64 encoding...")
+    test_incremental_base64()
+    print("All upload ingestion tests passed")
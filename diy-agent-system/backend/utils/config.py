@@ -18,6 +18,7 @@ class Settings(BaseSettings):
     
     # API Keys
     openai_api_key: Optional[str] = None
+    openai_base_url: Optional[str] = None  # 指向OpenAI兼容服务（本地测试用），为空时使用官方API
     serper_api_key: Optional[str] = None
     
     # 数据库
@@ -37,7 +38,121 @@ class Settings(BaseSettings):
     # 搜索配置
     search_results_limit: int = 20
     quality_threshold: float = 3.5
+
+    # 抓取连接池配置
+    scraper_pool_limit: int = 100
+    scraper_pool_limit_per_host: int = 10
+    scraper_keepalive_timeout: float = 30.0
+    scraper_dns_cache_ttl: int = 300  # 秒
+    scraper_request_timeout: int = 10
+    
+    # 价格缓存配置
+    price_cache_ttl: float = 900  # 秒，新鲜期
+    price_cache_stale_ttl: float = 3600  # 秒，过期后仍可返回旧值并后台刷新的窗口
+    price_cache_max_entries: int = 2000
+    price_cache_max_bytes: int = 8 * 1024 * 1024  # 8MB
+    
+    # 替代品并发查询配置
+    alternatives_request_concurrency: int = 6  # 单个请求内
+    price_lookup_process_concurrency: int = 24  # 整个进程
+    
+    # HTML解析配置
+    html_parser_backend: str = "auto"  # auto / lxml / bs4
+    cpu_worker_processes: int = 2  # 0表示使用线程池
     
+    # 熔断与自适应超时配置
+    breaker_window_seconds: float = 60  # 滚动错误率窗口
+    breaker_min_requests: int = 5  # 窗口内最少请求数才会熔断
+    breaker_error_rate_threshold: float = 0.5
+    breaker_open_seconds: float = 30  # 熔断后多久进入half-open试探
+    adaptive_timeout_window: int = 100  # 保留的延迟样本数
+    adaptive_timeout_min_samples: int = 20
+    adaptive_timeout_multiplier: float = 2.0  # 超时 = p95 × 倍数
+    adaptive_timeout_min: float = 2.0  # 秒
+    
+    # 多平台价格搜索截止时间
+    price_search_deadline: float = 4.0  # 秒，整个搜索（含限速排队）的截止时间，0表示等待所有平台
+    price_search_sent_timeout: float = 0  # 秒，请求发出后每个平台的最长等待，0表示只受截止时间限制
+    price_search_partial_ttl: float = 60  # 秒，部分结果和含估算价格结果的缓存时间
+    price_batch_concurrency: int = 8  # 批量价格查询的并发数
+    
+    # 后台价格刷新配置
+    price_refresh_enabled: bool = True
+    price_refresh_tick_seconds: float = 60  # 检查到期查询的间隔
+    price_refresh_min_interval: float = 900  # 秒，最热门查询的刷新间隔
+    price_refresh_max_interval: float = 6 * 3600  # 秒，只被识别一次的查询的刷新间隔
+    price_refresh_batch_size: int = 20  # 每轮最多刷新的查询数
+    price_refresh_watchlist_size: int = 500
+    price_refresh_watch_ttl: float = 7 * 24 * 3600  # 秒，多久未被识别后移出观察列表
+    price_snapshot_max_age: float = 6 * 3600  # 秒，识别时可直接使用的快照最大年龄
+    
+    # LLM网关配置
+    llm_max_concurrency: int = 8  # 同时进行的模型调用数
+    llm_timeout: float = 60.0  # 秒，单次调用超时
+    llm_pool_limit: int = 20
+    llm_pool_keepalive: int = 10
+    llm_max_retries: int = 2
+
+    # LLM响应缓存配置
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = "./data/llm_cache.db"
+    llm_cache_ttl: float = 7 * 24 * 3600  # 秒
+    llm_cache_max_entries: int = 5000
+    llm_cache_max_bytes: int = 50 * 1024 * 1024  # 50MB
+
+    # 批量导入配置
+    bulk_import_concurrency: int = 4  # 同时提取的URL数
+    bulk_import_per_domain: int = 2  # 同一域名同时提取的URL数
+    bulk_import_batch_size: int = 20  # 每次写库的条目数
+    bulk_import_flush_interval: float = 1.0  # 秒，不足一批时最长等待
+    bulk_import_max_urls: int = 1000  # 单个批次的URL上限
+    bulk_import_resume_on_startup: bool = True
+    bulk_import_claim_lease: float = 60  # 秒，运行批次的进程定期续约；超时未续约的批次可被其他进程接管
+
+    # 搜索兜底对冲配置
+    search_hedge_delay: float = 0.5  # 秒，下一个搜索策略的启动间隔
+    search_hedge_timeout: float = 30.0  # 秒，所有搜索策略的总截止时间
+
+    # 短链接重定向缓存配置
+    redirect_cache_path: str = "./data/redirect_cache.db"
+    redirect_cache_ttl: float = 30 * 24 * 3600  # 秒
+    redirect_cache_max_entries: int = 20000
+    redirect_cache_max_bytes: int = 8 * 1024 * 1024  # 8MB
+
+    # 按域名抓取限速配置（令牌桶，被429/503时降速，正常时缓慢提速）
+    politeness_enabled: bool = True
+    politeness_rate: float = 3.0  # 每个域名的初始请求速率（次/秒）
+    politeness_burst: int = 10  # 允许的突发请求数，需容纳一次替代品并发查询（最多9个）
+    politeness_min_rate: float = 0.1  # 被限流后的最低速率
+    politeness_max_rate: float = 8.0  # 提速上限
+    politeness_increase_step: float = 0.05  # 每次成功请求增加的速率
+    politeness_backoff_factor: float = 0.5  # 被限流时速率乘以该系数
+    politeness_max_wait: float = 5.0  # 交互式请求最长排队秒数，超过则走回退路径（0为不限）
+    politeness_background_max_wait: float = 120.0  # 后台请求最长排队秒数（0为不限）
+
+    # 视觉调用前的图片预处理配置
+    image_preprocess_enabled: bool = True
+    image_max_dimension: int = 1536  # 像素，长边上限
+    image_quality: int = 85  # 重新编码的质量
+    image_format: str = "jpeg"  # jpeg 或 webp
+
+    # 工具识别结果缓存配置（按图片感知哈希匹配近似重复的照片）
+    identification_cache_enabled: bool = True
+    identification_cache_path: str = "./data/identification_cache.db"
+    identification_cache_ttl: float = 30 * 24 * 3600  # 秒
+    identification_cache_max_entries: int = 20000
+    identification_cache_max_bytes: int = 32 * 1024 * 1024  # 32MB
+    identification_cache_max_distance: int = 6  # 64位哈希的最大汉明距离
+    identification_cache_min_confidence: float = 0.8  # 低于该置信度的识别结果不缓存
+
+    # 异步识别任务配置
+    identify_job_workers: int = 4  # 同时运行的识别任务数
+    identify_job_max_queued: int = 100  # 排队任务上限，超过时拒绝提交
+    identify_job_result_ttl: float = 600  # 秒，完成的任务保留多久供查询
+    identify_job_store_path: str = "./data/identification_jobs.db"  # 多个worker进程共享的任务状态
+    identify_job_store_max_entries: int = 10000
+    identify_job_store_max_bytes: int = 64 * 1024 * 1024  # 64MB
+
     class Config:
         env_file = ".env"
 
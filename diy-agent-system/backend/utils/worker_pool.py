@@ -0,0 +1,42 @@
+"""
+CPU-bound work pool
+把HTML解析等CPU密集任务移出事件循环
+"""
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """获取共享进程池（cpu_worker_processes为0时返回None，改用线程）"""
+    global _process_pool
+    workers = get_settings().cpu_worker_processes
+    if workers <= 0:
+        return None
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=workers)
+        logger.info(f"CPU worker pool started with {workers} processes")
+    return _process_pool
+
+
+async def run_cpu_bound(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """在工作进程中执行CPU密集函数（fn及参数必须可pickle）"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), partial(fn, *args, **kwargs))
+
+
+def shutdown_worker_pool():
+    """关闭共享进程池（在FastAPI shutdown中调用）"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+        logger.info("CPU worker pool shut down")